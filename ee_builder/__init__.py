@@ -0,0 +1,9 @@
+"""
+Ansible Custom EE Builder - Python tooling
+
+Run from the project root with: python -m ee_builder <command> [OPTIONS]
+"""
+
+from ee_builder.errors import EEBuilderError
+
+__all__ = ["EEBuilderError"]
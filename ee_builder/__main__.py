@@ -0,0 +1,6 @@
+"""Entry point for ``python -m ee_builder``."""
+
+from ee_builder.cli import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""
+Streaming query over ansible-navigator playbook artifacts
+
+Playbook artifacts (./artifacts/*.json) can be hundreds of MB on large
+inventories, so task results are parsed incrementally instead of loading
+whole documents with json.load. Each file is scanned in a worker process
+and only the aggregated counts are sent back.
+"""
+
+import fnmatch
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional, Sequence, Tuple
+
+from ee_builder.errors import EEBuilderError
+
+try:
+    import ijson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    ijson = None
+
+CHUNK_SIZE = 1024 * 1024
+STATUSES = ('ok', 'changed', 'failed', 'skipped', 'unreachable')
+GROUP_FIELDS = ('host', 'task', 'status')
+
+# JSONトークン: 構造文字 / 文字列 / リテラル（数値・true・false・null）
+_TOKEN = re.compile(r'\s*(?:([\[\]{}:,])|("[^"\\]*(?:\\.[^"\\]*)*")|([^\s\[\]{}:,"]+))')
+_TASKS_PATH = ('plays', '*', 'tasks')
+# 数値リテラルの続きになり得る文字だけがバッファ末尾まで残っているか
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class _StreamScanner:
+    """Incremental JSON scanner that decodes only the values under one array path."""
+
+    def __init__(self, fp: IO[str], array_path: Tuple[str, ...]):
+        self.fp = fp
+        self.array_path = array_path
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos > CHUNK_SIZE:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        # 未完了のトークンが大きい場合は読み込み量を倍増させて再走査を抑える
+        chunk = self.fp.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def _next_token(self) -> Optional[Tuple[str, str]]:
+        while True:
+            match = _TOKEN.match(self.buf, self.pos)
+            # 末尾で途切れたトークンは追加読み込みしてから判定する
+            if match and (match.end() < len(self.buf) or self.eof):
+                self.pos = match.end()
+                if match.group(1):
+                    return 'punct', match.group(1)
+                if match.group(2):
+                    return 'string', match.group(2)
+                return 'literal', match.group(3)
+            if not self._fill():
+                if match:
+                    continue
+                rest = self.buf[self.pos:].strip()
+                if rest:
+                    raise ValueError(f"Truncated JSON near: {rest[:40]!r}")
+                return None
+
+    def _decode_value(self) -> Any:
+        while True:
+            start = self.pos
+            while start < len(self.buf) and self.buf[start].isspace():
+                start += 1
+            try:
+                value, end = self.decoder.raw_decode(self.buf, start)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # 数値リテラルがバッファ境界で切れている可能性（"-2500." で止まると -2500 と読めてしまう）
+            if (isinstance(value, (int, float)) and not isinstance(value, bool) and not self.eof
+                    and _NUMBER_TAIL.match(self.buf, end) and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def _peek_is_value(self) -> bool:
+        while True:
+            idx = self.pos
+            while idx < len(self.buf) and self.buf[idx].isspace():
+                idx += 1
+            if idx < len(self.buf):
+                return self.buf[idx] != ']'
+            if not self._fill():
+                return False
+
+    def items(self) -> Iterator[Any]:
+        """Yield each element of the arrays found at ``array_path``."""
+        # スタック要素: [種別, キー, キー待ちかどうか]
+        stack: List[List[Any]] = []
+        pending_key: Optional[str] = None
+
+        def path() -> Tuple[str, ...]:
+            return tuple('*' if kind == 'arr' else key for kind, key, _ in stack)
+
+        while True:
+            if stack and stack[-1][0] == 'arr' and path()[:-1] == self.array_path:
+                if self._peek_is_value():
+                    yield self._decode_value()
+                token = self._next_token()
+                if token is None:
+                    raise ValueError("Unexpected end of JSON inside array")
+                if token[1] == ']':
+                    stack.pop()
+                elif token[1] != ',':
+                    raise ValueError(f"Unexpected token in array: {token[1]!r}")
+                continue
+
+            token = self._next_token()
+            if token is None:
+                if stack:
+                    raise ValueError("Unexpected end of JSON")
+                return
+            kind, text = token
+            top = stack[-1] if stack else None
+
+            if kind == 'string' and top and top[0] == 'obj' and top[2]:
+                pending_key = json.loads(text)
+                continue
+            if text == ':':
+                top[1] = pending_key
+                top[2] = False
+                continue
+            if text == ',':
+                if top and top[0] == 'obj':
+                    top[2] = True
+                continue
+            if text == '{':
+                stack.append(['obj', None, True])
+            elif text == '[':
+                stack.append(['arr', None, False])
+            elif text in ('}', ']'):
+                stack.pop()
+
+
+def iter_task_results(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield task result entries (plays[*].tasks[*]) from one artifact file."""
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'plays.item.tasks.item')
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from _StreamScanner(f, _TASKS_PATH).items()
+
+
+def task_status(task: Dict[str, Any]) -> str:
+    """Normalize a task entry to one of STATUSES."""
+    result = str(task.get('__result') or task.get('event') or '').lower()
+    res = task.get('res') if isinstance(task.get('res'), dict) else {}
+
+    if 'unreachable' in result or res.get('unreachable'):
+        return 'unreachable'
+    if 'fail' in result or task.get('__failed') or res.get('failed'):
+        return 'failed'
+    if 'skip' in result or res.get('skipped'):
+        return 'skipped'
+    if 'changed' in result or task.get('__changed') or res.get('changed'):
+        return 'changed'
+    return 'ok'
+
+
+def task_fields(task: Dict[str, Any]) -> Dict[str, str]:
+    """Extract the fields used for filtering and grouping."""
+    return {
+        'host': str(task.get('__host') or task.get('host') or ''),
+        'task': str(task.get('__task') or task.get('task') or ''),
+        'status': task_status(task),
+    }
+
+
+def _matches(fields: Dict[str, str], filters: Dict[str, Optional[str]]) -> bool:
+    for name in ('host', 'task'):
+        pattern = filters.get(name)
+        if pattern and not fnmatch.fnmatchcase(fields[name], pattern):
+            return False
+    statuses = filters.get('status')
+    if statuses and fields['status'] not in statuses.split(','):
+        return False
+    return True
+
+
+def scan_artifact(path: Path, filters: Dict[str, Optional[str]],
+                  group_by: Sequence[str]) -> Dict[str, Any]:
+    """Scan one artifact file and return per-group match counts."""
+    counts: Dict[Tuple[str, ...], int] = {}
+    scanned = 0
+    error = None
+
+    try:
+        for task in iter_task_results(path):
+            if not isinstance(task, dict):
+                continue
+            scanned += 1
+            fields = task_fields(task)
+            if _matches(fields, filters):
+                key = tuple(fields[name] for name in group_by)
+                counts[key] = counts.get(key, 0) + 1
+    except (OSError, ValueError) as e:
+        error = f"{path}: {e}"
+
+    return {'file': str(path), 'scanned': scanned, 'counts': counts, 'error': error}
+
+
+def find_artifacts(paths: Sequence[Path], last: Optional[int] = None) -> List[Path]:
+    """Expand files/directories into artifact files, newest last."""
+    files: List[Path] = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(p for p in path.glob('*.json') if p.is_file())
+        elif path.is_file():
+            files.append(path)
+        else:
+            raise EEBuilderError(f"Artifact path not found: {path}")
+
+    files = [p for _, _, p in sorted((p.stat().st_mtime, p.name, p) for p in files)]
+    if last:
+        files = files[-last:]
+    return files
+
+
+def query_artifacts(paths: Sequence[Path], host: Optional[str] = None,
+                    task: Optional[str] = None, status: Optional[str] = None,
+                    group_by: Sequence[str] = ('host', 'task', 'status'),
+                    last: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Query artifacts and aggregate matching task results across files.
+
+    ``host`` and ``task`` are shell-style patterns; ``status`` is a
+    comma separated list of STATUSES. Returns a dict with ``rows`` sorted by
+    match count, plus file/task totals and per-file errors.
+    """
+    unknown = [name for name in group_by if name not in GROUP_FIELDS]
+    if unknown:
+        raise EEBuilderError(f"Unknown group-by field(s): {unknown}")
+    if status:
+        bad = [s for s in status.split(',') if s not in STATUSES]
+        if bad:
+            raise EEBuilderError(f"Unknown status(es): {bad} (choose from {', '.join(STATUSES)})")
+
+    files = find_artifacts(paths, last)
+    filters = {'host': host, 'task': task, 'status': status}
+    group_by = tuple(group_by)
+
+    if workers is None:
+        workers = min(len(files), os.cpu_count() or 1)
+
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(scan_artifact, files,
+                                    [filters] * len(files), [group_by] * len(files)))
+    else:
+        results = [scan_artifact(f, filters, group_by) for f in files]
+
+    rows: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for result in results:
+        for key, count in result['counts'].items():
+            row = rows.setdefault(key, {'count': 0, 'runs': 0, 'last_file': None})
+            row['count'] += count
+            row['runs'] += 1
+            row['last_file'] = result['file']
+
+    ordered = [(key, row) for _, key, row in sorted((-row['count'], key, row) for key, row in rows.items())]
+    return {
+        'files': len(files),
+        'tasks_scanned': sum(r['scanned'] for r in results),
+        'errors': [r['error'] for r in results if r['error']],
+        'group_by': list(group_by),
+        'rows': [dict(zip(group_by, key), **row) for key, row in ordered],
+    }
+
+
+def _setting_image(entries: Any) -> Optional[str]:
+    if isinstance(entries, dict):
+        navigator = entries.get('ansible-navigator')
+        if isinstance(navigator, dict):
+            image = (navigator.get('execution-environment') or {}).get('image')
+            return image if isinstance(image, str) and image else None
+        image = entries.get('execution_environment_image')
+        if isinstance(image, dict):
+            image = image.get('current')
+        return image if isinstance(image, str) and image else None
+    if isinstance(entries, list):
+        # navigator の設定エントリ形式: [{"name": ..., "value": {"current": ...}}, ...]
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get('name') == 'execution_environment_image':
+                value = entry.get('value')
+                return _setting_image({'execution_environment_image': value})
+    return None
+
+
+def artifact_image(path: Path) -> Optional[str]:
+    """Return the EE image a playbook artifact was run with, from its trailing ``settings_entries``.
+
+    Only the last CHUNK_SIZE bytes are read; navigator writes the settings
+    after the (potentially huge) play results.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - CHUNK_SIZE))
+            tail = f.read().decode('utf-8', 'replace')
+    except OSError:
+        return None
+    start = tail.rfind('"settings_entries"')
+    if start < 0:
+        return None
+    colon = tail.find(':', start + len('"settings_entries"'))
+    try:
+        entries, _ = json.JSONDecoder().raw_decode(tail[colon + 1:].lstrip())
+    except ValueError:
+        return None
+    return _setting_image(entries)
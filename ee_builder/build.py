@@ -0,0 +1,451 @@
+"""
+Python build driver for Execution Environments
+
+Reusable replacement for the logic that lived in scripts/build-local.sh:
+dependency check, EE file check, Red Hat registry login, ansible-builder
+build, smoke tests and push. Every container operation goes through
+ContainerRuntime; telemetry, build caching and parallel builds are
+exposed as hooks so the Makefile, the test suites and CI can call
+``build()`` in-process.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ee_builder.collectiondeps import analyze_tarballs
+from ee_builder.credentials import CredentialBroker
+from ee_builder.eefile import copied_files, galaxy_requirements, load_ee_file, requirement_lines
+from ee_builder.eeschema import has_errors, validate_ee_file
+from ee_builder.errors import EEBuilderError
+from ee_builder.galaxylock import FETCH_JOBS, fetch_collections, galaxy_digest, locked_ee_config
+from ee_builder.lockfile import LockError, check_section, load_lock
+from ee_builder.profiling import span
+from ee_builder.pylock import locked_python_config, locked_requirements, python_digest, python_version_for
+from ee_builder.log import log_error, log_info, log_success, log_warn
+from ee_builder.runtime import ContainerRuntime, RuntimeCommandError, connect_runtime
+from ee_builder.sbom import generate_sbom, write_sbom
+from ee_builder.telemetry import SubstageTracker, Telemetry
+
+IMAGE_NAME = 'ansible-custom-ee'
+REDHAT_REGISTRY = 'registry.redhat.io'
+
+SMOKE_TESTS = [
+    ('Ansible version', ['ansible', '--version']),
+    ('Collection list', ['ansible-galaxy', 'collection', 'list']),
+    ('Python environment', ['python3', '-c', "import sys; print(f'Python {sys.version}')"]),
+]
+
+
+class BuildError(EEBuilderError):
+    """Raised when a build phase fails."""
+
+
+def image_reference(registry: str, tag: str, image_name: str = IMAGE_NAME) -> str:
+    return f"{registry}/{image_name}:{tag}"
+
+
+def build_inputs_digest(ee_file: Path, runtime: str, search_dirs: Sequence[Path] = (),
+                        extra_files: Sequence[Path] = ()) -> str:
+    """Hash the EE file, the local files its build steps copy and ``extra_files`` (e.g. ee.lock)."""
+    ee_file = Path(ee_file)
+    digest = hashlib.sha256()
+    digest.update(runtime.encode('utf-8') + b'\0')
+    digest.update(ee_file.read_bytes())
+    dirs = list(search_dirs) or [ee_file.parent, Path.cwd()]
+    for path in copied_files(load_ee_file(ee_file), dirs) + [Path(p) for p in extra_files]:
+        digest.update(b'\0' + str(path.name).encode('utf-8') + b'\0' + path.read_bytes())
+    return 'sha256:' + digest.hexdigest()
+
+
+class BuildCache:
+    """Map build input digests to images already built from them (JSON file)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, inputs_digest: str) -> Optional[str]:
+        with self._lock:
+            return self._load().get(inputs_digest)
+
+    def put(self, inputs_digest: str, image: str) -> None:
+        with self._lock:
+            entries = self._load()
+            entries[inputs_digest] = image
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+            tmp.write_text(json.dumps(entries, indent=2, sort_keys=True), encoding='utf-8')
+            os.replace(tmp, self.path)
+
+
+def _print_line(line: str) -> None:
+    sys.stdout.write(line)
+    sys.stdout.flush()
+
+
+def run_builder(args: List[str], tracker: Optional[SubstageTracker] = None,
+                line_sink: Callable[[str], None] = _print_line) -> int:
+    """Run ansible-builder, streaming its output and feeding the sub-stage tracker."""
+    with span('subprocess', f"ansible-builder {args[0] if args else ''}".rstrip()):
+        try:
+            process = subprocess.Popen(
+                ['ansible-builder'] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, encoding='utf-8', errors='replace'
+            )
+        except FileNotFoundError as e:
+            raise BuildError("ansible-builder not found") from e
+
+        assert process.stdout is not None
+        with process.stdout:
+            for line in process.stdout:
+                line_sink(line)
+                if tracker is not None:
+                    tracker.feed(line)
+        return process.wait()
+
+
+def check_dependencies(runtime: ContainerRuntime) -> None:
+    log_info("Checking dependencies...")
+    missing = [tool for tool in ('ansible-builder', runtime.command) if not shutil.which(tool)]
+    if missing:
+        log_error(f"Missing dependencies: {' '.join(missing)}")
+        log_error("Please install them using: pip install ansible-builder")
+        raise BuildError(f"Missing dependencies: {' '.join(missing)}")
+    log_success("All dependencies are available")
+
+
+def check_ee_file(ee_file: Path) -> None:
+    if not Path(ee_file).is_file():
+        log_error(f"Execution Environment file not found: {ee_file}")
+        raise BuildError(f"Execution Environment file not found: {ee_file}")
+    log_info(f"Using EE file: {ee_file}")
+
+    # ansible-builder に渡す前に検証し、依存関係の書き間違いを数秒で検出する
+    issues = validate_ee_file(ee_file)
+    for issue in issues:
+        message = f"{issue['path']}:{issue['line']}:{issue['column']}: {issue['field']}: {issue['message']}"
+        if issue['severity'] == 'error':
+            log_error(message)
+        else:
+            log_warn(message)
+    if has_errors(issues):
+        raise BuildError(f"Invalid Execution Environment file: {ee_file}")
+
+
+def locked_paths(ee_file: Path) -> Tuple[Path, Path]:
+    """Create a tarball staging directory next to ``ee_file`` and return (locked EE file, staging).
+
+    The names are unique per call, so concurrent builds of one EE file
+    (build_many, the build queue) never share or remove each other's files.
+    """
+    ee_file = Path(ee_file)
+    staging = Path(tempfile.mkdtemp(prefix=f".{ee_file.stem}.lock-", dir=ee_file.parent))
+    return staging.parent / f"{staging.name}.yml", staging
+
+
+def remove_locked(locked_file: Path) -> None:
+    """Remove a locked EE file written by apply_lock and its staging directory."""
+    locked_file = Path(locked_file)
+    locked_file.unlink(missing_ok=True)
+    shutil.rmtree(locked_file.with_suffix(''), ignore_errors=True)
+
+
+def lock_sections(ee_file: Path, lock_file: Path) -> Dict[str, Dict[str, Any]]:
+    """Return the up-to-date sections of ``lock_file`` (``galaxy``, ``python``).
+
+    Raises LockError when a section was resolved from requirements other
+    than the ones ``ee_file`` declares now.
+    """
+    ee_file = Path(ee_file)
+    ee_config = load_ee_file(ee_file)
+    lock = load_lock(lock_file)
+    python_version = (lock.get('python') or {}).get('python_version') or python_version_for(ee_config)
+    digests = {
+        'galaxy': lambda: galaxy_digest(galaxy_requirements(ee_config, ee_file.parent)),
+        'python': lambda: python_digest(requirement_lines(ee_config, 'python', ee_file.parent), python_version),
+    }
+    sections = {}
+    for name, digest in digests.items():
+        if name in lock:
+            sections[name] = check_section(lock, name, digest(), lock_file)
+    return sections
+
+
+def check_collection_dependencies(ee_config: Dict[str, Any], base_dir: Path, tarballs: Sequence[Path],
+                                  python_section: Optional[Dict[str, Any]] = None) -> None:
+    """Fail before ansible-builder runs when collection requirements clash with the EE's."""
+    options: Dict[str, Any] = {}
+    if python_section is not None:
+        options = {'python_lines': locked_requirements(python_section), 'hash_locked': True,
+                   'python_version': python_section.get('python_version')}
+    try:
+        issues = analyze_tarballs(ee_config, base_dir, tarballs, **options)
+    except EEBuilderError as e:
+        log_error(str(e))
+        raise BuildError(str(e)) from e
+    for issue in issues:
+        message = f"{issue['kind']} {issue['name']}: {issue['message']}"
+        if issue['severity'] == 'error':
+            log_error(message)
+        else:
+            log_warn(message)
+    if has_errors(issues):
+        raise BuildError("Collection dependencies conflict with the Execution Environment")
+
+
+def apply_lock(ee_file: Path, lock_file: Path, jobs: int = FETCH_JOBS) -> Path:
+    """Apply ``lock_file`` and return the EE file to build.
+
+    The returned file installs the fetched collection tarballs and the
+    hash-pinned Python packages without resolution; it is ``ee_file``
+    itself when the lock has neither a galaxy nor a python section.
+    Otherwise the caller removes it with remove_locked() after the build.
+    """
+    ee_file = Path(ee_file)
+    try:
+        sections = lock_sections(ee_file, lock_file)
+    except EEBuilderError as e:
+        log_error(str(e))
+        raise BuildError(str(e)) from e
+    if not sections:
+        return ee_file
+
+    config = load_ee_file(ee_file)
+    locked_file, staging = locked_paths(ee_file)
+    try:
+        section = sections.get('galaxy')
+        if section is not None:
+            log_info(f"Fetching {len(section.get('collections') or [])} locked collection(s) from {lock_file}...")
+            try:
+                tarballs = fetch_collections(section, staging / 'collections', Path(lock_file).parent, jobs=jobs)
+                check_collection_dependencies(config, ee_file.parent, tarballs, sections.get('python'))
+                config = locked_ee_config(config, ee_file.parent, section,
+                                          os.path.relpath(staging / 'collections', ee_file.parent))
+            except LockError as e:
+                log_error(str(e))
+                raise BuildError(str(e)) from e
+            log_success(f"Collections pinned by {lock_file}; ansible-galaxy will not resolve")
+        section = sections.get('python')
+        if section is not None:
+            config = locked_python_config(config, section)
+            log_success(f"{len(section.get('packages') or [])} Python package(s) pinned with hashes by {lock_file}")
+        locked_file.write_text(yaml.safe_dump(config, default_flow_style=False, sort_keys=False,
+                                              allow_unicode=True), encoding='utf-8')
+    except BaseException:
+        remove_locked(locked_file)
+        raise
+    return locked_file
+
+
+def authenticate_redhat(runtime: ContainerRuntime, broker: Optional[CredentialBroker] = None) -> None:
+    """Log in to the Red Hat registry, reusing a recent login recorded by the credential broker."""
+    username = os.environ.get('REDHAT_REGISTRY_USERNAME')
+    password = os.environ.get('REDHAT_REGISTRY_PASSWORD')
+    if username and password:
+        log_info("Authenticating to Red Hat registry...")
+        try:
+            logged_in = (broker or CredentialBroker()).registry_login(runtime, REDHAT_REGISTRY, username, password)
+        except RuntimeCommandError as e:
+            log_error("Red Hat registry authentication failed")
+            raise BuildError(str(e)) from e
+        if logged_in:
+            log_success("Red Hat registry authentication successful")
+        else:
+            log_success("Red Hat registry login still valid (cached)")
+    else:
+        log_warn("Red Hat registry credentials not provided")
+        log_warn("Set REDHAT_REGISTRY_USERNAME and REDHAT_REGISTRY_PASSWORD if using Red Hat base images")
+
+
+def build_ee(ee_file: Path, image: str, runtime: ContainerRuntime, context: Path, verbose: bool,
+             telemetry: Telemetry, line_sink: Callable[[str], None] = _print_line) -> None:
+    log_info("Building Execution Environment...")
+
+    args = ['build', '--file', str(ee_file), '--tag', image,
+            '--container-runtime', runtime.command, '--build-outputs-dir', str(context)]
+    if verbose:
+        args += ['--verbosity', '2']
+
+    tracker = SubstageTracker() if telemetry.enabled else None
+    start = time.time()
+    try:
+        returncode = run_builder(args, tracker, line_sink)
+    finally:
+        if tracker is not None:
+            telemetry.record_substages('build_ee', tracker, start)
+    if returncode != 0:
+        log_error("Build failed")
+        raise BuildError(f"ansible-builder exited with {returncode}")
+
+    log_success(f"Build completed: {image}")
+    github_output = os.environ.get('GITHUB_OUTPUT')
+    if github_output:
+        try:
+            with open(github_output, 'a', encoding='utf-8') as f:
+                f.write(f"IMAGE_NAME={image}\n")
+        except OSError:
+            pass
+
+
+def test_ee(image: str, runtime: ContainerRuntime) -> None:
+    log_info("Testing built EE...")
+    for name, command in SMOKE_TESTS:
+        log_info(f"Testing {name}...")
+        try:
+            result = runtime.run_container(image, command)
+        except RuntimeCommandError as e:
+            log_error(f"{name} test failed")
+            raise BuildError(str(e)) from e
+        if result.stdout:
+            print(result.stdout, end='' if result.stdout.endswith('\n') else '\n', flush=True)
+    log_success("All tests passed")
+
+
+def write_build_sbom(image: str, ee_file: Path, runtime: ContainerRuntime, path: Path,
+                     output_format: str = 'spdx', lock_file: Optional[Path] = None) -> Dict[str, Any]:
+    """Write the SBOM of a built image from its lock data and layer package manifests."""
+    log_info("Generating SBOM...")
+    try:
+        sections = lock_sections(ee_file, lock_file) if lock_file is not None else {}
+        document, summary = generate_sbom(image, ee_file, runtime, sections, output_format)
+        write_sbom(path, document)
+    except EEBuilderError as e:
+        log_error(str(e))
+        raise BuildError(str(e)) from e
+    log_success(f"SBOM written to {path}: {summary['components']} component(s), "
+                f"{summary['layers_scanned']}/{summary['layers']} layer(s) read in {summary['seconds']}s")
+    return summary
+
+
+def push_to_registry(image: str, runtime: ContainerRuntime) -> None:
+    log_info("Pushing to registry...")
+    try:
+        runtime.push(image)
+    except RuntimeCommandError as e:
+        log_error("Push failed")
+        raise BuildError(str(e)) from e
+    log_success(f"Push completed: {image}")
+
+
+def build(ee_file: Path, tag: str = 'latest', registry: str = 'localhost',
+          runtime: Optional[ContainerRuntime] = None, push: bool = False, verbose: bool = False,
+          context: Path = Path('./context'), image_name: str = IMAGE_NAME,
+          telemetry: Optional[Telemetry] = None, cache: Optional[BuildCache] = None,
+          run_tests: bool = True, line_sink: Callable[[str], None] = _print_line,
+          lock_file: Optional[Path] = None, sbom: Optional[Path] = None,
+          sbom_format: str = 'spdx') -> Dict[str, Any]:
+    """Build (and optionally test and push) an Execution Environment image.
+
+    With ``cache``, a build whose inputs digest maps to an image that still
+    exists locally skips the ansible-builder phase. With ``lock_file``,
+    collections are installed from the versions pinned there. With
+    ``sbom``, an SPDX/CycloneDX document is written there. Phases are
+    recorded in ``telemetry`` (and flushed) even when the build fails.
+    Raises BuildError.
+    """
+    ee_file = Path(ee_file)
+    context = Path(context)
+    runtime = runtime or connect_runtime()
+    telemetry = telemetry or Telemetry(None)
+    image = image_reference(registry, tag, image_name)
+    result: Dict[str, Any] = {'image': image, 'cached': False, 'inputs_digest': None}
+
+    log_info("Starting Ansible Custom EE build process...")
+    log_info(f"EE File: {ee_file}")
+    log_info(f"Tag: {tag}")
+    log_info(f"Registry: {registry}")
+    log_info(f"Container Runtime: {runtime.command}")
+
+    start = time.time()
+    status = 'failed'
+    builder_file = ee_file
+    try:
+        with telemetry.span('check_dependencies'):
+            check_dependencies(runtime)
+        with telemetry.span('check_ee_file'):
+            check_ee_file(ee_file)
+            if cache is not None:
+                result['inputs_digest'] = build_inputs_digest(
+                    ee_file, runtime.command, extra_files=[lock_file] if lock_file else ())
+        with telemetry.span('authenticate_redhat'):
+            authenticate_redhat(runtime)
+        with telemetry.span('build_ee'):
+            cached = cache.get(result['inputs_digest']) if cache is not None else None
+            if cached == image and runtime.inspect_image(image) is not None:
+                log_info(f"Inputs unchanged since last build, reusing {image}")
+                result['cached'] = True
+            else:
+                if lock_file is not None:
+                    with telemetry.span('apply_lock', event='substage', phase='build_ee'):
+                        builder_file = apply_lock(ee_file, lock_file)
+                build_ee(builder_file, image, runtime, context, verbose, telemetry, line_sink)
+                if cache is not None:
+                    cache.put(result['inputs_digest'], image)
+        if sbom is not None:
+            with telemetry.span('sbom'):
+                write_build_sbom(image, ee_file, runtime, sbom, sbom_format, lock_file)
+                result['sbom'] = str(sbom)
+        if run_tests:
+            with telemetry.span('test_ee'):
+                test_ee(image, runtime)
+        with telemetry.span('push_to_registry'):
+            if push:
+                push_to_registry(image, runtime)
+            else:
+                log_info("Skipping push (use -p/--push to enable)")
+        status = 'ok'
+    finally:
+        telemetry.record('build', 'build', start, time.time() - start, status)
+        telemetry.flush()
+        if context.is_dir():
+            log_info("Cleaning up build context...")
+            shutil.rmtree(context, ignore_errors=True)
+        if builder_file != ee_file:
+            remove_locked(builder_file)
+
+    log_success("Build process completed successfully!")
+    if not push:
+        log_info("To run the built EE:")
+        log_info(f"  {runtime.command} run -it --rm {image}")
+    result['duration_seconds'] = round(time.time() - start, 3)
+    return result
+
+
+def build_many(builds: Sequence[Dict[str, Any]], jobs: int = 2) -> List[Dict[str, Any]]:
+    """Run several ``build()`` calls concurrently, each with its own build context.
+
+    Each entry holds keyword arguments for ``build()``. Builder output is
+    prefixed with the image tag so interleaved logs stay readable. Returns
+    one result per entry; failures carry an ``error`` instead of raising.
+    """
+    def run(index: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = dict(kwargs)
+        tag = kwargs.get('tag', 'latest')
+        kwargs.setdefault('context', Path(f"./context-{index}"))
+        kwargs.setdefault('line_sink', lambda line: _print_line(f"[{tag}] {line}"))
+        try:
+            return build(**kwargs)
+        except EEBuilderError as e:
+            return {'image': image_reference(kwargs.get('registry', 'localhost'), tag,
+                                             kwargs.get('image_name', IMAGE_NAME)), 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(run, range(len(builds)), builds))
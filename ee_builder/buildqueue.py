@@ -0,0 +1,362 @@
+"""
+Build queue service for shared build hosts
+
+Engineers and CI jobs on one host often trigger the same build within
+minutes of each other. ``queue serve`` runs a BuildQueue behind a Unix
+socket; ``queue build`` (and build-local.sh when EE_BUILD_SOCKET is set)
+submits a request to it instead of building in-process.
+
+- Requests are identified by a content hash of the build inputs (the EE
+  file, the files its build steps copy, the lock file) plus the build
+  options. An identical request that arrives while one is queued or
+  running is attached to it instead of starting another build.
+- At most ``jobs`` builds run at once, and builds of the same image tag
+  run one after another.
+- Every waiter receives the builder output from the start (late joiners
+  get it replayed) and the same result.
+- Builds run as the queue's user for anyone who can reach the socket, so
+  requests may only name podman or docker as the runtime, and their EE
+  and lock files must lie inside the queue's project roots.
+
+The protocol is JSON lines: the client sends one request object and reads
+``accepted``, ``line`` and ``result`` (or ``error``) events.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ee_builder.build import IMAGE_NAME, BuildCache, build, build_inputs_digest, image_reference
+from ee_builder.errors import EEBuilderError
+from ee_builder.log import log_error, log_info
+from ee_builder.runtime import connect_runtime, default_runtime
+
+DEFAULT_JOBS = 2
+HISTORY = 50
+RUNTIMES = ('podman', 'docker')
+
+# queued: 実行待ち / running: ビルド中 / ok・failed: 完了
+QUEUED, RUNNING, OK, FAILED = 'queued', 'running', 'ok', 'failed'
+
+
+class BuildQueueError(EEBuilderError):
+    """Raised for invalid requests or when the queue cannot be reached."""
+
+
+def default_socket_path() -> Path:
+    configured = os.environ.get('EE_BUILD_SOCKET')
+    if configured:
+        return Path(configured)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return Path(runtime_dir) / 'ee-builder' / 'build.sock'
+    return Path(f'/tmp/ee-builder-{os.getuid()}') / 'build.sock'
+
+
+def _inside(path: Path, roots: Sequence[Path]) -> bool:
+    return any(path == root or root in path.parents for root in roots)
+
+
+def normalize_request(request: Dict[str, Any], roots: Sequence[Path]) -> Dict[str, Any]:
+    """Validate a build request and fill in the defaults.
+
+    The runtime must be one of RUNTIMES, and the EE and lock files must
+    resolve (after following symlinks) inside one of ``roots``.
+    """
+    if not request.get('ee_file'):
+        raise BuildQueueError("ee_file is required")
+    normalized = {
+        'ee_file': str(Path(request['ee_file']).resolve()),
+        'tag': str(request.get('tag') or 'latest'),
+        'registry': str(request.get('registry') or 'localhost'),
+        'image_name': str(request.get('image_name') or IMAGE_NAME),
+        'runtime': str(request.get('runtime') or default_runtime()),
+        'push': bool(request.get('push')),
+        'run_tests': bool(request.get('run_tests', True)),
+        'verbose': bool(request.get('verbose')),
+        'lock_file': str(Path(request['lock_file']).resolve()) if request.get('lock_file') else None,
+    }
+    if normalized['runtime'] not in RUNTIMES:
+        raise BuildQueueError(f"Unsupported runtime: {normalized['runtime']!r} "
+                              f"(the build queue runs {' or '.join(RUNTIMES)})")
+    roots = [Path(root).resolve() for root in roots]
+    for name in ('ee_file', 'lock_file'):
+        if normalized[name] and not _inside(Path(normalized[name]), roots):
+            raise BuildQueueError(f"{name} is outside the build queue's project roots: {normalized[name]} "
+                                  f"(allowed: {', '.join(str(root) for root in roots)})")
+    if not Path(normalized['ee_file']).is_file():
+        raise BuildQueueError(f"Execution Environment file not found: {normalized['ee_file']}")
+    if normalized['lock_file'] and not Path(normalized['lock_file']).is_file():
+        raise BuildQueueError(f"Lock file not found: {normalized['lock_file']}")
+    return normalized
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Return the coalescing key: the build inputs digest plus every option that changes the outcome."""
+    lock_file = request['lock_file']
+    try:
+        inputs = build_inputs_digest(Path(request['ee_file']), request['runtime'],
+                                     extra_files=[Path(lock_file)] if lock_file else ())
+    except (EEBuilderError, OSError) as e:
+        raise BuildQueueError(f"Cannot read build inputs: {e}") from e
+    options = {name: value for name, value in request.items() if name not in ('ee_file', 'lock_file')}
+    return 'sha256:' + hashlib.sha256(json.dumps([inputs, options], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BuildQueue:
+    """Run build requests with coalescing, a concurrency limit and one build per image at a time.
+
+    Requests may only build EE files below ``roots`` (default: the current
+    directory).
+    """
+
+    def __init__(self, jobs: int = DEFAULT_JOBS, cache: Optional[BuildCache] = None,
+                 workdir: Path = Path('.'), build_func: Callable[..., Dict[str, Any]] = build,
+                 roots: Sequence[Path] = ()):
+        self.jobs = max(1, jobs)
+        self.cache = cache
+        self.workdir = Path(workdir)
+        self.roots = [Path(root).resolve() for root in roots] or [Path.cwd()]
+        self.build_func = build_func
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        # イメージごとに、実行中ジョブの後ろで待っているジョブ（キーがあればそのイメージは実行中）
+        self._image_queues: Dict[str, List[Dict[str, Any]]] = {}
+        self._drained = threading.Condition(self._lock)
+        self._history: List[Dict[str, Any]] = []
+        self._next_id = 1
+
+    def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a request, or attach to the identical one in flight; returns the job."""
+        request = normalize_request(request, self.roots)
+        key = request_key(request)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                job['waiters'] += 1
+                return job
+            job = {
+                'id': self._next_id, 'key': key, 'request': request,
+                'image': image_reference(request['registry'], request['tag'], request['image_name']),
+                'state': QUEUED, 'waiters': 1, 'lines': [], 'result': None,
+                'submitted': time.time(), 'started': None, 'finished': None,
+                'changed': threading.Condition(self._lock),
+            }
+            self._next_id += 1
+            self._inflight[key] = job
+            self._history = (self._history + [job])[-HISTORY:]
+            # 同じタグへのビルドは順番に（別内容のビルドがタグを奪い合わないように）。
+            # 待つジョブはプールに入れないので、並列数の枠を塞がない
+            waiting = self._image_queues.get(job['image'])
+            if waiting is not None:
+                waiting.append(job)
+                return job
+            self._image_queues[job['image']] = []
+        self._pool.submit(self._run, job)
+        return job
+
+    def _append(self, job: Dict[str, Any], line: str) -> None:
+        with self._lock:
+            job['lines'].append(line)
+            job['changed'].notify_all()
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        request = job['request']
+        with self._lock:
+            job.update(state=RUNNING, started=time.time())
+        log_info(f"Build #{job['id']} started: {job['image']} ({job['waiters']} waiter(s))")
+        try:
+            result = self.build_func(
+                Path(request['ee_file']), tag=request['tag'], registry=request['registry'],
+                runtime=connect_runtime(request['runtime']), push=request['push'],
+                verbose=request['verbose'], context=self.workdir / f"context-{job['id']}",
+                image_name=request['image_name'], cache=self.cache, run_tests=request['run_tests'],
+                line_sink=lambda line: self._append(job, line),
+                lock_file=Path(request['lock_file']) if request['lock_file'] else None,
+            )
+            result = dict(result, status=OK, error=None)
+        except Exception as e:
+            # 常駐プロセスなので想定外の例外でもこのジョブの失敗として扱い、待機者に返す
+            if not isinstance(e, EEBuilderError):
+                log_error(f"Build #{job['id']} crashed: {e!r}")
+            result = {'image': job['image'], 'status': FAILED, 'error': str(e) or repr(e)}
+        with self._lock:
+            # 完了後の同一リクエストは新しいビルドになる（再利用はビルドキャッシュの役割）
+            self._inflight.pop(job['key'], None)
+            job.update(state=result['status'], result=dict(result, id=job['id'], waiters=job['waiters']),
+                       finished=time.time())
+            job['changed'].notify_all()
+            waiting = self._image_queues[job['image']]
+            successor = waiting.pop(0) if waiting else None
+            if successor is None:
+                del self._image_queues[job['image']]
+                self._drained.notify_all()
+        log_info(f"Build #{job['id']} {result['status']}: {job['image']}")
+        if successor is not None:
+            self._pool.submit(self._run, successor)
+
+    def position(self, job: Dict[str, Any]) -> int:
+        """Return how many queued jobs were submitted before ``job`` (0 once it runs)."""
+        with self._lock:
+            if job['state'] != QUEUED:
+                return 0
+            return sum(1 for other in self._history if other['state'] == QUEUED and other['id'] < job['id'])
+
+    def follow(self, job: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """Yield the job's output lines from the start, then its result."""
+        sent = 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                while sent == len(job['lines']) and job['result'] is None:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise BuildQueueError(f"Timed out waiting for build #{job['id']}")
+                    job['changed'].wait(remaining)
+                lines = job['lines'][sent:]
+                result = job['result']
+            sent += len(lines)
+            yield from ({'event': 'line', 'line': line} for line in lines)
+            if result is not None:
+                yield dict(result, event='result')
+                return
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Return a summary of the recent jobs, oldest first."""
+        with self._lock:
+            return [{'id': job['id'], 'image': job['image'], 'state': job['state'], 'waiters': job['waiters'],
+                     'ee_file': job['request']['ee_file'], 'submitted': job['submitted'],
+                     'started': job['started'], 'finished': job['finished']} for job in self._history]
+
+    def shutdown(self) -> None:
+        """Wait for the running and queued builds, then stop the workers."""
+        with self._lock:
+            while self._image_queues:
+                self._drained.wait()
+        self._pool.shutdown(wait=True)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, message: Dict[str, Any]) -> None:
+        self.wfile.write((json.dumps(message, default=str) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        queue: BuildQueue = self.server.queue  # type: ignore[attr-defined]
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8') or '{}')
+            if request.get('op') == 'status':
+                self.send({'event': 'status', 'jobs': queue.status()})
+                return
+            if request.get('op') != 'build':
+                raise BuildQueueError(f"Unknown op: {request.get('op')!r}")
+            job = queue.submit(request)
+            self.send({'event': 'accepted', 'id': job['id'], 'image': job['image'],
+                       'coalesced': job['waiters'] > 1, 'position': queue.position(job)})
+            for message in queue.follow(job):
+                self.send(message)
+        except (ValueError, EEBuilderError) as e:
+            self.send({'event': 'error', 'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが切断してもビルドは他の待機者のために続行する
+            pass
+
+
+class BuildQueueServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket front end of a BuildQueue (one thread per client)."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, queue: BuildQueue):
+        self.socket_path = Path(socket_path)
+        self.queue = queue
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if _connectable(self.socket_path):
+                raise BuildQueueError(f"A build queue is already listening on {self.socket_path}")
+            self.socket_path.unlink()
+        super().__init__(str(self.socket_path), _Handler)
+        # 同じグループの利用者が共有できるようにする
+        os.chmod(self.socket_path, 0o660)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+def _connectable(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+            return True
+        except OSError:
+            return False
+
+
+def _exchange(socket_path: Path, request: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+    """Send one request and yield the server's messages; ``timeout`` bounds the whole exchange."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = f"Timed out after {timeout:g}s waiting for the build queue" if timeout is not None else ''
+
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise BuildQueueError(timed_out)
+        return left
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(socket_path))
+    except OSError as e:
+        sock.close()
+        raise BuildQueueError(f"No build queue at {socket_path} ({e}); "
+                              f"start one with: python -m ee_builder queue serve") from e
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps(request) + '\n').encode('utf-8'))
+        stream.flush()
+        while True:
+            # 受信ごとのタイムアウトではなく、残り時間で待つ（出力が続いても期限で打ち切る）
+            sock.settimeout(remaining())
+            try:
+                raw = stream.readline()
+            except socket.timeout as e:
+                raise BuildQueueError(timed_out) from e
+            if not raw:
+                return
+            message = json.loads(raw.decode('utf-8'))
+            if message.get('event') == 'error':
+                raise BuildQueueError(message['error'])
+            yield message
+
+
+def submit_build(request: Dict[str, Any], socket_path: Optional[Path] = None,
+                 on_message: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Submit a build request and wait for its result; ``on_message`` sees every event."""
+    result = None
+    for message in _exchange(socket_path or default_socket_path(), dict(request, op='build'), timeout):
+        if on_message is not None:
+            on_message(message)
+        if message.get('event') == 'result':
+            result = message
+    if result is None:
+        raise BuildQueueError("The build queue closed the connection before the build finished")
+    return result
+
+
+def queue_status(socket_path: Optional[Path] = None, timeout: Optional[float] = 10) -> List[Dict[str, Any]]:
+    """Return the queue's recent jobs."""
+    for message in _exchange(socket_path or default_socket_path(), {'op': 'status'}, timeout):
+        return message.get('jobs') or []
+    return []
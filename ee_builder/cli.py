@@ -0,0 +1,1554 @@
+"""
+Command line interface for the ee_builder tooling
+
+Usage: python -m ee_builder <command> [OPTIONS]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from ee_builder.errors import EEBuilderError
+
+
+def print_data(data: Any, output_format: str) -> None:
+    """Print structured data as json or yaml."""
+    if output_format == 'json':
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+    else:
+        print(yaml.dump(data, default_flow_style=False, allow_unicode=True, sort_keys=False), end='')
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[str]) -> None:
+    """Print result rows as an aligned table."""
+    widths = [max([len(col)] + [len(str(row.get(col, ''))) for row in rows]) for col in columns]
+    print('  '.join(col.upper().ljust(width) for col, width in zip(columns, widths)))
+    print('  '.join('-' * width for width in widths))
+    for row in rows:
+        print('  '.join(str(row.get(col, '')).ljust(width) for col, width in zip(columns, widths)))
+
+
+# === query ===
+def add_query_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'query',
+        help='Query ansible-navigator playbook artifacts',
+        description='Stream-parse playbook artifacts and aggregate task results',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --status failed --group-by host              # Hosts with failed tasks
+  %(prog)s --task 'Install*' --status failed --last 500  # Failures of a task in the last 500 runs
+  %(prog)s artifacts/site-2024*.json -f json             # Specific files, JSON output
+        """
+    )
+    parser.add_argument(
+        'paths',
+        nargs='*',
+        type=Path,
+        default=[Path('./artifacts')],
+        help='Artifact files or directories (default: ./artifacts)'
+    )
+    parser.add_argument('--host', help='Host name pattern (shell-style wildcards)')
+    parser.add_argument('--task', help='Task name pattern (shell-style wildcards)')
+    parser.add_argument(
+        '--status',
+        help='Comma separated statuses (ok,changed,failed,skipped,unreachable)'
+    )
+    parser.add_argument(
+        '--group-by',
+        default='host,task,status',
+        help='Comma separated fields to aggregate by (default: host,task,status)'
+    )
+    parser.add_argument('--last', type=int, help='Only scan the N most recent artifacts')
+    parser.add_argument('-j', '--jobs', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_query)
+
+
+def cmd_query(args: argparse.Namespace) -> int:
+    from ee_builder.artifacts import query_artifacts
+
+    group_by = [field.strip() for field in args.group_by.split(',') if field.strip()]
+    result = query_artifacts(
+        args.paths, host=args.host, task=args.task, status=args.status,
+        group_by=group_by, last=args.last, workers=args.jobs
+    )
+
+    for error in result['errors']:
+        print(f"Warning: {error}", file=sys.stderr)
+
+    if args.format == 'table':
+        print_table(result['rows'], group_by + ['count', 'runs'])
+        print(f"\n{len(result['rows'])} group(s), {result['tasks_scanned']} task results "
+              f"in {result['files']} artifact(s)")
+    else:
+        print_data(result, args.format)
+    return 0
+
+
+# === prewarm ===
+def add_prewarm_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'prewarm',
+        help='Pull stale or missing EE images ahead of time',
+        description='Compare local image digests with the registry and pull only cold images',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                         # Images from ansible-navigator.yml / execution-environment.yml
+  %(prog)s --check-only -f json                    # Report warm/cold status without pulling
+  %(prog)s nodes/*/ansible-navigator.yml --max-pulls 1
+  %(prog)s -i localhost:5000/ansible-custom-ee:dev --insecure-registry localhost:5000
+        """
+    )
+    parser.add_argument(
+        'sources',
+        nargs='*',
+        type=Path,
+        help='Navigator configs or EE files to read images from '
+             '(default: ansible-navigator.yml and execution-environment.yml if present)'
+    )
+    parser.add_argument('-i', '--image', action='append', default=[], help='Additional image (repeatable)')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='Parallel registry checks (default: 8)')
+    parser.add_argument('--max-pulls', type=int, default=2, help='Parallel pulls (default: 2)')
+    parser.add_argument('--pull-timeout', type=float, help='Timeout per pull in seconds')
+    parser.add_argument('--check-only', action='store_true', help='Report status without pulling')
+    parser.add_argument(
+        '--insecure-registry',
+        action='append',
+        default=[],
+        help='Registry reached over plain HTTP, e.g. localhost:5000 (repeatable)'
+    )
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_prewarm)
+
+
+def cmd_prewarm(args: argparse.Namespace) -> int:
+    from ee_builder.prewarm import DEFAULT_SOURCES, collect_images, prewarm
+    from ee_builder.registry import RegistryClient
+    from ee_builder.runtime import connect_runtime
+
+    sources = args.sources or [Path(p) for p in DEFAULT_SOURCES if Path(p).exists()]
+    images = collect_images(sources, args.image)
+    if not images:
+        raise EEBuilderError("No images found (pass config files or --image)")
+
+    rows = prewarm(
+        images,
+        runtime=connect_runtime(args.runtime),
+        registry=RegistryClient(insecure=args.insecure_registry),
+        jobs=args.jobs, max_pulls=args.max_pulls,
+        check_only=args.check_only, pull_timeout=args.pull_timeout
+    )
+
+    if args.format == 'table':
+        print_table(rows, ['image', 'state', 'action', 'local_digest', 'error'])
+        warm = sum(1 for row in rows if row['state'] == 'warm' or row['action'] == 'pulled')
+        print(f"\n{warm}/{len(rows)} image(s) warm")
+    else:
+        print_data(rows, args.format)
+    return 1 if any(row['action'] == 'failed' for row in rows) else 0
+
+
+# === images ===
+def _human_size(size: float) -> str:
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1000:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1000
+    return f"{size:.1f}TB"
+
+
+def add_images_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'images',
+        help='List or remove local EE images',
+        description='List local images through the engine API socket (CLI fallback)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --filter '*ansible-custom-ee*'           # Local EE images
+  %(prog)s --filter '*ansible-custom-ee*' --remove  # Remove them
+        """
+    )
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument('--filter', help='Image name pattern (shell-style wildcards)')
+    parser.add_argument('--remove', action='store_true', help='Remove the matching images')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_images)
+
+
+def cmd_images(args: argparse.Namespace) -> int:
+    import fnmatch
+    import time
+
+    from ee_builder.runtime import connect_runtime
+
+    runtime = connect_runtime(args.runtime)
+    rows = []
+    for image in runtime.list_images():
+        for tag in image['tags'] or ['<none>']:
+            if args.filter and not fnmatch.fnmatchcase(tag, args.filter):
+                continue
+            rows.append({
+                'image': tag, 'id': image['id'].replace('sha256:', '')[:12], 'size': image['size'],
+                'created': time.strftime('%Y-%m-%d %H:%M', time.localtime(image['created'])),
+            })
+
+    if args.remove:
+        for row in rows:
+            runtime.remove_image(row['image'], force=True)
+            row['removed'] = True
+
+    if args.format == 'table':
+        if not rows:
+            print("No local images found")
+            return 0
+        print_table([dict(row, size=_human_size(row['size'])) for row in rows],
+                    ['image', 'id', 'size', 'created'] + (['removed'] if args.remove else []))
+    else:
+        print_data(rows, args.format)
+    return 0
+
+
+# === export / import ===
+def add_export_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'export',
+        help='Export an image as an OCI bundle for air-gapped promotion',
+        description='Save an image as a compressed OCI bundle; with --base only the blobs '
+                    'missing from earlier bundles are included',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s localhost/ansible-custom-ee:v1 -o ee-v1.tar.gz                       # Full bundle
+  %(prog)s localhost/ansible-custom-ee:v2 -o ee-v2.tar.gz --base ee-v1.tar.gz  # Delta against v1
+        """
+    )
+    parser.add_argument('image', help='Local image to export')
+    parser.add_argument('-o', '--output', type=Path, required=True, help='Bundle file to write')
+    parser.add_argument('--base', type=Path, action='append', default=[],
+                        help='Earlier bundle whose blobs the target already has (repeatable)')
+    parser.add_argument('--level', type=int, default=6, help='gzip level, 0 for none (default: 6)')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument('--timeout', type=float, help='Timeout for saving the image in seconds')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_export)
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    from ee_builder.ocibundle import export_image
+    from ee_builder.runtime import connect_runtime
+
+    result = export_image(args.image, args.output, runtime=connect_runtime(args.runtime),
+                          bases=args.base, level=args.level, timeout=args.timeout)
+    if args.format == 'table':
+        print_table([dict(result, image_bytes=_human_size(result['image_bytes']),
+                          included_bytes=_human_size(result['included_bytes']),
+                          bundle_bytes=_human_size(result['bundle_bytes']))],
+                    ['image', 'blobs', 'included', 'image_bytes', 'included_bytes', 'bundle_bytes'])
+        print(f"\nWrote {result['bundle']} (sha256 {result['sha256']})")
+    else:
+        print_data(result, args.format)
+    return 0
+
+
+def add_import_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'import',
+        help='Verify and load OCI bundles made by export',
+        description='Verify bundle checksums and blob digests, keep the blobs in the local '
+                    'OCI store and load the images into the container runtime',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s ee-v1.tar.gz ee-v2.tar.gz   # A full bundle, then a delta (in export order)
+  %(prog)s ee-v3.tar.gz --no-load      # Only verify and store the blobs
+        """
+    )
+    parser.add_argument('bundles', nargs='+', type=Path, help='Bundle files, bases first')
+    parser.add_argument('--store', type=Path,
+                        help='Blob store (default: $EE_OCI_STORE_DIR or ~/.cache/ee-builder/oci)')
+    parser.add_argument('--no-load', action='store_true', help='Do not load the images into the runtime')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument('--timeout', type=float, help='Timeout for loading each image in seconds')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_import)
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    from ee_builder.ocibundle import import_bundle
+    from ee_builder.runtime import connect_runtime
+
+    runtime = None if args.no_load else connect_runtime(args.runtime)
+    rows = [import_bundle(bundle, runtime=runtime, store=args.store, load=not args.no_load,
+                          timeout=args.timeout) for bundle in args.bundles]
+    if args.format == 'table':
+        print_table(rows, ['image', 'blobs', 'stored', 'verified', 'loaded', 'seconds'])
+    else:
+        print_data(rows, args.format)
+    return 0
+
+
+# === secrets ===
+def add_secrets_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'secrets',
+        help='Scan the project for exposed secrets',
+        description='Find NAME= assignments of sensitive names (.gitignore aware, binary files skipped)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                   # Scan the current checkout
+  %(prog)s --pattern api_key --pattern pat   # Custom patterns
+  %(prog)s --no-gitignore -f json            # Include ignored files, JSON output
+        """
+    )
+    parser.add_argument('root', nargs='?', type=Path, default=Path('.'), help='Directory to scan (default: .)')
+    parser.add_argument('--pattern', action='append', help='Sensitive name (repeatable, default: built-in list)')
+    parser.add_argument('--no-gitignore', action='store_true', help='Also scan files ignored by .gitignore')
+    parser.add_argument('-j', '--jobs', type=int, help='Parallel worker processes (default: CPU count)')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_secrets)
+
+
+def cmd_secrets(args: argparse.Namespace) -> int:
+    from ee_builder.secretscan import SENSITIVE_PATTERNS, scan_tree
+
+    hits = scan_tree(args.root, patterns=args.pattern or SENSITIVE_PATTERNS,
+                     use_gitignore=not args.no_gitignore, workers=args.jobs)
+    if args.format == 'table':
+        if hits:
+            print_table(hits, ['path', 'line', 'column', 'pattern', 'text'])
+        print(f"\n{len(hits)} potential secret(s) found")
+    else:
+        print_data(hits, args.format)
+    return 1 if hits else 0
+
+
+# === validate ===
+def add_validate_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'validate',
+        help='Validate EE definitions offline',
+        description='Check EE version 3 files against the schema and parse their python/system/galaxy requirements',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                   # Validate ./execution-environment.yml
+  %(prog)s examples/ ee-*.yml                # Files and directories (execution-environment*.yml)
+  %(prog)s --strict -f json                  # Treat warnings as errors, JSON output
+        """
+    )
+    parser.add_argument('paths', nargs='*', type=Path, default=[Path('execution-environment.yml')],
+                        help='EE files or directories (default: execution-environment.yml)')
+    parser.add_argument('--strict', action='store_true', help='Exit non-zero on warnings too')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_validate)
+
+
+def cmd_validate(args: argparse.Namespace) -> int:
+    from ee_builder.eefile import find_ee_files
+    from ee_builder.eeschema import has_errors, validate_files
+
+    files = find_ee_files(args.paths)
+    if not files:
+        raise EEBuilderError(f"No EE files found in: {' '.join(str(p) for p in args.paths)}")
+
+    issues = validate_files(files)
+    if args.format == 'table':
+        if issues:
+            print_table(issues, ['path', 'line', 'column', 'severity', 'field', 'message'])
+            print()
+        errors = sum(1 for issue in issues if issue['severity'] == 'error')
+        print(f"{len(files)} file(s) checked: {errors} error(s), {len(issues) - errors} warning(s)")
+    else:
+        print_data(issues, args.format)
+    if has_errors(issues) or (args.strict and issues):
+        return 1
+    return 0
+
+
+# === lock ===
+def add_lock_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'lock',
+        help='Pin EE dependencies into ee.lock',
+        description='Resolve dependencies offline against local snapshots and write pinned versions with hashes',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --index galaxy-index.yml                 # Lock dependencies.galaxy of ./execution-environment.yml
+  %(prog)s --index ~/collections/ -f examples/execution-environment.yml
+  %(prog)s --wheelhouse wheels/                     # Lock dependencies.python with --hash pins
+  %(prog)s --wheelhouse pypi-index.yml --python-version 3.11
+  %(prog)s --check                                  # Fail when ee.lock no longer matches the EE file
+
+Environment Variables:
+  EE_COLLECTION_INDEX                         Same as --index
+  EE_PYTHON_INDEX                             Same as --wheelhouse
+        """
+    )
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('-o', '--output', type=Path, help='Lock file (default: ee.lock next to the EE file)')
+    parser.add_argument('--index', type=Path, default=os.environ.get('EE_COLLECTION_INDEX') or None,
+                        help='Collection index snapshot (YAML/JSON) or directory of collection tarballs')
+    parser.add_argument('--wheelhouse', type=Path, default=os.environ.get('EE_PYTHON_INDEX') or None,
+                        help='Directory of wheels/sdists or Python package index snapshot (YAML/JSON)')
+    parser.add_argument('--python-version',
+                        help='Python version of the image for markers (default: from python_interpreter, else 3.9)')
+    parser.add_argument('--check', action='store_true', help='Only check that the lock is up to date')
+    parser.set_defaults(func=cmd_lock)
+
+
+def cmd_lock(args: argparse.Namespace) -> int:
+    from ee_builder.build import lock_sections
+    from ee_builder.collectiondeps import collection_python_lines, locked_tarballs, read_collection_requirements
+    from ee_builder.eefile import load_ee_file
+    from ee_builder.galaxylock import load_index, lock_galaxy
+    from ee_builder.lockfile import LockError, default_lock_path, load_lock, write_lock
+    from ee_builder.log import log_warn
+    from ee_builder.pylock import load_python_index, lock_python
+
+    lock_path = args.output or default_lock_path(args.file)
+    ee_config = load_ee_file(args.file)
+    base_dir = args.file.parent
+
+    if args.check:
+        try:
+            sections = lock_sections(args.file, lock_path)
+        except LockError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ {lock_path} is up to date ({', '.join(sections) or 'no sections'})")
+        return 0
+
+    if args.index is None and args.wheelhouse is None:
+        raise EEBuilderError("Nothing to lock: pass --index and/or --wheelhouse "
+                             "(or set EE_COLLECTION_INDEX / EE_PYTHON_INDEX)")
+    lock = load_lock(lock_path) if lock_path.is_file() else {}
+    lock['ee_file'] = os.path.relpath(args.file, lock_path.parent)
+    rows = []
+    timings = []
+    if args.index is not None:
+        start = time.perf_counter()
+        lock['galaxy'] = lock_galaxy(ee_config, base_dir, load_index(args.index), lock_path.parent)
+        timings.append(f"{len(lock['galaxy']['collections'])} collection(s) in {time.perf_counter() - start:.2f}s")
+        rows += [{'kind': 'collection', 'name': c['name'], 'version': c['version'],
+                  'sha256': (c.get('sha256') or '')[:12]} for c in lock['galaxy']['collections']]
+    if args.wheelhouse is not None:
+        extra = []
+        if lock.get('galaxy'):
+            tarballs, missing = locked_tarballs(lock['galaxy'], lock_path.parent)
+            if missing:
+                log_warn(f"Python requirements of {', '.join(missing)} not locked "
+                         f"(tarballs not in the local cache)")
+            extra = collection_python_lines(ee_config, [read_collection_requirements(t) for t in tarballs])
+        start = time.perf_counter()
+        lock['python'] = lock_python(ee_config, base_dir, load_python_index(args.wheelhouse),
+                                     args.python_version, extra)
+        timings.append(f"{len(lock['python']['packages'])} Python package(s) in {time.perf_counter() - start:.2f}s")
+        rows += [{'kind': 'python', 'name': p['name'], 'version': p['version'],
+                  'sha256': p['hashes'][0].split(':', 1)[1][:12]} for p in lock['python']['packages']]
+    write_lock(lock_path, lock)
+
+    print_table(rows, ['kind', 'name', 'version', 'sha256'])
+    print(f"\nLocked {' and '.join(timings)} -> {lock_path}")
+    return 0
+
+
+# === galaxy ===
+def add_galaxy_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'galaxy',
+        help='Prefetch collection metadata from Galaxy / Automation Hub',
+        description='Fetch version metadata for dependencies.galaxy from the servers in ansible.cfg, '
+                    'check that every server is reachable with its token and show what the ranges resolve to',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # ./execution-environment.yml against ./ansible.cfg servers
+  %(prog)s -o galaxy-index.yml                      # Also write an index snapshot for: lock --index galaxy-index.yml
+  %(prog)s -f custom-ee.yml --config ~/.ansible.cfg --format json
+  %(prog)s --no-cache --connections 8
+
+Environment Variables:
+  ANSIBLE_GALAXY_SERVER_<NAME>_TOKEN          Token of a server in server_list (also _URL, _AUTH_URL)
+  EE_GALAXY_CACHE_DIR                         Response cache (default: ~/.cache/ee-builder/galaxy)
+        """
+    )
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('--config', type=Path,
+                        help='ansible.cfg with the galaxy server list (default: found like ansible does)')
+    parser.add_argument('-o', '--output', type=Path, help='Write the fetched versions as a collection index snapshot')
+    parser.add_argument('--connections', type=int, default=4, help='Keep-alive connections per host (default: 4)')
+    parser.add_argument('--max-versions', type=int, default=10,
+                        help='Newest versions fetched per collection range (default: 10)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use or update the ETag response cache')
+    parser.add_argument(
+        '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_galaxy)
+
+
+def cmd_galaxy(args: argparse.Namespace) -> int:
+    from ee_builder.credentials import CredentialBroker
+    from ee_builder.eefile import load_ee_file
+    from ee_builder.galaxyapi import find_ansible_cfg, galaxy_cache_dir, galaxy_servers, prefetch, write_index
+
+    config = args.config or find_ansible_cfg(args.file.parent)
+    if args.config is not None and not args.config.is_file():
+        raise EEBuilderError(f"ansible.cfg not found: {args.config}")
+    servers = galaxy_servers(config)
+    start = time.perf_counter()
+    result = prefetch(load_ee_file(args.file), args.file.parent, servers,
+                      cache_dir=None if args.no_cache else galaxy_cache_dir(),
+                      connections=args.connections, max_versions=args.max_versions, broker=CredentialBroker())
+    elapsed = time.perf_counter() - start
+    if args.output:
+        write_index(result['index'], args.output)
+    failed = result['error'] or any(row['error'] for row in result['collections'])
+
+    if args.format != 'table':
+        print_data({name: result[name] for name in ('servers', 'collections', 'resolved', 'error', 'stats')},
+                   args.format)
+        return 1 if failed else 0
+
+    print_table(result['servers'], ['server', 'url', 'auth', 'status', 'error'])
+    print()
+    print_table(result['collections'], ['name', 'requested', 'server', 'versions', 'latest', 'resolved', 'error'])
+    stats = result['stats']
+    print(f"\n{stats['requests']} request(s) over {stats['connections']} connection(s), "
+          f"{stats['revalidated']} unchanged (ETag) in {elapsed:.2f}s")
+    if result['error']:
+        print(f"❌ {result['error']}")
+    if args.output:
+        print(f"Index snapshot -> {args.output}")
+    return 1 if failed else 0
+
+
+# === credentials ===
+def add_credentials_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'credentials',
+        help='Cached SSO tokens and registry logins',
+        description='Inspect or clear the credential cache shared by builds, and log in to the Red Hat '
+                    'registry only when no fresh login is recorded',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s login --runtime podman             # Used by scripts/check-base-images.sh
+  %(prog)s status
+  %(prog)s clear                              # After rotating a token or password
+
+Environment Variables:
+  EE_CREDENTIAL_CACHE         Cache file (default: $XDG_RUNTIME_DIR/ee-builder/credentials.json)
+  REDHAT_REGISTRY_USERNAME    Registry login for: login
+  REDHAT_REGISTRY_PASSWORD    Registry password for: login
+        """
+    )
+    actions = parser.add_subparsers(dest='action', metavar='<action>')
+
+    login = actions.add_parser('login', help='Log in to a registry unless a fresh login is cached')
+    login.add_argument('--registry', default='registry.redhat.io', help='Registry (default: registry.redhat.io)')
+    login.add_argument('--runtime', default='podman', help='Container runtime (podman/docker, default: podman)')
+    login.add_argument('--ttl', type=int, default=3600,
+                       help='Seconds a login is reused before logging in again (default: 3600)')
+    login.set_defaults(func=cmd_credentials_login)
+
+    status = actions.add_parser('status', help='List cached credentials (without secrets)')
+    status.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    status.set_defaults(func=cmd_credentials_status)
+
+    clear = actions.add_parser('clear', help='Forget every cached credential')
+    clear.set_defaults(func=cmd_credentials_clear)
+
+
+def cmd_credentials_login(args: argparse.Namespace) -> int:
+    from ee_builder.credentials import CredentialBroker
+    from ee_builder.runtime import ContainerRuntime
+
+    username = os.environ.get('REDHAT_REGISTRY_USERNAME')
+    password = os.environ.get('REDHAT_REGISTRY_PASSWORD')
+    if not (username and password):
+        raise EEBuilderError("Set REDHAT_REGISTRY_USERNAME and REDHAT_REGISTRY_PASSWORD to log in")
+    if CredentialBroker().registry_login(ContainerRuntime(args.runtime), args.registry, username, password,
+                                         ttl=args.ttl):
+        print(f"Logged in to {args.registry}")
+    else:
+        print(f"Login to {args.registry} still valid (cached)")
+    return 0
+
+
+def cmd_credentials_status(args: argparse.Namespace) -> int:
+    from ee_builder.credentials import CredentialBroker
+
+    rows = CredentialBroker().entries()
+    if args.format != 'table':
+        print_data(rows, args.format)
+    elif rows:
+        print_table(rows, ['kind', 'target', 'identity', 'expires_in'])
+    else:
+        print("No cached credentials")
+    return 0
+
+
+def cmd_credentials_clear(args: argparse.Namespace) -> int:
+    from ee_builder.credentials import CredentialBroker
+
+    print(f"Removed {CredentialBroker().clear()} cached credential(s)")
+    return 0
+
+
+# === deps ===
+def add_deps_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'deps',
+        help='Check collection-declared dependencies against the EE',
+        description='Merge the python/system requirements of the collections with the EE file and '
+                    'report unsatisfiable or redundant pins before building',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # Collections pinned in ./ee.lock (from the local cache)
+  %(prog)s --collections ~/collections/             # Newest tarball per collection in a download directory
+  %(prog)s --wheelhouse wheels/ --strict            # Also require a matching version in the wheelhouse
+        """
+    )
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('--lock', type=Path, help='Lock file (default: ee.lock next to the EE file)')
+    parser.add_argument('--collections', type=Path,
+                        help='Directory of collection tarballs (default: collections pinned in the lock)')
+    parser.add_argument('--wheelhouse', type=Path, default=os.environ.get('EE_PYTHON_INDEX') or None,
+                        help='Directory of wheels/sdists or Python package index snapshot (YAML/JSON)')
+    parser.add_argument('--python-version',
+                        help='Python version of the image for markers (default: from python_interpreter, else 3.9)')
+    parser.add_argument('--strict', action='store_true', help='Exit non-zero on warnings too')
+    parser.add_argument(
+        '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_deps)
+
+
+def cmd_deps(args: argparse.Namespace) -> int:
+    from ee_builder.build import lock_sections
+    from ee_builder.collectiondeps import analyze_tarballs, directory_tarballs, locked_tarballs
+    from ee_builder.eefile import load_ee_file
+    from ee_builder.eeschema import has_errors
+    from ee_builder.lockfile import default_lock_path
+    from ee_builder.pylock import load_python_index, locked_requirements
+
+    ee_config = load_ee_file(args.file)
+    sections: Dict[str, Any] = {}
+    lock_path = args.lock or default_lock_path(args.file)
+    if args.lock is not None or lock_path.is_file():
+        sections = lock_sections(args.file, lock_path)
+
+    if args.collections is not None:
+        tarballs = directory_tarballs(args.collections)
+    elif 'galaxy' in sections:
+        tarballs, missing = locked_tarballs(sections['galaxy'], lock_path.parent)
+        if missing:
+            raise EEBuilderError(f"Not in the local collection cache: {', '.join(missing)} "
+                                 f"(build once or pass --collections)")
+    else:
+        raise EEBuilderError("No collections to check: pass --collections or lock dependencies.galaxy first")
+
+    options: Dict[str, Any] = {'python_version': args.python_version}
+    if 'python' in sections:
+        options.update(python_lines=locked_requirements(sections['python']), hash_locked=True,
+                       python_version=args.python_version or sections['python'].get('python_version'))
+    if args.wheelhouse is not None:
+        options['index'] = load_python_index(args.wheelhouse)
+    start = time.perf_counter()
+    issues = analyze_tarballs(ee_config, args.file.parent, tarballs, **options)
+    elapsed = time.perf_counter() - start
+
+    if args.format == 'table':
+        if issues:
+            print_table(issues, ['severity', 'kind', 'name', 'message'])
+            print()
+        errors = sum(1 for issue in issues if issue['severity'] == 'error')
+        print(f"{len(tarballs)} collection(s) checked in {elapsed:.2f}s: "
+              f"{errors} error(s), {len(issues) - errors} warning(s)")
+    else:
+        print_data(issues, args.format)
+    if has_errors(issues) or (args.strict and issues):
+        return 1
+    return 0
+
+
+# === impact ===
+def add_impact_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'impact',
+        help='List the EE images to rebuild after a change',
+        description='Index the inputs of every EE file and print the images affected by a change set, '
+                    'parents before derived images',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Change items:
+  PATH                                      File changed (EE file, requirements, COPY source, ee.lock, ...)
+  image:REPO[:TAG]                          Base image moved (any tag when TAG is omitted)
+  collection:NAME, python:NAME, system:NAME Dependency changed
+
+Examples:
+  %(prog)s --since origin/main              # Files changed since origin/main (git)
+  %(prog)s -c ansible.cfg -c image:quay.io/ansible/creator-ee -f json
+  %(prog)s                                  # Show the whole graph in build order
+        """
+    )
+    parser.add_argument('paths', nargs='*', type=Path, default=[Path('.')],
+                        help='EE files or directories (default: current directory)')
+    parser.add_argument('-c', '--change', action='append', default=[], metavar='ITEM',
+                        help='Changed input (repeatable)')
+    parser.add_argument('--since', metavar='REF', help='Add files changed since REF (git diff + untracked files)')
+    parser.add_argument('--root', type=Path, default=Path('.'),
+                        help='Project root for relative paths (default: current directory)')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_impact)
+
+
+def cmd_impact(args: argparse.Namespace) -> int:
+    from ee_builder.impact import affected, changed_files, index_project, parents, parse_change, topological_order
+
+    nodes = index_project(args.paths, args.root)
+    items = list(args.change)
+    if args.since:
+        items += changed_files(args.root, args.since)
+
+    if not items and not args.since:
+        graph = parents(nodes)
+        by_file = {node['ee_file']: node for node in nodes}
+        rows = [{'order': i, 'ee_file': name, 'image': by_file[name]['image'],
+                 'base_image': by_file[name]['base_image'], 'parents': ', '.join(graph[name])}
+                for i, name in enumerate(topological_order(nodes), 1)]
+        if args.format == 'table':
+            print_table(rows, ['order', 'ee_file', 'image', 'base_image', 'parents'])
+        else:
+            print_data(rows, args.format)
+        return 0
+
+    result = affected(nodes, [parse_change(item, args.root) for item in items])
+    if args.format == 'table':
+        rows = [dict(entry, order=i, reasons='; '.join(entry['reasons'])) for i, entry in enumerate(result, 1)]
+        if rows:
+            print_table(rows, ['order', 'ee_file', 'image', 'reasons'])
+            print()
+        print(f"{len(result)} of {len(nodes)} image(s) to rebuild ({len(items)} change(s))")
+    else:
+        print_data(result, args.format)
+    return 0
+
+
+# === share ===
+def add_share_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'share',
+        help='Plan a shared dependency image for EE variants',
+        description='Group EE files by base image, move their common collections and packages into a '
+                    'shared intermediate EE and estimate the bytes saved per node pull',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # Plan for every EE file under the current directory
+  %(prog)s ee/ --min-share 0.8 -o shared-ee/        # Share items used by 80%% of the variants, write EE files
+  %(prog)s --index ~/collections/ --wheelhouse wheels/ -f json   # Sizes from local artifacts
+        """
+    )
+    parser.add_argument('paths', nargs='*', type=Path, default=[Path('.')],
+                        help='EE files or directories (default: current directory)')
+    parser.add_argument('-o', '--output', type=Path,
+                        help='Write the shared EE and derived variants to this directory')
+    parser.add_argument('--min-share', type=float, default=1.0,
+                        help='Share items required by at least this fraction of a group (default: 1.0)')
+    parser.add_argument('--registry', default='localhost',
+                        help='Registry of the shared image in derived base_image (default: localhost)')
+    parser.add_argument('--root', type=Path, default=Path('.'),
+                        help='Project root for relative paths (default: current directory)')
+    parser.add_argument('--index', type=Path, default=os.environ.get('EE_COLLECTION_INDEX') or None,
+                        help='Collection index snapshot or tarball directory (sizes)')
+    parser.add_argument('--wheelhouse', type=Path, default=os.environ.get('EE_PYTHON_INDEX') or None,
+                        help='Wheelhouse or Python package index snapshot (sizes)')
+    parser.add_argument('--sizes', type=Path,
+                        help='YAML/JSON {collection|python|system: {name: bytes}} overriding size estimates')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_share)
+
+
+def cmd_share(args: argparse.Namespace) -> int:
+    from ee_builder.sharedbase import plan_shared, size_lookup, write_plan
+
+    size = size_lookup(args.index, args.wheelhouse, args.sizes)
+    plans = plan_shared(args.paths, args.root, args.min_share, size,
+                        exclude=[args.output] if args.output else ())
+    written = write_plan(plans, args.output, args.root, args.registry) if args.output else []
+
+    rows = []
+    for plan in plans:
+        kinds = [kind for kind, _ in plan['shared']]
+        rows.append({
+            'base_image': plan['base_image'],
+            'variants': len(plan['variants']),
+            'collections': kinds.count('collection'),
+            'python': kinds.count('python'),
+            'system': kinds.count('system'),
+            'shared_bytes': plan['shared_bytes'],
+            'saved_per_node': plan['saved_per_node'],
+            'estimated_items': plan['estimated_items'],
+            'shared_items': [f"{kind}:{name}" for kind, name in plan['shared']],
+            'ee_files': plan['variants'],
+        })
+    if args.format == 'table':
+        if rows:
+            print_table([dict(row, shared_bytes=_human_size(row['shared_bytes']),
+                              saved_per_node=_human_size(row['saved_per_node'])) for row in rows],
+                        ['base_image', 'variants', 'collections', 'python', 'system',
+                         'shared_bytes', 'saved_per_node', 'estimated_items'])
+            print()
+        saved = sum(row['saved_per_node'] for row in rows)
+        print(f"{len(rows)} shared image(s); ~{_human_size(saved)} saved per node pulling every variant")
+        for path in written:
+            print(f"  wrote {path}")
+    else:
+        print_data(rows, args.format)
+    return 0
+
+
+# === sbom ===
+def add_sbom_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'sbom',
+        help='Generate an SBOM for a built EE image',
+        description='Generate an SPDX/CycloneDX SBOM from ee.lock and the package manifests '
+                    'in the image layers (no network access, layer results are cached)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s localhost/ansible-custom-ee:latest -o sbom.spdx.json
+  %(prog)s localhost/ansible-custom-ee:latest --format cyclonedx -o sbom.cdx.json
+        """
+    )
+    parser.add_argument('image', help='Local image built from the EE file')
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('--lock', type=Path, help='Lock file (default: ee.lock next to the EE file)')
+    parser.add_argument('--no-lock', action='store_true', help='Ignore ee.lock')
+    parser.add_argument('--no-layers', action='store_true',
+                        help='Do not read the image layers (lock and EE file only)')
+    parser.add_argument('--format', choices=['spdx', 'cyclonedx'], default='spdx', help='SBOM format (default: spdx)')
+    parser.add_argument('-o', '--output', type=Path, help='Output file (default: stdout)')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.set_defaults(func=cmd_sbom)
+
+
+def cmd_sbom(args: argparse.Namespace) -> int:
+    from ee_builder.build import lock_sections
+    from ee_builder.lockfile import default_lock_path
+    from ee_builder.runtime import connect_runtime
+    from ee_builder.sbom import generate_sbom, write_sbom
+
+    sections = {}
+    if not args.no_lock:
+        lock_file = args.lock or default_lock_path(args.file)
+        if args.lock is not None or lock_file.is_file():
+            sections = lock_sections(args.file, lock_file)
+    document, summary = generate_sbom(args.image, args.file, connect_runtime(args.runtime), sections,
+                                      args.format, scan_layers=not args.no_layers)
+    if args.output is None:
+        print(json.dumps(document, indent=2, ensure_ascii=False))
+        return 0
+    write_sbom(args.output, document)
+    sources = ', '.join(f"{count} from {source}" for source, count in sorted(summary['sources'].items()))
+    print(f"Wrote {args.output}: {summary['components']} component(s) ({sources}); "
+          f"{summary['layers_scanned']}/{summary['layers']} layer(s) read in {summary['seconds']}s")
+    return 0
+
+
+# === vulnscan ===
+def add_vulnscan_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'vulnscan',
+        help='Scan an EE image for vulnerabilities layer by layer',
+        description='Run the vulnerability scanner (trivy) on each image layer once and reuse cached '
+                    'results for layers shared with earlier images',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s localhost/ansible-custom-ee:latest
+  %(prog)s localhost/ansible-custom-ee:latest --fail-on HIGH
+  %(prog)s localhost/ansible-custom-ee:latest -f sarif -o trivy-results.sarif
+
+Environment Variables:
+  EE_VULN_SCANNER     Scanner executable (default: trivy)
+  EE_VULN_CACHE_DIR   Layer result cache (default: ~/.cache/ee-builder/vulnscan)
+        """
+    )
+    parser.add_argument('image', help='Local image to scan')
+    parser.add_argument('--scanner', help='Scanner executable (default: $EE_VULN_SCANNER or trivy)')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument('--severity', choices=['UNKNOWN', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL'], default='UNKNOWN',
+                        help='Report findings of at least this severity (default: UNKNOWN)')
+    parser.add_argument('--fail-on', choices=['UNKNOWN', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL'],
+                        help='Exit 1 when a finding of at least this severity is reported')
+    parser.add_argument('--max-age', type=float, default=24.0,
+                        help='Reuse layer results scanned with an older DB for this many hours (default: 24)')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Per-layer scan timeout in seconds')
+    parser.add_argument('-o', '--output', type=Path, help='Write the report to a file')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'sarif'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_vulnscan)
+
+
+def cmd_vulnscan(args: argparse.Namespace) -> int:
+    from ee_builder.runtime import connect_runtime
+    from ee_builder.vulnscan import render_sarif, scan_image_vulns, severity_counts, severity_rank
+
+    result = scan_image_vulns(args.image, connect_runtime(args.runtime), args.scanner,
+                              max_age=args.max_age, timeout=args.timeout)
+    result['findings'] = [finding for finding in result['findings']
+                          if severity_rank(finding['severity']) >= severity_rank(args.severity)]
+    failed = args.fail_on is not None and any(
+        severity_rank(finding['severity']) >= severity_rank(args.fail_on) for finding in result['findings'])
+    counts = ', '.join(f"{count} {severity}" for severity, count in severity_counts(result['findings']).items()
+                       if count)
+    summary = (f"{len(result['findings'])} finding(s){f' ({counts})' if counts else ''}; "
+               f"{result['scanned']}/{len(result['layers'])} layer(s) scanned, "
+               f"{result['reused']} reused in {result['seconds']}s")
+
+    if args.format == 'table':
+        rows = [dict(finding, layer=finding['layer'].split(':')[-1][:12], fixed=finding['fixed'] or '-')
+                for finding in result['findings']]
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as out, contextlib.redirect_stdout(out):
+                print_table(rows, ['severity', 'id', 'package', 'version', 'fixed', 'layer'])
+            print(f"Wrote {args.output}: {summary}")
+        else:
+            if rows:
+                print_table(rows, ['severity', 'id', 'package', 'version', 'fixed', 'layer'])
+                print()
+            print(summary)
+    else:
+        data = render_sarif(result) if args.format == 'sarif' else result
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        if args.output:
+            Path(args.output).write_text(text + '\n', encoding='utf-8')
+            print(f"Wrote {args.output}: {summary}")
+        else:
+            print(text)
+    return 1 if failed else 0
+
+
+# === gc ===
+def add_gc_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'gc',
+        help='Remove old EE tags from the registries',
+        description='List EE tags in the registries, apply keep-rules and delete the rest '
+                    '(dry run unless --apply is given)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # Dry run on the configured registries
+  %(prog)s --max-age 7 --keep-releases 5 --apply    # Delete dev tags older than 7 days
+  %(prog)s quay.io/myorg/ansible-custom-ee --protect 'stable*' -f json
+
+Repositories default to the ones the build-push action pushes to
+(DOCKER_USERNAME, ECR_REGISTRY, ACR_REGISTRY, GCP_PROJECT_ID and IMAGE_NAME).
+        """
+    )
+    parser.add_argument('repositories', nargs='*', help='Repositories, e.g. quay.io/myorg/ansible-custom-ee')
+    parser.add_argument('--image-name', help='Image name for the configured registries (default: $IMAGE_NAME)')
+    parser.add_argument('--keep-releases', type=int, default=10, help='Release tags (v1.2.3) to keep (default: 10)')
+    parser.add_argument('--max-age', type=float, default=14.0,
+                        help='Delete other tags older than this many days (default: 14)')
+    parser.add_argument('--protect', action='append',
+                        help="Tag pattern that is never deleted (repeatable, default: 'latest')")
+    parser.add_argument('--apply', action='store_true', help='Delete the planned tags (default: dry run)')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='Parallel registry reads (default: 8)')
+    parser.add_argument('--delete-jobs', type=int, default=4, help='Parallel deletes (default: 4)')
+    parser.add_argument('--batch-size', type=int, default=20, help='Deletes per batch (default: 20)')
+    parser.add_argument(
+        '--insecure-registry',
+        action='append',
+        default=[],
+        help='Registry reached over plain HTTP, e.g. localhost:5000 (repeatable)'
+    )
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_gc)
+
+
+def cmd_gc(args: argparse.Namespace) -> int:
+    from ee_builder.registry import RegistryClient
+    from ee_builder.registrygc import DEFAULT_PROTECTED, apply_gc, configured_repositories, plan_gc
+
+    client = RegistryClient(insecure=args.insecure_registry)
+    repositories = args.repositories or configured_repositories(args.image_name)
+    rows = plan_gc(repositories, client, protected=args.protect or DEFAULT_PROTECTED,
+                   keep_releases=args.keep_releases, max_age_days=args.max_age, jobs=args.jobs)
+    if args.apply:
+        rows = apply_gc(rows, client, jobs=args.delete_jobs, batch_size=args.batch_size)
+
+    if args.format == 'table':
+        print_table([dict(row, image=f"{row['registry']}/{row['repository']}:{row['tag']}",
+                          digest=(row['digest'] or '-')[7:19], error=row['error'] or '') for row in rows],
+                    ['image', 'digest', 'action', 'reason', 'error'])
+        counts: Dict[str, int] = {}
+        for row in rows:
+            counts[row['action']] = counts.get(row['action'], 0) + 1
+        summary = ', '.join(f"{count} {action}" for action, count in sorted(counts.items()))
+        print(f"\n{len(rows)} tag(s) in {len(repositories)} repositor{'y' if len(repositories) == 1 else 'ies'}: "
+              f"{summary or 'nothing to do'}" + ('' if args.apply else ' (dry run, pass --apply to delete)'))
+    else:
+        print_data(rows, args.format)
+    return 1 if any(row['action'] == 'failed' for row in rows) else 0
+
+
+# === prune ===
+def add_prune_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'prune',
+        help='Remove least recently used local EE images down to a disk budget',
+        description='Record EE image usage from container start events and navigator artifacts, '
+                    'then remove the least recently used local EE images until they fit the budget',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --dry-run                                 # Show what would be removed
+  %(prog)s --budget 10GB --artifacts ~/runs/artifacts
+  %(prog)s --config site/ansible-navigator.yml --filter '*my-ee*'
+
+Images referenced by ansible-navigator.yml ($ANSIBLE_NAVIGATOR_CONFIG,
+./ansible-navigator.yml, ~/.ansible-navigator.yml) are always kept.
+
+Environment Variables:
+  EE_IMAGE_BUDGET       Same as --budget
+  EE_IMAGE_USAGE_FILE   Usage record (default: ~/.cache/ee-builder/image-usage.json)
+        """
+    )
+    parser.add_argument('--budget', default=os.environ.get('EE_IMAGE_BUDGET', '20GB'),
+                        help='Total size of local EE images to keep, e.g. 20GB (default: $EE_IMAGE_BUDGET or 20GB)')
+    parser.add_argument('--config', type=Path, action='append',
+                        help='Navigator config whose image is never removed (repeatable)')
+    parser.add_argument('--artifacts', type=Path, action='append',
+                        help='Playbook artifact file or directory to read usage from (default: ./artifacts)')
+    parser.add_argument('--filter', action='append',
+                        help="Image name pattern to manage (repeatable, default: '*$IMAGE_NAME*')")
+    parser.add_argument('--dry-run', action='store_true', help='Only show the plan')
+    parser.add_argument('--runtime', help='Container runtime (default: $CONTAINER_RUNTIME or podman)')
+    parser.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    parser.set_defaults(func=cmd_prune)
+
+
+def cmd_prune(args: argparse.Namespace) -> int:
+    from ee_builder.imageprune import parse_size, prune_images
+    from ee_builder.runtime import connect_runtime
+
+    result = prune_images(connect_runtime(args.runtime), parse_size(args.budget), configs=args.config,
+                          artifact_paths=args.artifacts or [Path('artifacts')], patterns=args.filter,
+                          dry_run=args.dry_run)
+    for warning in result['warnings']:
+        print(f"Warning: {warning}", file=sys.stderr)
+
+    rows = result['rows']
+    if args.format == 'table':
+        if not rows:
+            print("No local EE images found")
+            return 0
+        print_table([dict(row, image=', '.join(row['tags']), size=_human_size(row['size']),
+                          last_used=time.strftime('%Y-%m-%d %H:%M', time.localtime(row['last_used']))
+                          if row['last_used'] else '-', error=row['error'] or '') for row in rows],
+                    ['image', 'size', 'last_used', 'action', 'reason', 'error'])
+        print(f"\n{_human_size(result['total'])} in {len(rows)} image(s), budget {_human_size(result['budget'])}: "
+              f"{'would free' if args.dry_run else 'freed'} {_human_size(result['freed'])} "
+              f"({result['events']} container start(s), {result['artifacts']} artifact(s) read)")
+    else:
+        print_data(result, args.format)
+    return 1 if any(row['action'] == 'failed' for row in rows) else 0
+
+
+# === build ===
+def add_build_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'build',
+        help='Build, test and optionally push an Execution Environment',
+        description='Build an EE with ansible-builder, smoke-test it and optionally push it',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # Basic build
+  %(prog)s -f custom-ee.yml -t v1.0.0              # Custom EE file and tag
+  %(prog)s -t dev -p -r docker.io/myorg           # Build and push to registry
+  %(prog)s --verbose --runtime docker              # Use Docker runtime with verbose output
+  %(prog)s --telemetry build-times.jsonl           # Append phase/sub-stage timings as JSON lines
+  %(prog)s --cache .ee-build-cache.json            # Skip ansible-builder when inputs are unchanged
+  %(prog)s --sbom sbom.spdx.json                   # Write an SBOM from ee.lock and the layers
+
+Environment Variables:
+  ANSIBLE_GALAXY_SERVER_AUTOMATION_HUB_TOKEN   Automation Hub token
+  ANSIBLE_GALAXY_SERVER_GALAXY_TOKEN          Galaxy token
+  REDHAT_REGISTRY_USERNAME                    Red Hat registry username
+  REDHAT_REGISTRY_PASSWORD                    Red Hat registry password
+  EE_TELEMETRY_FILE                           Same as --telemetry
+  EE_TELEMETRY_FORMAT                         Same as --telemetry-format
+        """
+    )
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('-t', '--tag', default='latest', help='Container image tag (default: latest)')
+    parser.add_argument('-r', '--registry', default='localhost',
+                        help='Registry to push to (default: localhost)')
+    parser.add_argument('-p', '--push', action='store_true', help='Push image to registry after build')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    parser.add_argument('--runtime', default='podman',
+                        help='Container runtime (podman/docker, default: podman)')
+    parser.add_argument('--context', type=Path, default=Path('./context'),
+                        help='Build context directory (default: ./context)')
+    parser.add_argument('--telemetry', type=Path, default=os.environ.get('EE_TELEMETRY_FILE') or None,
+                        help='Record per-phase build timings to FILE')
+    parser.add_argument('--telemetry-format', default=os.environ.get('EE_TELEMETRY_FORMAT') or 'jsonl',
+                        help='Telemetry format (jsonl|openmetrics, default: jsonl)')
+    parser.add_argument('--cache', type=Path,
+                        help='Build cache file; reuse the image when the EE inputs are unchanged')
+    parser.add_argument('--skip-tests', action='store_true', help='Do not smoke-test the built image')
+    parser.add_argument('--lock', type=Path,
+                        help='Install dependencies pinned in this lock file (default: ee.lock next to the EE file)')
+    parser.add_argument('--no-lock', action='store_true', help='Ignore ee.lock and let the build resolve')
+    parser.add_argument('--sbom', type=Path, help='Write an SBOM of the built image to FILE')
+    parser.add_argument('--sbom-format', choices=['spdx', 'cyclonedx'], default='spdx',
+                        help='SBOM format (default: spdx)')
+    parser.set_defaults(func=cmd_build)
+
+
+def cmd_build(args: argparse.Namespace) -> int:
+    from ee_builder.build import BuildCache, BuildError, build
+    from ee_builder.lockfile import default_lock_path
+    from ee_builder.log import log_error, log_info
+    from ee_builder.runtime import connect_runtime
+    from ee_builder.telemetry import Telemetry
+
+    lock_file = None
+    if not args.no_lock:
+        lock_file = args.lock or default_lock_path(args.file)
+        if args.lock is None and not lock_file.is_file():
+            lock_file = None
+    telemetry = Telemetry(args.telemetry, args.telemetry_format, labels={
+        'ee_file': str(args.file), 'tag': args.tag, 'runtime': args.runtime,
+    })
+    try:
+        build(
+            args.file, tag=args.tag, registry=args.registry, runtime=connect_runtime(args.runtime),
+            push=args.push, verbose=args.verbose, context=args.context, telemetry=telemetry,
+            cache=BuildCache(args.cache) if args.cache else None, run_tests=not args.skip_tests,
+            lock_file=lock_file, sbom=args.sbom, sbom_format=args.sbom_format
+        )
+    except BuildError:
+        return 1
+    except KeyboardInterrupt:
+        log_error("Script interrupted")
+        return 1
+    finally:
+        if telemetry.enabled:
+            log_info(f"Telemetry written to {telemetry.path}")
+    return 0
+
+
+# === watch ===
+def add_watch_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'watch',
+        help='Rebuild, retest or regenerate the navigator config when EE inputs change',
+        description='Watch the EE file, ansible.cfg and the files the EE references, and rerun only '
+                    'the affected stage (config / build / test) after changes settle',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                   # Watch execution-environment.yml
+  %(prog)s -f custom-ee.yml -t dev --poll    # Poll instead of inotify (e.g. network filesystems)
+        """
+    )
+    parser.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    parser.add_argument('-t', '--tag', default='latest', help='Container image tag (default: latest)')
+    parser.add_argument('-r', '--registry', default='localhost',
+                        help='Registry part of the image name (default: localhost)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    parser.add_argument('--runtime', default='podman',
+                        help='Container runtime (podman/docker, default: podman)')
+    parser.add_argument('--lock', type=Path,
+                        help='Install dependencies pinned in this lock file (default: ee.lock next to the EE file)')
+    parser.add_argument('--no-lock', action='store_true', help='Ignore ee.lock and let the build resolve')
+    parser.add_argument('--navigator-config', type=Path, default=Path('ansible-navigator.yml'),
+                        help='Navigator config to regenerate (default: ansible-navigator.yml)')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='Seconds without further changes before a stage runs (default: 0.5)')
+    parser.add_argument('--poll', action='store_true', help='Poll file modification times instead of inotify')
+    parser.set_defaults(func=cmd_watch)
+
+
+def cmd_watch(args: argparse.Namespace) -> int:
+    from ee_builder.lockfile import default_lock_path
+    from ee_builder.runtime import connect_runtime
+    from ee_builder.watch import watch
+
+    lock_file = None
+    if not args.no_lock:
+        lock_file = args.lock or default_lock_path(args.file)
+        if args.lock is None and not lock_file.is_file():
+            lock_file = None
+    results = watch(args.file, tag=args.tag, registry=args.registry, runtime=connect_runtime(args.runtime),
+                    navigator_config=args.navigator_config, lock_file=lock_file, debounce=args.debounce,
+                    poll=args.poll, verbose=args.verbose)
+    return 1 if results and results[-1]['status'] == 'failed' else 0
+
+
+# === queue ===
+def add_queue_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'queue',
+        help='Shared build queue with request coalescing',
+        description='Run builds through a local build service on a Unix socket: identical requests '
+                    '(same inputs and options) share one build and its result',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s serve -j 2 --cache ~/.cache/ee-builder/build-cache.json   # On the build host
+  %(prog)s build -f execution-environment.yml -t dev                 # Submit and wait
+  %(prog)s status
+
+Environment Variables:
+  EE_BUILD_SOCKET   Socket path (default: $XDG_RUNTIME_DIR/ee-builder/build.sock);
+                    scripts/build-local.sh submits to the queue when it is set
+        """
+    )
+    actions = parser.add_subparsers(dest='action', metavar='<action>')
+
+    serve = actions.add_parser('serve', help='Run the build queue in the foreground')
+    serve.add_argument('--socket', type=Path, help='Socket path (default: $EE_BUILD_SOCKET)')
+    serve.add_argument('-j', '--jobs', type=int, default=2, help='Builds running at once (default: 2)')
+    serve.add_argument('--cache', type=Path, help='Build cache file shared by all requests')
+    serve.add_argument('--workdir', type=Path, default=Path('.'),
+                       help='Directory for the per-build contexts (default: current directory)')
+    serve.add_argument('--root', type=Path, action='append', dest='roots',
+                       help='Project directory requests may build from; repeatable (default: current directory)')
+    serve.set_defaults(func=cmd_queue_serve)
+
+    submit = actions.add_parser('build', help='Submit a build and wait for its result')
+    submit.add_argument('-f', '--file', type=Path, default=Path('execution-environment.yml'),
+                        help='Execution Environment file (default: execution-environment.yml)')
+    submit.add_argument('-t', '--tag', default='latest', help='Container image tag (default: latest)')
+    submit.add_argument('-r', '--registry', default='localhost', help='Registry to push to (default: localhost)')
+    submit.add_argument('-p', '--push', action='store_true', help='Push image to registry after build')
+    submit.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    submit.add_argument('--runtime', choices=['podman', 'docker'], default='podman',
+                        help='Container runtime (default: podman)')
+    submit.add_argument('--skip-tests', action='store_true', help='Do not smoke-test the built image')
+    submit.add_argument('--lock', type=Path,
+                        help='Install dependencies pinned in this lock file (default: ee.lock next to the EE file)')
+    submit.add_argument('--no-lock', action='store_true', help='Ignore ee.lock and let the build resolve')
+    submit.add_argument('--socket', type=Path, help='Socket path (default: $EE_BUILD_SOCKET)')
+    submit.add_argument('--timeout', type=float,
+                        help='Give up after this many seconds in total, including time spent queued')
+    submit.set_defaults(func=cmd_queue_build)
+
+    status = actions.add_parser('status', help='Show queued, running and recent builds')
+    status.add_argument('--socket', type=Path, help='Socket path (default: $EE_BUILD_SOCKET)')
+    status.add_argument(
+        '-f', '--format',
+        choices=['table', 'json', 'yaml'],
+        default='table',
+        help='Output format (default: table)'
+    )
+    status.set_defaults(func=cmd_queue_status)
+
+
+def cmd_queue_serve(args: argparse.Namespace) -> int:
+    from ee_builder.build import BuildCache
+    from ee_builder.buildqueue import BuildQueue, BuildQueueServer, default_socket_path
+    from ee_builder.log import log_info
+
+    queue = BuildQueue(jobs=args.jobs, cache=BuildCache(args.cache) if args.cache else None, workdir=args.workdir,
+                       roots=args.roots or ())
+    server = BuildQueueServer(args.socket or default_socket_path(), queue)
+    log_info(f"Build queue listening on {server.socket_path} ({queue.jobs} concurrent build(s), "
+             f"projects under {', '.join(str(root) for root in queue.roots)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log_info("Stopping build queue")
+    finally:
+        server.server_close()
+        queue.shutdown()
+    return 0
+
+
+def cmd_queue_build(args: argparse.Namespace) -> int:
+    from ee_builder.buildqueue import submit_build
+    from ee_builder.lockfile import default_lock_path
+    from ee_builder.log import log_error, log_info, log_success
+
+    lock_file = None
+    if not args.no_lock:
+        lock_file = args.lock or default_lock_path(args.file)
+        if args.lock is None and not lock_file.is_file():
+            lock_file = None
+
+    def show(message: Dict[str, Any]) -> None:
+        if message['event'] == 'accepted':
+            how = 'joined in-flight build' if message['coalesced'] else 'queued as build'
+            waiting = f", {message['position']} ahead" if message['position'] else ''
+            log_info(f"{message['image']}: {how} #{message['id']}{waiting}")
+        elif message['event'] == 'line':
+            sys.stdout.write(message['line'])
+            sys.stdout.flush()
+
+    result = submit_build({
+        'ee_file': str(args.file), 'tag': args.tag, 'registry': args.registry, 'runtime': args.runtime,
+        'push': args.push, 'run_tests': not args.skip_tests, 'verbose': args.verbose,
+        'lock_file': str(lock_file) if lock_file else None,
+    }, args.socket, show, args.timeout)
+    if result['status'] != 'ok':
+        log_error(f"Build #{result['id']} failed: {result['error']}")
+        return 1
+    log_success(f"Build #{result['id']} completed: {result['image']} (shared by {result['waiters']} request(s))")
+    return 0
+
+
+def cmd_queue_status(args: argparse.Namespace) -> int:
+    from ee_builder.buildqueue import queue_status
+
+    jobs = queue_status(args.socket)
+    if args.format == 'table':
+        if not jobs:
+            print("No builds")
+            return 0
+        print_table([dict(job, submitted=time.strftime('%H:%M:%S', time.localtime(job['submitted'])),
+                          seconds=f"{(job['finished'] or time.time()) - (job['started'] or time.time()):.0f}")
+                     for job in jobs], ['id', 'image', 'state', 'waiters', 'submitted', 'seconds'])
+    else:
+        print_data(jobs, args.format)
+    return 0
+
+
+# === telemetry ===
+def add_telemetry_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'telemetry',
+        help='Build telemetry helpers',
+        description='Render recorded build telemetry in other formats'
+    )
+    actions = parser.add_subparsers(dest='action', metavar='<action>')
+
+    render = actions.add_parser('render', help='Convert JSON lines records to another format')
+    render.add_argument('--input', type=Path, required=True, help='JSON lines records')
+    render.add_argument('--output', type=Path, help='Output file (default: stdout)')
+    render.add_argument('--format', choices=['openmetrics'], default='openmetrics',
+                        help='Output format (default: openmetrics)')
+    render.set_defaults(func=cmd_telemetry_render)
+
+
+def cmd_telemetry_render(args: argparse.Namespace) -> int:
+    from ee_builder.telemetry import read_jsonl, render_openmetrics
+
+    text = render_openmetrics(read_jsonl(args.input))
+    if args.output:
+        args.output.write_text(text, encoding='utf-8')
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+# === profile ===
+def add_profile_parser(subparsers: Any) -> None:
+    parser = subparsers.add_parser(
+        'profile',
+        help='Profile a Python script or module',
+        description='Run a script (e.g. scripts/generate-navigator-config.py or a test suite) under the '
+                    'profiler, writing pstats, collapsed stacks for flamegraphs and span timings'
+    )
+    parser.add_argument('-o', '--output', help='Output directory (default: EE_PROFILE or ./profiles)')
+    parser.add_argument('--mode', choices=['cprofile', 'sample'],
+                        help='cProfile, or a sampling profiler covering every thread '
+                             '(default: EE_PROFILE_MODE or cprofile)')
+    parser.add_argument('--interval', type=float, help='Sampling interval in seconds (default: 0.005)')
+    parser.add_argument('-m', dest='module', action='store_true', help='Run TARGET as a module')
+    parser.add_argument('target', help='Script path (or module name with -m)')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help='Arguments passed to the script')
+    parser.set_defaults(func=cmd_profile)
+
+
+def cmd_profile(args: argparse.Namespace) -> int:
+    import runpy
+
+    from ee_builder.profiling import ProfilingError, profiling
+
+    if not args.module and not Path(args.target).is_file():
+        raise ProfilingError(f"Script not found: {args.target}")
+    directory = args.output or os.environ.get('EE_PROFILE') or 'profiles'
+    name = args.target.rsplit('.', 1)[-1] if args.module else Path(args.target).stem
+    saved_argv, saved_path = sys.argv, sys.path[0]
+    # python script.py と同じく argv とスクリプトのディレクトリ（sys.path[0]）を差し替える
+    sys.argv = [args.target] + args.arguments
+    if not args.module:
+        sys.path[0] = str(Path(args.target).resolve().parent)
+    try:
+        with profiling(directory, name, args.mode, args.interval):
+            try:
+                if args.module:
+                    runpy.run_module(args.target, run_name='__main__', alter_sys=True)
+                else:
+                    runpy.run_path(args.target, run_name='__main__')
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    return e.code or 0
+                print(e.code, file=sys.stderr)
+                return 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[0] = saved_path
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m ee_builder',
+        description='Ansible Custom EE Builder tooling'
+    )
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Profile the command into DIR (pstats, collapsed stacks, span timings; '
+                             'default: EE_PROFILE)')
+    parser.add_argument('--profile-mode', choices=['cprofile', 'sample'],
+                        help='Profiler for --profile (default: EE_PROFILE_MODE or cprofile)')
+    parser.add_argument('--profile-interval', type=float, metavar='SECONDS',
+                        help='Sampling interval for --profile-mode sample (default: 0.005)')
+    subparsers = parser.add_subparsers(dest='command', metavar='<command>')
+    add_query_parser(subparsers)
+    add_prewarm_parser(subparsers)
+    add_images_parser(subparsers)
+    add_export_parser(subparsers)
+    add_import_parser(subparsers)
+    add_validate_parser(subparsers)
+    add_lock_parser(subparsers)
+    add_galaxy_parser(subparsers)
+    add_credentials_parser(subparsers)
+    add_deps_parser(subparsers)
+    add_impact_parser(subparsers)
+    add_share_parser(subparsers)
+    add_sbom_parser(subparsers)
+    add_vulnscan_parser(subparsers)
+    add_gc_parser(subparsers)
+    add_prune_parser(subparsers)
+    add_build_parser(subparsers)
+    add_watch_parser(subparsers)
+    add_queue_parser(subparsers)
+    add_secrets_parser(subparsers)
+    add_telemetry_parser(subparsers)
+    add_profile_parser(subparsers)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Main function."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        sys.exit(1)
+
+    from ee_builder.profiling import profiling
+
+    # profile コマンドは対象スクリプトを自分でプロファイルする
+    if args.command == 'profile':
+        profiler = contextlib.nullcontext()
+    else:
+        profiler = profiling(args.profile, f'ee_builder-{args.command}', args.profile_mode, args.profile_interval)
+    try:
+        with profiler:
+            code = args.func(args)
+    except EEBuilderError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(code)
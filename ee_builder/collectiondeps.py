@@ -0,0 +1,365 @@
+"""
+Conflict check for collection-declared dependencies
+
+Collections such as amazon.aws or kubernetes.core ship their own Python
+requirements and bindep files, which ansible-builder merges with the EE
+file's dependencies.python / dependencies.system. Clashing ranges only
+show up late, as slow pip backtracking or a broken image. This module
+streams those files out of the collection tarballs (from the ee.lock
+cache or a download directory), merges every range per package and
+reports, before the build starts:
+
+- ``error``: ranges that no version can satisfy together (or that no
+  version in a wheelhouse satisfies), and collection requirements that
+  a hash-pinned ee.lock does not cover;
+- ``warning``: EE file pins that add nothing because a collection
+  already requires a stricter range.
+"""
+
+import json
+import re
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ee_builder.eefile import requirement_lines
+from ee_builder.eeschema import canonical_name, parse_bindep, parse_requirement
+from ee_builder.galaxylock import collection_cache_dir, version_key
+from ee_builder.lockfile import LockError
+from ee_builder.pylock import (
+    PyIndex, parse_requirement_lines, parse_version, python_version_for, specifier_matches, target_environment,
+)
+
+ROOT = 'execution-environment'
+
+# ansible-builder (introspect) が常に除外する Python 要件
+BUILDER_EXCLUDES = frozenset((
+    'ansible', 'ansible-base', 'ansible-core', 'python',
+    'tox', 'pytest', 'pytest-mock', 'pytest-xdist', 'pytest-cov', 'mock', 'coverage',
+))
+# ベースイメージは RHEL 系
+RPM_PLATFORMS = frozenset(('platform:rpm', 'platform:redhat', 'platform:rhel', 'platform:centos'))
+# ansible-builder が bindep で入れるプロファイル（ビルダーステージでの compile を含む）
+INSTALLED_PROFILES = frozenset(('compile',))
+
+_MAX_MEMBER_SIZE = 1 << 20
+_TARBALL_NAME = re.compile(r'^([a-z0-9_]+)-([a-z0-9_]+)-(.+)\.tar\.gz$')
+_CLAUSE = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*(\S+)\s*$')
+
+Bound = Optional[Tuple[Tuple[Any, ...], bool]]  # (version key, inclusive)
+
+
+# === collection tarballs ===
+def read_collection_requirements(tarball: Path) -> Dict[str, Any]:
+    """Stream a collection tarball once and return its declared dependencies.
+
+    Like ansible-builder, meta/execution-environment.yml names the files;
+    without it, requirements.txt and bindep.txt at the collection root are
+    used. Returns ``{name, version, python: [lines], system: [lines]}``.
+    """
+    texts: Dict[str, str] = {}
+    try:
+        with tarfile.open(tarball, 'r|*') as archive:
+            for member in archive:
+                name = member.name[2:] if member.name.startswith('./') else member.name
+                if not member.isfile() or member.size > _MAX_MEMBER_SIZE:
+                    continue
+                if name == 'MANIFEST.json' or name.endswith('.txt') or \
+                        name in ('meta/execution-environment.yml', 'meta/execution-environment.yaml'):
+                    f = archive.extractfile(member)
+                    if f is not None:
+                        texts[name] = f.read().decode('utf-8', 'replace')
+    except (OSError, tarfile.TarError) as e:
+        raise LockError(f"Cannot read collection tarball {tarball}: {e}") from e
+
+    try:
+        info = json.loads(texts['MANIFEST.json'])['collection_info']
+        meta = yaml.safe_load(texts.get('meta/execution-environment.yml')
+                              or texts.get('meta/execution-environment.yaml') or '') or {}
+    except (KeyError, ValueError, yaml.YAMLError) as e:
+        raise LockError(f"{tarball}: not a collection artifact ({e})") from e
+    declared = meta.get('dependencies') or {} if isinstance(meta, dict) else {}
+
+    result: Dict[str, Any] = {'name': f"{info['namespace']}.{info['name']}", 'version': info['version']}
+    for section, default in (('python', 'requirements.txt'), ('system', 'bindep.txt')):
+        path = default
+        if isinstance(declared, dict) and declared.get(section):
+            path = re.sub(r'^\./', '', str(declared[section]))
+        result[section] = texts.get(path, '').splitlines()
+    return result
+
+
+def locked_tarballs(section: Dict[str, Any], lock_dir: Path,
+                    cache_dir: Optional[Path] = None) -> Tuple[List[Path], List[str]]:
+    """Return (cached tarballs, names not available locally) for a galaxy lock section."""
+    cache_dir = cache_dir or collection_cache_dir()
+    found, missing = [], []
+    for entry in section.get('collections') or []:
+        cached = cache_dir / f"{entry.get('sha256')}.tar.gz"
+        url = str(entry.get('url') or '')
+        if entry.get('sha256') and cached.is_file():
+            found.append(cached)
+        elif url and '://' not in url and (Path(lock_dir) / url).is_file():
+            found.append(Path(lock_dir) / url)
+        else:
+            missing.append(entry['name'])
+    return found, missing
+
+
+def directory_tarballs(directory: Path) -> List[Path]:
+    """Newest tarball per collection in an ``ansible-galaxy collection download`` directory."""
+    newest: Dict[str, Tuple[Tuple[Any, ...], Path]] = {}
+    for path in Path(directory).glob('*.tar.gz'):
+        match = _TARBALL_NAME.match(path.name)
+        if not match:
+            continue
+        name = f"{match.group(1)}.{match.group(2)}"
+        key = version_key(match.group(3))
+        if name not in newest or key > newest[name][0]:
+            newest[name] = (key, path)
+    return [newest[name][1] for name in sorted(newest)]
+
+
+# === version ranges ===
+def _next_prefix(release: Tuple[int, ...]) -> Tuple[int, ...]:
+    return release[:-1] + (release[-1] + 1,)
+
+
+def _key(release: Tuple[int, ...], epoch: int = 0) -> Tuple[Any, ...]:
+    return parse_version(f"{epoch}!" + '.'.join(str(part) for part in release)).public_key
+
+
+class Range:
+    """Versions allowed by a set of specifier clauses, as one interval minus points."""
+
+    def __init__(self, lower: Bound = None, upper: Bound = None, excluded: Sequence[Tuple[Any, ...]] = ()):
+        self.lower = lower
+        self.upper = upper
+        self.excluded = set(excluded)
+
+    @classmethod
+    def parse(cls, specifier: str) -> 'Range':
+        result = cls()
+        for clause in (specifier or '').split(','):
+            if not clause.strip():
+                continue
+            match = _CLAUSE.match(clause)
+            if not match:
+                raise ValueError(f"invalid version specifier '{clause.strip()}'")
+            op, target = match.groups()
+            if target.endswith('.*'):
+                version = parse_version(target[:-2])
+                if op == '==':
+                    result = result.intersect(cls((_key(version.release, version.epoch), True),
+                                                  (_key(_next_prefix(version.release), version.epoch), False)))
+                continue  # != X.* は区間から除けないため無視する
+            version = parse_version(target)
+            key = version.public_key
+            if op in ('==', '==='):
+                result = result.intersect(cls((key, True), (key, True)))
+            elif op == '!=':
+                result.excluded.add(key)
+            elif op == '~=':
+                upper = _key(_next_prefix(version.release[:-1] or version.release), version.epoch)
+                result = result.intersect(cls((key, True), (upper, False)))
+            elif op in ('>=', '>'):
+                result = result.intersect(cls((key, op == '>=')))
+            else:
+                result = result.intersect(cls(None, (key, op == '<=')))
+        return result
+
+    def intersect(self, other: 'Range') -> 'Range':
+        # 同じ版なら排他的な境界の方が厳しい
+        lowers = [((b[0], not b[1]), b) for b in (self.lower, other.lower) if b]
+        uppers = [(b, b) for b in (self.upper, other.upper) if b]
+        return Range(max(lowers)[1] if lowers else None, min(uppers)[1] if uppers else None,
+                     self.excluded | other.excluded)
+
+    @property
+    def empty(self) -> bool:
+        if self.lower is None or self.upper is None:
+            return False
+        (low, low_in), (high, high_in) = self.lower, self.upper
+        if low > high or (low == high and not (low_in and high_in)):
+            return True
+        return low == high and low in self.excluded
+
+    def within(self, other: 'Range') -> bool:
+        """True when every version in this range is also in ``other``."""
+        if self.empty:
+            return True
+        if other.lower is not None:
+            if self.lower is None or self.lower[0] < other.lower[0] or \
+                    (self.lower[0] == other.lower[0] and self.lower[1] and not other.lower[1]):
+                return False
+        if other.upper is not None:
+            if self.upper is None or self.upper[0] > other.upper[0] or \
+                    (self.upper[0] == other.upper[0] and self.upper[1] and not other.upper[1]):
+                return False
+        return all(point in self.excluded or Range(self.lower, self.upper).intersect(
+            Range((point, True), (point, True))).empty for point in other.excluded)
+
+
+# === analysis ===
+def _bindep_applies(selectors: Sequence[str]) -> bool:
+    platforms = [s for s in selectors if s.lstrip('!').startswith('platform:')]
+    profiles = [s for s in selectors if s not in platforms]
+    wanted = [s for s in platforms if not s.startswith('!')]
+    if wanted and not RPM_PLATFORMS.intersection(wanted):
+        return False
+    if any(s[1:] in RPM_PLATFORMS for s in platforms if s.startswith('!')):
+        return False
+    positive = [s for s in profiles if not s.startswith('!')]
+    return not positive or bool(INSTALLED_PROFILES.intersection(positive))
+
+
+def _skipped(kind: str, origin: str, text: str, reason: Any) -> Dict[str, Any]:
+    return {'severity': 'warning', 'kind': kind, 'name': origin,
+            'message': f"not checked: '{text}' ({reason})"}
+
+
+def _python_entries(lines: Sequence[str], origin: str, env: Dict[str, str],
+                    issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    entries = []
+    for line in lines:
+        try:
+            requirements = parse_requirement_lines([line], env)
+        except LockError as e:
+            issues.append(_skipped('python', origin, line.strip(), e))
+            continue
+        entries.extend({'name': canonical_name(r['name']), 'specifier': r['specifier'], 'origin': origin}
+                       for r in requirements)
+    return entries
+
+
+def _system_entries(lines: Sequence[str], origin: str, issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    entries = []
+    for line in lines:
+        text = line.split('#', 1)[0].strip()
+        if not text:
+            continue
+        try:
+            parsed = parse_bindep(text)
+        except ValueError as e:
+            issues.append(_skipped('system', origin, text, e))
+            continue
+        if _bindep_applies(parsed['selectors']):
+            entries.append({'name': parsed['name'], 'specifier': parsed['version'], 'origin': origin})
+    return entries
+
+
+def _check_group(kind: str, name: str, entries: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    issues: List[Dict[str, Any]] = []
+    ranges = []
+    for entry in entries:
+        try:
+            ranges.append(Range.parse(entry['specifier']))
+        except ValueError:
+            return []  # RPM の epoch 付きなど PEP 440 で比較できないものは判定しない
+    merged = Range()
+    for item in ranges:
+        merged = merged.intersect(item)
+    wanted = '; '.join(f"{e['specifier'] or 'any'} ({e['origin']})" for e in entries)
+    if merged.empty:
+        issues.append({'severity': 'error', 'kind': kind, 'name': name,
+                       'message': f"unsatisfiable: {wanted}"})
+        return issues
+
+    for i, entry in enumerate(entries):
+        if entry['origin'] != ROOT or not entry['specifier']:
+            continue
+        others = [r for j, r in enumerate(ranges) if j != i and entries[j]['origin'] != ROOT]
+        if not others:
+            continue
+        rest = Range()
+        for item in others:
+            rest = rest.intersect(item)
+        if rest.within(ranges[i]):
+            by = ', '.join(f"{e['specifier'] or 'any'} ({e['origin']})"
+                           for e in entries if e['origin'] != ROOT and e['specifier'])
+            issues.append({'severity': 'warning', 'kind': kind, 'name': name,
+                           'message': f"redundant pin {entry['specifier']}: already implied by {by}"})
+    return issues
+
+
+def analyze(ee_config: Dict[str, Any], base_dir: Path, collections: Sequence[Dict[str, Any]],
+            python_lines: Optional[Sequence[str]] = None, hash_locked: bool = False,
+            index: Optional[PyIndex] = None, python_version: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Merge the EE file's and the collections' requirements and report conflicts.
+
+    ``collections`` are ``read_collection_requirements`` results.
+    ``python_lines`` replaces dependencies.python (e.g. the ee.lock pins,
+    with ``hash_locked``); ``index`` additionally checks that some
+    version in the wheelhouse satisfies each merged range.
+    """
+    env = target_environment(python_version or python_version_for(ee_config))
+    exclude = (ee_config.get('dependencies') or {}).get('exclude') or {}
+    excluded_python = BUILDER_EXCLUDES | {canonical_name(str(n)) for n in exclude.get('python') or []}
+    excluded_system = {str(n) for n in exclude.get('system') or []}
+    excluded_collections = {str(n) for n in exclude.get('all_from_collections') or []}
+
+    if python_lines is None:
+        python_lines = requirement_lines(ee_config, 'python', base_dir)
+    issues: List[Dict[str, Any]] = []
+    python = _python_entries(python_lines, ROOT, env, issues)
+    system = _system_entries(requirement_lines(ee_config, 'system', base_dir), ROOT, issues)
+    locked = {entry['name'] for entry in python}
+    for collection in collections:
+        if collection['name'] in excluded_collections:
+            continue
+        origin = f"{collection['name']} {collection['version']}"
+        for entry in _python_entries(collection['python'], origin, env, issues):
+            if entry['name'] in excluded_python:
+                continue
+            python.append(entry)
+            if hash_locked and entry['name'] not in locked:
+                issues.append({'severity': 'error', 'kind': 'python', 'name': entry['name'],
+                               'message': f"required by {origin} but not pinned in ee.lock; "
+                                          f"hash-checking pip will reject it (run lock again)"})
+        system.extend(e for e in _system_entries(collection['system'], origin, issues)
+                      if e['name'] not in excluded_system)
+
+    for kind, entries in (('python', python), ('system', system)):
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            groups.setdefault(entry['name'], []).append(entry)
+        for name in sorted(groups):
+            group_issues = _check_group(kind, name, groups[name])
+            issues.extend(group_issues)
+            if kind == 'python' and index is not None and not group_issues:
+                specs = [e['specifier'] for e in groups[name]]
+                if not any(all(specifier_matches(v, s) for s in specs) for v in index.get(name) or {}):
+                    wanted = '; '.join(f"{e['specifier'] or 'any'} ({e['origin']})" for e in groups[name])
+                    issues.append({'severity': 'error', 'kind': kind, 'name': name,
+                                   'message': f"no version in the index satisfies: {wanted}"})
+    return issues
+
+
+def analyze_tarballs(ee_config: Dict[str, Any], base_dir: Path, tarballs: Sequence[Path],
+                     **options: Any) -> List[Dict[str, Any]]:
+    """``analyze`` over collection tarballs (see analyze for ``options``)."""
+    return analyze(ee_config, base_dir, [read_collection_requirements(t) for t in tarballs], **options)
+
+
+def collection_python_lines(ee_config: Dict[str, Any],
+                            collections: Sequence[Dict[str, Any]]) -> List[Tuple[str, List[str]]]:
+    """``(origin, lines)`` of the collection requirements ansible-builder would merge in."""
+    exclude = (ee_config.get('dependencies') or {}).get('exclude') or {}
+    excluded = BUILDER_EXCLUDES | {canonical_name(str(n)) for n in exclude.get('python') or []}
+    excluded_collections = {str(n) for n in exclude.get('all_from_collections') or []}
+    result = []
+    for collection in collections:
+        if collection['name'] in excluded_collections:
+            continue
+        lines = []
+        for line in collection['python']:
+            try:
+                name = canonical_name(parse_requirement(line.split('#', 1)[0].strip())['name'])
+            except ValueError:
+                continue  # 空行・オプション行・不正な行は analyze が報告する
+            if name not in excluded:
+                lines.append(line)
+        result.append((f"{collection['name']} {collection['version']}", lines))
+    return result
@@ -0,0 +1,198 @@
+"""
+Credential broker for Red Hat SSO and registry logins
+
+Automation Hub servers in ansible.cfg set ``auth_url`` to the Red Hat SSO
+token endpoint: the configured offline token has to be exchanged for a
+short-lived access token before every API call. Registry logins to
+registry.redhat.io are repeated by every build and base image check.
+
+The broker keeps both on disk until they expire and shares them between
+concurrent processes:
+
+- SSO access tokens are cached per (auth_url, client id, offline token)
+  until ``expires_in`` (minus a safety margin). The offline token itself
+  is never written; entries are keyed by a hash of it.
+- A registry login is recorded per (runtime, registry, user, password
+  hash) and skipped while the record is fresh and the containers auth
+  file still holds the same credentials.
+- The cache file (mode 0600) is read and updated under an exclusive
+  ``flock``, held across the exchange or login, so builds starting
+  together perform one exchange and one login between them.
+"""
+
+import base64
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import ssl
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.profiling import span
+from ee_builder.registry import load_auth_file
+from ee_builder.runtime import ContainerRuntime
+
+# Red Hat SSO でオフライントークンを交換するときのクライアントID（ansible-galaxy と同じ）
+SSO_CLIENT_ID = 'cloud-services'
+# 有効期限の直前に渡したトークンがリクエスト中に失効しないよう、この秒数を残して更新する
+EXPIRY_MARGIN = 60
+REGISTRY_LOGIN_TTL = 3600
+EXCHANGE_TIMEOUT = 30
+
+
+class CredentialError(EEBuilderError):
+    """Raised when a token exchange or registry login fails."""
+
+
+def credential_cache_path() -> Path:
+    configured = os.environ.get('EE_CREDENTIAL_CACHE')
+    if configured:
+        return Path(configured)
+    # 認証情報は再起動で消える XDG_RUNTIME_DIR を優先する
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return Path(runtime_dir) / 'ee-builder' / 'credentials.json'
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'credentials.json'
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def exchange_token(auth_url: str, offline_token: str, client_id: str = SSO_CLIENT_ID,
+                   validate_certs: bool = True, timeout: float = EXCHANGE_TIMEOUT) -> Tuple[str, float]:
+    """Exchange an offline (refresh) token at an OpenID Connect token endpoint.
+
+    Returns (access token, lifetime in seconds).
+    """
+    form = urllib.parse.urlencode({'grant_type': 'refresh_token', 'client_id': client_id,
+                                   'refresh_token': offline_token}).encode('ascii')
+    request = urllib.request.Request(auth_url, data=form,
+                                     headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    context = None
+    if not validate_certs:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    try:
+        with span('http', 'sso token exchange'), \
+                urllib.request.urlopen(request, timeout=timeout, context=context) as response:  # nosec B310
+            data = json.load(response)
+    except urllib.error.HTTPError as e:
+        raise CredentialError(f"Token exchange at {auth_url} failed (HTTP {e.code})") from e
+    except (OSError, ValueError) as e:
+        raise CredentialError(f"Token exchange at {auth_url} failed: {e}") from e
+    access = data.get('access_token') if isinstance(data, dict) else None
+    if not access:
+        raise CredentialError(f"Token exchange at {auth_url} returned no access_token")
+    return str(access), float(data.get('expires_in') or 300)
+
+
+class CredentialBroker:
+    """Disk-cached SSO access tokens and registry logins, shared under a file lock."""
+
+    def __init__(self, path: Optional[Path] = None, clock: Callable[[], float] = time.time,
+                 exchange: Callable[..., Tuple[str, float]] = exchange_token):
+        self.path = Path(path) if path else credential_cache_path()
+        self.clock = clock
+        self.exchange = exchange
+        self.stats = {'exchanges': 0, 'logins': 0, 'hits': 0}
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[Dict[str, Any]]:
+        """Hold the cache lock and yield its data; changes are written back on exit."""
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(f'{self.path}.lock', 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                data = self._read()
+                before = json.dumps(data, sort_keys=True)
+                yield data
+                if json.dumps(data, sort_keys=True) != before:
+                    self._write(data)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        now = self.clock()
+        # 期限切れのエントリは読み込み時に捨てる
+        return {section: {name: entry for name, entry in (data.get(section) or {}).items()
+                          if isinstance(entry, dict) and entry.get('expires_at', 0) > now}
+                for section in ('sso', 'registries')}
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix='.credentials-')
+        try:
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def sso_token(self, auth_url: str, offline_token: str, client_id: str = SSO_CLIENT_ID,
+                  validate_certs: bool = True) -> str:
+        """Return a valid access token for ``offline_token``, exchanging it only when needed."""
+        entry_id = _digest(auth_url, client_id, offline_token)
+        with self._locked() as data:
+            entry = data['sso'].get(entry_id)
+            now = self.clock()
+            if entry and entry['expires_at'] - EXPIRY_MARGIN > now:
+                self.stats['hits'] += 1
+                return entry['access_token']
+            access, lifetime = self.exchange(auth_url, offline_token, client_id, validate_certs)
+            self.stats['exchanges'] += 1
+            data['sso'][entry_id] = {'auth_url': auth_url, 'client_id': client_id,
+                                     'access_token': access, 'expires_at': now + lifetime}
+            return access
+
+    def registry_login(self, runtime: ContainerRuntime, registry: str, username: str, password: str,
+                       ttl: float = REGISTRY_LOGIN_TTL) -> bool:
+        """Log in unless a fresh login with the same credentials is recorded; True when it logged in."""
+        entry_id = _digest(runtime.command, registry, username, password)
+        expected = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
+        with self._locked() as data:
+            entry = data['registries'].get(entry_id)
+            # 記録が新しくても、認証ファイルからログイン情報が消えていれば（logout 等）ログインし直す
+            if entry and load_auth_file().get(registry) == expected:
+                self.stats['hits'] += 1
+                return False
+            runtime.login(registry, username, password)
+            self.stats['logins'] += 1
+            data['registries'][entry_id] = {'registry': registry, 'username': username,
+                                            'runtime': runtime.command, 'expires_at': self.clock() + ttl}
+            return True
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Cached credentials without their secrets, soonest expiry first."""
+        with self._locked() as data:
+            now = self.clock()
+            rows = [{'kind': 'sso', 'target': entry['auth_url'], 'identity': entry.get('client_id'),
+                     'expires_in': int(entry['expires_at'] - now)} for entry in data['sso'].values()]
+            rows += [{'kind': 'registry', 'target': entry['registry'], 'identity': entry.get('username'),
+                      'expires_in': int(entry['expires_at'] - now)} for entry in data['registries'].values()]
+        return [row for _, _, row in sorted((row['expires_in'], n, row) for n, row in enumerate(rows))]
+
+    def clear(self) -> int:
+        """Forget every cached credential; returns how many were removed."""
+        with self._locked() as data:
+            removed = len(data['sso']) + len(data['registries'])
+            data['sso'].clear()
+            data['registries'].clear()
+        return removed
@@ -0,0 +1,149 @@
+"""
+Execution Environment definition helpers
+
+Shared accessors for execution-environment.yml (version 3) files.
+"""
+
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.yamlcache import load_yaml
+
+DEFAULT_BASE_IMAGE = 'quay.io/ansible/creator-ee:latest'
+
+_COPY_LINE = re.compile(r'^\s*(?:-\s*)?(?:COPY|ADD)\s+(?:--\S+\s+)*(.+?)\s+\S+\s*$', re.IGNORECASE)
+
+
+def load_ee_file(path: Path) -> Dict[str, Any]:
+    """Load an EE definition, raising EEBuilderError on unreadable or invalid files."""
+    try:
+        data = load_yaml(path)
+    except OSError as e:
+        raise EEBuilderError(f"Cannot read {path}: {e}") from e
+    except yaml.YAMLError as e:
+        raise EEBuilderError(f"Invalid YAML in {path}: {e}") from e
+    if not isinstance(data, dict):
+        raise EEBuilderError(f"{path}: not a mapping")
+    return data
+
+
+def base_image(ee_config: Dict[str, Any]) -> str:
+    """Return the base image name (same fallback as generate-navigator-config.py)."""
+    image = (ee_config.get('images') or {}).get('base_image', {})
+    if isinstance(image, dict):
+        return image.get('name', DEFAULT_BASE_IMAGE)
+    if isinstance(image, str):
+        return image
+    return DEFAULT_BASE_IMAGE
+
+
+def build_step_lines(ee_config: Dict[str, Any]) -> List[str]:
+    """Return every line of additional_build_steps (prepend/append, str or list)."""
+    lines: List[str] = []
+    for value in (ee_config.get('additional_build_steps') or {}).values():
+        if isinstance(value, str):
+            lines.extend(value.splitlines())
+        elif isinstance(value, list):
+            lines.extend(str(item) for item in value)
+    return lines
+
+
+def copied_files(ee_config: Dict[str, Any], search_dirs: Sequence[Path], include_dirs: bool = False) -> List[Path]:
+    """Return local files referenced by COPY/ADD build steps.
+
+    Each source is looked up in ``search_dirs`` in order (typically the EE
+    file's directory, then the project root); sources that are not found
+    are ignored, and so are directories unless ``include_dirs`` is set.
+    """
+    files: List[Path] = []
+    for line in build_step_lines(ee_config):
+        match = _COPY_LINE.match(line)
+        if not match:
+            continue
+        for source in match.group(1).split():
+            candidate = next((d / source for d in search_dirs
+                              if (d / source).is_file() or (include_dirs and (d / source).is_dir())), None)
+            if candidate is not None and candidate not in files:
+                files.append(candidate)
+    return files
+
+
+def find_ee_files(paths: Sequence[Path]) -> List[Path]:
+    """Expand directories to the ``execution-environment*.yml`` files below them."""
+    files: List[Path] = []
+    for path in paths:
+        if Path(path).is_dir():
+            files.extend(sorted(p for p in Path(path).rglob('execution-environment*.yml')
+                                if not any(part.startswith('.') for part in p.relative_to(path).parts)))
+        else:
+            files.append(Path(path))
+    return files
+
+
+def dependency_text(ee_config: Dict[str, Any], section: str) -> Optional[str]:
+    """Return an inline dependencies.<section> block as text (None if absent)."""
+    value = (ee_config.get('dependencies') or {}).get(section)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return yaml.dump(value, default_flow_style=False)
+
+
+def _dependency_data(ee_config: Dict[str, Any], section: str, base_dir: Path) -> Any:
+    value = (ee_config.get('dependencies') or {}).get(section)
+    if isinstance(value, str) and '\n' not in value:
+        # ansible-builder と同じく1行の文字列はEEファイルからの相対パス
+        path = Path(value.strip())
+        return base_dir / path if not path.is_absolute() else path
+    return value
+
+
+def galaxy_requirements(ee_config: Dict[str, Any], base_dir: Path) -> Dict[str, Any]:
+    """Return dependencies.galaxy as a requirements.yml mapping (inline, list or file)."""
+    value = _dependency_data(ee_config, 'galaxy', Path(base_dir))
+    try:
+        if isinstance(value, Path):
+            value = load_yaml(value)
+        elif isinstance(value, str):
+            value = yaml.safe_load(value)
+        elif isinstance(value, list):
+            value = yaml.safe_load('\n'.join(str(line) for line in value))
+    except OSError as e:
+        raise EEBuilderError(f"Cannot read galaxy requirements {value}: {e}") from e
+    except yaml.YAMLError as e:
+        raise EEBuilderError(f"Invalid galaxy requirements YAML: {e}") from e
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise EEBuilderError("dependencies.galaxy must be a requirements.yml mapping")
+    return value
+
+
+def requirement_lines(ee_config: Dict[str, Any], section: str, base_dir: Path) -> List[str]:
+    """Return the lines of dependencies.python / dependencies.system (inline, list or file)."""
+    value = _dependency_data(ee_config, section, Path(base_dir))
+    if value is None:
+        return []
+    if isinstance(value, Path):
+        try:
+            return value.read_text(encoding='utf-8').splitlines()
+        except OSError as e:
+            raise EEBuilderError(f"Cannot read {section} requirements {value}: {e}") from e
+    if isinstance(value, list):
+        return [str(line) for line in value]
+    return str(value).splitlines()
+
+
+def dependency_files(ee_config: Dict[str, Any], base_dir: Path) -> List[Path]:
+    """Return the requirement files dependencies.galaxy/python/system point at (not inline blocks)."""
+    files = []
+    for section in ('galaxy', 'python', 'system'):
+        value = _dependency_data(ee_config, section, Path(base_dir))
+        if isinstance(value, Path):
+            files.append(value)
+    return files
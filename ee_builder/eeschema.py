@@ -0,0 +1,793 @@
+"""
+Offline Execution Environment validator
+
+Checks execution-environment.yml (version 3) files in milliseconds,
+without ansible-builder or network access. SCHEMA_V3 mirrors
+ansible-builder's JSON schema and is compiled once at import into a tree
+of rules that is walked over the YAML node tree, so every issue carries
+the line and column of the offending key or value.
+
+The dependency blocks are parsed as well: ``python`` as pip requirement
+lines (PEP 508), ``system`` as bindep lines and ``galaxy`` as a
+requirements.yml collection list. Like ansible-builder, a single-line
+string is a file reference relative to the EE file, a multi-line string
+or a list is inline content.
+"""
+
+import difflib
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ee_builder.yamlcache import SafeLoader
+
+Issue = Dict[str, Any]
+
+SUPPORTED_VERSION = 3
+OUTDATED_BASE_IMAGES = ('quay.io/ansible/ansible-runner:latest',)
+
+_STRING_OR_LIST = {'type': ['string', 'array'], 'items': {'type': 'string'}}
+
+
+def _steps() -> Dict[str, Any]:
+    return dict(_STRING_OR_LIST, content='build_steps')
+
+
+# ansible-builder 3.x の schema_v3 と同じキー構成（content は本モジュール独自の内容検査）
+SCHEMA_V3: Dict[str, Any] = {
+    'type': 'object',
+    'required': ['version'],
+    'properties': {
+        'version': {'type': ['integer', 'number'], 'content': 'version'},
+        'build_arg_defaults': {
+            'type': 'object',
+            'properties': {
+                'ANSIBLE_GALAXY_CLI_COLLECTION_OPTS': {'type': 'string'},
+                'ANSIBLE_GALAXY_CLI_ROLE_OPTS': {'type': 'string'},
+                'PKGMGR_PRESERVE_CACHE': {'type': 'string'},
+            },
+        },
+        'dependencies': {
+            'type': 'object',
+            'properties': {
+                'python': dict(_STRING_OR_LIST, content='python'),
+                'galaxy': {'type': ['object', 'string', 'array'], 'items': {'type': 'string'},
+                           'content': 'galaxy'},
+                'system': dict(_STRING_OR_LIST, content='system'),
+                'python_interpreter': {
+                    'type': 'object',
+                    'properties': {
+                        'package_system': {'type': 'string'},
+                        'python_path': {'type': 'string'},
+                    },
+                },
+                'ansible_core': {
+                    'type': 'object',
+                    'required': ['package_pip'],
+                    'properties': {'package_pip': {'type': 'string', 'content': 'requirement'}},
+                },
+                'ansible_runner': {
+                    'type': 'object',
+                    'required': ['package_pip'],
+                    'properties': {'package_pip': {'type': 'string', 'content': 'requirement'}},
+                },
+                'exclude': {
+                    'type': 'object',
+                    'properties': {
+                        'python': {'type': 'array', 'items': {'type': 'string'}},
+                        'system': {'type': 'array', 'items': {'type': 'string'}},
+                        'all_from_collections': {'type': 'array', 'items': {'type': 'string'}},
+                    },
+                },
+            },
+        },
+        'images': {
+            'type': 'object',
+            'properties': {
+                'base_image': {
+                    'type': 'object',
+                    'required': ['name'],
+                    'properties': {
+                        'name': {'type': 'string', 'content': 'image'},
+                        'signature_original_name': {'type': 'string'},
+                    },
+                },
+            },
+        },
+        'additional_build_steps': {
+            'type': 'object',
+            'properties': {
+                name: _steps() for name in (
+                    'prepend_base', 'append_base', 'prepend_galaxy', 'append_galaxy',
+                    'prepend_builder', 'append_builder', 'prepend_final', 'append_final')
+            },
+        },
+        'additional_build_files': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['src', 'dest'],
+                'properties': {
+                    'src': {'type': 'string'},
+                    'dest': {'type': 'string', 'content': 'build_file_dest'},
+                },
+            },
+        },
+        'options': {
+            'type': 'object',
+            'properties': {
+                'relax_passwd_permissions': {'type': 'boolean'},
+                'skip_ansible_check': {'type': 'boolean'},
+                'skip_pip_install': {'type': 'boolean'},
+                'workdir': {'type': ['string', 'null']},
+                'package_manager_path': {'type': 'string'},
+                'user': {'type': 'string'},
+                'container_init': {
+                    'type': 'object',
+                    'properties': {
+                        'package_pip': {'type': 'string', 'content': 'requirement'},
+                        'entrypoint': {'type': 'string'},
+                        'cmd': {'type': 'string'},
+                    },
+                },
+                'tags': {'type': 'array', 'items': {'type': 'string'}},
+            },
+        },
+    },
+}
+
+# version 1/2 のキーや、よくある書き間違いへの案内
+KEY_HINTS = {
+    'additional_build_steps.prepend': "version 1/2 key; use 'prepend_final' in version 3",
+    'additional_build_steps.append': "version 1/2 key; use 'append_final' in version 3",
+    'images.builder_image': "version 2 key; version 3 builds with the base image only",
+    'ansible_config': "version 1/2 key; copy the file with additional_build_files instead",
+    'options.build_outputs_dir': "not an EE option; pass --build-outputs-dir to ansible-builder",
+}
+
+_YAML_TYPES = {
+    'tag:yaml.org,2002:map': 'object',
+    'tag:yaml.org,2002:seq': 'array',
+    'tag:yaml.org,2002:str': 'string',
+    'tag:yaml.org,2002:bool': 'boolean',
+    'tag:yaml.org,2002:int': 'integer',
+    'tag:yaml.org,2002:float': 'number',
+    'tag:yaml.org,2002:null': 'null',
+}
+
+
+# === compiled schema ===
+class Rule:
+    """One compiled schema node."""
+
+    __slots__ = ('types', 'properties', 'required', 'items', 'content')
+
+    def __init__(self, types: frozenset, properties: Optional[Dict[str, 'Rule']],
+                 required: Tuple[str, ...], items: Optional['Rule'], content: Optional[str]):
+        self.types = types
+        self.properties = properties
+        self.required = required
+        self.items = items
+        self.content = content
+
+
+def compile_schema(schema: Dict[str, Any]) -> Rule:
+    """Compile a SCHEMA_V3-style dict into a Rule tree (objects are closed)."""
+    types = schema.get('type', [])
+    types = frozenset([types] if isinstance(types, str) else types)
+    if 'integer' in types:
+        types |= {'number'}
+    properties = None
+    if 'properties' in schema:
+        properties = {name: compile_schema(sub) for name, sub in schema['properties'].items()}
+    items = compile_schema(schema['items']) if 'items' in schema else None
+    return Rule(types, properties, tuple(schema.get('required', ())), items, schema.get('content'))
+
+
+RULES_V3 = compile_schema(SCHEMA_V3)
+
+
+def _node_type(node: yaml.Node) -> str:
+    kind = _YAML_TYPES.get(node.tag)
+    if kind:
+        return kind
+    if isinstance(node, yaml.MappingNode):
+        return 'object'
+    if isinstance(node, yaml.SequenceNode):
+        return 'array'
+    return 'string'
+
+
+# === requirement parsers ===
+_NAME = r'[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?'
+_REQUIREMENT = re.compile(
+    r'^(?P<name>' + _NAME + r')\s*'
+    r'(?:\[(?P<extras>[^\]]*)\])?\s*'
+    r'(?:@\s*(?P<url>\S+)\s*(?=;|$)|(?P<specifier>[^;@]*?))\s*'
+    r'(?:;\s*(?P<marker>.*?))?\s*$'
+)
+_VERSION_CLAUSE = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*(\S+)\s*$')
+_PEP440 = re.compile(
+    r'^v?(?:\d+!)?\d+(?:\.\d+)*'
+    r'(?:[-_.]?(?:a|b|c|rc|alpha|beta|pre|preview)[-_.]?\d*)?'
+    r'(?:-\d+|[-_.]?(?:post|rev|r)[-_.]?\d*)?'
+    r'(?:[-_.]?dev[-_.]?\d*)?'
+    r'(?:\+[a-z0-9]+(?:[-_.][a-z0-9]+)*)?$',
+    re.IGNORECASE,
+)
+_MARKER_VARIABLES = frozenset((
+    'python_version', 'python_full_version', 'os_name', 'sys_platform', 'platform_release',
+    'platform_system', 'platform_version', 'platform_machine', 'platform_python_implementation',
+    'implementation_name', 'implementation_version', 'extra',
+    'os.name', 'sys.platform', 'platform.version', 'platform.machine',
+    'platform.python_implementation', 'python_implementation',
+))
+_MARKER_TOKEN = re.compile(
+    r'\s*(?:(?P<string>\'[^\']*\'|"[^"]*")|(?P<op>===|==|!=|<=|>=|~=|<|>|not\s+in\b|in\b)'
+    r'|(?P<bool>and\b|or\b)|(?P<paren>[()])|(?P<var>[A-Za-z_][A-Za-z0-9_.]*))'
+)
+_PIP_OPTIONS = frozenset((
+    '-i', '--index-url', '--extra-index-url', '--no-index', '-f', '--find-links',
+    '--pre', '--prefer-binary', '--only-binary', '--no-binary', '--trusted-host',
+    '--require-hashes', '--use-feature',
+))
+_PIP_FILE_OPTIONS = frozenset(('-r', '--requirement', '-c', '--constraint'))
+_PIP_EDITABLE = frozenset(('-e', '--editable'))
+_DIRECT_REFERENCE = re.compile(r'^(?:(?:git|hg|svn|bzr)\+|https?://|file:|\.{0,2}/)')
+
+
+def canonical_name(name: str) -> str:
+    """PEP 503 normalised project name."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def parse_marker(marker: str) -> Tuple[Any, ...]:
+    """Parse a PEP 508 environment marker into a tree; raises ValueError.
+
+    Nodes are ``('or', [nodes])``, ``('and', [nodes])`` and
+    ``('compare', (kind, value), op, (kind, value))`` where kind is
+    ``var`` or ``string`` (string values keep their quotes).
+    """
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    while pos < len(marker):
+        if marker[pos:].strip() == '':
+            break
+        match = _MARKER_TOKEN.match(marker, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"invalid environment marker near '{marker[pos:].strip()}'")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'var' and value not in _MARKER_VARIABLES:
+            raise ValueError(f"unknown marker variable '{value}'")
+        if kind == 'op':
+            value = ' '.join(value.split())
+        tokens.append((kind, value))
+        pos = match.end()
+
+    # or := and ('or' and)* ; and := atom ('and' atom)* ; atom := '(' or ')' | value op value
+    index = 0
+
+    def expect_value() -> Tuple[str, str]:
+        nonlocal index
+        if index >= len(tokens) or tokens[index][0] not in ('var', 'string'):
+            raise ValueError("environment marker: expected a variable or quoted string")
+        index += 1
+        return tokens[index - 1]
+
+    def parse_atom() -> Tuple[Any, ...]:
+        nonlocal index
+        if index < len(tokens) and tokens[index] == ('paren', '('):
+            index += 1
+            node = parse_or()
+            if index >= len(tokens) or tokens[index] != ('paren', ')'):
+                raise ValueError("environment marker: unbalanced parentheses")
+            index += 1
+            return node
+        left = expect_value()
+        if index >= len(tokens) or tokens[index][0] != 'op':
+            raise ValueError("environment marker: expected a comparison operator")
+        op = tokens[index][1]
+        index += 1
+        return ('compare', left, op, expect_value())
+
+    def parse_chain(word: str, parse_item: Callable[[], Tuple[Any, ...]]) -> Tuple[Any, ...]:
+        nonlocal index
+        items = [parse_item()]
+        while index < len(tokens) and tokens[index] == ('bool', word):
+            index += 1
+            items.append(parse_item())
+        return items[0] if len(items) == 1 else (word, items)
+
+    def parse_and() -> Tuple[Any, ...]:
+        return parse_chain('and', parse_atom)
+
+    def parse_or() -> Tuple[Any, ...]:
+        return parse_chain('or', parse_and)
+
+    if not tokens:
+        raise ValueError("empty environment marker")
+    tree = parse_or()
+    if index != len(tokens):
+        raise ValueError(f"environment marker: unexpected '{tokens[index][1]}'")
+    return tree
+
+
+def parse_requirement(line: str) -> Dict[str, Any]:
+    """Parse one PEP 508 requirement; raises ValueError with a readable message."""
+    match = _REQUIREMENT.match(line.strip())
+    if not match:
+        raise ValueError(f"not a valid requirement: '{line.strip()}'")
+    extras = [e.strip() for e in (match.group('extras') or '').split(',') if e.strip()]
+    for extra in extras:
+        if not re.fullmatch(_NAME, extra):
+            raise ValueError(f"invalid extra '{extra}'")
+
+    specifier = (match.group('specifier') or '').strip()
+    if specifier.startswith('(') and specifier.endswith(')'):
+        specifier = specifier[1:-1].strip()
+    clauses = []
+    if specifier:
+        for clause in specifier.split(','):
+            clause_match = _VERSION_CLAUSE.match(clause)
+            if not clause_match:
+                raise ValueError(f"invalid version specifier '{clause.strip()}'")
+            op, version = clause_match.groups()
+            if op != '===':
+                wildcard = version.endswith('.*')
+                if wildcard and op not in ('==', '!='):
+                    raise ValueError(f"'{op}{version}': '.*' is only allowed with == and !=")
+                if not _PEP440.match(version[:-2] if wildcard else version):
+                    raise ValueError(f"invalid version '{version}'")
+                if op == '~=' and '.' not in version.split('+')[0]:
+                    raise ValueError(f"'~={version}' needs at least two release segments")
+            clauses.append(op + version)
+
+    marker = match.group('marker')
+    if marker is not None:
+        parse_marker(marker)
+    return {
+        'name': match.group('name'),
+        'extras': extras,
+        'specifier': ','.join(clauses),
+        'url': match.group('url'),
+        'marker': marker.strip() if marker else None,
+    }
+
+
+_BINDEP_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9+._-]*$')
+_BINDEP_PROFILE = re.compile(r'^!?[A-Za-z0-9_.+-]+(?::[A-Za-z0-9_.+-]+)*$')
+_BINDEP_VERSION = re.compile(r'^(?:<=|>=|==|!=|<|>)[A-Za-z0-9_.+:~-]+$')
+
+
+def parse_bindep(line: str) -> Dict[str, Any]:
+    """Parse one bindep line (``name [selectors] [version]``); raises ValueError."""
+    text = line.strip()
+    if text.count('[') != text.count(']') or text.count('[') > 1:
+        raise ValueError("unbalanced or repeated '[...]' selector list")
+    selectors: List[str] = []
+    start = text.find('[')
+    if start != -1:
+        end = text.index(']')
+        if end < start:
+            raise ValueError("unbalanced '[...]' selector list")
+        selectors = text[start + 1:end].split()
+        if not selectors:
+            raise ValueError("empty '[]' selector list")
+        for selector in selectors:
+            if not _BINDEP_PROFILE.match(selector):
+                raise ValueError(f"invalid selector '{selector}'")
+        text = (text[:start] + ' ' + text[end + 1:]).strip()
+    parts = text.split(None, 1)
+    if not parts:
+        raise ValueError("missing package name")
+    if not _BINDEP_NAME.match(parts[0]):
+        raise ValueError(f"invalid package name '{parts[0]}'")
+    versions: List[str] = []
+    if len(parts) > 1:
+        for clause in parts[1].replace(' ', '').split(','):
+            if not _BINDEP_VERSION.match(clause):
+                raise ValueError(f"invalid version constraint '{clause}'")
+            versions.append(clause)
+    return {'name': parts[0], 'selectors': selectors, 'version': ','.join(versions)}
+
+
+_COLLECTION_NAME = re.compile(r'^[a-z0-9][a-z0-9_]*\.[a-z0-9][a-z0-9_]*$')
+_COLLECTION_VERSION = re.compile(
+    r'^(?:==|!=|>=|<=|>|<|=)?\s*\d+(?:\.\d+){0,2}(?:-[0-9A-Za-z.-]+)?(?:\+[0-9A-Za-z.-]+)?$'
+)
+_COLLECTION_TYPES = ('galaxy', 'git', 'url', 'file', 'dir', 'subdirs')
+_COLLECTION_KEYS = ('name', 'version', 'source', 'type', 'signatures')
+_ROLE_KEYS = ('name', 'src', 'version', 'scm', 'source')
+
+_IMAGE_REFERENCE = re.compile(
+    r'^[a-z0-9]+(?:[._-][a-z0-9]+)*(?::\d+)?'
+    r'(?:/[a-z0-9]+(?:(?:[._]|__|-+)[a-z0-9]+)*)*'
+    r'(?::[A-Za-z0-9_][A-Za-z0-9_.-]{0,127})?'
+    r'(?:@sha256:[a-f0-9]{64})?$'
+)
+
+
+def check_collection_version(version: str) -> None:
+    """Validate an ansible-galaxy version range (``*``, ``1.2.3``, ``>=1.0.0,<2.0.0``)."""
+    if version.strip() == '*':
+        return
+    for clause in version.split(','):
+        if not _COLLECTION_VERSION.match(clause.strip()):
+            raise ValueError(f"invalid collection version '{clause.strip()}'")
+
+
+# === validation ===
+class _Validator:
+    """Collects issues for one file; line offsets map inline blocks back to the EE file."""
+
+    def __init__(self, path: str, base_dir: Optional[Path], source_lines: Sequence[str]):
+        self.path = path
+        self.base_dir = base_dir
+        self.source_lines = source_lines
+        self.issues: List[Issue] = []
+
+    def add(self, line: int, column: int, field: str, message: str, severity: str = 'error',
+            path: Optional[str] = None) -> None:
+        self.issues.append({
+            'path': path or self.path,
+            'line': line,
+            'column': column,
+            'severity': severity,
+            'field': field,
+            'message': message,
+        })
+
+    def add_at(self, node: yaml.Node, field: str, message: str, severity: str = 'error') -> None:
+        self.add(node.start_mark.line + 1, node.start_mark.column + 1, field, message, severity)
+
+    # --- schema walk ---
+    def walk(self, node: yaml.Node, rule: Rule, field: str) -> None:
+        kind = _node_type(node)
+        if kind == 'integer' and 'number' in rule.types:
+            kind = 'number'
+        if rule.types and kind not in rule.types:
+            expected = ' or '.join(sorted(rule.types - {'integer'}))
+            self.add_at(node, field or '<root>', f"expected {expected}, got {kind}")
+            return
+
+        if kind == 'object' and rule.properties is not None:
+            seen: Dict[str, yaml.Node] = {}
+            for key_node, value_node in node.value:
+                key = str(key_node.value)
+                child = f"{field}.{key}" if field else key
+                if key in seen:
+                    self.add_at(key_node, child,
+                                f"duplicate key (first defined on line {seen[key].start_mark.line + 1})")
+                    continue
+                seen[key] = key_node
+                sub = rule.properties.get(key)
+                if sub is None:
+                    self.add_at(key_node, child, self._unknown_key_message(child, key, rule))
+                    continue
+                self.walk(value_node, sub, child)
+            for name in rule.required:
+                if name not in seen:
+                    self.add_at(node, field or '<root>', f"missing required key '{name}'")
+        elif kind == 'array' and rule.items is not None:
+            for index, item in enumerate(node.value):
+                self.walk(item, rule.items, f"{field}[{index}]")
+
+        if rule.content:
+            getattr(self, f"check_{rule.content}")(node, field)
+
+    @staticmethod
+    def _unknown_key_message(field: str, key: str, rule: Rule) -> str:
+        hint = KEY_HINTS.get(field)
+        if hint:
+            return f"unknown key '{key}' ({hint})"
+        close = difflib.get_close_matches(key, list(rule.properties or ()), n=1)
+        if close:
+            return f"unknown key '{key}' (did you mean '{close[0]}'?)"
+        return f"unknown key '{key}'"
+
+    # --- inline text helpers ---
+    def _inline_lines(self, node: yaml.Node) -> List[Tuple[int, int, str]]:
+        """(line, column, text) for each line of a string node or each item of a list node."""
+        if isinstance(node, yaml.SequenceNode):
+            return [(item.start_mark.line + 1, item.start_mark.column + 1, str(item.value))
+                    for item in node.value if isinstance(item, yaml.ScalarNode)]
+        text = str(node.value)
+        if node.style in ('|', '>'):
+            # ブロックスカラーは "|" の次の行から始まる
+            first = node.start_mark.line + 2
+        else:
+            first = node.start_mark.line + 1
+        result = []
+        for offset, line in enumerate(text.splitlines()):
+            number = first + offset
+            column = node.start_mark.column + 1
+            stripped = line.strip()
+            if stripped and number - 1 < len(self.source_lines):
+                found = self.source_lines[number - 1].find(stripped)
+                if found != -1:
+                    column = found + 1
+            result.append((number, column, line))
+        return result
+
+    def _reference(self, node: yaml.Node, field: str) -> Optional[Tuple[str, List[str]]]:
+        """Resolve a single-line string dependency as a file next to the EE file."""
+        if not isinstance(node, yaml.ScalarNode) or '\n' in str(node.value):
+            return None
+        name = str(node.value).strip()
+        path = Path(name)
+        if not path.is_absolute() and self.base_dir is not None:
+            path = self.base_dir / path
+        try:
+            text = path.read_text(encoding='utf-8')
+        except OSError as e:
+            self.add_at(node, field, f"dependency file '{name}' cannot be read: {e.strerror or e}")
+            return '', []
+        return str(path), text.splitlines()
+
+    def _line_source(self, node: yaml.Node, field: str) -> Optional[Tuple[str, List[Tuple[int, int, str]]]]:
+        reference = self._reference(node, field)
+        if reference is None:
+            return self.path, self._inline_lines(node)
+        path, lines = reference
+        return path, [(index + 1, 1, line) for index, line in enumerate(lines)]
+
+    # --- content checks ---
+    def check_version(self, node: yaml.Node, field: str) -> None:
+        try:
+            version = int(float(node.value))
+        except (TypeError, ValueError):
+            return
+        if version != SUPPORTED_VERSION:
+            self.add_at(node, field, f"unsupported EE version {node.value} (expected {SUPPORTED_VERSION})")
+
+    def check_image(self, node: yaml.Node, field: str) -> None:
+        name = str(node.value)
+        if not _IMAGE_REFERENCE.match(name):
+            self.add_at(node, field, f"invalid image reference '{name}'")
+        elif name in OUTDATED_BASE_IMAGES:
+            self.add_at(node, field, f"outdated base image '{name}' may break the build", 'warning')
+
+    def check_requirement(self, node: yaml.Node, field: str) -> None:
+        try:
+            parse_requirement(str(node.value))
+        except ValueError as e:
+            self.add_at(node, field, str(e))
+
+    def check_build_file_dest(self, node: yaml.Node, field: str) -> None:
+        dest = Path(str(node.value))
+        if dest.is_absolute() or '..' in dest.parts:
+            self.add_at(node, field, "'dest' must be relative and must not contain '..'")
+
+    def check_build_steps(self, node: yaml.Node, field: str) -> None:
+        for line, column, text in self._inline_lines(node):
+            if text.strip().startswith('USER '):
+                self.add(line, column, field,
+                         "USER directive may break the build; set options.user instead", 'warning')
+
+    def check_python(self, node: yaml.Node, field: str) -> None:
+        path, lines = self._line_source(node, field)
+        seen: Dict[str, int] = {}
+        pending = ''
+        for line, column, raw in lines:
+            text = re.sub(r'(^|\s)#.*$', '', raw).strip()
+            if pending:
+                text = pending + ' ' + text
+                pending = ''
+            if text.endswith('\\'):
+                pending = text[:-1].strip()
+                continue
+            if not text:
+                continue
+            if text.startswith('-'):
+                option = re.split(r'[\s=]', text, 1)[0]
+                if option in _PIP_FILE_OPTIONS:
+                    self.add(line, column, field,
+                             f"'{option}' references a file that is not copied into the build context",
+                             'warning', path)
+                elif option not in _PIP_OPTIONS and option not in _PIP_EDITABLE:
+                    self.add(line, column, field, f"unknown pip option '{option}'", path=path)
+                continue
+            if _DIRECT_REFERENCE.match(text):
+                continue
+            text = re.split(r'\s--hash[=\s]', text, 1)[0]
+            try:
+                requirement = parse_requirement(text)
+            except ValueError as e:
+                self.add(line, column, field, str(e), path=path)
+                continue
+            if requirement['marker']:
+                # マーカー違いで同名パッケージを並べるのは正当な書き方
+                continue
+            name = canonical_name(requirement['name'])
+            if name in seen:
+                self.add(line, column, field,
+                         f"'{requirement['name']}' is already listed on line {seen[name]}", 'warning', path)
+            else:
+                seen[name] = line
+
+    def check_system(self, node: yaml.Node, field: str) -> None:
+        path, lines = self._line_source(node, field)
+        for line, column, raw in lines:
+            text = raw.split('#', 1)[0].strip()
+            if not text:
+                continue
+            try:
+                parse_bindep(text)
+            except ValueError as e:
+                self.add(line, column, field, str(e), path=path)
+
+    def check_galaxy(self, node: yaml.Node, field: str) -> None:
+        if isinstance(node, yaml.MappingNode):
+            self._check_galaxy_root(node, field, self.path, 0, 0)
+            return
+        if isinstance(node, yaml.SequenceNode):
+            self.add_at(node, field, "expected a requirements.yml mapping or file name, got a list")
+            return
+        reference = self._reference(node, field)
+        if reference is None:
+            path, text = self.path, str(node.value)
+            line_offset = node.start_mark.line + (1 if node.style in ('|', '>') else 0)
+            column_offset = 0
+            for number, column, content in self._inline_lines(node):
+                if content.strip():
+                    column_offset = column - 1 - (len(content) - len(content.lstrip()))
+                    break
+        else:
+            path, lines = reference
+            if not path:
+                return
+            text, line_offset, column_offset = '\n'.join(lines), 0, 0
+        try:
+            root = yaml.compose(text, Loader=SafeLoader)
+        except yaml.YAMLError as e:
+            mark = getattr(e, 'problem_mark', None)
+            line = (mark.line if mark else 0) + line_offset + 1
+            column = (mark.column if mark else 0) + column_offset + 1
+            problem = getattr(e, 'problem', None) or str(e)
+            self.add(line, column, field, f"invalid galaxy requirements YAML: {problem}", path=path)
+            return
+        if root is None:
+            self.add(line_offset + 1, column_offset + 1, field, "empty galaxy requirements", path=path)
+            return
+        self._check_galaxy_root(root, field, path, line_offset, column_offset)
+
+    def _check_galaxy_root(self, root: yaml.Node, field: str, path: str,
+                           line_offset: int, column_offset: int) -> None:
+        def add(node: yaml.Node, message: str, severity: str = 'error') -> None:
+            self.add(node.start_mark.line + line_offset + 1, node.start_mark.column + column_offset + 1,
+                     field, message, severity, path)
+
+        if not isinstance(root, yaml.MappingNode):
+            add(root, "galaxy requirements must be a mapping with 'collections' and/or 'roles'")
+            return
+        for key_node, value_node in root.value:
+            key = str(key_node.value)
+            if key not in ('collections', 'roles'):
+                add(key_node, f"unknown galaxy requirements key '{key}'")
+            elif not isinstance(value_node, yaml.SequenceNode):
+                if _node_type(value_node) != 'null':
+                    add(value_node, f"'{key}' must be a list")
+            elif key == 'collections':
+                self._check_collections(value_node, add, line_offset)
+            else:
+                self._check_roles(value_node, add)
+
+    def _check_collections(self, node: yaml.SequenceNode, add: Callable[..., None],
+                           line_offset: int) -> None:
+        seen: Dict[str, int] = {}
+        for item in node.value:
+            fields: Dict[str, yaml.Node] = {}
+            if isinstance(item, yaml.ScalarNode):
+                if _DIRECT_REFERENCE.match(str(item.value)):
+                    continue
+                name, _, version = str(item.value).partition(':')
+                name_node = version_node = item
+                if version:
+                    try:
+                        check_collection_version(version)
+                    except ValueError as e:
+                        add(item, str(e))
+                kind = 'galaxy'
+            elif isinstance(item, yaml.MappingNode):
+                for key_node, value_node in item.value:
+                    key = str(key_node.value)
+                    if key not in _COLLECTION_KEYS:
+                        add(key_node, f"unknown collection key '{key}'")
+                    fields[key] = value_node
+                if 'name' not in fields:
+                    add(item, "collection entry is missing 'name'")
+                    continue
+                name_node = fields['name']
+                name = str(name_node.value)
+                kind = str(fields['type'].value) if 'type' in fields else 'galaxy'
+                if kind not in _COLLECTION_TYPES:
+                    add(fields['type'], f"invalid collection type '{kind}' (one of: {', '.join(_COLLECTION_TYPES)})")
+                version_node = fields.get('version')
+                if version_node is not None and kind == 'galaxy':
+                    version_type = _node_type(version_node)
+                    if version_type in ('integer', 'number'):
+                        add(version_node, f"version {version_node.value} is parsed as a number; quote it",
+                            'warning')
+                    elif version_type == 'string':
+                        try:
+                            check_collection_version(str(version_node.value))
+                        except ValueError as e:
+                            add(version_node, str(e))
+                    else:
+                        add(version_node, f"version must be a string, got {version_type}")
+            else:
+                add(item, "collection entry must be a name or a mapping")
+                continue
+
+            if kind == 'galaxy':
+                if not _COLLECTION_NAME.match(name):
+                    add(name_node, f"invalid collection name '{name}' (expected namespace.collection)")
+                    continue
+                if name in seen:
+                    add(name_node, f"collection '{name}' is already listed on line {seen[name]}", 'warning')
+                else:
+                    seen[name] = name_node.start_mark.line + line_offset + 1
+
+    def _check_roles(self, node: yaml.SequenceNode, add: Callable[..., None]) -> None:
+        for item in node.value:
+            if isinstance(item, yaml.ScalarNode):
+                continue
+            if not isinstance(item, yaml.MappingNode):
+                add(item, "role entry must be a name or a mapping")
+                continue
+            keys = [str(key_node.value) for key_node, _ in item.value]
+            for key_node, _ in item.value:
+                if str(key_node.value) not in _ROLE_KEYS:
+                    add(key_node, f"unknown role key '{key_node.value}'")
+            if 'name' not in keys and 'src' not in keys:
+                add(item, "role entry needs 'name' or 'src'")
+
+
+def _sort_issues(issues: List[Issue]) -> List[Issue]:
+    return [issue for _, issue in sorted(
+        ((str(issue['path']), issue['line'], issue['column'], index), issue)
+        for index, issue in enumerate(issues))]
+
+
+def validate_text(text: str, path: str = '<string>', base_dir: Optional[Path] = None) -> List[Issue]:
+    """Validate EE definition text; referenced files are resolved against ``base_dir``."""
+    validator = _Validator(path, base_dir, text.splitlines())
+    try:
+        root = yaml.compose(text, Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        mark = getattr(e, 'problem_mark', None)
+        problem = getattr(e, 'problem', None) or str(e)
+        validator.add((mark.line + 1) if mark else 1, (mark.column + 1) if mark else 1,
+                      '<root>', f"invalid YAML: {problem}")
+        return validator.issues
+    if root is None:
+        validator.add(1, 1, '<root>', "empty EE definition")
+        return validator.issues
+    validator.walk(root, RULES_V3, '')
+    return _sort_issues(validator.issues)
+
+
+def validate_ee_file(path: Path) -> List[Issue]:
+    """Validate one EE file; an unreadable file is reported as an issue."""
+    path = Path(path)
+    try:
+        text = path.read_text(encoding='utf-8')
+    except (OSError, UnicodeDecodeError) as e:
+        return [{'path': str(path), 'line': 0, 'column': 0, 'severity': 'error',
+                 'field': '<file>', 'message': f"cannot read file: {e}"}]
+    return validate_text(text, str(path), path.parent)
+
+
+def validate_files(paths: Sequence[Path]) -> List[Issue]:
+    """Validate many EE files in this process, sharing the compiled schema."""
+    issues: List[Issue] = []
+    for path in paths:
+        issues.extend(validate_ee_file(path))
+    return issues
+
+
+def has_errors(issues: Sequence[Issue]) -> bool:
+    return any(issue['severity'] == 'error' for issue in issues)
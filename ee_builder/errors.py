@@ -0,0 +1,7 @@
+"""
+Exception types shared by the ee_builder modules.
+"""
+
+
+class EEBuilderError(Exception):
+    """Base error raised by ee_builder; the CLI reports it and exits with 1."""
@@ -0,0 +1,274 @@
+"""
+Subprocess execution with streaming output and time budgets
+
+run() starts a command without a shell, in its own process group, and
+reads stdout and stderr line by line as they arrive, handing each line to
+sinks (log files, a progress reporter, the telemetry sub-stage tracker).
+Only the last ``tail_lines`` lines of each stream are kept, so a long build
+log does not accumulate in memory.
+
+Time limits are Budgets: a test suite or build owns one, and every command
+runs under a child budget that ends at the earlier of its own timeout and
+its parents' deadlines. When the budget runs out the whole process group
+gets SIGTERM, then SIGKILL after a grace period, so grandchildren (a build
+spawned by make, a container spawned by ansible-navigator) go too. The
+same happens when run() itself is interrupted (a sink raises,
+KeyboardInterrupt), so no detached command outlives its caller.
+"""
+
+import os
+import selectors
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import IO, Any, Callable, Dict, Optional, Sequence, Union
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.profiling import span
+
+TAIL_LINES = 1000
+# 改行のない出力でメモリを使い切らないよう、この長さで行を区切る
+MAX_LINE_BYTES = 64 * 1024
+KILL_GRACE = 5.0
+POLL_INTERVAL = 0.5
+
+Sink = Callable[[str, str], None]
+
+
+class ExecutionError(EEBuilderError):
+    """Raised when a command cannot be started or a budget setting is invalid."""
+
+
+class Budget:
+    """A deadline that also ends when any parent budget ends."""
+
+    def __init__(self, seconds: Optional[float] = None, name: str = '', parent: Optional['Budget'] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.seconds = seconds
+        self.parent = parent
+        self.clock = clock
+        self.deadline = None if seconds is None else clock() + seconds
+
+    def child(self, seconds: Optional[float] = None, name: str = '') -> 'Budget':
+        return Budget(seconds, name, self, self.clock)
+
+    def limiting(self) -> Optional['Budget']:
+        """The budget in this chain with the earliest deadline (None when unlimited)."""
+        budget: Optional[Budget] = self
+        found = None
+        while budget is not None:
+            if budget.deadline is not None and (found is None or budget.deadline < found.deadline):
+                found = budget
+            budget = budget.parent
+        return found
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None when no budget in the chain has a deadline."""
+        budget = self.limiting()
+        if budget is None:
+            return None
+        return max(0.0, budget.deadline - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def describe(self) -> str:
+        budget = self.limiting()
+        if budget is None:
+            return 'no budget'
+        return f"{budget.name or 'command'} budget of {budget.seconds:g}s"
+
+
+def budget_from_env(variable: str, name: str, default: Optional[float] = None) -> Budget:
+    """A top-level budget whose length (seconds) may be set in ``variable``."""
+    value = os.environ.get(variable)
+    if not value:
+        return Budget(default, name)
+    try:
+        return Budget(float(value), name)
+    except ValueError as e:
+        raise ExecutionError(f"Invalid {variable}: {value} (expected seconds)") from e
+
+
+# === sinks ===
+def log_sink(handle: IO[str], prefix_streams: bool = False) -> Sink:
+    """Write every line to an open text file."""
+    def sink(stream: str, line: str) -> None:
+        handle.write(f'[{stream}] {line}' if prefix_streams else line)
+    return sink
+
+
+def tracker_sink(tracker: Any) -> Sink:
+    """Feed lines to a telemetry.SubstageTracker (podman/buildah print steps on either stream)."""
+    def sink(stream: str, line: str) -> None:
+        tracker.feed(line)
+    return sink
+
+
+class ProgressSink:
+    """Print a line count, the elapsed time and the latest line at most every ``interval`` seconds."""
+
+    def __init__(self, label: str, interval: float = 10.0, out: Optional[IO[str]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.label = label
+        self.interval = interval
+        self.out = out
+        self.clock = clock
+        self.start = clock()
+        self.last_report = self.start
+        self.lines = 0
+
+    def __call__(self, stream: str, line: str) -> None:
+        self.lines += 1
+        now = self.clock()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        latest = line.strip()
+        if len(latest) > 100:
+            latest = latest[:97] + '...'
+        print(f"  ... {self.label}: {self.lines} lines, {now - self.start:.0f}s: {latest}",
+              file=self.out or sys.stdout, flush=True)
+
+
+# === run ===
+def _kill_group(process: subprocess.Popen, grace: float) -> None:
+    """SIGTERM the process group, then SIGKILL whatever is left after ``grace`` seconds."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if sig == signal.SIGTERM:
+            try:
+                process.wait(timeout=grace)
+            except subprocess.TimeoutExpired:
+                pass
+    process.wait()
+
+
+def _feed_stdin(pipe: IO[bytes], data: bytes) -> None:
+    try:
+        pipe.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def run(command: Union[str, Sequence[Any]], cwd: Optional[Any] = None, env: Optional[Dict[str, str]] = None,
+        budget: Optional[Budget] = None, timeout: Optional[float] = None, sinks: Sequence[Sink] = (),
+        stdin_text: Optional[str] = None, tail_lines: int = TAIL_LINES,
+        kill_grace: float = KILL_GRACE) -> Dict[str, Any]:
+    """Run a command without a shell, streaming its output to ``sinks``.
+
+    A string command is split with shlex (quotes work; pipes, globs and
+    ``$VAR`` do not). ``timeout`` starts a child of ``budget``. Returns
+    ``{argv, returncode, stdout, stderr, lines, truncated, seconds,
+    timed_out, error}`` where stdout/stderr hold the last ``tail_lines``
+    lines and ``error`` explains a timeout. Raises ExecutionError when
+    the command cannot be started.
+    """
+    argv = shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
+    if not argv:
+        raise ExecutionError("Empty command")
+    budget = (budget or Budget()).child(timeout, 'command') if timeout is not None else (budget or Budget())
+    tails: Dict[str, deque] = {'stdout': deque(maxlen=tail_lines), 'stderr': deque(maxlen=tail_lines)}
+    lines = {'stdout': 0, 'stderr': 0}
+    result = {'argv': argv, 'returncode': None, 'stdout': '', 'stderr': '', 'lines': lines,
+              'truncated': False, 'seconds': 0.0, 'timed_out': False, 'error': None}
+
+    def emit(stream: str, data: bytes) -> None:
+        line = data.decode('utf-8', 'replace')
+        lines[stream] += 1
+        tails[stream].append(line)
+        for sink in sinks:
+            sink(stream, line)
+
+    if budget.expired:
+        result['timed_out'] = True
+        result['error'] = f"Not started: {budget.describe()} exhausted"
+        return result
+
+    start = time.monotonic()
+    with span('subprocess', os.path.basename(argv[0])):
+        try:
+            process = subprocess.Popen(
+                argv, cwd=None if cwd is None else str(cwd), env=env,
+                stdin=subprocess.DEVNULL if stdin_text is None else subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True
+            )
+        except OSError as e:
+            raise ExecutionError(f"Cannot run {argv[0]}: {e.strerror or e}") from e
+
+        if stdin_text is not None:
+            threading.Thread(target=_feed_stdin, args=(process.stdin, stdin_text.encode('utf-8')),
+                             daemon=True).start()
+
+        pending = {'stdout': bytearray(), 'stderr': bytearray()}
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+        drained = False
+        try:
+            while selector.get_map():
+                remaining = budget.remaining()
+                if remaining == 0.0:
+                    result['timed_out'] = True
+                    break
+                wait = POLL_INTERVAL if remaining is None else min(POLL_INTERVAL, remaining)
+                for key, _ in selector.select(wait):
+                    stream = key.data
+                    data = os.read(key.fd, 65536)
+                    buffer = pending[stream]
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        if buffer:
+                            emit(stream, bytes(buffer))
+                            buffer.clear()
+                        continue
+                    buffer += data
+                    while True:
+                        end = buffer.find(b'\n')
+                        if end < 0 and len(buffer) < MAX_LINE_BYTES:
+                            break
+                        size = end + 1 if 0 <= end < MAX_LINE_BYTES else MAX_LINE_BYTES
+                        emit(stream, bytes(buffer[:size]))
+                        del buffer[:size]
+            drained = not result['timed_out']
+        finally:
+            selector.close()
+            # 予算切れに加え、シンクの例外・KeyboardInterrupt・読み込みエラーで抜けた場合もプロセスグループを残さない
+            if not drained:
+                _kill_group(process, kill_grace)
+            process.stdout.close()
+            process.stderr.close()
+
+        if not result['timed_out']:
+            # 出力を閉じた後に終了しないプロセスも予算で打ち切る
+            try:
+                process.wait(timeout=budget.remaining())
+            except subprocess.TimeoutExpired:
+                result['timed_out'] = True
+                _kill_group(process, kill_grace)
+            except BaseException:
+                _kill_group(process, kill_grace)
+                raise
+
+    result['returncode'] = process.returncode
+    result['seconds'] = time.monotonic() - start
+    result['stdout'] = ''.join(tails['stdout'])
+    result['stderr'] = ''.join(tails['stderr'])
+    result['truncated'] = any(lines[stream] > len(tails[stream]) for stream in tails)
+    if result['timed_out']:
+        result['error'] = f"Command timed out after {result['seconds']:.1f}s ({budget.describe()} exhausted)"
+    return result
@@ -0,0 +1,557 @@
+"""
+Galaxy / Automation Hub metadata prefetcher
+
+Before a build, answers two questions for the whole dependencies.galaxy
+block: which versions the ranges (``community.general >=8.0.0`` and so on)
+would resolve to on the configured servers right now, and whether every
+server can be reached with its token.
+
+- Servers come from ansible.cfg (``[galaxy] server_list`` and
+  ``[galaxy_server.<name>]`` url / auth_url / token / validate_certs), with
+  the ANSIBLE_GALAXY_SERVER_<NAME>_<KEY> environment overrides that
+  ansible-galaxy honours. A server with ``auth_url`` exchanges its offline
+  token at the SSO endpoint for a bearer token (through the credential
+  broker's disk cache when one is given).
+- Metadata is fetched from the Galaxy v3 API concurrently with asyncio,
+  over at most ``connections`` HTTP/1.1 keep-alive connections per host
+  (standard library only).
+- GET responses are cached on disk with their ETag and revalidated with
+  If-None-Match, so an unchanged collection costs a 304 per request.
+
+The fetched versions form an index snapshot in the format galaxylock
+reads, so ``lock --index`` can pin against what the servers offer.
+"""
+
+import asyncio
+import configparser
+import hashlib
+import json
+import os
+import re
+import ssl
+import tempfile
+import urllib.parse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ee_builder.credentials import SSO_CLIENT_ID, CredentialBroker, CredentialError
+from ee_builder.eefile import galaxy_requirements
+from ee_builder.errors import EEBuilderError
+from ee_builder.galaxylock import Index, collection_requirements, matches, resolve, version_key
+from ee_builder.lockfile import LockError
+from ee_builder.profiling import span
+
+DEFAULT_SERVER = 'https://galaxy.ansible.com/'
+CONNECTIONS = 4
+MAX_VERSIONS = 10
+PAGE_SIZE = 100
+REQUEST_TIMEOUT = 30
+MAX_REDIRECTS = 5
+USER_AGENT = 'ee-builder'
+
+_UNSET_VARIABLE = re.compile(r'\$(\{\w+\}|\w+)')
+
+
+class GalaxyAPIError(EEBuilderError):
+    """Raised when a Galaxy server cannot be reached or answers with an error."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+# === configuration ===
+def find_ansible_cfg(project_dir: Path = Path('.')) -> Optional[Path]:
+    """Locate ansible.cfg the way ansible does (ANSIBLE_CONFIG, ./, ~/, /etc/ansible/)."""
+    candidates = [os.environ.get('ANSIBLE_CONFIG'), Path(project_dir) / 'ansible.cfg',
+                  Path.home() / '.ansible.cfg', '/etc/ansible/ansible.cfg']
+    for candidate in candidates:
+        if candidate and Path(candidate).is_file():
+            return Path(candidate)
+    return None
+
+
+def _setting(section: Any, server: str, option: str) -> Optional[str]:
+    value = os.environ.get(f"ANSIBLE_GALAXY_SERVER_{server.upper()}_{option.upper()}")
+    if value is None:
+        value = section.get(option)
+    if value is None:
+        return None
+    value = os.path.expandvars(str(value).strip())
+    # 未設定の環境変数を参照している値（token = ${VAR} など）は未指定として扱う
+    return None if not value or _UNSET_VARIABLE.search(value) else value
+
+
+def galaxy_servers(config_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Return the configured Galaxy servers in priority order."""
+    parser = configparser.ConfigParser(interpolation=None)
+    if config_path is not None:
+        try:
+            parser.read(config_path, encoding='utf-8')
+        except (OSError, configparser.Error) as e:
+            raise GalaxyAPIError(f"Cannot read {config_path}: {e}") from e
+
+    server_list = os.environ.get('ANSIBLE_GALAXY_SERVER_LIST') or parser.get('galaxy', 'server_list', fallback='')
+    names = [name.strip() for name in server_list.split(',') if name.strip()]
+    if not names:
+        return [{'name': 'galaxy', 'url': DEFAULT_SERVER, 'auth_url': None, 'token': None, 'validate_certs': True}]
+
+    servers = []
+    for name in names:
+        section_name = f'galaxy_server.{name}'
+        section = parser[section_name] if parser.has_section(section_name) else {}
+        url = _setting(section, name, 'url')
+        if not url:
+            raise GalaxyAPIError(f"{config_path or 'ansible.cfg'}: galaxy server '{name}' has no url")
+        validate = (_setting(section, name, 'validate_certs') or 'true').lower()
+        servers.append({
+            'name': name,
+            'url': url if url.endswith('/') else url + '/',
+            'auth_url': _setting(section, name, 'auth_url'),
+            'token': _setting(section, name, 'token'),
+            'validate_certs': validate not in ('false', 'no', 'off', '0'),
+        })
+    return servers
+
+
+def galaxy_cache_dir() -> Path:
+    configured = os.environ.get('EE_GALAXY_CACHE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'galaxy'
+
+
+# === HTTP ===
+async def _read_response(reader: asyncio.StreamReader, method: str) -> Tuple[int, Dict[str, str], bytes]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('connection closed by the server')
+    try:
+        status = int(status_line.split(b' ', 2)[1])
+    except (IndexError, ValueError) as e:
+        raise ConnectionResetError(f'invalid status line {status_line[:80]!r}') from e
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if method == 'HEAD' or status in (204, 304) or status < 200:
+        return status, headers, b''
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return status, headers, b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    if 'content-length' in headers:
+        return status, headers, await reader.readexactly(int(headers['content-length']))
+    # 長さ不明の応答は接続の終わりまでが本文で、接続は再利用できない
+    headers['connection'] = 'close'
+    return status, headers, await reader.read()
+
+
+def _origin(url: str) -> Tuple[str, str, int]:
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme, parts.hostname or '', parts.port or (443 if parts.scheme == 'https' else 80)
+
+
+class ConnectionPool:
+    """HTTP/1.1 client keeping up to ``size`` keep-alive connections per host."""
+
+    def __init__(self, size: int = CONNECTIONS, timeout: float = REQUEST_TIMEOUT):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.stats = {'connections': 0, 'requests': 0}
+        self._idle: Dict[Tuple[Any, ...], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._slots: Dict[Tuple[Any, ...], asyncio.Semaphore] = {}
+
+    async def _connect(self, origin: Tuple[Any, ...]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        scheme, host, port, verify = origin
+        context = None
+        if scheme == 'https':
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+        try:
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=context, server_hostname=host if context else None),
+                self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise GalaxyAPIError(f"Cannot connect to {host}:{port}: {e or 'timed out'}") from e
+        self.stats['connections'] += 1
+        return connection
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                      body: Optional[bytes] = None, verify: bool = True) -> Tuple[int, Dict[str, str], bytes]:
+        """Send one request on a pooled connection and return (status, headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise GalaxyAPIError(f"Unsupported URL: {url}")
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), verify)
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {parts.netloc}', f'User-Agent: {USER_AGENT}',
+                 'Accept: application/json', 'Accept-Encoding: identity', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        raw = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+        slot = self._slots.setdefault(origin, asyncio.Semaphore(self.size))
+        async with slot:
+            for attempt in (1, 2):
+                idle = self._idle.setdefault(origin, [])
+                reused = bool(idle)
+                reader, writer = idle.pop() if reused else await self._connect(origin)
+                try:
+                    writer.write(raw)
+                    await writer.drain()
+                    status, response_headers, content = await asyncio.wait_for(
+                        _read_response(reader, method), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    # 待機中の接続はサーバー側で閉じられていることがあるので、新しい接続で一度だけやり直す
+                    if reused and attempt == 1:
+                        continue
+                    raise GalaxyAPIError(f"{method} {url}: {e or type(e).__name__}") from e
+                except asyncio.TimeoutError as e:
+                    writer.close()
+                    raise GalaxyAPIError(f"{method} {url}: timed out after {self.timeout}s") from e
+                self.stats['requests'] += 1
+                if response_headers.get('connection', '').lower() == 'close':
+                    writer.close()
+                else:
+                    idle.append((reader, writer))
+                return status, response_headers, content
+        raise GalaxyAPIError(f"{method} {url}: connection lost")  # pragma: no cover
+
+    async def close(self) -> None:
+        writers = [writer for connections in self._idle.values() for _, writer in connections]
+        self._idle.clear()
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+
+class ResponseCache:
+    """JSON responses on disk, keyed by URL and revalidated with their ETag."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, url: str) -> Path:
+        return self.directory / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry = json.loads(self._path(url).read_text())
+        except (OSError, ValueError):
+            return None
+        return entry if isinstance(entry, dict) and entry.get('url') == url and entry.get('etag') else None
+
+    def put(self, url: str, etag: str, data: Any) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'url': url, 'etag': etag, 'data': data}, f)
+            os.replace(tmp, self._path(url))
+        except OSError:
+            pass  # キャッシュは最適化にすぎないので書けなくても続行する
+
+
+# === Galaxy v3 API ===
+class GalaxyClient:
+    """Collection metadata from one Galaxy / Automation Hub server."""
+
+    def __init__(self, server: Dict[str, Any], pool: ConnectionPool, cache: Optional[ResponseCache] = None,
+                 broker: Optional[CredentialBroker] = None):
+        self.server = server
+        self.name = server['name']
+        self.pool = pool
+        self.cache = cache
+        self.broker = broker
+        self.stats = {'revalidated': 0, 'exchanges': 0}
+        self._authorization: Optional[str] = None
+        self._root: Optional[str] = None
+        self._auth_lock = asyncio.Lock()
+        self._root_lock = asyncio.Lock()
+
+    async def authorization(self) -> Optional[str]:
+        """Return the Authorization header, exchanging an offline token at auth_url once.
+
+        With a credential broker the access token comes from its disk cache
+        (shared with other processes); otherwise it is exchanged once per client.
+        """
+        token, auth_url = self.server.get('token'), self.server.get('auth_url')
+        if not token:
+            return None
+        if not auth_url:
+            return f'Token {token}'
+        async with self._auth_lock:
+            if self._authorization is None and self.broker is not None:
+                loop = asyncio.get_running_loop()
+                try:
+                    access = await loop.run_in_executor(None, self.broker.sso_token, auth_url, token, SSO_CLIENT_ID,
+                                                        self.server.get('validate_certs', True))
+                except CredentialError as e:
+                    raise GalaxyAPIError(f"{self.name}: {e}; "
+                                         f"check ANSIBLE_GALAXY_SERVER_{self.name.upper()}_TOKEN") from e
+                self._authorization = f'Bearer {access}'
+            if self._authorization is None:
+                form = urllib.parse.urlencode({'grant_type': 'refresh_token', 'client_id': SSO_CLIENT_ID,
+                                               'refresh_token': token}).encode('ascii')
+                status, _, body = await self.pool.request(
+                    'POST', auth_url, {'Content-Type': 'application/x-www-form-urlencoded'}, form,
+                    self.server.get('validate_certs', True))
+                self.stats['exchanges'] += 1
+                try:
+                    access = json.loads(body)['access_token'] if status == 200 else None
+                except (ValueError, KeyError, TypeError):
+                    access = None
+                if not access:
+                    raise GalaxyAPIError(f"{self.name}: token exchange at {auth_url} failed (HTTP {status}); "
+                                         f"check ANSIBLE_GALAXY_SERVER_{self.name.upper()}_TOKEN", status)
+                self._authorization = f'Bearer {access}'
+        return self._authorization
+
+    async def get_json(self, url: str) -> Any:
+        """GET a JSON document, following redirects and revalidating the cached copy.
+
+        Like urllib and requests, the token is not sent again once a redirect
+        leaves the original scheme, host and port (e.g. to a CDN).
+        """
+        send_token = True
+        for _ in range(MAX_REDIRECTS + 1):
+            headers = {}
+            authorization = await self.authorization() if send_token else None
+            if authorization:
+                headers['Authorization'] = authorization
+            cached = self.cache.get(url) if self.cache else None
+            if cached:
+                headers['If-None-Match'] = cached['etag']
+            with span('http', f'galaxy {self.name}'):
+                status, response_headers, body = await self.pool.request(
+                    'GET', url, headers, verify=self.server.get('validate_certs', True))
+            if status in (301, 302, 303, 307, 308) and response_headers.get('location'):
+                target = urllib.parse.urljoin(url, response_headers['location'])
+                if _origin(target) != _origin(url):
+                    send_token = False
+                url = target
+                continue
+            if status == 304 and cached:
+                self.stats['revalidated'] += 1
+                return cached['data']
+            if status in (401, 403):
+                raise GalaxyAPIError(f"{self.name}: {url}: HTTP {status} (check the server token)", status)
+            if status != 200:
+                raise GalaxyAPIError(f"{self.name}: {url}: HTTP {status}", status)
+            try:
+                data = json.loads(body)
+            except ValueError as e:
+                raise GalaxyAPIError(f"{self.name}: {url}: invalid JSON ({e})") from e
+            if self.cache and response_headers.get('etag'):
+                self.cache.put(url, response_headers['etag'], data)
+            return data
+        raise GalaxyAPIError(f"{self.name}: {url}: too many redirects")
+
+    async def api_root(self) -> str:
+        """Discover the v3 API base URL (the server URL or its api/ path lists available_versions)."""
+        async with self._root_lock:
+            if self._root is None:
+                url = self.server['url']
+                for candidate in (url, urllib.parse.urljoin(url, 'api/')):
+                    try:
+                        data = await self.get_json(candidate)
+                    except GalaxyAPIError as e:
+                        if e.status == 404:
+                            continue
+                        raise
+                    versions = data.get('available_versions') if isinstance(data, dict) else None
+                    if isinstance(versions, dict) and versions.get('v3'):
+                        self._root = urllib.parse.urljoin(candidate, versions['v3'])
+                        break
+                else:
+                    raise GalaxyAPIError(f"{self.name}: no Galaxy v3 API at {url}")
+        return self._root
+
+    async def _collection_url(self, name: str, suffix: str = '') -> str:
+        namespace, _, collection = name.partition('.')
+        return urllib.parse.urljoin(await self.api_root(), f'collections/{namespace}/{collection}/versions/{suffix}')
+
+    async def versions(self, name: str) -> List[str]:
+        """Every published version of a collection, newest first."""
+        url: Optional[str] = await self._collection_url(name, f'?limit={PAGE_SIZE}')
+        found = []
+        while url:
+            page = await self.get_json(url)
+            found += [str(item.get('version')) for item in page.get('data') or []]
+            next_link = (page.get('links') or {}).get('next')
+            url = urllib.parse.urljoin(url, next_link) if next_link else None
+        valid = []
+        for version in found:
+            try:
+                valid.append((version_key(version), version))
+            except ValueError:
+                continue
+        return [version for _, version in sorted(valid, reverse=True)]
+
+    async def version_info(self, name: str, version: str) -> Dict[str, Any]:
+        """Index entry (url, sha256, dependencies) for one collection version."""
+        url = await self._collection_url(name, f'{version}/')
+        data = await self.get_json(url)
+        artifact = data.get('artifact') or {}
+        return {
+            'url': urllib.parse.urljoin(url, data.get('download_url') or ''),
+            'sha256': artifact.get('sha256'),
+            'dependencies': dict((data.get('metadata') or {}).get('dependencies') or {}),
+        }
+
+
+# === prefetch ===
+def _selected(versions: Sequence[str], specs: Sequence[str], limit: int) -> List[str]:
+    """Newest ``limit`` versions per range (``versions`` is newest first)."""
+    chosen: List[str] = []
+    for spec in specs:
+        try:
+            matching = [version for version in versions if matches(version, spec)]
+        except ValueError:
+            continue
+        chosen += [version for version in matching[:limit] if version not in chosen]
+    return chosen
+
+
+async def _prefetch(requirements: Sequence[Dict[str, Any]], clients: List[GalaxyClient],
+                    limit: int) -> Dict[str, Any]:
+    by_source = {client.name: client for client in clients}
+    by_source.update({client.server['url']: client for client in clients})
+
+    async def check(client: GalaxyClient) -> Dict[str, Any]:
+        row = {'server': client.name, 'url': client.server['url'],
+               'auth': 'sso' if client.server.get('auth_url') and client.server.get('token')
+               else 'token' if client.server.get('token') else 'anonymous', 'status': 'ok', 'error': None}
+        try:
+            await client.api_root()
+        except GalaxyAPIError as e:
+            row.update(status='error', error=str(e))
+        return row
+
+    async def locate(name: str) -> Tuple[GalaxyClient, List[str]]:
+        # ansible-galaxy と同じく source 指定が無ければ server_list の順に探す
+        source = sources.get(name)
+        if source and source not in by_source:
+            by_source[source] = GalaxyClient({'name': source, 'url': source.rstrip('/') + '/'},
+                                             clients[0].pool, clients[0].cache, clients[0].broker)
+        order = [by_source[source]] if source else clients
+        errors = []
+        for client in order:
+            try:
+                return client, await client.versions(name)
+            except GalaxyAPIError as e:
+                errors.append(str(e))
+        raise GalaxyAPIError('; '.join(errors))
+
+    sources = {r['name']: r['source'] for r in requirements if r.get('source')}
+    specs: Dict[str, List[str]] = {}
+    for requirement in requirements:
+        specs.setdefault(requirement['name'], []).append(requirement.get('version') or '*')
+
+    servers = await asyncio.gather(*(check(client) for client in clients))
+    located: Dict[str, Tuple[GalaxyClient, List[str]]] = {}
+    errors: Dict[str, str] = {}
+    index: Index = {}
+    while True:
+        names = [name for name in specs if name not in located and name not in errors]
+        for name, outcome in zip(names, await asyncio.gather(*(locate(name) for name in names),
+                                                             return_exceptions=True)):
+            if isinstance(outcome, GalaxyAPIError):
+                errors[name] = str(outcome)
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                located[name] = outcome
+        wanted = [(name, version) for name in specs if name in located
+                  for version in _selected(located[name][1], specs[name], limit)
+                  if version not in index.get(name, {})]
+        if not wanted:
+            break
+        infos = await asyncio.gather(*(located[name][0].version_info(name, version) for name, version in wanted),
+                                     return_exceptions=True)
+        for (name, version), info in zip(wanted, infos):
+            if isinstance(info, GalaxyAPIError):
+                errors.setdefault(name, str(info))
+                info = {'url': '', 'sha256': None, 'dependencies': {}, 'error': str(info)}
+            elif isinstance(info, BaseException):
+                raise info
+            index.setdefault(name, {})[version] = info
+            for dependency, spec in info['dependencies'].items():
+                if str(spec or '*') not in specs.setdefault(dependency, []):
+                    specs[dependency].append(str(spec or '*'))
+
+    usable: Index = {name: {version: entry for version, entry in versions.items() if 'error' not in entry}
+                     for name, versions in index.items()}
+    try:
+        resolved, resolution_error = resolve(requirements, usable), None
+    except (LockError, ValueError) as e:
+        resolved, resolution_error = {}, str(e)
+
+    collections = []
+    for name in specs:
+        client, versions = located.get(name, (None, []))
+        collections.append({
+            'name': name, 'requested': ','.join(specs[name]), 'server': client.name if client else None,
+            'versions': len(versions), 'latest': versions[0] if versions else None,
+            'resolved': resolved.get(name), 'error': errors.get(name),
+        })
+    return {'servers': list(servers), 'collections': collections, 'resolved': resolved,
+            'error': resolution_error, 'index': usable}
+
+
+def prefetch(ee_config: Dict[str, Any], base_dir: Path, servers: List[Dict[str, Any]],
+             cache_dir: Optional[Path] = None, connections: int = CONNECTIONS,
+             max_versions: int = MAX_VERSIONS, timeout: float = REQUEST_TIMEOUT,
+             broker: Optional[CredentialBroker] = None) -> Dict[str, Any]:
+    """Fetch metadata for dependencies.galaxy from ``servers`` and resolve it.
+
+    Returns ``{servers, collections, resolved, error, index, stats}``:
+    one reachability row per server, one row per collection (including
+    dependencies found along the way), the versions the ranges resolve to
+    (``error`` says why when they do not) and the fetched index snapshot.
+    ``cache_dir=None`` disables the ETag cache; with a ``broker`` SSO access
+    tokens are taken from (and stored in) its disk cache.
+    """
+    lockable, _ = collection_requirements(galaxy_requirements(ee_config, base_dir))
+    cache = ResponseCache(cache_dir) if cache_dir else None
+
+    async def run() -> Dict[str, Any]:
+        pool = ConnectionPool(connections, timeout)
+        clients = [GalaxyClient(server, pool, cache, broker) for server in servers]
+        try:
+            result = await _prefetch(lockable, clients, max_versions)
+        finally:
+            await pool.close()
+        result['stats'] = dict(pool.stats, revalidated=sum(c.stats['revalidated'] for c in clients),
+                               exchanges=sum(c.stats['exchanges'] for c in clients)
+                               + (broker.stats['exchanges'] if broker else 0))
+        return result
+
+    return asyncio.run(run())
+
+
+def write_index(index: Index, path: Path) -> None:
+    """Write an index snapshot that ``lock --index`` (galaxylock.load_index) reads."""
+    Path(path).write_text(yaml.safe_dump({'collections': index}, sort_keys=True), encoding='utf-8')
@@ -0,0 +1,338 @@
+"""
+Offline collection resolver for dependencies.galaxy
+
+Resolves the collection ranges of an EE definition (``>=8.0.0`` and so
+on) against a local index snapshot instead of the Galaxy / Automation Hub
+APIs, and pins the result in the ``galaxy`` section of ee.lock with the
+SHA-256 of every tarball.
+
+An index snapshot is either a YAML/JSON file::
+
+    collections:
+      community.general:
+        8.1.0:
+          url: https://galaxy.example/community-general-8.1.0.tar.gz
+          sha256: 9f0c...
+          dependencies: {ansible.posix: ">=1.0.0"}
+
+or a directory of collection tarballs (``ansible-galaxy collection
+download`` output), whose MANIFEST.json files are read straight from the
+archives.
+
+A build with a lock fetches the pinned tarballs in parallel, verifies
+their hashes and installs them as local files with ``--no-deps``, so
+ansible-galaxy does no resolution of its own. Collections from git, url
+or dir sources cannot be locked: their dependencies are not in the index
+and ``--no-deps`` would silently skip them.
+"""
+
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ee_builder.eefile import galaxy_requirements
+from ee_builder.lockfile import LockError, file_sha256, requirements_digest
+from ee_builder.resolver import MAX_STEPS, Constraint, ResolutionError, backtrack  # noqa: F401
+from ee_builder.yamlcache import load_yaml
+
+Index = Dict[str, Dict[str, Dict[str, Any]]]
+
+ROOT = 'execution-environment'
+FETCH_JOBS = 8
+FETCH_TIMEOUT = 60
+# ビルドコンテキスト内の配置先と、galaxy ステージでのコピー先
+CONTEXT_DIR = 'collections'
+IMAGE_DIR = '/tmp/ee-lock-collections'
+_LOCKABLE_TYPES = ('galaxy',)
+
+_SEMVER = re.compile(
+    r'^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$'
+)
+_CLAUSE = re.compile(r'^(==|!=|>=|<=|>|<|=)?\s*(\S+)$')
+
+
+# === versions ===
+def version_key(version: str) -> Tuple[Any, ...]:
+    """Semantic version sort key (pre-releases sort before their release)."""
+    match = _SEMVER.match(str(version).strip())
+    if not match:
+        raise ValueError(f"invalid collection version '{version}'")
+    major, minor, patch, pre = match.groups()
+    release = (int(major), int(minor or 0), int(patch or 0))
+    if pre is None:
+        return release + (1, ())
+    identifiers = tuple((0, int(p), '') if p.isdigit() else (1, 0, p) for p in pre.split('.'))
+    return release + (0, identifiers)
+
+
+def is_prerelease(version: str) -> bool:
+    return version_key(version)[3] == 0
+
+
+def matches(version: str, spec: str) -> bool:
+    """True when ``version`` satisfies an ansible-galaxy range such as ``>=1.0.0,<2.0.0``.
+
+    Like ansible-galaxy, pre-releases only match a clause that names them
+    exactly.
+    """
+    spec = (spec or '*').strip()
+    key = version_key(version)
+    exact = False
+    if spec != '*':
+        for clause in spec.split(','):
+            match = _CLAUSE.match(clause.strip())
+            if not match:
+                raise ValueError(f"invalid version range '{spec}'")
+            op, other = match.group(1) or '==', match.group(2)
+            if other == '*':
+                continue
+            other_key = version_key(other)
+            if op in ('==', '='):
+                if key != other_key:
+                    return False
+                exact = True
+            elif (op == '!=' and key == other_key) or (op == '>=' and key < other_key) \
+                    or (op == '>' and key <= other_key) or (op == '<=' and key > other_key) \
+                    or (op == '<' and key >= other_key):
+                return False
+    return exact or not is_prerelease(version)
+
+
+# === index snapshots ===
+def read_manifest(tarball: Path) -> Dict[str, Any]:
+    """Read collection_info from MANIFEST.json without unpacking the archive."""
+    with tarfile.open(tarball, 'r:*') as archive:
+        for member in archive:
+            if member.name.lstrip('./') == 'MANIFEST.json':
+                f = archive.extractfile(member)
+                if f is None:
+                    break
+                return json.load(f).get('collection_info') or {}
+    raise LockError(f"{tarball}: MANIFEST.json not found")
+
+
+def index_from_tarballs(directory: Path) -> Index:
+    index: Index = {}
+    for tarball in sorted(Path(directory).glob('*.tar.gz')):
+        info = read_manifest(tarball)
+        name = f"{info.get('namespace')}.{info.get('name')}"
+        index.setdefault(name, {})[str(info.get('version'))] = {
+            'url': str(tarball.resolve()),
+            'sha256': file_sha256(tarball),
+            'dependencies': dict(info.get('dependencies') or {}),
+        }
+    return index
+
+
+def load_index(path: Path) -> Index:
+    """Load an index snapshot file or build one from a directory of tarballs."""
+    path = Path(path)
+    if path.is_dir():
+        return index_from_tarballs(path)
+    try:
+        data = load_yaml(path)
+    except OSError as e:
+        raise LockError(f"Cannot read collection index {path}: {e}") from e
+    collections = (data or {}).get('collections') if isinstance(data, dict) else None
+    if not isinstance(collections, dict):
+        raise LockError(f"{path}: expected a 'collections' mapping")
+    index: Index = {}
+    for name, versions in collections.items():
+        for version, entry in (versions or {}).items():
+            entry = dict(entry or {})
+            url = entry.get('url', '')
+            if url and '://' not in url and not os.path.isabs(url):
+                # スナップショットからの相対パスは絶対パスにしておく
+                entry['url'] = str((path.parent / url).resolve())
+            entry['dependencies'] = dict(entry.get('dependencies') or {})
+            index.setdefault(str(name), {})[str(version)] = entry
+    return index
+
+
+# === requirements ===
+def collection_requirements(galaxy: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split requirements.yml collections into (lockable, passed through unchanged)."""
+    lockable: List[Dict[str, Any]] = []
+    unlocked: List[Dict[str, Any]] = []
+    for item in galaxy.get('collections') or []:
+        if isinstance(item, str):
+            name, _, version = item.partition(':')
+            item = {'name': name, 'version': version or '*'}
+        entry = {'name': str(item.get('name')), 'version': str(item.get('version') or '*')}
+        for optional in ('source', 'type'):
+            if item.get(optional):
+                entry[optional] = str(item[optional])
+        if entry.get('type', 'galaxy') in _LOCKABLE_TYPES:
+            lockable.append(entry)
+        else:
+            unlocked.append(entry)
+    return lockable, unlocked
+
+
+def _refuse_unlocked(unlocked: Sequence[Dict[str, Any]]) -> None:
+    if unlocked:
+        names = ', '.join(f"{entry['name']} ({entry.get('type')})" for entry in unlocked)
+        raise LockError(f"Cannot lock collections from git/url/dir sources: {names}. "
+                        "A locked build installs with --no-deps, which would skip their dependencies; "
+                        "publish them to the index or build without a lock (--no-lock)")
+
+
+# === resolver ===
+def _candidates(index: Index, name: str, constraints: Sequence[Constraint]) -> List[str]:
+    versions = index.get(name) or {}
+    ordered = [v for _, v in sorted(((version_key(v), v) for v in versions), reverse=True)]
+    return [v for v in ordered if all(matches(v, spec) for spec, _ in constraints)]
+
+
+def resolve(requirements: Sequence[Dict[str, Any]], index: Index,
+            max_steps: int = MAX_STEPS) -> Dict[str, str]:
+    """Pick one version per collection satisfying every range, newest first."""
+    def dependencies(name: str, version: str) -> List[Tuple[str, str]]:
+        deps = index[name][version].get('dependencies') or {}
+        return [(dep, str(spec or '*')) for dep, spec in deps.items()]
+
+    return backtrack(
+        [(r['name'], r.get('version', '*'), ROOT) for r in requirements],
+        lambda name, constraints: _candidates(index, name, constraints),
+        dependencies,
+        lambda name, version, spec: matches(version, spec),
+        lambda name: name in index,
+        max_steps, label='collections',
+    )
+
+
+def lock_galaxy(ee_config: Dict[str, Any], base_dir: Path, index: Index, lock_dir: Path) -> Dict[str, Any]:
+    """Resolve dependencies.galaxy and return the ee.lock ``galaxy`` section."""
+    galaxy = galaxy_requirements(ee_config, base_dir)
+    lockable, unlocked = collection_requirements(galaxy)
+    _refuse_unlocked(unlocked)
+    sources = {r['name']: r['source'] for r in lockable if 'source' in r}
+    pinned = resolve(lockable, index)
+
+    collections = []
+    for name in sorted(pinned):
+        entry = index[name][pinned[name]]
+        url = str(entry.get('url', ''))
+        if url and '://' not in url:
+            url = os.path.relpath(url, lock_dir)
+        locked = {'name': name, 'version': pinned[name], 'url': url, 'sha256': entry.get('sha256')}
+        if name in sources:
+            locked['source'] = sources[name]
+        if entry.get('dependencies'):
+            locked['dependencies'] = dict(entry['dependencies'])
+        collections.append(locked)
+    return {'requirements_digest': galaxy_digest(galaxy), 'collections': collections}
+
+
+def galaxy_digest(galaxy: Dict[str, Any]) -> str:
+    lockable, unlocked = collection_requirements(galaxy)
+    return requirements_digest({'collections': lockable + unlocked})
+
+
+# === fetching ===
+def tarball_name(entry: Dict[str, Any]) -> str:
+    return f"{entry['name'].replace('.', '-')}-{entry['version']}.tar.gz"
+
+
+def collection_cache_dir() -> Path:
+    configured = os.environ.get('EE_COLLECTION_CACHE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'collections'
+
+
+def _fetch_one(entry: Dict[str, Any], dest_dir: Path, lock_dir: Path, cache_dir: Path) -> Path:
+    target = dest_dir / tarball_name(entry)
+    expected = entry.get('sha256')
+    cached = cache_dir / f"{expected}.tar.gz" if expected else None
+
+    if cached is None or not cached.is_file():
+        url = str(entry.get('url') or '')
+        if not url:
+            raise LockError(f"{entry['name']} {entry['version']}: no url in lock file")
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if '://' in url:
+                    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:  # nosec B310
+                        shutil.copyfileobj(response, out)
+                else:
+                    with open(lock_dir / url, 'rb') as source:
+                        shutil.copyfileobj(source, out)
+            actual = file_sha256(Path(tmp))
+            if expected and actual != expected:
+                raise LockError(f"{entry['name']} {entry['version']}: sha256 mismatch "
+                                f"(expected {expected}, got {actual})")
+            cached = cache_dir / f"{actual}.tar.gz"
+            os.replace(tmp, cached)
+        except OSError as e:
+            raise LockError(f"Cannot fetch {entry['name']} {entry['version']} from {url}: {e}") from e
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    shutil.copyfile(cached, target)
+    return target
+
+
+def fetch_collections(section: Dict[str, Any], dest_dir: Path, lock_dir: Path,
+                      cache_dir: Optional[Path] = None, jobs: int = FETCH_JOBS) -> List[Path]:
+    """Fetch every locked tarball into ``dest_dir`` in parallel, verifying hashes.
+
+    Tarballs are kept in a content-addressed cache, so a collection is
+    downloaded once per machine whatever EE file locks it.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = Path(cache_dir) if cache_dir else collection_cache_dir()
+    entries = section.get('collections') or []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(entries) or 1))) as pool:
+        futures = [pool.submit(_fetch_one, entry, dest_dir, Path(lock_dir), cache_dir) for entry in entries]
+        return [future.result() for future in futures]
+
+
+def locked_ee_config(ee_config: Dict[str, Any], base_dir: Path, section: Dict[str, Any],
+                     build_files_src: str) -> Dict[str, Any]:
+    """Return a copy of the EE definition that installs the locked tarballs.
+
+    ``build_files_src`` is the fetched tarball directory relative to the EE
+    file. It is added to the build context and copied into the galaxy
+    stage; the requirements list then points at the files and
+    ansible-galaxy runs with ``--no-deps``. Roles are kept as they were.
+    Raises LockError for a lock that still lists unlocked (git, url, dir)
+    collections.
+    """
+    _refuse_unlocked(section.get('unlocked') or [])
+    config = json.loads(json.dumps(ee_config))
+    collections: List[Any] = [
+        {'name': f"{IMAGE_DIR}/{tarball_name(entry)}", 'type': 'file'}
+        for entry in section.get('collections') or []
+    ]
+
+    dependencies = config.setdefault('dependencies', {})
+    roles = galaxy_requirements(ee_config, base_dir).get('roles')
+    dependencies['galaxy'] = {'collections': collections}
+    if roles:
+        dependencies['galaxy']['roles'] = roles
+
+    config.setdefault('additional_build_files', []).append({'src': build_files_src, 'dest': CONTEXT_DIR})
+    steps = config.setdefault('additional_build_steps', {})
+    prepend = steps.get('prepend_galaxy') or []
+    if isinstance(prepend, str):
+        prepend = prepend.splitlines()
+    steps['prepend_galaxy'] = [f"COPY _build/{CONTEXT_DIR}/ {IMAGE_DIR}/"] + list(prepend)
+
+    build_args = config.setdefault('build_arg_defaults', {})
+    options = build_args.get('ANSIBLE_GALAXY_CLI_COLLECTION_OPTS', '')
+    if '--no-deps' not in options.split():
+        build_args['ANSIBLE_GALAXY_CLI_COLLECTION_OPTS'] = f"{options} --no-deps".strip()
+    return config
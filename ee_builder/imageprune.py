@@ -0,0 +1,226 @@
+"""
+LRU pruning of local EE images
+
+Nodes that run ``ansible-navigator`` accumulate one EE image per build and
+nothing removes them. ``prune_images`` keeps the total size of the local EE
+images under a disk budget by removing the least recently used ones first.
+
+"Used" means a container was started from the image. Usage is recorded in
+a small JSON file from two sources, incrementally on every run:
+
+- the runtime's container start events since the previous run (the first
+  run looks back LOOKBACK_DAYS);
+- the ``settings_entries`` of ansible-navigator playbook artifacts, which
+  name the EE image a run used (the file modification time is the use).
+
+Images referenced by the current ansible-navigator.yml files are never
+removed, and neither are images a container still uses (``rmi`` runs
+without force). Images without any recorded use fall back to their
+creation time. The budget is compared with the sum of the image sizes,
+which over-counts layers the images share, so pruning errs on the side of
+freeing more.
+"""
+
+import fnmatch
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from ee_builder.artifacts import artifact_image, find_artifacts
+from ee_builder.build import IMAGE_NAME
+from ee_builder.errors import EEBuilderError
+from ee_builder.prewarm import collect_images
+from ee_builder.registry import parse_image_ref
+from ee_builder.runtime import ContainerRuntime, RuntimeCommandError
+
+USAGE_VERSION = 1
+LOOKBACK_DAYS = 30
+DEFAULT_BUDGET = '20GB'
+
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(i?)b?\s*$', re.IGNORECASE)
+_IMAGE_ID = re.compile(r'^(?:sha256:)?([0-9a-f]{12,64})$')
+
+# keep: 保持 / remove: 削除予定（dry-run） / removed・failed: 実行結果
+KEEP, REMOVE, REMOVED, FAILED = 'keep', 'remove', 'removed', 'failed'
+
+
+class PruneError(EEBuilderError):
+    """Raised for an invalid budget or an unreadable navigator config."""
+
+
+def usage_file() -> Path:
+    configured = os.environ.get('EE_IMAGE_USAGE_FILE')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'image-usage.json'
+
+
+def parse_size(text: str) -> int:
+    """Parse '20GB', '512M', '1.5GiB' or a plain byte count (decimal units, like the runtimes print)."""
+    match = _SIZE.match(str(text))
+    if not match:
+        raise PruneError(f"Invalid size: {text!r} (e.g. 20GB, 512MB, 1.5GiB)")
+    number, unit, binary = match.groups()
+    power = ' kmgt'.index(unit.lower()) if unit else 0
+    return int(float(number) * (1024 if binary else 1000) ** power)
+
+
+def image_key(reference: str) -> str:
+    """Normalize an image reference or ID so events, artifacts and local tags compare equal."""
+    match = _IMAGE_ID.match(reference)
+    if match:
+        return f"id:{match.group(1)}"
+    registry, repository, tag = parse_image_ref(reference)
+    return f"{registry}/{repository}{'@' if tag.startswith('sha256:') else ':'}{tag}"
+
+
+def load_usage(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        data = None
+    if not isinstance(data, dict) or data.get('version') != USAGE_VERSION:
+        return {'version': USAGE_VERSION, 'events_until': None, 'artifacts': {}, 'images': {}}
+    return data
+
+
+def save_usage(path: Path, usage: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(usage, indent=1, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def _touch(usage: Dict[str, Any], reference: str, when: float) -> None:
+    key = image_key(reference)
+    usage['images'][key] = max(when, usage['images'].get(key) or 0)
+
+
+def record_events(runtime: ContainerRuntime, usage: Dict[str, Any], now: Optional[float] = None) -> int:
+    """Record container starts since the previous run; returns the number of events read."""
+    now = time.time() if now is None else now
+    since = usage.get('events_until') or now - LOOKBACK_DAYS * 86400
+    events = runtime.container_starts(since, now)
+    for event in events:
+        _touch(usage, event['image'], event['time'])
+    usage['events_until'] = now
+    return len(events)
+
+
+def record_artifacts(paths: Sequence[Path], usage: Dict[str, Any]) -> int:
+    """Record the EE image of new or changed playbook artifacts; returns the number read."""
+    existing = [path for path in paths if path.exists()]
+    files = find_artifacts(existing) if existing else []
+    seen = usage['artifacts']
+    read = 0
+    for path in files:
+        mtime = path.stat().st_mtime
+        if seen.get(str(path)) == mtime:
+            continue
+        image = artifact_image(path)
+        if image:
+            _touch(usage, image, mtime)
+        seen[str(path)] = mtime
+        read += 1
+    # 削除されたアーティファクトの記録は残さない（利用時刻は images 側に残る）
+    usage['artifacts'] = {path: mtime for path, mtime in seen.items() if os.path.exists(path)}
+    return read
+
+
+def default_configs() -> List[Path]:
+    """Return the navigator configs ansible-navigator itself would read, if present."""
+    candidates = [Path(os.environ['ANSIBLE_NAVIGATOR_CONFIG'])] if os.environ.get('ANSIBLE_NAVIGATOR_CONFIG') else []
+    candidates += [Path('ansible-navigator.yml'), Path.home() / '.ansible-navigator.yml']
+    return list(dict.fromkeys(path for path in candidates if path.is_file()))
+
+
+def keep_images(configs: Sequence[Path]) -> Dict[str, str]:
+    """Return {image key: config file} for the images the navigator configs reference."""
+    keep: Dict[str, str] = {}
+    for config in configs:
+        try:
+            images = collect_images([config])
+        except EEBuilderError as e:
+            raise PruneError(str(e)) from e
+        for image in images:
+            keep.setdefault(image_key(image), str(config))
+    return keep
+
+
+def plan_prune(images: List[Dict[str, Any]], usage: Dict[str, Any], keep: Dict[str, str], budget: int,
+               patterns: Sequence[str]) -> List[Dict[str, Any]]:
+    """Decide keep/remove for the local images matching ``patterns``, least recently used first."""
+    rows = []
+    for image in images:
+        tags = image['tags']
+        if not any(fnmatch.fnmatchcase(tag, pattern) for tag in tags for pattern in patterns):
+            continue
+        keys = [image_key(tag) for tag in tags] + [image_key(image['id'])]
+        used = [usage['images'][key] for key in keys if usage['images'].get(key)]
+        referenced = next((keep[key] for key in keys if key in keep), None)
+        rows.append({
+            'id': image['id'], 'tags': tags, 'size': image['size'],
+            'last_used': max(used) if used else None, 'created': image['created'],
+            'action': KEEP if referenced else None,
+            'reason': f'referenced by {referenced}' if referenced else '', 'error': None,
+        })
+
+    total = sum(row['size'] for row in rows)
+    # 使用記録が無いイメージは作成日時を最終利用とみなす
+    order = sorted((row['last_used'] or row['created'], row['id'], index)
+                   for index, row in enumerate(rows) if row['action'] is None)
+    for _, _, index in order:
+        row = rows[index]
+        if total > budget:
+            row.update(action=REMOVE, reason='least recently used')
+            total -= row['size']
+        else:
+            row.update(action=KEEP, reason='within budget')
+    return rows
+
+
+def apply_prune(rows: List[Dict[str, Any]], runtime: ContainerRuntime) -> List[Dict[str, Any]]:
+    """Remove the planned images tag by tag without force; images in use are reported as failed."""
+    for row in rows:
+        if row['action'] != REMOVE:
+            continue
+        try:
+            for tag in row['tags']:
+                runtime.remove_image(tag)
+            row['action'] = REMOVED
+        except RuntimeCommandError as e:
+            row.update(action=FAILED, error=str(e))
+    return rows
+
+
+def prune_images(runtime: ContainerRuntime, budget: int, configs: Optional[Sequence[Path]] = None,
+                 artifact_paths: Sequence[Path] = (Path('artifacts'),), patterns: Optional[Sequence[str]] = None,
+                 dry_run: bool = False, usage_path: Optional[Path] = None,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+    """Update the usage record, then plan (and unless ``dry_run``, apply) the LRU prune."""
+    usage_path = usage_path or usage_file()
+    usage = load_usage(usage_path)
+    keep = keep_images(default_configs() if configs is None else configs)
+    patterns = list(patterns or [f"*{os.environ.get('IMAGE_NAME') or IMAGE_NAME}*"])
+
+    warnings = []
+    try:
+        events = record_events(runtime, usage, now)
+    except RuntimeCommandError as e:
+        # イベントログが無効な環境（events_logger=none 等）ではアーティファクトだけで判定する
+        events = 0
+        warnings.append(f"container events unavailable: {e}")
+    artifacts = record_artifacts(artifact_paths, usage)
+    save_usage(usage_path, usage)
+
+    rows = plan_prune(runtime.list_images(), usage, keep, budget, patterns)
+    if not dry_run:
+        apply_prune(rows, runtime)
+    total = sum(row['size'] for row in rows)
+    freed = sum(row['size'] for row in rows if row['action'] in (REMOVE, REMOVED))
+    return {'rows': rows, 'total': total, 'freed': freed, 'budget': budget, 'events': events,
+            'artifacts': artifacts, 'warnings': warnings, 'dry_run': dry_run}
@@ -0,0 +1,241 @@
+"""
+Rebuild impact graph for EE images
+
+Indexes the inputs of every EE file in the project: base image,
+collections, Python and system packages, and the local files it reads
+(the EE file itself, requirement files, COPY/ADD sources,
+additional_build_files and ee.lock). An EE whose base image is the image
+another EE produces depends on it. Given a change set, ``affected``
+returns the minimal set of images to rebuild, parents before the images
+derived from them, so CI builds only those.
+
+Change set items are ``kind:value`` strings; a bare item is a file path::
+
+    execution-environment.yml          file changed (git diff)
+    image:quay.io/ansible/creator-ee   base image digest moved (any tag)
+    collection:amazon.aws              collection version changed
+    python:boto3 / system:gcc          package changed
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from ee_builder.build import IMAGE_NAME
+from ee_builder.eefile import (
+    base_image, copied_files, find_ee_files, galaxy_requirements, load_ee_file, requirement_lines,
+)
+from ee_builder.eeschema import canonical_name, parse_bindep, parse_requirement
+from ee_builder.errors import EEBuilderError
+from ee_builder.lockfile import LOCK_NAME
+from ee_builder.profiling import span
+
+KINDS = ('file', 'image', 'collection', 'python', 'system')
+EE_STEM = 'execution-environment'
+
+Node = Dict[str, Any]
+
+
+class ImpactError(EEBuilderError):
+    """Raised for unusable change sets and cyclic image dependencies."""
+
+
+# === image references ===
+def split_reference(reference: str) -> Tuple[str, Optional[str]]:
+    """Return (repository, tag or digest) with ``localhost/`` dropped."""
+    reference = reference.strip()
+    tag = None
+    if '@' in reference:
+        reference, tag = reference.split('@', 1)
+    elif ':' in reference.rsplit('/', 1)[-1]:
+        reference, tag = reference.rsplit(':', 1)
+    if reference.startswith('localhost/'):
+        reference = reference[len('localhost/'):]
+    return reference, tag
+
+
+def produced_image(ee_file: Path, ee_config: Dict[str, Any], root: Path) -> str:
+    """Image an EE file builds: options.tags[0], else a name derived from its path.
+
+    ``execution-environment.yml`` at the root builds IMAGE_NAME; other
+    files add their directories and file-name suffix, e.g.
+    ``examples/execution-environment-aws.yml`` builds
+    ``ansible-custom-ee-examples-aws``.
+    """
+    tags = (ee_config.get('options') or {}).get('tags')
+    if isinstance(tags, list) and tags:
+        return str(tags[0])
+    relative = Path(ee_file).resolve().relative_to(Path(root).resolve())
+    suffix = Path(ee_file).stem[len(EE_STEM):].lstrip('-_.') if Path(ee_file).stem.startswith(EE_STEM) \
+        else Path(ee_file).stem
+    parts = [part for part in relative.parent.parts] + ([suffix] if suffix else [])
+    return '-'.join([IMAGE_NAME] + [part.lower().replace('_', '-') for part in parts])
+
+
+# === index ===
+def _relative(path: Path, root: Path) -> str:
+    try:
+        return Path(path).resolve().relative_to(Path(root).resolve()).as_posix()
+    except ValueError:
+        return Path(path).resolve().as_posix()
+
+
+def index_ee_file(ee_file: Path, root: Path) -> Node:
+    """Collect every input of one EE file, keyed by kind."""
+    ee_file = Path(ee_file)
+    ee_config = load_ee_file(ee_file)
+    base_dir = ee_file.parent
+    inputs: Dict[str, Dict[str, str]] = {kind: {} for kind in KINDS}
+
+    inputs['file'][_relative(ee_file, root)] = 'EE file'
+    for section in ('python', 'system', 'galaxy'):
+        value = (ee_config.get('dependencies') or {}).get(section)
+        if isinstance(value, str) and '\n' not in value:
+            inputs['file'][_relative(base_dir / value.strip(), root)] = f"dependencies.{section}"
+    for path in copied_files(ee_config, [base_dir, Path(root)], include_dirs=True):
+        inputs['file'][_relative(path, root) + ('/' if path.is_dir() else '')] = 'COPY'
+    for entry in ee_config.get('additional_build_files') or []:
+        if isinstance(entry, dict) and entry.get('src'):
+            source = base_dir / str(entry['src'])
+            inputs['file'][_relative(source, root) + ('/' if source.is_dir() else '')] = \
+                'additional_build_files'
+    if (base_dir / LOCK_NAME).is_file():
+        inputs['file'][_relative(base_dir / LOCK_NAME, root)] = 'lock file'
+
+    image = base_image(ee_config)
+    inputs['image'][image] = 'base image'
+    for collection in galaxy_requirements(ee_config, base_dir).get('collections') or []:
+        if isinstance(collection, str):
+            collection = {'name': collection}
+        if isinstance(collection, dict) and collection.get('name'):
+            inputs['collection'][str(collection['name'])] = str(collection.get('version') or '*')
+    for line in requirement_lines(ee_config, 'python', base_dir):
+        try:
+            requirement = parse_requirement(line.split('#', 1)[0].strip())
+        except ValueError:
+            continue  # 空行・オプション行
+        inputs['python'][canonical_name(requirement['name'])] = requirement['specifier'] or '*'
+    for line in requirement_lines(ee_config, 'system', base_dir):
+        try:
+            inputs['system'][parse_bindep(line.split('#', 1)[0].strip())['name']] = 'bindep'
+        except ValueError:
+            continue
+
+    return {
+        'ee_file': _relative(ee_file, root),
+        'image': produced_image(ee_file, ee_config, root),
+        'base_image': image,
+        'inputs': inputs,
+    }
+
+
+def index_project(paths: Sequence[Path], root: Path) -> List[Node]:
+    """Index every EE file found under ``paths``; raises ImpactError on duplicate images."""
+    nodes = [index_ee_file(path, root) for path in find_ee_files(paths)]
+    seen: Dict[str, str] = {}
+    for node in nodes:
+        repository = split_reference(node['image'])[0]
+        if repository in seen:
+            raise ImpactError(f"{node['ee_file']} and {seen[repository]} both build {repository}; "
+                              f"set options.tags in one of them")
+        seen[repository] = node['ee_file']
+    return nodes
+
+
+def parents(nodes: Sequence[Node]) -> Dict[str, List[str]]:
+    """Map each EE file to the EE files that build its base image."""
+    builders = {split_reference(node['image'])[0]: node['ee_file'] for node in nodes}
+    result: Dict[str, List[str]] = {}
+    for node in nodes:
+        builder = builders.get(split_reference(node['base_image'])[0])
+        result[node['ee_file']] = [builder] if builder and builder != node['ee_file'] else []
+    return result
+
+
+def topological_order(nodes: Sequence[Node]) -> List[str]:
+    """EE files ordered parents first (ties by path); raises ImpactError on cycles."""
+    graph = parents(nodes)
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    order: List[str] = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ImpactError(f"Cyclic base images between: {', '.join(sorted(remaining))}")
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order
+
+
+# === change sets ===
+def parse_change(item: str, root: Path) -> Tuple[str, str]:
+    """Return (kind, value) for a change set item."""
+    kind, sep, value = item.partition(':')
+    if sep and kind in KINDS and kind != 'file':
+        if not value:
+            raise ImpactError(f"Empty change item: '{item}'")
+        if kind == 'python':
+            value = canonical_name(value)
+        return kind, value
+    path = item[len('file:'):] if item.startswith('file:') else item
+    candidate = Path(path)
+    return 'file', _relative(candidate if candidate.is_absolute() else Path(root) / candidate, root)
+
+
+def changed_files(root: Path, since: Optional[str] = None) -> List[str]:
+    """Files changed relative to ``since`` (default HEAD), plus untracked files."""
+    commands = [['git', 'diff', '--name-only', since or 'HEAD'],
+                ['git', 'ls-files', '--others', '--exclude-standard']]
+    files: Set[str] = set()
+    for command in commands:
+        try:
+            with span('subprocess', f'git {command[1]}'):
+                result = subprocess.run(command, cwd=root, capture_output=True, text=True)
+        except OSError as e:
+            raise ImpactError(f"Cannot run git: {e}") from e
+        if result.returncode != 0:
+            raise ImpactError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+        files.update(line.strip() for line in result.stdout.splitlines() if line.strip())
+    return sorted(files)
+
+
+def _matches(node: Node, kind: str, value: str) -> List[str]:
+    inputs = node['inputs'][kind]
+    if kind == 'file':
+        return [f"{path} ({what})" for path, what in inputs.items()
+                if path == value or (path.endswith('/') and value.startswith(path))]
+    if kind == 'image':
+        repository, tag = split_reference(value)
+        return [f"base image {image}" for image in inputs
+                if split_reference(image)[0] == repository
+                and (tag is None or (split_reference(image)[1] or 'latest') == tag)]
+    if value in inputs:
+        return [f"{kind} {value} ({inputs[value]})"]
+    return []
+
+
+def affected(nodes: Sequence[Node], changes: Sequence[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Images to rebuild for ``changes``, parents first.
+
+    An EE is rebuilt when one of its inputs changed or when the image it
+    is based on is rebuilt; nothing else is.
+    """
+    by_file = {node['ee_file']: node for node in nodes}
+    graph = parents(nodes)
+    reasons: Dict[str, List[str]] = {}
+    for node in nodes:
+        hits = [hit for kind, value in changes for hit in _matches(node, kind, value)]
+        if hits:
+            reasons[node['ee_file']] = hits
+
+    result = []
+    for name in topological_order(nodes):
+        rebuilt_parents = [p for p in graph[name] if p in reasons]
+        if rebuilt_parents:
+            reasons.setdefault(name, []).extend(
+                f"base image {by_file[p]['image']} rebuilt" for p in rebuilt_parents)
+        if name in reasons:
+            result.append({'ee_file': name, 'image': by_file[name]['image'], 'reasons': reasons[name]})
+    return result
@@ -0,0 +1,83 @@
+"""
+ee.lock handling
+
+An EE lock file pins what an EE definition resolves to so builds neither
+resolve again nor drift between runs. It is YAML, written next to the EE
+file (``<ee dir>/ee.lock`` by default), with one section per dependency
+kind. Each section records the digest of the requirements it was
+resolved from, so a lock that no longer matches its EE file is detected
+instead of silently used.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.yamlcache import load_yaml
+
+LOCK_NAME = 'ee.lock'
+LOCK_VERSION = 1
+
+_HEADER = "# Generated by `python -m ee_builder lock`; do not edit by hand.\n"
+
+
+class LockError(EEBuilderError):
+    """Raised for unreadable, stale or unsatisfiable locks."""
+
+
+def default_lock_path(ee_file: Path) -> Path:
+    return Path(ee_file).parent / LOCK_NAME
+
+
+def requirements_digest(requirements: Any) -> str:
+    """Stable digest of requirement data (order of mapping keys does not matter)."""
+    blob = json.dumps(requirements, sort_keys=True, separators=(',', ':'), default=str)
+    return 'sha256:' + hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_lock(path: Path) -> Dict[str, Any]:
+    try:
+        data = load_yaml(path)
+    except OSError as e:
+        raise LockError(f"Cannot read lock file {path}: {e}") from e
+    except yaml.YAMLError as e:
+        raise LockError(f"Invalid lock file {path}: {e}") from e
+    if not isinstance(data, dict) or data.get('version') != LOCK_VERSION:
+        raise LockError(f"{path}: unsupported lock file (expected version {LOCK_VERSION})")
+    return data
+
+
+def write_lock(path: Path, data: Dict[str, Any]) -> None:
+    """Write the lock atomically; sections keep their insertion order."""
+    path = Path(path)
+    body = dict(data, version=LOCK_VERSION)
+    ordered = {'version': body.pop('version')}
+    ordered.update(body)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(_HEADER + yaml.safe_dump(ordered, default_flow_style=False, sort_keys=False),
+                   encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def check_section(lock: Dict[str, Any], section: str, digest: str, lock_path: Path) -> Optional[Dict[str, Any]]:
+    """Return a lock section, raising LockError when it was resolved from other requirements."""
+    data = lock.get(section)
+    if data is None:
+        return None
+    if data.get('requirements_digest') != digest:
+        raise LockError(f"{lock_path}: {section} section is out of date; "
+                        f"run `python -m ee_builder lock` again")
+    return data
@@ -0,0 +1,21 @@
+"""
+Colored log output matching the shell scripts ([INFO]/[SUCCESS]/[WARN]/[ERROR])
+"""
+
+import sys
+
+
+def log_info(message: str) -> None:
+    print(f"\033[1;34m[INFO]\033[0m {message}", flush=True)
+
+
+def log_success(message: str) -> None:
+    print(f"\033[1;32m[SUCCESS]\033[0m {message}", flush=True)
+
+
+def log_warn(message: str) -> None:
+    print(f"\033[1;33m[WARN]\033[0m {message}", flush=True)
+
+
+def log_error(message: str) -> None:
+    print(f"\033[1;31m[ERROR]\033[0m {message}", file=sys.stderr, flush=True)
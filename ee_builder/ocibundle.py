@@ -0,0 +1,380 @@
+"""
+OCI bundles for promoting EE images into air-gapped networks
+
+``export_image`` saves a built image as an OCI archive and writes it as a
+bundle: a tar stream (gzip-compressed while it is written) holding
+``bundle.json``, an OCI image layout and the blobs. Given earlier bundles
+of the same image as bases, blobs whose digest they already list are left
+out, so a small dependency bump ships only its new layers plus the
+manifest and config. A ``<bundle>.sha256`` file is written next to it.
+
+``import_bundle`` streams a bundle, checks the file checksum and the
+digest of every blob, and keeps the blobs in a content-addressed store
+(EE_OCI_STORE_DIR, default ``~/.cache/ee-builder/oci``). Once every blob
+of the image is in the store, an OCI archive is assembled from it and
+loaded into the container runtime. Bundles are imported in export order;
+a delta whose base blobs are not in the store is rejected.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Sequence, Tuple
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.runtime import ContainerRuntime, connect_runtime
+
+BUNDLE_VERSION = 1
+BUNDLE_META = 'bundle.json'
+CHUNK = 1 << 20
+DEFAULT_LEVEL = 6
+
+INDEX_TYPES = ('application/vnd.oci.image.index.v1+json',
+               'application/vnd.docker.distribution.manifest.list.v2+json')
+MANIFEST_TYPE = 'application/vnd.oci.image.manifest.v1+json'
+# podman は ref.name、docker は io.containerd.image.name でタグを復元する
+REF_ANNOTATIONS = ('org.opencontainers.image.ref.name', 'io.containerd.image.name')
+
+Descriptor = Dict[str, Any]
+
+
+class BundleError(EEBuilderError):
+    """Raised for unreadable archives, corrupt bundles and incomplete deltas."""
+
+
+def oci_store_dir() -> Path:
+    configured = os.environ.get('EE_OCI_STORE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'oci'
+
+
+def blob_path(digest: str) -> str:
+    """Path of a blob inside an OCI image layout."""
+    algorithm, _, encoded = digest.partition(':')
+    return f"blobs/{algorithm}/{encoded}"
+
+
+# === streams ===
+class _HashingWriter:
+    """File wrapper that hashes and counts everything written through it."""
+
+    def __init__(self, target: IO[bytes]):
+        self.target = target
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.target.write(data)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+class _HashingReader:
+    """File wrapper that hashes everything read through it."""
+
+    def __init__(self, source: IO[bytes]):
+        self.source = source
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        self.sha256.update(data)
+        return data
+
+    def drain(self) -> str:
+        """Read to the end (tar padding included) and return the hex digest."""
+        while self.read(CHUNK):
+            pass
+        return self.sha256.hexdigest()
+
+
+class _VerifyingReader:
+    """Reader that checks a blob's digest once it has been read to the end."""
+
+    def __init__(self, source: IO[bytes], descriptor: Descriptor):
+        self.source = source
+        self.descriptor = descriptor
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.size == self.descriptor['size'] and \
+                f"sha256:{self.sha256.hexdigest()}" != self.descriptor['digest']:
+            raise BundleError(f"Blob {self.descriptor['digest']} in the saved image does not match its digest")
+        return data
+
+
+def _copy_verified(source: IO[bytes], target: IO[bytes], descriptor: Descriptor) -> None:
+    """Copy a blob, raising BundleError unless its digest and size match the descriptor."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(CHUNK)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        target.write(chunk)
+    actual = f"sha256:{digest.hexdigest()}"
+    if actual != descriptor['digest'] or size != descriptor['size']:
+        raise BundleError(f"Blob {descriptor['digest']} is corrupt (got {actual}, {size} bytes)")
+
+
+def _add_json(tar: tarfile.TarFile, name: str, data: Any) -> None:
+    payload = json.dumps(data, indent=2, sort_keys=True).encode('utf-8')
+    _add_bytes(tar, name, payload)
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, payload: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def _layout_index(descriptor: Descriptor, image: str) -> Dict[str, Any]:
+    annotated = dict(descriptor)
+    annotated['annotations'] = dict(descriptor.get('annotations') or {},
+                                    **{name: image for name in REF_ANNOTATIONS})
+    return {'schemaVersion': 2, 'mediaType': 'application/vnd.oci.image.index.v1+json',
+            'manifests': [annotated]}
+
+
+# === OCI archives ===
+class OCIArchive:
+    """Random-access reader for the OCI layout in a ``save`` archive."""
+
+    def __init__(self, path: Path):
+        try:
+            self.tar = tarfile.open(path, 'r:*')
+            self.names = {member.name.lstrip('./'): member for member in self.tar.getmembers()}
+        except (OSError, tarfile.TarError) as e:
+            raise BundleError(f"Cannot read image archive {path}: {e}") from e
+        if 'index.json' not in self.names:
+            raise BundleError(f"{path} is not an OCI archive (no index.json); "
+                              f"use podman or docker 25 or later")
+
+    def __enter__(self) -> 'OCIArchive':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.tar.close()
+
+    def open(self, name: str) -> IO[bytes]:
+        member = self.names.get(name)
+        handle = self.tar.extractfile(member) if member else None
+        if handle is None:
+            raise BundleError(f"{name} is missing from the image archive")
+        return handle
+
+    def json(self, name: str) -> Any:
+        with self.open(name) as handle:
+            return json.load(handle)
+
+    def image(self) -> Tuple[Descriptor, List[Descriptor]]:
+        """Return the image manifest descriptor and every blob (manifest, config, layers)."""
+        manifests = self.json('index.json').get('manifests') or []
+        if not manifests:
+            raise BundleError("The image archive lists no manifest")
+        descriptor = manifests[0]
+        # docker は index.json からさらにイメージインデックスを参照することがある
+        while descriptor.get('mediaType') in INDEX_TYPES:
+            descriptor = (self.json(blob_path(descriptor['digest'])).get('manifests') or [{}])[0]
+            if not descriptor.get('digest'):
+                raise BundleError("The image index lists no manifest")
+        manifest = self.json(blob_path(descriptor['digest']))
+        descriptor = {'mediaType': descriptor.get('mediaType') or manifest.get('mediaType') or MANIFEST_TYPE,
+                      'digest': descriptor['digest'], 'size': descriptor['size']}
+        blobs = [descriptor, manifest['config']] + list(manifest.get('layers') or [])
+        return descriptor, [{'mediaType': b.get('mediaType', ''), 'digest': b['digest'], 'size': int(b['size'])}
+                            for b in blobs]
+
+
+# === bundles ===
+def read_bundle_meta(bundle: Path) -> Dict[str, Any]:
+    """Return a bundle's bundle.json (its first member) without reading the blobs."""
+    try:
+        with tarfile.open(bundle, 'r|*') as tar:
+            member = tar.next()
+            if member is None or member.name != BUNDLE_META:
+                raise BundleError(f"{bundle} is not an EE bundle ({BUNDLE_META} must come first)")
+            meta = json.load(tar.extractfile(member))
+    except (OSError, tarfile.TarError, ValueError) as e:
+        raise BundleError(f"Cannot read bundle {bundle}: {e}") from e
+    if meta.get('version') != BUNDLE_VERSION:
+        raise BundleError(f"{bundle}: unsupported bundle version {meta.get('version')}")
+    return meta
+
+
+def export_image(image: str, output: Path, runtime: Optional[ContainerRuntime] = None,
+                 bases: Sequence[Path] = (), level: int = DEFAULT_LEVEL,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Write ``image`` to the bundle ``output``, leaving out blobs listed by ``bases``."""
+    if not 0 <= level <= 9:
+        raise BundleError("Compression level must be between 0 and 9")
+    runtime = runtime or connect_runtime()
+    output = Path(output)
+    known: Dict[str, str] = {}
+    base_meta = [read_bundle_meta(Path(base)) for base in bases]
+    for meta in base_meta:
+        for blob in meta['blobs']:
+            known.setdefault(blob['digest'], meta['image'])
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=output.parent, prefix='.export-') as work_dir:
+        archive = Path(work_dir) / 'image.tar'
+        runtime.save(image, str(archive), timeout=timeout)
+        with OCIArchive(archive) as layout:
+            descriptor, blobs = layout.image()
+            included = [blob for blob in blobs if blob['digest'] not in known]
+            meta = {
+                'version': BUNDLE_VERSION,
+                'image': image,
+                'manifest': descriptor,
+                'blobs': blobs,
+                'included': [blob['digest'] for blob in included],
+                'bases': [{'image': m['image'], 'manifest': m['manifest']['digest']} for m in base_meta],
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }
+            partial = Path(work_dir) / output.name
+            with open(partial, 'wb') as raw:
+                writer = _HashingWriter(raw)
+                compressed = gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=level, mtime=0) \
+                    if level else None
+                with tarfile.open(fileobj=compressed or writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+                    _add_json(tar, BUNDLE_META, meta)
+                    _add_json(tar, 'oci-layout', {'imageLayoutVersion': '1.0.0'})
+                    _add_json(tar, 'index.json', _layout_index(descriptor, image))
+                    for blob in included:
+                        info = tarfile.TarInfo(blob_path(blob['digest']))
+                        info.size = blob['size']
+                        info.mode = 0o644
+                        with layout.open(blob_path(blob['digest'])) as source:
+                            tar.addfile(info, _VerifyingReader(source, blob))
+                if compressed:
+                    compressed.close()
+            os.replace(partial, output)
+
+    checksum = writer.sha256.hexdigest()
+    Path(f"{output}.sha256").write_text(f"{checksum}  {output.name}\n", encoding='utf-8')
+    return {
+        'image': image,
+        'bundle': str(output),
+        'manifest': descriptor['digest'],
+        'blobs': len(blobs),
+        'included': len(included),
+        'image_bytes': sum(blob['size'] for blob in blobs),
+        'included_bytes': sum(blob['size'] for blob in included),
+        'bundle_bytes': writer.size,
+        'sha256': checksum,
+        'bases': [m['image'] for m in base_meta],
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def _expected_checksum(bundle: Path) -> Optional[str]:
+    sidecar = Path(f"{bundle}.sha256")
+    if not sidecar.is_file():
+        return None
+    text = sidecar.read_text(encoding='utf-8').split()
+    return text[0] if text else None
+
+
+def _store_blob(source: IO[bytes], descriptor: Descriptor, store: Path) -> bool:
+    """Verify a blob into the store; returns False if it was already there."""
+    target = store / blob_path(descriptor['digest'])
+    if target.is_file() and target.stat().st_size == descriptor['size']:
+        return False  # 読み飛ばした分もファイル全体のチェックサムには含まれる
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            _copy_verified(source, out, descriptor)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return True
+
+
+def _write_archive(meta: Dict[str, Any], store: Path, archive: Path) -> None:
+    with tarfile.open(archive, 'w', format=tarfile.PAX_FORMAT) as tar:
+        _add_json(tar, 'oci-layout', {'imageLayoutVersion': '1.0.0'})
+        _add_json(tar, 'index.json', _layout_index(meta['manifest'], meta['image']))
+        for blob in meta['blobs']:
+            tar.add(store / blob_path(blob['digest']), arcname=blob_path(blob['digest']), recursive=False)
+
+
+def import_bundle(bundle: Path, runtime: Optional[ContainerRuntime] = None, store: Optional[Path] = None,
+                  load: bool = True, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Verify ``bundle`` into the blob store and load the image it carries."""
+    bundle = Path(bundle)
+    store = Path(store) if store else oci_store_dir()
+    expected = _expected_checksum(bundle)
+    started = time.perf_counter()
+    meta: Optional[Dict[str, Any]] = None
+    descriptors: Dict[str, Descriptor] = {}
+    stored = 0
+    try:
+        with open(bundle, 'rb') as raw:
+            reader = _HashingReader(raw)
+            with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                for member in tar:
+                    if member.name == BUNDLE_META:
+                        meta = json.load(tar.extractfile(member))
+                        descriptors = {blob['digest']: blob for blob in meta.get('blobs') or []}
+                        continue
+                    if meta is None:
+                        raise BundleError(f"{bundle} is not an EE bundle ({BUNDLE_META} must come first)")
+                    if not member.name.startswith('blobs/'):
+                        continue  # oci-layout / index.json は取り込み時に作り直す
+                    digest = member.name[len('blobs/'):].replace('/', ':', 1)
+                    if digest not in descriptors:
+                        raise BundleError(f"{bundle}: blob {digest} is not listed in {BUNDLE_META}")
+                    stored += _store_blob(tar.extractfile(member), descriptors[digest], store)
+            checksum = reader.drain()
+    except (OSError, tarfile.TarError, ValueError) as e:
+        raise BundleError(f"Cannot read bundle {bundle}: {e}") from e
+    if expected and checksum != expected:
+        raise BundleError(f"{bundle}: sha256 mismatch (expected {expected}, got {checksum})")
+    if meta is None:
+        raise BundleError(f"{bundle} is not an EE bundle (no {BUNDLE_META})")
+
+    missing = [blob['digest'] for blob in meta['blobs'] if not (store / blob_path(blob['digest'])).is_file()]
+    if missing:
+        bases = ', '.join(base['image'] for base in meta.get('bases') or []) or 'its base image'
+        raise BundleError(f"{bundle} is a delta: {len(missing)} blob(s) of {meta['image']} are not in "
+                          f"{store}; import the bundle of {bases} first")
+
+    if load:
+        runtime = runtime or connect_runtime()
+        with tempfile.TemporaryDirectory(prefix='ee-import-') as work_dir:
+            archive = Path(work_dir) / 'image.tar'
+            _write_archive(meta, store, archive)
+            runtime.load(str(archive), timeout=timeout)
+
+    return {
+        'image': meta['image'],
+        'bundle': str(bundle),
+        'manifest': meta['manifest']['digest'],
+        'blobs': len(meta['blobs']),
+        'stored': stored,
+        'verified': 'sha256 file' if expected else 'blob digests',
+        'loaded': load,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,126 @@
+"""
+Pull-policy-aware image pre-warmer
+
+The generated navigator config uses ``pull-policy: missing``, so a stale
+or absent image is pulled by the first ``ansible-navigator run`` on a node.
+This module compares local digests with the registry and pulls only the
+images that are cold, ahead of time and with bounded parallelism.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.registry import RegistryClient, RegistryError
+from ee_builder.runtime import ContainerRuntime, RuntimeCommandError, connect_runtime, manifest_digests
+from ee_builder.yamlcache import load_yaml
+
+DEFAULT_SOURCES = ('ansible-navigator.yml', 'execution-environment.yml')
+
+# warm: ローカルとレジストリのダイジェストが一致 / stale: 不一致 / missing: ローカルに無し
+# unknown: レジストリに到達できず比較不可
+WARM, STALE, MISSING, UNKNOWN = 'warm', 'stale', 'missing', 'unknown'
+
+
+def images_from_config(data: Any) -> List[str]:
+    """Return image references from a navigator config or EE definition."""
+    if not isinstance(data, dict):
+        return []
+
+    navigator = data.get('ansible-navigator')
+    if isinstance(navigator, dict):
+        image = (navigator.get('execution-environment') or {}).get('image')
+        return [image] if image else []
+
+    base_image = (data.get('images') or {}).get('base_image')
+    if isinstance(base_image, dict):
+        base_image = base_image.get('name')
+    return [base_image] if isinstance(base_image, str) and base_image else []
+
+
+def collect_images(sources: Sequence[Path], extra: Sequence[str] = ()) -> List[str]:
+    """Collect unique image references from config files plus explicit images."""
+    images: List[str] = []
+    for source in sources:
+        try:
+            data = load_yaml(source)
+        except OSError as e:
+            raise EEBuilderError(f"Cannot read {source}: {e}") from e
+        except yaml.YAMLError as e:
+            raise EEBuilderError(f"Invalid YAML in {source}: {e}") from e
+        images.extend(images_from_config(data))
+
+    images.extend(extra)
+    return list(dict.fromkeys(images))
+
+
+def check_image(image: str, runtime: ContainerRuntime, registry: RegistryClient) -> Dict[str, Any]:
+    """Compare the local digests of an image with the registry digest."""
+    info = runtime.inspect_image(image)
+    present = info is not None
+    local = manifest_digests(info)
+    row: Dict[str, Any] = {'image': image, 'local_digest': local[0] if local else '',
+                           'remote_digest': '', 'state': MISSING, 'action': '', 'error': ''}
+
+    if '@' in image:
+        # ダイジェスト指定のイメージは内容が変わらないため存在確認のみ
+        row['remote_digest'] = image.split('@', 1)[1]
+        row['state'] = WARM if present else MISSING
+        return row
+
+    try:
+        remote = registry.manifest_digest(image)
+    except RegistryError as e:
+        row['state'] = UNKNOWN if present else MISSING
+        row['error'] = str(e)
+        return row
+
+    row['remote_digest'] = remote
+    if remote in local:
+        row['local_digest'] = remote
+        row['state'] = WARM
+    elif present:
+        row['state'] = STALE
+    return row
+
+
+def prewarm(images: Sequence[str], runtime: Optional[ContainerRuntime] = None,
+            registry: Optional[RegistryClient] = None, jobs: int = 8, max_pulls: int = 2,
+            check_only: bool = False, pull_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Check every image and pull the cold (stale or missing) ones.
+
+    Registry checks run ``jobs`` at a time; pulls are limited separately to
+    ``max_pulls`` so several multi-GB layers do not saturate the node link.
+    Each returned row carries ``state`` (before pulling) and ``action``.
+    """
+    runtime = runtime or connect_runtime()
+    registry = registry or RegistryClient()
+
+    if not images:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(images)))) as pool:
+        rows = list(pool.map(lambda image: check_image(image, runtime, registry), images))
+
+    cold = [row for row in rows if row['state'] in (STALE, MISSING)]
+    if check_only or not cold:
+        return rows
+
+    def pull(row: Dict[str, Any]) -> None:
+        try:
+            runtime.pull(row['image'], timeout=pull_timeout)
+        except RuntimeCommandError as e:
+            row['action'] = 'failed'
+            row['error'] = str(e)
+            return
+        digests = runtime.image_digests(row['image'])
+        row['action'] = 'pulled'
+        row['local_digest'] = row['remote_digest'] if row['remote_digest'] in digests else \
+            (digests[0] if digests else '')
+
+    with ThreadPoolExecutor(max_workers=max(1, max_pulls)) as pool:
+        list(pool.map(pull, cold))
+    return rows
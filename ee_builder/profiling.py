@@ -0,0 +1,242 @@
+"""
+Profiling hooks for the Python tooling
+
+``python -m ee_builder --profile DIR <command>`` (or EE_PROFILE=DIR in the
+environment, which also reaches child ``python -m ee_builder`` processes)
+profiles one command; ``python -m ee_builder profile`` runs any script
+(scripts/generate-navigator-config.py, a test suite) the same way. Each
+profiled process writes ``DIR/<name>-<pid>.*``:
+
+- ``.pstats``: cProfile statistics (``python -m pstats``, snakeviz).
+  cProfile only sees the main thread.
+- ``.collapsed``: collapsed stacks for flamegraph.pl / speedscope /
+  inferno. The sampling profiler (EE_PROFILE_MODE=sample) records real
+  stacks of every thread; under cProfile they are rebuilt from the caller
+  graph, splitting each function's own time between its callers in
+  proportion to their cumulative time, so they are approximate.
+- ``.spans.json``: wall time of named spans (subprocess calls, registry
+  and Galaxy requests, YAML parsing) aggregated by kind and name, which
+  shows time spent waiting on child processes and the network that a CPU
+  profile does not.
+
+span() costs one global lookup when profiling is off.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ee_builder.errors import EEBuilderError
+
+MODES = ('cprofile', 'sample')
+DEFAULT_INTERVAL = 0.005
+# caller グラフからスタックを復元するときの深さの上限と、関数ごとの分岐数の上限（自身の時間に対する最小の配分比）
+MAX_STACK_DEPTH = 64
+MIN_SHARE_RATIO = 0.001
+
+_spans: Optional[Dict[Tuple[str, str], List[float]]] = None
+_spans_lock = threading.Lock()
+_active = False
+
+
+class ProfilingError(EEBuilderError):
+    """Raised for an invalid profiler mode or interval."""
+
+
+@contextmanager
+def span(kind: str, name: str) -> Iterator[None]:
+    """Time a block as a named span while profiling is active."""
+    if _spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _spans_lock:
+            entry = _spans.setdefault((kind, name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+
+def span_summary(spans: Dict[Tuple[str, str], List[float]]) -> List[Dict[str, Any]]:
+    """Span totals, largest first."""
+    rows = [{'kind': kind, 'name': name, 'count': int(count), 'total_seconds': round(total, 6),
+             'max_seconds': round(longest, 6)}
+            for (kind, name), (count, total, longest) in spans.items()]
+    return [row for _, _, row in sorted((-row['total_seconds'], n, row) for n, row in enumerate(rows))]
+
+
+def _label(filename: str, lineno: int, name: str) -> str:
+    # flamegraph.pl はフレームを ';' で区切るので名前から除く
+    if filename == '~':
+        return name.replace(';', ',')
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(';', ',')
+
+
+def collapsed_from_pstats(stats: pstats.Stats) -> Counter:
+    """Approximate collapsed stacks (microseconds) from a cProfile caller graph."""
+    table = stats.stats  # type: ignore[attr-defined]
+    stacks: Counter = Counter()
+
+    def walk(chain: List[Tuple[str, int, str]], weight: float, cutoff: float) -> None:
+        callers = [(caller, edge[3]) for caller, edge in table[chain[-1]][4].items()
+                   if caller in table and caller not in chain]
+        total = sum(cumulative for _, cumulative in callers)
+        if not callers or total <= 0 or len(chain) >= MAX_STACK_DEPTH or weight < cutoff:
+            stacks[';'.join(_label(*func) for func in reversed(chain))] += weight
+            return
+        for caller, cumulative in callers:
+            walk(chain + [caller], weight * cumulative / total, cutoff)
+
+    for func, (_, _, own_time, _, _) in table.items():
+        if own_time > 0:
+            walk([func], own_time, own_time * MIN_SHARE_RATIO)
+    return Counter({stack: int(seconds * 1e6) for stack, seconds in stacks.items() if seconds * 1e6 >= 1})
+
+
+class Sampler:
+    """Sample the stacks of every thread at a fixed interval."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            frames.append(names.get(ident, f'thread-{ident}').replace(';', ','))
+            self.stacks[';'.join(reversed(frames))] += 1
+        self.samples += 1
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name='ee-profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def write_collapsed(path: Path, stacks: Counter) -> None:
+    lines = [f'{stack} {count}' for stack, count in sorted(stacks.items()) if count > 0]
+    path.write_text('\n'.join(lines) + ('\n' if lines else ''), encoding='utf-8')
+
+
+class Profiler:
+    """Profile the current process and write pstats / collapsed stacks / span totals."""
+
+    def __init__(self, mode: str = 'cprofile', interval: float = DEFAULT_INTERVAL):
+        if mode not in MODES:
+            raise ProfilingError(f"Unknown profiler mode: {mode} (expected one of {', '.join(MODES)})")
+        if interval <= 0:
+            raise ProfilingError(f"Sampling interval must be positive: {interval}")
+        self.mode = mode
+        self.interval = interval
+        self.profile: Optional[cProfile.Profile] = None
+        self.sampler: Optional[Sampler] = None
+        self.spans: Dict[Tuple[str, str], List[float]] = {}
+        self.wall_seconds = 0.0
+        self._start = 0.0
+
+    def start(self) -> None:
+        global _spans
+        _spans = self.spans
+        self._start = time.perf_counter()
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = Sampler(self.interval)
+            self.sampler.start()
+
+    def stop(self) -> None:
+        global _spans
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.wall_seconds = time.perf_counter() - self._start
+        _spans = None
+
+    def write(self, prefix: Path) -> List[Path]:
+        """Write ``<prefix>.pstats`` (cProfile only), ``.collapsed`` and ``.spans.json``."""
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        written = []
+        if self.profile is not None:
+            stats_path = prefix.with_name(prefix.name + '.pstats')
+            self.profile.dump_stats(str(stats_path))
+            stacks = collapsed_from_pstats(pstats.Stats(str(stats_path)))
+            written.append(stats_path)
+        else:
+            stacks = self.sampler.stacks if self.sampler is not None else Counter()
+        collapsed_path = prefix.with_name(prefix.name + '.collapsed')
+        write_collapsed(collapsed_path, stacks)
+        written.append(collapsed_path)
+        spans_path = prefix.with_name(prefix.name + '.spans.json')
+        report = {'mode': self.mode, 'wall_seconds': round(self.wall_seconds, 6),
+                  'samples': self.sampler.samples if self.sampler is not None else None,
+                  'spans': span_summary(self.spans)}
+        spans_path.write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+        written.append(spans_path)
+        return written
+
+
+def _env_interval() -> float:
+    value = os.environ.get('EE_PROFILE_INTERVAL')
+    try:
+        return float(value) if value else DEFAULT_INTERVAL
+    except ValueError as e:
+        raise ProfilingError(f"Invalid EE_PROFILE_INTERVAL: {value}") from e
+
+
+@contextmanager
+def profiling(directory: Optional[str], name: str, mode: Optional[str] = None,
+              interval: Optional[float] = None) -> Iterator[Optional[Profiler]]:
+    """Profile the block into ``directory`` (default EE_PROFILE); a no-op when neither is set.
+
+    Nested calls (a profiled command run in-process by a profiled script)
+    leave the outer profiler in charge.
+    """
+    global _active
+    directory = directory or os.environ.get('EE_PROFILE')
+    if not directory or _active:
+        yield None
+        return
+    profiler = Profiler(mode or os.environ.get('EE_PROFILE_MODE') or 'cprofile',
+                        interval or _env_interval())
+    _active = True
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = False
+        paths = profiler.write(Path(directory) / f'{name}-{os.getpid()}')
+        print(f"Profile written: {', '.join(str(p) for p in paths)}", file=sys.stderr)
@@ -0,0 +1,528 @@
+"""
+Python requirements lock for the EE pip stage
+
+Resolves dependencies.python (PEP 508 lines with open ``>=`` ranges)
+against a local stand-in for the package index and pins the result, with
+the SHA-256 of every distribution file, in the ``python`` section of
+ee.lock. A locked build hands pip ``name==version --hash=sha256:...``
+lines only, so pip has nothing left to resolve and the install is
+reproducible.
+
+The index stand-in is either a wheelhouse (``pip download`` output:
+wheels and sdists whose metadata is read from the archives) or a
+YAML/JSON snapshot::
+
+    packages:
+      boto3:
+        1.28.0:
+          requires: ["botocore>=1.31.0,<1.32.0", "jmespath>=0.7.1,<2.0.0"]
+          requires_python: ">=3.7"
+          files:
+            - {url: boto3-1.28.0-py3-none-any.whl, sha256: 9d1c...}
+
+Markers are evaluated for the image's interpreter (``--python-version``,
+by default taken from dependencies.python_interpreter.python_path).
+"""
+
+import email.parser
+import functools
+import re
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ee_builder.eefile import requirement_lines
+from ee_builder.eeschema import canonical_name, parse_marker, parse_requirement
+from ee_builder.lockfile import LockError, file_sha256, requirements_digest
+from ee_builder.resolver import MAX_STEPS, Constraint, ResolutionError, backtrack  # noqa: F401
+from ee_builder.yamlcache import load_yaml
+
+PyIndex = Dict[str, Dict[str, Dict[str, Any]]]
+
+# 既定のベースイメージ（ee-minimal-rhel9）のシステム Python
+DEFAULT_PYTHON_VERSION = '3.9'
+ROOT = 'execution-environment'
+
+_VERSION = re.compile(
+    r'^\s*v?(?:(?P<epoch>\d+)!)?(?P<release>\d+(?:\.\d+)*)'
+    r'(?:[-_.]?(?P<pre_l>alpha|beta|preview|pre|rc|a|b|c)[-_.]?(?P<pre_n>\d+)?)?'
+    r'(?:-(?P<post_n1>\d+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>\d+)?)?'
+    r'(?:[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>\d+)?)?'
+    r'(?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?\s*$',
+    re.IGNORECASE,
+)
+_PRE_LETTERS = {'alpha': 'a', 'a': 'a', 'beta': 'b', 'b': 'b', 'c': 'rc', 'rc': 'rc', 'pre': 'rc', 'preview': 'rc'}
+_CLAUSE = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*(\S+)\s*$')
+_PYTHON_PATH_VERSION = re.compile(r'python(\d+\.\d+)')
+_WHEEL_NAME = re.compile(r'^(?P<name>.+?)-(?P<version>[^-]+)(?:-\d[^-]*)?'
+                         r'-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$')
+_SDIST_NAME = re.compile(r'^(?P<name>.+)-(?P<version>[^-]+)\.(?:tar\.gz|zip)$')
+_VERSION_VARIABLES = ('python_version', 'python_full_version', 'implementation_version')
+_INDEX_OPTIONS = ('-i', '--index-url', '--extra-index-url', '--no-index', '-f', '--find-links', '--pre',
+                  '--prefer-binary', '--only-binary', '--no-binary', '--trusted-host', '--require-hashes',
+                  '--use-feature')
+
+
+# === PEP 440 versions ===
+class Version:
+    """Parsed PEP 440 version; ``key`` orders versions like pip does."""
+
+    __slots__ = ('text', 'epoch', 'release', 'pre', 'post', 'dev', 'local', 'key')
+
+    def __init__(self, text: str):
+        match = _VERSION.match(text)
+        if not match:
+            raise ValueError(f"invalid version '{text}'")
+        self.text = text
+        self.epoch = int(match.group('epoch') or 0)
+        self.release = tuple(int(part) for part in match.group('release').split('.'))
+        self.pre = None
+        if match.group('pre_l'):
+            self.pre = (_PRE_LETTERS[match.group('pre_l').lower()], int(match.group('pre_n') or 0))
+        self.post = None
+        if match.group('post_n1') is not None:
+            self.post = int(match.group('post_n1'))
+        elif match.group('post_l'):
+            self.post = int(match.group('post_n2') or 0)
+        self.dev = int(match.group('dev_n') or 0) if match.group('dev_l') else None
+        self.local = match.group('local')
+
+        release = self.release
+        while len(release) > 1 and release[-1] == 0:
+            release = release[:-1]
+        if self.pre is None and self.post is None and self.dev is not None:
+            pre_key: Tuple[Any, ...] = (0,)
+        elif self.pre is None:
+            pre_key = (2,)
+        else:
+            pre_key = (1,) + self.pre
+        post_key = (0,) if self.post is None else (1, self.post)
+        dev_key = (2,) if self.dev is None else (1, self.dev)
+        local_key: Tuple[Any, ...] = (0,)
+        if self.local:
+            local_key = (1, tuple((1, int(p), '') if p.isdigit() else (0, 0, p.lower())
+                                  for p in re.split(r'[-_.]', self.local)))
+        self.key = (self.epoch, release, pre_key, post_key, dev_key, local_key)
+
+    @property
+    def public_key(self) -> Tuple[Any, ...]:
+        return self.key[:5] + ((0,),)
+
+    @property
+    def base(self) -> Tuple[int, Tuple[int, ...]]:
+        return self.key[0], self.key[1]
+
+    @property
+    def is_prerelease(self) -> bool:
+        return self.pre is not None or self.dev is not None
+
+
+@functools.lru_cache(maxsize=None)
+def parse_version(text: str) -> Version:
+    return Version(str(text))
+
+
+def _padded(release: Tuple[int, ...], length: int) -> Tuple[int, ...]:
+    return release[:length] + (0,) * (length - len(release))
+
+
+def _clause_matches(version: Version, op: str, target: str) -> bool:
+    if op == '===':
+        return version.text == target
+    if op in ('==', '!=') and target.endswith('.*'):
+        prefix = parse_version(target[:-2])
+        equal = version.epoch == prefix.epoch and \
+            _padded(version.release, len(prefix.release)) == prefix.release
+        return equal if op == '==' else not equal
+    other = parse_version(target)
+    mine = version.key if other.local else version.public_key
+    if op == '==':
+        return mine == other.key
+    if op == '!=':
+        return mine != other.key
+    if op == '~=':
+        prefix = other.release[:-1]
+        return version.public_key >= other.key and version.epoch == other.epoch and \
+            _padded(version.release, len(prefix)) == prefix
+    if op == '>=':
+        return version.public_key >= other.key
+    if op == '<=':
+        return version.public_key <= other.key
+    if op == '>':
+        # 1.0.post1 は >1.0 に含めない（PEP 440）
+        return version.public_key > other.key and not (
+            version.post is not None and other.post is None and version.base == other.base)
+    if op == '<':
+        return version.public_key < other.key and not (
+            version.is_prerelease and not other.is_prerelease and version.base == other.base)
+    raise ValueError(f"unknown operator '{op}'")
+
+
+def specifier_matches(version: str, specifier: str, prereleases: Optional[bool] = None) -> bool:
+    """True when ``version`` satisfies a PEP 440 specifier such as ``>=1.0,!=1.3.*``.
+
+    Pre-releases match only when ``prereleases`` is true or, by default,
+    when the specifier itself names a pre-release.
+    """
+    parsed = parse_version(version)
+    clauses = []
+    for clause in (specifier or '').split(','):
+        if not clause.strip():
+            continue
+        match = _CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"invalid version specifier '{clause.strip()}'")
+        clauses.append(match.groups())
+    if parsed.is_prerelease:
+        if prereleases is None:
+            prereleases = any(op != '===' and parse_version(target.rstrip('.*') or '0').is_prerelease
+                              for op, target in clauses)
+        if not prereleases:
+            return False
+    return all(_clause_matches(parsed, op, target) for op, target in clauses)
+
+
+# === markers ===
+def target_environment(python_version: str = DEFAULT_PYTHON_VERSION) -> Dict[str, str]:
+    """Marker environment of a Linux x86_64 CPython image."""
+    full = python_version if python_version.count('.') >= 2 else f"{python_version}.0"
+    env = {
+        'python_version': '.'.join(python_version.split('.')[:2]),
+        'python_full_version': full,
+        'implementation_version': full,
+        'implementation_name': 'cpython',
+        'platform_python_implementation': 'CPython',
+        'os_name': 'posix',
+        'sys_platform': 'linux',
+        'platform_system': 'Linux',
+        'platform_machine': 'x86_64',
+        'platform_release': '',
+        'platform_version': '',
+        'extra': '',
+    }
+    env.update({'os.name': env['os_name'], 'sys.platform': env['sys_platform'],
+                'platform.version': '', 'platform.machine': env['platform_machine'],
+                'platform.python_implementation': 'CPython', 'python_implementation': 'CPython'})
+    return env
+
+
+def _compare(left: Tuple[str, str], op: str, right: Tuple[str, str], env: Dict[str, str]) -> bool:
+    def value(token: Tuple[str, str]) -> str:
+        kind, text = token
+        return env.get(text, '') if kind == 'var' else text[1:-1]
+
+    lhs, rhs = value(left), value(right)
+    if 'extra' in (left[1], right[1]):
+        lhs, rhs = canonical_name(lhs), canonical_name(rhs)
+    if op == 'in':
+        return lhs in rhs
+    if op == 'not in':
+        return lhs not in rhs
+    if left[1] in _VERSION_VARIABLES or right[1] in _VERSION_VARIABLES:
+        try:
+            return specifier_matches(lhs, op + rhs, prereleases=True)
+        except ValueError:
+            pass
+    if op == '==':
+        return lhs == rhs
+    if op == '!=':
+        return lhs != rhs
+    return {'<': lhs < rhs, '<=': lhs <= rhs, '>': lhs > rhs, '>=': lhs >= rhs}.get(op, False)
+
+
+def evaluate_marker(marker: Optional[str], env: Dict[str, str]) -> bool:
+    if not marker:
+        return True
+
+    def walk(node: Tuple[Any, ...]) -> bool:
+        if node[0] == 'or':
+            return any(walk(child) for child in node[1])
+        if node[0] == 'and':
+            return all(walk(child) for child in node[1])
+        _, left, op, right = node
+        return _compare(left, op, right, env)
+
+    return walk(parse_marker(marker))
+
+
+# === index stand-ins ===
+def _metadata_fields(text: str) -> Dict[str, Any]:
+    message = email.parser.HeaderParser().parsestr(text)
+    return {'requires': [str(r) for r in message.get_all('Requires-Dist') or []],
+            'requires_python': message.get('Requires-Python')}
+
+
+def read_distribution_metadata(path: Path) -> Optional[Dict[str, Any]]:
+    """Read Requires-Dist / Requires-Python from a wheel or sdist without unpacking it."""
+    name = path.name
+    try:
+        if name.endswith('.whl'):
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.namelist():
+                    if member.count('/') == 1 and member.endswith('.dist-info/METADATA'):
+                        return _metadata_fields(archive.read(member).decode('utf-8', 'replace'))
+        elif name.endswith('.tar.gz'):
+            with tarfile.open(path, 'r:gz') as archive:
+                for member in archive:
+                    if member.name.count('/') == 1 and member.name.endswith('/PKG-INFO'):
+                        f = archive.extractfile(member)
+                        if f is not None:
+                            return _metadata_fields(f.read().decode('utf-8', 'replace'))
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise LockError(f"Cannot read {path}: {e}") from e
+    return None
+
+
+def index_from_wheelhouse(directory: Path) -> PyIndex:
+    index: PyIndex = {}
+    for path in sorted(Path(directory).iterdir()):
+        match = _WHEEL_NAME.match(path.name) or _SDIST_NAME.match(path.name)
+        if not match or not path.is_file():
+            continue
+        entry = index.setdefault(canonical_name(match.group('name')), {}).setdefault(
+            match.group('version'), {'files': [], 'requires': None, 'requires_python': None})
+        entry['files'].append({'url': str(path.resolve()), 'sha256': file_sha256(path), 'filename': path.name})
+        # wheel のメタデータを優先（sdist は Requires-Dist を持たないことがある）
+        if entry['requires'] is None or path.name.endswith('.whl'):
+            metadata = read_distribution_metadata(path)
+            if metadata is not None:
+                entry.update(metadata)
+    for versions in index.values():
+        for entry in versions.values():
+            entry['requires'] = entry['requires'] or []
+    return index
+
+
+def load_python_index(path: Path) -> PyIndex:
+    """Load a wheelhouse directory or a YAML/JSON package snapshot."""
+    path = Path(path)
+    if path.is_dir():
+        return index_from_wheelhouse(path)
+    try:
+        data = load_yaml(path)
+    except OSError as e:
+        raise LockError(f"Cannot read package index {path}: {e}") from e
+    packages = (data or {}).get('packages') if isinstance(data, dict) else None
+    if not isinstance(packages, dict):
+        raise LockError(f"{path}: expected a 'packages' mapping")
+    index: PyIndex = {}
+    for name, versions in packages.items():
+        for version, entry in (versions or {}).items():
+            entry = dict(entry or {})
+            files = list(entry.get('files') or [])
+            if entry.get('sha256'):
+                files.append({'url': entry.get('url', ''), 'sha256': entry['sha256']})
+            index.setdefault(canonical_name(str(name)), {})[str(version)] = {
+                'files': [{'url': f.get('url', ''), 'sha256': f.get('sha256'),
+                           'filename': f.get('filename') or Path(str(f.get('url', ''))).name}
+                          for f in files],
+                'requires': [str(r) for r in entry.get('requires') or []],
+                'requires_python': entry.get('requires_python'),
+            }
+    return index
+
+
+def _wheel_compatible(filename: str, python_version: str) -> bool:
+    match = _WHEEL_NAME.match(filename or '')
+    if not match:
+        return True
+    if match.group('platform').startswith(('win', 'macosx')):
+        return False
+    major, minor = (int(part) for part in python_version.split('.')[:2])
+    for tag in match.group('python').split('.'):
+        if tag in ('py3', f"py{major}{minor}"):
+            return True
+        cp = re.match(r'^cp(\d)(\d+)$', tag)
+        if cp and int(cp.group(1)) == major:
+            # abi3 wheel は指定バージョン以降で使える
+            if int(cp.group(2)) == minor or (match.group('abi') == 'abi3' and int(cp.group(2)) <= minor):
+                return True
+    return False
+
+
+# === requirements ===
+def parse_requirement_lines(lines: Sequence[str], env: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Parse pip requirement lines into requirements that apply to ``env``.
+
+    Index options are dropped (the lock replaces resolution); file
+    includes, editables and direct references cannot be locked.
+    """
+    requirements: List[Dict[str, Any]] = []
+    pending = ''
+    for raw in lines:
+        text = re.sub(r'(^|\s)#.*$', '', raw).strip()
+        if pending:
+            text = f"{pending} {text}"
+            pending = ''
+        if text.endswith('\\'):
+            pending = text[:-1].strip()
+            continue
+        if not text:
+            continue
+        if text.startswith('-'):
+            option = re.split(r'[\s=]', text, 1)[0]
+            if option in _INDEX_OPTIONS:
+                continue
+            raise LockError(f"Cannot lock pip option line: '{text}'")
+        text = re.split(r'\s--hash[=\s]', text, 1)[0]
+        try:
+            requirement = parse_requirement(text)
+        except ValueError as e:
+            raise LockError(f"Invalid python requirement '{text}': {e}") from e
+        if requirement['url']:
+            raise LockError(f"Cannot lock direct reference '{text}'")
+        if evaluate_marker(requirement['marker'], env):
+            requirements.append(requirement)
+    return requirements
+
+
+def python_version_for(ee_config: Dict[str, Any]) -> str:
+    """Interpreter version of the image, from python_interpreter.python_path when set."""
+    interpreter = (ee_config.get('dependencies') or {}).get('python_interpreter') or {}
+    match = _PYTHON_PATH_VERSION.search(str(interpreter.get('python_path') or ''))
+    return match.group(1) if match else DEFAULT_PYTHON_VERSION
+
+
+def python_digest(lines: Sequence[str], python_version: str) -> str:
+    env = target_environment(python_version)
+    requirements = parse_requirement_lines(lines, env)
+    return requirements_digest({
+        'python_version': python_version,
+        'requirements': [[canonical_name(r['name']), sorted(r['extras']), r['specifier']] for r in requirements],
+    })
+
+
+# === resolver ===
+def _node(name: str, extras: Sequence[str] = ()) -> str:
+    name = canonical_name(name)
+    return f"{name}[{','.join(sorted(canonical_name(e) for e in extras))}]" if extras else name
+
+
+def _split_node(node: str) -> Tuple[str, List[str]]:
+    if '[' not in node:
+        return node, []
+    name, extras = node[:-1].split('[', 1)
+    return name, extras.split(',')
+
+
+def resolve_python(requirements: Sequence[Dict[str, Any]], index: PyIndex, python_version: str,
+                   max_steps: int = MAX_STEPS) -> Dict[str, str]:
+    """Pin every package (dependencies included) for ``python_version``, newest first.
+
+    ``pkg[extra]`` is resolved as its own node that depends on ``pkg`` at
+    the same version plus the extra's requirements, so extras need no
+    special casing in the search.
+    """
+    env = target_environment(python_version)
+
+    def candidates(node: str, constraints: Sequence[Constraint]) -> List[str]:
+        name, _ = _split_node(node)
+        versions = index.get(name) or {}
+        allowed = []
+        for version in versions:
+            entry = versions[version]
+            try:
+                parse_version(version)
+            except ValueError:
+                continue
+            if entry.get('requires_python') and \
+                    not specifier_matches(env['python_full_version'], entry['requires_python'], True):
+                continue
+            files = entry.get('files') or []
+            if files and not any(_wheel_compatible(f.get('filename', ''), python_version) for f in files):
+                continue
+            if all(specifier_matches(version, spec) for spec, _ in constraints):
+                allowed.append(version)
+        return [v for _, v in sorted(((parse_version(v).key, v) for v in allowed), reverse=True)]
+
+    def dependencies(node: str, version: str) -> List[Tuple[str, str]]:
+        name, extras = _split_node(node)
+        deps: List[Tuple[str, str]] = [(name, f"=={version}")] if extras else []
+        for line in index[name][version].get('requires') or []:
+            try:
+                requirement = parse_requirement(line)
+            except ValueError as e:
+                raise LockError(f"{name} {version}: invalid Requires-Dist '{line}': {e}") from e
+            base = evaluate_marker(requirement['marker'], env)
+            # extra ノードは extra 指定時だけ増える依存を持つ（共通の依存は本体ノード側）
+            if extras:
+                wanted = not base and any(evaluate_marker(requirement['marker'], dict(env, extra=e))
+                                          for e in extras)
+            else:
+                wanted = base
+            if wanted:
+                deps.append((_node(requirement['name']), requirement['specifier']))
+                if requirement['extras']:
+                    deps.append((_node(requirement['name'], requirement['extras']), requirement['specifier']))
+        return deps
+
+    roots = []
+    for requirement in requirements:
+        origin = requirement.get('origin', ROOT)
+        roots.append((_node(requirement['name']), requirement['specifier'], origin))
+        if requirement['extras']:
+            roots.append((_node(requirement['name'], requirement['extras']), requirement['specifier'], origin))
+
+    pinned = backtrack(
+        roots, candidates, dependencies,
+        lambda node, version, spec: specifier_matches(version, spec, prereleases=True),
+        lambda node: _split_node(node)[0] in index,
+        max_steps, label='python packages',
+    )
+    return {node: version for node, version in pinned.items() if '[' not in node}
+
+
+def lock_python(ee_config: Dict[str, Any], base_dir: Path, index: PyIndex,
+                python_version: Optional[str] = None,
+                extra: Sequence[Tuple[str, Sequence[str]]] = ()) -> Dict[str, Any]:
+    """Resolve dependencies.python and return the ee.lock ``python`` section.
+
+    ``extra`` holds ``(origin, lines)`` pairs resolved along with the EE
+    file, e.g. the requirements of locked collections, so hash-checking
+    pip finds a pin for everything ansible-builder merges in.
+    """
+    python_version = python_version or python_version_for(ee_config)
+    env = target_environment(python_version)
+    lines = requirement_lines(ee_config, 'python', base_dir)
+    requirements = parse_requirement_lines(lines, env)
+    for origin, extra_lines in extra:
+        requirements += [dict(r, origin=origin) for r in parse_requirement_lines(extra_lines, env)]
+    pinned = resolve_python(requirements, index, python_version)
+
+    packages = []
+    for name in sorted(pinned):
+        files = index[name][pinned[name]].get('files') or []
+        hashes = sorted({f"sha256:{f['sha256']}" for f in files
+                         if f.get('sha256') and _wheel_compatible(f.get('filename', ''), python_version)})
+        if not hashes:
+            raise LockError(f"{name} {pinned[name]}: no file hashes in the index")
+        packages.append({'name': name, 'version': pinned[name], 'hashes': hashes})
+    return {
+        'requirements_digest': python_digest(lines, python_version),
+        'python_version': python_version,
+        'packages': packages,
+    }
+
+
+def locked_requirements(section: Dict[str, Any]) -> List[str]:
+    """pip requirement lines for a python lock section (hash-checking mode)."""
+    return [f"{p['name']}=={p['version']} " + ' '.join(f"--hash={h}" for h in p['hashes'])
+            for p in section.get('packages') or []]
+
+
+def locked_python_config(ee_config: Dict[str, Any], section: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of the EE definition whose pip stage installs the locked set.
+
+    Locked names are also excluded from collection-declared requirements
+    so ansible-builder does not add unhashed duplicates of them.
+    """
+    config = dict(ee_config)
+    dependencies = dict(config.get('dependencies') or {})
+    dependencies['python'] = locked_requirements(section)
+    exclude = dict(dependencies.get('exclude') or {})
+    names = [p['name'] for p in section.get('packages') or []]
+    exclude['python'] = list(dict.fromkeys(list(exclude.get('python') or []) + names))
+    dependencies['exclude'] = exclude
+    config['dependencies'] = dependencies
+    return config
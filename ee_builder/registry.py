@@ -0,0 +1,224 @@
+"""
+Minimal container registry (Distribution API v2) client
+
+Only the calls the tooling needs are implemented. Credentials are read
+from the containers auth file (REGISTRY_AUTH_FILE) and anonymous bearer
+tokens are requested on demand, as podman/docker would do.
+"""
+
+import json
+import os
+import re
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.profiling import span
+
+DEFAULT_REGISTRY = 'docker.io'
+DOCKER_HUB_API = 'registry-1.docker.io'
+
+INDEX_TYPES = ('application/vnd.oci.image.index.v1+json',
+               'application/vnd.docker.distribution.manifest.list.v2+json')
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+
+
+class RegistryError(EEBuilderError):
+    """Raised when a registry request fails."""
+
+
+def parse_image_ref(image: str) -> Tuple[str, str, str]:
+    """Split an image reference into (registry, repository, tag-or-digest)."""
+    name, reference = image, 'latest'
+    if '@' in name:
+        name, reference = name.split('@', 1)
+    else:
+        last = name.rsplit('/', 1)[-1]
+        if ':' in last:
+            name, reference = name.rsplit(':', 1)
+
+    first, _, rest = name.partition('/')
+    if rest and ('.' in first or ':' in first or first == 'localhost'):
+        registry, repository = first, rest
+    else:
+        registry, repository = DEFAULT_REGISTRY, name
+
+    if registry == DEFAULT_REGISTRY and '/' not in repository:
+        repository = f'library/{repository}'
+    return registry, repository, reference
+
+
+def load_auth_file(path: Optional[Path] = None) -> Dict[str, str]:
+    """Return {registry: base64 'user:password'} from the containers auth file."""
+    candidates = [path] if path else [
+        Path(os.environ['REGISTRY_AUTH_FILE']) if os.environ.get('REGISTRY_AUTH_FILE') else None,
+        Path(os.environ.get('XDG_RUNTIME_DIR', '/nonexistent')) / 'containers/auth.json',
+        Path.home() / '.config/containers/auth.json',
+        Path.home() / '.docker/config.json',
+    ]
+    for candidate in candidates:
+        if candidate and candidate.is_file():
+            try:
+                data = json.loads(candidate.read_text())
+            except (OSError, ValueError):
+                continue
+            return {registry: entry['auth'] for registry, entry in data.get('auths', {}).items()
+                    if isinstance(entry, dict) and entry.get('auth')}
+    return {}
+
+
+def find_auth(auths: Dict[str, str], registry: str) -> Optional[str]:
+    """Look up a registry in load_auth_file() output, including Docker Hub's legacy key."""
+    names = [registry, f'https://{registry}']
+    if registry == DEFAULT_REGISTRY:
+        names.append('https://index.docker.io/v1/')
+    return next((auths[name] for name in names if name in auths), None)
+
+
+class RegistryClient:
+    """Registry v2 client with per-repository bearer token caching."""
+
+    def __init__(self, insecure: Optional[List[str]] = None, auth_file: Optional[Path] = None,
+                 timeout: float = 30):
+        self.insecure = set(insecure or [])
+        self.auths = load_auth_file(auth_file)
+        self.timeout = timeout
+        self._bearer: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def base_url(self, registry: str) -> str:
+        host = DOCKER_HUB_API if registry == DEFAULT_REGISTRY else registry
+        scheme = 'http' if registry in self.insecure else 'https'
+        return f'{scheme}://{host}'
+
+    def _basic_auth(self, registry: str) -> Optional[str]:
+        return find_auth(self.auths, registry)
+
+    def _fetch_bearer(self, registry: str, challenge: str) -> Optional[str]:
+        scheme, _, params = challenge.partition(' ')
+        if scheme.lower() != 'bearer':
+            return None
+        fields = dict(
+            (part.split('=', 1)[0].strip(), part.split('=', 1)[1].strip().strip('"'))
+            for part in params.split(',') if '=' in part
+        )
+        realm = fields.pop('realm', None)
+        if not realm:
+            return None
+
+        request = urllib.request.Request(f"{realm}?{urllib.parse.urlencode(fields)}")
+        basic = self._basic_auth(registry)
+        if basic:
+            request.add_header('Authorization', f'Basic {basic}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise RegistryError(f"{registry}: token request to {realm} failed: {e}") from e
+        return data.get('token') or data.get('access_token')
+
+    def request(self, method: str, registry: str, repository: str, path: str,
+                headers: Optional[Dict[str, str]] = None, data: Optional[bytes] = None
+                ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send an authenticated request to /v2/<repository>/<path>."""
+        url = f"{self.base_url(registry)}/v2/{repository}/{path}"
+        cache_slot = (registry, repository)
+
+        for attempt in range(2):
+            request = urllib.request.Request(url, data=data, method=method, headers=dict(headers or {}))
+            with self._lock:
+                bearer = self._bearer.get(cache_slot)
+            if bearer:
+                request.add_header('Authorization', f'Bearer {bearer}')
+            elif self._basic_auth(registry):
+                request.add_header('Authorization', f'Basic {self._basic_auth(registry)}')
+
+            try:
+                with span('http', f'registry {method}'), \
+                        urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return response.status, dict(response.headers.items()), response.read()
+            except urllib.error.HTTPError as e:
+                challenge = e.headers.get('WWW-Authenticate', '')
+                if e.code == 401 and attempt == 0 and challenge:
+                    bearer = self._fetch_bearer(registry, challenge)
+                    if bearer:
+                        with self._lock:
+                            self._bearer[cache_slot] = bearer
+                        continue
+                return e.code, dict(e.headers.items()), e.read()
+            except (urllib.error.URLError, OSError) as e:
+                raise RegistryError(f"{registry}: {e}") from e
+        raise RegistryError(f"{registry}: authentication failed for {repository}")
+
+    def manifest_digest(self, image: str) -> str:
+        """Return the digest the registry currently serves for an image reference."""
+        registry, repository, reference = parse_image_ref(image)
+        status, headers, _ = self.request(
+            'HEAD', registry, repository, f'manifests/{reference}',
+            headers={'Accept': MANIFEST_TYPES}
+        )
+        if status != 200:
+            raise RegistryError(f"{image}: manifest request returned HTTP {status}")
+
+        digest = next((v for k, v in headers.items() if k.lower() == 'docker-content-digest'), None)
+        if not digest:
+            raise RegistryError(f"{image}: registry did not return a content digest")
+        return digest
+
+    def list_tags(self, registry: str, repository: str, page_size: int = 1000) -> List[str]:
+        """Return every tag of a repository, following ``Link`` pagination."""
+        tags: List[str] = []
+        path = f'tags/list?n={page_size}'
+        while path:
+            status, headers, body = self.request('GET', registry, repository, path)
+            if status == 404:
+                return tags
+            if status != 200:
+                raise RegistryError(f"{registry}/{repository}: tag list returned HTTP {status}")
+            try:
+                tags.extend(json.loads(body.decode('utf-8')).get('tags') or [])
+            except ValueError as e:
+                raise RegistryError(f"{registry}/{repository}: invalid tag list: {e}") from e
+            link = next((v for k, v in headers.items() if k.lower() == 'link'), '')
+            match = re.search(r'<[^>]*/tags/list\?([^>]*)>\s*;\s*rel="?next"?', link)
+            path = f'tags/list?{match.group(1)}' if match else ''
+        return tags
+
+    def get_manifest(self, registry: str, repository: str, reference: str) -> Tuple[str, Dict[str, Any]]:
+        """Return (digest, manifest) for a tag or digest."""
+        status, headers, body = self.request('GET', registry, repository, f'manifests/{reference}',
+                                             headers={'Accept': MANIFEST_TYPES})
+        if status != 200:
+            raise RegistryError(f"{registry}/{repository}:{reference}: manifest request returned HTTP {status}")
+        digest = next((v for k, v in headers.items() if k.lower() == 'docker-content-digest'), None)
+        try:
+            return digest or '', json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise RegistryError(f"{registry}/{repository}:{reference}: invalid manifest: {e}") from e
+
+    def get_blob_json(self, registry: str, repository: str, digest: str) -> Dict[str, Any]:
+        """Return a JSON blob such as an image config."""
+        status, _, body = self.request('GET', registry, repository, f'blobs/{digest}')
+        if status != 200:
+            raise RegistryError(f"{registry}/{repository}@{digest}: blob request returned HTTP {status}")
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise RegistryError(f"{registry}/{repository}@{digest}: invalid JSON blob: {e}") from e
+
+    def delete_manifest(self, registry: str, repository: str, digest: str) -> None:
+        """Delete a manifest by digest (every tag pointing at it goes with it)."""
+        status, _, body = self.request('DELETE', registry, repository, f'manifests/{digest}')
+        if status not in (200, 202):
+            detail = body.decode('utf-8', 'replace').strip()[:200]
+            raise RegistryError(f"{registry}/{repository}@{digest}: delete returned HTTP {status}"
+                                + (f": {detail}" if detail else ''))
@@ -0,0 +1,215 @@
+"""
+Registry-side tag garbage collection
+
+Every CI run pushes a ``dev-YYYYMMDD`` tag to each configured registry and
+nothing ever removes them. ``plan_gc`` lists the tags of the EE
+repositories concurrently, reads each tag's digest and creation time, and
+applies the keep-rules:
+
+- protected tags (shell-style patterns, ``latest`` by default) are kept;
+- release tags (``v1.2.3``) are kept for the newest ``keep_releases``;
+- other tags are kept while younger than ``max_age_days``; the creation
+  time comes from the image config, or from a ``YYYYMMDD`` in the tag.
+
+Deletion in the Distribution API is by digest and removes every tag that
+points at it, so a tag whose digest is still referenced by a kept tag is
+kept as well. ``apply_gc`` deletes the planned digests in batches with
+bounded parallelism; a batch in which every delete fails stops the run
+(registries such as Docker Hub do not support the delete API).
+"""
+
+import fnmatch
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.registry import INDEX_TYPES, RegistryClient, RegistryError, parse_image_ref
+
+DEFAULT_IMAGE_NAME = 'ansible-custom-ee'
+DEFAULT_PROTECTED = ('latest',)
+DEFAULT_KEEP_RELEASES = 10
+DEFAULT_MAX_AGE_DAYS = 14.0
+DEFAULT_BATCH = 20
+
+RELEASE_TAG = re.compile(r'^v?(\d+(?:\.\d+)*)$')
+TAG_DATE = re.compile(r'(?:^|\D)(20\d{2})(\d{2})(\d{2})(?:\D|$)')
+
+# keep: 保持 / delete: 削除予定（dry-run） / deleted・failed・skipped: 実行結果
+KEEP, DELETE, DELETED, FAILED, SKIPPED = 'keep', 'delete', 'deleted', 'failed', 'skipped'
+
+
+class RegistryGCError(EEBuilderError):
+    """Raised when no repositories are configured or a repository cannot be listed."""
+
+
+def configured_repositories(image_name: Optional[str] = None) -> List[str]:
+    """Return the repositories the build-push action pushes to, from the same environment variables."""
+    name = image_name or os.environ.get('IMAGE_NAME') or DEFAULT_IMAGE_NAME
+    repositories = []
+    if os.environ.get('DOCKER_USERNAME'):
+        repositories.append(f"docker.io/{os.environ['DOCKER_USERNAME']}/{name}")
+    for variable in ('ECR_REGISTRY', 'ACR_REGISTRY'):
+        if os.environ.get(variable):
+            repositories.append(f"{os.environ[variable].rstrip('/')}/{name}")
+    if os.environ.get('GCP_PROJECT_ID'):
+        repositories.append(f"gcr.io/{os.environ['GCP_PROJECT_ID']}/{name}")
+    return repositories
+
+
+def _split_repository(repository: str) -> Tuple[str, str]:
+    registry, path, _ = parse_image_ref(repository)
+    return registry, path
+
+
+def tag_created(tag: str, config: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Return the creation time (epoch seconds) from the image config or a YYYYMMDD in the tag."""
+    created = (config or {}).get('created')
+    if isinstance(created, str) and created:
+        # RFC 3339（ナノ秒付きもある）の秒までを使う
+        match = re.match(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})', created)
+        if match:
+            try:
+                return datetime(*map(int, match.groups()), tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                pass
+    match = TAG_DATE.search(tag)
+    if match:
+        try:
+            return datetime(*map(int, match.groups()), tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def inspect_tag(client: RegistryClient, registry: str, repository: str, tag: str) -> Dict[str, Any]:
+    """Return {tag, digest, created, error} for one tag."""
+    try:
+        digest, manifest = client.get_manifest(registry, repository, tag)
+        if manifest.get('mediaType') in INDEX_TYPES or 'manifests' in manifest:
+            # マルチアーキのインデックスは最初のイメージのコンフィグで作成日時を判定する
+            children = manifest.get('manifests') or []
+            manifest = client.get_manifest(registry, repository, children[0]['digest'])[1] if children else {}
+        config_digest = (manifest.get('config') or {}).get('digest')
+        config = client.get_blob_json(registry, repository, config_digest) if config_digest else None
+    except RegistryError as e:
+        return {'tag': tag, 'digest': None, 'created': tag_created(tag, None), 'error': str(e)}
+    return {'tag': tag, 'digest': digest or None, 'created': tag_created(tag, config), 'error': None}
+
+
+def _release_key(tag: str) -> Tuple[int, ...]:
+    match = RELEASE_TAG.match(tag)
+    return tuple(int(part) for part in match.group(1).split('.')) if match else ()
+
+
+def apply_rules(tags: List[Dict[str, Any]], protected: Sequence[str] = DEFAULT_PROTECTED,
+                keep_releases: int = DEFAULT_KEEP_RELEASES, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Decide keep/delete with a reason for every tag of one repository."""
+    now = time.time() if now is None else now
+    releases = [(_release_key(entry['tag']), entry['tag']) for entry in tags if RELEASE_TAG.match(entry['tag'])]
+    releases.sort(reverse=True)
+    kept_releases = {tag for _, tag in releases[:max(0, keep_releases)]}
+
+    decided = []
+    for entry in tags:
+        tag = entry['tag']
+        if any(fnmatch.fnmatchcase(tag, pattern) for pattern in protected):
+            action, reason = KEEP, 'protected'
+        elif entry['digest'] is None:
+            action, reason = KEEP, f"not inspected: {entry['error']}"
+        elif RELEASE_TAG.match(tag):
+            action, reason = (KEEP, f'newest {keep_releases} releases') if tag in kept_releases \
+                else (DELETE, f'older than the newest {keep_releases} releases')
+        elif entry['created'] is None:
+            action, reason = KEEP, 'age unknown'
+        else:
+            age = (now - entry['created']) / 86400
+            action, reason = (DELETE, f'{age:.0f} days old') if age > max_age_days \
+                else (KEEP, f'{age:.0f} days old')
+        decided.append(dict(entry, action=action, reason=reason))
+
+    # 削除はダイジェスト単位なので、保持するタグと同じダイジェストは消せない
+    kept_digests = {entry['digest']: entry['tag'] for entry in decided if entry['action'] == KEEP and entry['digest']}
+    for entry in decided:
+        if entry['action'] == DELETE and entry['digest'] in kept_digests:
+            entry.update(action=KEEP, reason=f"same digest as kept tag {kept_digests[entry['digest']]}")
+    return decided
+
+
+def plan_gc(repositories: Sequence[str], client: Optional[RegistryClient] = None,
+            protected: Sequence[str] = DEFAULT_PROTECTED, keep_releases: int = DEFAULT_KEEP_RELEASES,
+            max_age_days: float = DEFAULT_MAX_AGE_DAYS, jobs: int = 8,
+            now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """List the tags of every repository concurrently and return the plan rows."""
+    if not repositories:
+        raise RegistryGCError("No repositories given or configured "
+                              "(set DOCKER_USERNAME, ECR_REGISTRY, ACR_REGISTRY or GCP_PROJECT_ID)")
+    client = client or RegistryClient()
+    targets = [_split_repository(repository) for repository in repositories]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(targets)))) as pool:
+        listings = list(pool.map(lambda target: _list_or_error(client, *target), targets))
+    errors = [f"{registry}/{repository}: {error}" for (registry, repository), (_, error) in zip(targets, listings)
+              if error]
+    if errors:
+        raise RegistryGCError('; '.join(errors))
+
+    work = [(registry, repository, tag) for (registry, repository), (tags, _) in zip(targets, listings)
+            for tag in tags]
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(work) or 1))) as pool:
+        inspected = list(pool.map(lambda item: inspect_tag(client, *item), work))
+
+    rows = []
+    for registry, repository in targets:
+        tags = [entry for (reg, repo, _), entry in zip(work, inspected) if (reg, repo) == (registry, repository)]
+        for entry in apply_rules(tags, protected, keep_releases, max_age_days, now):
+            rows.append(dict(entry, registry=registry, repository=repository))
+    return rows
+
+
+def _list_or_error(client: RegistryClient, registry: str, repository: str) -> Tuple[List[str], Optional[str]]:
+    try:
+        return client.list_tags(registry, repository), None
+    except RegistryError as e:
+        return [], str(e)
+
+
+def apply_gc(rows: List[Dict[str, Any]], client: Optional[RegistryClient] = None, jobs: int = 4,
+             batch_size: int = DEFAULT_BATCH) -> List[Dict[str, Any]]:
+    """Delete the planned digests in batches of ``batch_size``, ``jobs`` at a time; update the rows."""
+    client = client or RegistryClient()
+    targets = list(dict.fromkeys((row['registry'], row['repository'], row['digest'])
+                                 for row in rows if row['action'] == DELETE))
+    outcome: Dict[Tuple[str, str, str], Tuple[str, Optional[str]]] = {}
+
+    def delete(target: Tuple[str, str, str]) -> Tuple[str, Optional[str]]:
+        try:
+            client.delete_manifest(*target)
+            return DELETED, None
+        except RegistryError as e:
+            return FAILED, str(e)
+
+    batch_size = max(1, batch_size)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for start in range(0, len(targets), batch_size):
+            batch = targets[start:start + batch_size]
+            results = list(pool.map(delete, batch))
+            outcome.update(zip(batch, results))
+            if all(status == FAILED for status, _ in results):
+                # 削除APIが無効なレジストリでは残りも全て失敗するので中断する
+                for target in targets[start + batch_size:]:
+                    outcome[target] = (SKIPPED, 'stopped after a batch in which every delete failed')
+                break
+
+    updated = []
+    for row in rows:
+        key = (row['registry'], row['repository'], row['digest'])
+        if row['action'] == DELETE and key in outcome:
+            status, error = outcome[key]
+            row = dict(row, action=status, error=error or row.get('error'))
+        updated.append(row)
+    return updated
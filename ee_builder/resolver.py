@@ -0,0 +1,90 @@
+"""
+Backtracking dependency resolver
+
+Shared by the collection and Python lockers. Callers describe their
+ecosystem with three callbacks (candidate versions, dependencies of a
+version, whether a version satisfies a range); the search itself knows
+nothing about version syntax.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ee_builder.lockfile import LockError
+
+Constraint = Tuple[Any, str]  # (version range, requested by)
+Requirement = Tuple[str, Any, str]  # (name, version range, requested by)
+
+MAX_STEPS = 100000
+
+
+class ResolutionError(LockError):
+    """Raised when no set of versions satisfies every range."""
+
+
+def _describe(name: str, constraints: Sequence[Constraint]) -> str:
+    wanted = ', '.join(f"{spec} (from {origin})" for spec, origin in constraints)
+    return f"{name}: {wanted}"
+
+
+def backtrack(requirements: Sequence[Requirement],
+              candidates: Callable[[str, Sequence[Constraint]], List[str]],
+              dependencies: Callable[[str, str], Sequence[Tuple[str, Any]]],
+              satisfies: Callable[[str, str, Any], bool],
+              known: Callable[[str], bool],
+              max_steps: int = MAX_STEPS, label: str = 'dependencies') -> Dict[str, str]:
+    """Pick one version per name so that every range is satisfied.
+
+    Depth-first search: the name with the fewest remaining candidates is
+    decided next, trying ``candidates`` in the order given (best first).
+    Each choice adds the ranges of its dependencies; a choice that
+    contradicts an earlier pin or leaves a name without candidates is
+    undone. Raises ResolutionError naming the ranges that clashed last.
+    """
+    constraints: Dict[str, List[Constraint]] = {}
+    for name, spec, origin in requirements:
+        constraints.setdefault(name, []).append((spec, origin))
+
+    steps = 0
+    conflicts: List[str] = []
+
+    def search(pinned: Dict[str, str], constraints: Dict[str, List[Constraint]]) -> Optional[Dict[str, str]]:
+        nonlocal steps
+        open_names = [name for name in constraints if name not in pinned]
+        if not open_names:
+            return pinned
+        options = {name: candidates(name, constraints[name]) for name in open_names}
+        # 候補が少ないものから決めると矛盾を早く見つけられる
+        _, name = min((len(options[n]), n) for n in open_names)
+        if not options[name]:
+            if not known(name):
+                conflicts.append(f"{name}: not in the index (required by "
+                                 f"{', '.join(origin for _, origin in constraints[name])})")
+            else:
+                conflicts.append(_describe(name, constraints[name]))
+            return None
+
+        for version in options[name]:
+            steps += 1
+            if steps > max_steps:
+                raise ResolutionError(f"Resolution gave up after {max_steps} steps")
+            origin = f"{name} {version}"
+            deps = list(dependencies(name, version))
+            clash = next(((dep, spec) for dep, spec in deps
+                          if dep in pinned and not satisfies(dep, pinned[dep], spec)), None)
+            if clash is not None:
+                dep, spec = clash
+                conflicts.append(_describe(dep, constraints[dep] + [(spec, origin)])
+                                 + f" but {pinned[dep]} is already chosen")
+                continue
+            extended = {n: list(c) for n, c in constraints.items()}
+            for dep, spec in deps:
+                extended.setdefault(dep, []).append((spec, origin))
+            result = search(dict(pinned, **{name: version}), extended)
+            if result is not None:
+                return result
+        return None
+
+    result = search({}, constraints)
+    if result is None:
+        raise ResolutionError(f"Cannot resolve {label}: {conflicts[-1] if conflicts else 'no candidates'}")
+    return result
@@ -0,0 +1,518 @@
+"""
+Container runtime layer (podman/docker)
+
+ContainerRuntime drives the podman/docker CLI. APIRuntime talks to the
+engine's Docker-compatible REST API over its Unix socket, reusing a small
+pool of keep-alive connections instead of forking one CLI process per
+operation, and falls back to the CLI when the socket goes away.
+connect_runtime() picks the API when a socket answers and the CLI otherwise.
+"""
+
+import base64
+import http.client
+import itertools
+import json
+import os
+import socket
+import struct
+import subprocess
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.profiling import span
+from ee_builder.registry import find_auth, load_auth_file, parse_image_ref
+
+
+class RuntimeCommandError(EEBuilderError):
+    """Raised when a container runtime command fails."""
+
+
+class APIConnectionError(OSError):
+    """Raised when the engine API socket cannot be connected (nothing was sent)."""
+
+
+def default_runtime() -> str:
+    """Return the runtime from CONTAINER_RUNTIME, defaulting to podman."""
+    return os.environ.get('CONTAINER_RUNTIME', 'podman')
+
+
+def manifest_digests(info: Optional[Dict[str, Any]]) -> List[str]:
+    """Return the manifest digests recorded in ``image inspect`` data."""
+    if not info:
+        return []
+    digests = [ref.split('@', 1)[1] for ref in info.get('RepoDigests') or [] if '@' in ref]
+    if info.get('Digest'):
+        digests.append(info['Digest'])
+    return sorted(set(digests))
+
+
+def _parse_created(value: Any) -> float:
+    """Return an image creation time (epoch int or RFC 3339 string) as epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return 0.0
+    text = value.replace('Z', '+00:00')
+    # podman/docker は小数点以下9桁を返すが fromisoformat は6桁まで
+    if '.' in text:
+        head, _, rest = text.partition('.')
+        digits = ''.join(c for c in rest if c.isdigit())
+        text = head + '.' + digits[:6].ljust(6, '0') + rest[len(digits):]
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def image_summary(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize ``image inspect`` or API image list data to one shape."""
+    return {
+        'id': info.get('Id') or info.get('ID') or '',
+        'tags': [tag for tag in info.get('RepoTags') or [] if tag and '<none>' not in tag],
+        'digests': manifest_digests(info),
+        'size': int(info.get('Size') or 0),
+        'created': _parse_created(info.get('Created')),
+    }
+
+
+class ContainerRuntime:
+    """Run podman/docker commands and parse their output."""
+
+    def __init__(self, command: Optional[str] = None):
+        self.command = command or default_runtime()
+
+    def run(self, args: List[str], timeout: Optional[float] = None, check: bool = True,
+            stdin_text: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Run ``<runtime> args...`` and capture its output."""
+        verb = ' '.join(itertools.takewhile(str.isalpha, args[:2]))
+        try:
+            with span('subprocess', f'{os.path.basename(self.command)} {verb}'):
+                result = subprocess.run(
+                    [self.command] + args, timeout=timeout, capture_output=True, text=True, input=stdin_text
+                )
+        except FileNotFoundError as e:
+            raise RuntimeCommandError(f"{self.command} not found") from e
+        except subprocess.TimeoutExpired as e:
+            raise RuntimeCommandError(f"{self.command} {' '.join(args)} timed out after {timeout}s") from e
+
+        if check and result.returncode != 0:
+            raise RuntimeCommandError(
+                f"{self.command} {' '.join(args)} failed: {result.stderr.strip()}"
+            )
+        return result
+
+    def inspect_image(self, image: str) -> Optional[Dict[str, Any]]:
+        """Return ``image inspect`` data, or None if the image is not present locally."""
+        result = self.run(['image', 'inspect', image], check=False)
+        if result.returncode != 0:
+            return None
+        data = json.loads(result.stdout or '[]')
+        return data[0] if data else None
+
+    def image_digests(self, image: str) -> List[str]:
+        """Return the manifest digests recorded for a local image."""
+        return manifest_digests(self.inspect_image(image))
+
+    def pull(self, image: str, timeout: Optional[float] = None) -> None:
+        """Pull an image."""
+        self.run(['pull', image], timeout=timeout)
+
+    def push(self, image: str, timeout: Optional[float] = None) -> None:
+        """Push an image."""
+        self.run(['push', image], timeout=timeout)
+
+    def login(self, registry: str, username: str, password: str) -> None:
+        """Log in to a registry, passing the password on stdin."""
+        self.run(['login', registry, '-u', username, '--password-stdin'], stdin_text=password + '\n')
+
+    def run_container(self, image: str, command: List[str],
+                      timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a command in a throwaway container; raises on a non-zero exit."""
+        return self.run(['run', '--rm', image] + command, timeout=timeout)
+
+    def list_images(self) -> List[Dict[str, Any]]:
+        """Return summaries of all local images (see image_summary)."""
+        ids = self.run(['images', '-q', '--no-trunc']).stdout.split()
+        unique = list(dict.fromkeys(ids))
+        if not unique:
+            return []
+        return [image_summary(info) for info in json.loads(self.run(['image', 'inspect'] + unique).stdout)]
+
+    def remove_image(self, image: str, force: bool = False) -> None:
+        """Remove a local image."""
+        self.run(['rmi'] + (['-f'] if force else []) + [image])
+
+    def save(self, image: str, path: str, timeout: Optional[float] = None) -> None:
+        """Write an image to ``path`` as an OCI archive (docker 25+ writes an OCI layout by default)."""
+        oci = [] if os.path.basename(self.command).startswith('docker') else ['--format', 'oci-archive']
+        self.run(['save'] + oci + ['-o', str(path), image], timeout=timeout)
+
+    def load(self, path: str, timeout: Optional[float] = None) -> None:
+        """Load an image archive."""
+        self.run(['load', '-i', str(path)], timeout=timeout)
+
+    def container_starts(self, since: float, until: float) -> List[Dict[str, Any]]:
+        """Return [{image, time}] for containers started between two epoch times."""
+        result = self.run(['events', '--since', str(int(since)), '--until', str(int(until)),
+                           '--filter', 'type=container', '--filter', 'event=start', '--format', '{{json .}}'])
+        events = []
+        for line in result.stdout.splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            # podman: Image / Time(RFC 3339) / time、docker: from / Actor.Attributes.image / timeNano
+            image = event.get('Image') or event.get('from') or \
+                ((event.get('Actor') or {}).get('Attributes') or {}).get('image')
+            if event.get('timeNano'):
+                when = event['timeNano'] / 1e9
+            elif isinstance(event.get('time'), (int, float)):
+                when = float(event['time'])
+            else:
+                when = _parse_created(event.get('Time') or event.get('time'))
+            if image and when:
+                events.append({'image': image, 'time': when})
+        return events
+
+
+def find_socket(command: Optional[str] = None) -> Optional[str]:
+    """Locate the engine API socket for ``command`` (podman or docker).
+
+    The engine's own variable (a unix:// URL) wins: CONTAINER_HOST for
+    podman, DOCKER_HOST for docker. Otherwise the usual rootless and
+    rootful socket paths are tried.
+    """
+    command = os.path.basename(command or default_runtime())
+    docker = 'docker' in command
+    value = os.environ.get('DOCKER_HOST' if docker else 'CONTAINER_HOST', '')
+    if value.startswith('unix://'):
+        return value[len('unix://'):]
+
+    candidates = []
+    if docker:
+        candidates.append('/var/run/docker.sock')
+    else:
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or f'/run/user/{os.getuid()}'
+        candidates += [os.path.join(runtime_dir, 'podman', 'podman.sock'), '/run/podman/podman.sock']
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+_DEFAULT_TIMEOUT = object()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class APIClient:
+    """Minimal HTTP/1.1 client for the engine REST API with pooled keep-alive connections."""
+
+    def __init__(self, socket_path: str, timeout: float = 60.0, pool_size: int = 4):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: List[_UnixHTTPConnection] = []
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _acquire(self) -> _UnixHTTPConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.connections_opened += 1
+        return _UnixHTTPConnection(self.socket_path, self.timeout)
+
+    def _release(self, conn: _UnixHTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def request(self, method: str, path: str, query: Optional[Dict[str, Any]] = None,
+                body: Any = None, headers: Optional[Dict[str, str]] = None,
+                timeout: Any = _DEFAULT_TIMEOUT) -> Tuple[int, bytes]:
+        """Send a request and return (status, body).
+
+        ``timeout`` overrides the client timeout for slow calls (None waits
+        forever). Raises APIConnectionError when the socket cannot be
+        connected, and RuntimeCommandError when the request fails or times
+        out after it was sent.
+        """
+        if query:
+            path += '?' + urlencode(query)
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        # 再利用した接続がサーバー側で閉じられていた場合は一度だけ張り直す
+        for attempt in range(2):
+            conn = self._acquire()
+            reused = conn.sock is not None
+            conn.timeout = self.timeout if timeout is _DEFAULT_TIMEOUT else timeout
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                else:
+                    conn.sock.settimeout(conn.timeout)
+            except OSError as e:
+                conn.close()
+                raise APIConnectionError(f"Cannot connect to the engine API at {self.socket_path}: {e}") from e
+            # ここから先はリクエストが届いている可能性があるので、失敗してもCLIでやり直させない
+            try:
+                with span('http', f'engine API {method}'):
+                    conn.request(method, path, body=data, headers=headers)
+                    response = conn.getresponse()
+                    payload = response.read()
+            except socket.timeout as e:
+                conn.close()
+                raise RuntimeCommandError(f"API request {method} {path} timed out after {conn.timeout}s") from e
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise RuntimeCommandError(f"API request {method} {path} failed: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise RuntimeCommandError(f"API request {method} {path} failed: {e}") from e
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, payload
+        raise RuntimeCommandError(f"API request {method} {path} failed")
+
+    def json(self, method: str, path: str, **kwargs: Any) -> Tuple[int, Any]:
+        status, payload = self.request(method, path, **kwargs)
+        try:
+            return status, json.loads(payload) if payload.strip() else None
+        except ValueError:
+            return status, None
+
+
+def _error_message(data: Any, payload_text: str = '') -> str:
+    if isinstance(data, dict):
+        return str(data.get('message') or data.get('cause') or data)
+    return payload_text.strip()
+
+
+def _stream_errors(payload: bytes) -> Iterator[str]:
+    """Yield ``error`` entries from a JSON-lines progress stream (pull/push)."""
+    for line in payload.splitlines():
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(item, dict) and (item.get('error') or item.get('errorDetail')):
+            yield str(item.get('error') or item['errorDetail'].get('message'))
+
+
+def _demultiplex(payload: bytes) -> Tuple[str, str]:
+    """Split a non-TTY log stream (8-byte frame headers) into stdout and stderr."""
+    out, err = [], []
+    pos = 0
+    while pos + 8 <= len(payload):
+        stream, size = struct.unpack('>BxxxL', payload[pos:pos + 8])
+        chunk = payload[pos + 8:pos + 8 + size]
+        (err if stream == 2 else out).append(chunk)
+        pos += 8 + size
+    if pos == 0 and payload:
+        out.append(payload)
+    return b''.join(out).decode('utf-8', 'replace'), b''.join(err).decode('utf-8', 'replace')
+
+
+def _split_image(image: str) -> Tuple[str, str]:
+    """Split ``name:tag`` for the pull/push endpoints (digests stay in the name)."""
+    if '@' in image:
+        return image, ''
+    name, sep, tag = image.rpartition(':')
+    if sep and '/' not in tag:
+        return name, tag
+    return image, 'latest'
+
+
+def registry_auth_header(image: str) -> str:
+    """X-Registry-Auth for ``image``'s registry, from the auth file ``login`` writes.
+
+    The engine does not read the client's auth file itself, so an empty
+    header means an anonymous pull/push.
+    """
+    registry = parse_image_ref(image)[0]
+    auth = find_auth(load_auth_file(), registry)
+    config: Dict[str, str] = {}
+    if auth:
+        try:
+            username, _, password = base64.b64decode(auth).decode('utf-8').partition(':')
+        except ValueError as e:
+            raise RuntimeCommandError(f"Invalid credentials for {registry} in the auth file") from e
+        config = {'username': username, 'password': password, 'serveraddress': registry}
+    return base64.urlsafe_b64encode(json.dumps(config).encode('utf-8')).decode('ascii')
+
+
+class APIRuntime(ContainerRuntime):
+    """ContainerRuntime backed by the engine REST API.
+
+    Operations use the socket; if it can no longer be connected, the
+    runtime switches to the inherited CLI implementation for the rest of
+    its life. Failures after a request was sent (including timeouts) are
+    raised instead, so a pull, push or run is never issued twice. Registry
+    login and raw ``run()`` calls always use the CLI so credentials land in
+    the auth file ansible-builder reads, and so do save/load (the API only
+    exports docker archives) and container_starts.
+    """
+
+    def __init__(self, socket_path: str, command: Optional[str] = None, timeout: float = 60.0,
+                 pool_size: int = 4):
+        super().__init__(command)
+        self.client = APIClient(socket_path, timeout=timeout, pool_size=pool_size)
+        self.use_api = True
+
+    def _call(self, name: str, api_call: Any, *args: Any) -> Any:
+        if self.use_api:
+            try:
+                return api_call()
+            except APIConnectionError:
+                self.use_api = False
+                self.client.close()
+        return getattr(ContainerRuntime, name)(self, *args)
+
+    def ping(self) -> bool:
+        try:
+            status, _ = self.client.request('GET', '/_ping')
+        except (OSError, RuntimeCommandError):
+            return False
+        return status == 200
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _inspect(self, image: str) -> Optional[Dict[str, Any]]:
+        status, data = self.client.json('GET', f"/images/{quote(image, safe='/:@')}/json")
+        if status == 404:
+            return None
+        if status != 200:
+            raise RuntimeCommandError(f"inspect {image} failed: {_error_message(data)}")
+        return data
+
+    def inspect_image(self, image: str) -> Optional[Dict[str, Any]]:
+        """Return image inspect data, or None if the image is not present locally."""
+        return self._call('inspect_image', lambda: self._inspect(image), image)
+
+    def _progress(self, action: str, image: str, method: str, path: str, query: Dict[str, Any],
+                  timeout: Optional[float], headers: Optional[Dict[str, str]] = None) -> None:
+        status, payload = self.client.request(method, path, query=query, headers=headers, timeout=timeout)
+        if status != 200:
+            raise RuntimeCommandError(f"{action} {image} failed: {payload.decode('utf-8', 'replace').strip()}")
+        errors = list(_stream_errors(payload))
+        if errors:
+            raise RuntimeCommandError(f"{action} {image} failed: {errors[-1]}")
+
+    def pull(self, image: str, timeout: Optional[float] = None) -> None:
+        """Pull an image with the registry credentials from the auth file."""
+        name, tag = _split_image(image)
+        query = {'fromImage': name, 'tag': tag} if tag else {'fromImage': name}
+        headers = {'X-Registry-Auth': registry_auth_header(image)}
+        self._call('pull', lambda: self._progress('pull', image, 'POST', '/images/create', query, timeout, headers),
+                   image, timeout)
+
+    def push(self, image: str, timeout: Optional[float] = None) -> None:
+        """Push an image with the registry credentials from the auth file."""
+        name, tag = _split_image(image)
+        headers = {'X-Registry-Auth': registry_auth_header(image)}
+        path = f"/images/{quote(name, safe='/:@')}/push"
+        self._call('push', lambda: self._progress('push', image, 'POST', path, {'tag': tag}, timeout, headers),
+                   image, timeout)
+
+    def _run_container(self, image: str, command: List[str],
+                       timeout: Optional[float]) -> subprocess.CompletedProcess:
+        args = ['run', '--rm', image] + command
+        status, data = self.client.json('POST', '/containers/create', body={
+            'Image': image, 'Cmd': command, 'AttachStdout': True, 'AttachStderr': True, 'Tty': False,
+        })
+        if status not in (200, 201):
+            raise RuntimeCommandError(f"{self.command} {' '.join(args)} failed: {_error_message(data)}")
+        container = data['Id']
+        try:
+            status, payload = self.client.request('POST', f'/containers/{container}/start')
+            if status not in (204, 304):
+                raise RuntimeCommandError(
+                    f"{self.command} {' '.join(args)} failed: {payload.decode('utf-8', 'replace').strip()}"
+                )
+            status, data = self.client.json('POST', f'/containers/{container}/wait', timeout=timeout)
+            returncode = int((data or {}).get('StatusCode', 1))
+            _, logs = self.client.request('GET', f'/containers/{container}/logs',
+                                          query={'stdout': 1, 'stderr': 1})
+            stdout, stderr = _demultiplex(logs)
+        finally:
+            self.client.request('DELETE', f'/containers/{container}', query={'force': 1})
+
+        if returncode != 0:
+            raise RuntimeCommandError(f"{self.command} {' '.join(args)} failed: {stderr.strip()}")
+        return subprocess.CompletedProcess([self.command] + args, returncode, stdout, stderr)
+
+    def run_container(self, image: str, command: List[str],
+                      timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Run a command in a throwaway container; raises on a non-zero exit."""
+        return self._call('run_container', lambda: self._run_container(image, command, timeout),
+                          image, command, timeout)
+
+    def _list_images(self) -> List[Dict[str, Any]]:
+        status, data = self.client.json('GET', '/images/json')
+        if status != 200:
+            raise RuntimeCommandError(f"listing images failed: {_error_message(data)}")
+        return [image_summary(info) for info in data or []]
+
+    def list_images(self) -> List[Dict[str, Any]]:
+        """Return summaries of all local images (see image_summary)."""
+        return self._call('list_images', self._list_images)
+
+    def _remove(self, image: str, force: bool) -> None:
+        status, data = self.client.json('DELETE', f"/images/{quote(image, safe='/:@')}",
+                                        query={'force': 'true' if force else 'false'})
+        if status != 200:
+            raise RuntimeCommandError(f"removing {image} failed: {_error_message(data)}")
+
+    def remove_image(self, image: str, force: bool = False) -> None:
+        """Remove a local image."""
+        self._call('remove_image', lambda: self._remove(image, force), image, force)
+
+
+def connect_runtime(command: Optional[str] = None, socket_path: Optional[str] = None,
+                    use_api: Optional[bool] = None) -> ContainerRuntime:
+    """Return an APIRuntime when the engine socket answers, else a CLI ContainerRuntime.
+
+    ``use_api`` (default: EE_RUNTIME_API, on unless set to 0/false/no)
+    disables the socket probe entirely.
+    """
+    if use_api is None:
+        use_api = os.environ.get('EE_RUNTIME_API', '1').lower() not in ('0', 'false', 'no')
+    socket_path = socket_path or (find_socket(command) if use_api else None)
+    if use_api and socket_path:
+        runtime = APIRuntime(socket_path, command)
+        if runtime.ping():
+            return runtime
+        runtime.close()
+    return ContainerRuntime(command)
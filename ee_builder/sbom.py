@@ -0,0 +1,541 @@
+"""
+SBOM generation from build metadata
+
+Instead of scanning the finished image with an external tool, the SBOM
+is assembled from what the build already knows:
+
+- the base image and its digest;
+- ee.lock: collection versions with tarball sha256 and source URL, and
+  Python versions with their pinned hashes;
+- the package manifests inside each image layer: the RPM database
+  (sqlite), the dpkg status file, Python ``*.dist-info/METADATA`` and
+  collection ``MANIFEST.json`` files, plus os-release.
+
+Layers are read by streaming their tar members; only those manifests are
+looked at, whiteouts are applied in layer order, and results are cached
+by layer diff ID (EE_SBOM_CACHE_DIR, default ``~/.cache/ee-builder/sbom``)
+so base image layers are read once per machine. When every layer is
+cached the image is not even saved. Output is SPDX 2.3 or CycloneDX 1.5
+JSON.
+"""
+
+import email.parser
+import json
+import os
+import re
+import sqlite3
+import struct
+import tarfile
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from ee_builder.eefile import base_image, galaxy_requirements, load_ee_file, requirement_lines
+from ee_builder.eeschema import canonical_name, parse_bindep, parse_requirement
+from ee_builder.errors import EEBuilderError
+from ee_builder.ocibundle import OCIArchive, blob_path
+from ee_builder.runtime import ContainerRuntime, RuntimeCommandError, connect_runtime
+
+FORMATS = ('spdx', 'cyclonedx')
+SCAN_VERSION = 1
+
+RPMDB_PATHS = ('var/lib/rpm/rpmdb.sqlite', 'usr/lib/sysimage/rpm/rpmdb.sqlite')
+DPKG_STATUS = 'var/lib/dpkg/status'
+OS_RELEASE = ('etc/os-release', 'usr/lib/os-release')
+_PYTHON_METADATA = re.compile(r'(?:^|/)(?:site|dist)-packages/[^/]+\.(?:dist-info/METADATA|egg-info/PKG-INFO)$')
+_COLLECTION_MANIFEST = re.compile(r'(?:^|/)ansible_collections/[^/]+/[^/]+/MANIFEST\.json$')
+_SPDX_LICENSE = re.compile(r'^[A-Za-z0-9.+-]+(?: (?:AND|OR|WITH) [A-Za-z0-9.+-]+)*$')
+
+# RPM ヘッダーのタグ（rpmtag.h）
+_RPM_TAGS = {1000: 'name', 1001: 'version', 1002: 'release', 1003: 'epoch', 1014: 'license', 1022: 'arch'}
+
+Component = Dict[str, Any]
+
+
+class SBOMError(EEBuilderError):
+    """Raised when an image cannot be inspected or an SBOM cannot be written."""
+
+
+def sbom_cache_dir() -> Path:
+    configured = os.environ.get('EE_SBOM_CACHE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'sbom'
+
+
+# === package manifests ===
+def _rpm_header(blob: bytes) -> Dict[str, Any]:
+    """Read the tags SBOMs need from an RPM header blob (as stored in rpmdb.sqlite)."""
+    count, size = struct.unpack('>II', blob[:8])
+    data = blob[8 + count * 16:8 + count * 16 + size]
+    tags: Dict[str, Any] = {}
+    for i in range(count):
+        tag, kind, offset, _ = struct.unpack('>IIiI', blob[8 + i * 16:24 + i * 16])
+        if tag not in _RPM_TAGS:
+            continue
+        if kind == 4:  # INT32
+            tags[_RPM_TAGS[tag]] = struct.unpack('>i', data[offset:offset + 4])[0]
+        elif kind in (6, 8, 9):  # STRING / STRING_ARRAY / I18NSTRING（先頭の文字列）
+            tags[_RPM_TAGS[tag]] = data[offset:data.index(b'\0', offset)].decode('utf-8', 'replace')
+    return tags
+
+
+def read_rpmdb(path: Path) -> List[Component]:
+    """Installed packages from an rpmdb.sqlite file."""
+    immutable = '' if Path(f"{path}-wal").is_file() else '&immutable=1'
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro{immutable}", uri=True)
+        try:
+            rows = connection.execute('SELECT blob FROM Packages').fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        raise SBOMError(f"Cannot read RPM database {path}: {e}") from e
+    packages = []
+    for (blob,) in rows:
+        tags = _rpm_header(bytes(blob))
+        if not tags.get('name') or tags['name'] == 'gpg-pubkey':
+            continue
+        packages.append({'type': 'rpm', 'name': tags['name'], 'version': tags.get('version'),
+                         'release': tags.get('release'), 'epoch': tags.get('epoch'),
+                         'arch': tags.get('arch'), 'license': tags.get('license')})
+    return packages
+
+
+def parse_dpkg_status(text: str) -> List[Component]:
+    packages = []
+    for paragraph in text.split('\n\n'):
+        fields: Dict[str, str] = {}
+        for line in paragraph.splitlines():
+            if line and not line[0].isspace() and ':' in line:
+                name, _, value = line.partition(':')
+                fields[name] = value.strip()
+        if fields.get('Package') and fields.get('Status', '').endswith(' installed'):
+            packages.append({'type': 'deb', 'name': fields['Package'], 'version': fields.get('Version'),
+                             'arch': fields.get('Architecture')})
+    return packages
+
+
+def parse_python_metadata(text: str) -> List[Component]:
+    headers = email.parser.HeaderParser().parsestr(text.split('\n\n', 1)[0])
+    if not headers.get('Name'):
+        return []
+    license_text = headers.get('License-Expression') or headers.get('License')
+    return [{'type': 'python', 'name': canonical_name(headers['Name']), 'version': headers.get('Version'),
+             'license': license_text if license_text and '\n' not in license_text else None}]
+
+
+def parse_collection_manifest(text: str) -> List[Component]:
+    info = (json.loads(text) or {}).get('collection_info') or {}
+    if not info.get('namespace') or not info.get('name'):
+        return []
+    licenses = info.get('license') or []
+    return [{'type': 'collection', 'name': f"{info['namespace']}.{info['name']}", 'version': info.get('version'),
+             'license': ' OR '.join(licenses) if licenses else None}]
+
+
+def parse_os_release(text: str) -> List[Component]:
+    fields = {}
+    for line in text.splitlines():
+        name, sep, value = line.partition('=')
+        if sep:
+            fields[name.strip()] = value.strip().strip('"\'')
+    if not fields.get('ID'):
+        return []
+    return [{'type': 'os', 'name': fields['ID'], 'version': fields.get('VERSION_ID'),
+             'description': fields.get('PRETTY_NAME')}]
+
+
+def _manifest_kind(path: str) -> Optional[str]:
+    if path in RPMDB_PATHS or any(path == p + '-wal' for p in RPMDB_PATHS):
+        return 'rpm'
+    if path == DPKG_STATUS:
+        return 'deb'
+    if path in OS_RELEASE:
+        return 'os'
+    if _PYTHON_METADATA.search(path):
+        return 'python'
+    if _COLLECTION_MANIFEST.search(path):
+        return 'collection'
+    return None
+
+
+# === layers ===
+def scan_layer(stream: IO[bytes]) -> Dict[str, Any]:
+    """Stream one layer tar and return its package manifests and whiteouts."""
+    parsers = {'deb': parse_dpkg_status, 'os': parse_os_release, 'python': parse_python_metadata,
+               'collection': parse_collection_manifest}
+    files: Dict[str, List[Component]] = {}
+    whiteouts: List[str] = []
+    opaque: List[str] = []
+    with tempfile.TemporaryDirectory(prefix='ee-sbom-') as work_dir:
+        rpmdbs = []
+        with tarfile.open(fileobj=stream, mode='r|*') as tar:
+            for member in tar:
+                path = re.sub(r'^(?:\./)+', '', member.name).lstrip('/')
+                directory, _, name = path.rpartition('/')
+                if name == '.wh..wh..opq':
+                    opaque.append(directory)
+                    continue
+                if name.startswith('.wh.'):
+                    whiteouts.append(f"{directory}/{name[4:]}" if directory else name[4:])
+                    continue
+                kind = _manifest_kind(path) if member.isfile() else None
+                if kind is None:
+                    continue
+                handle = tar.extractfile(member)
+                if handle is None:
+                    continue
+                if kind == 'rpm':
+                    # WAL と本体を同じディレクトリに置いてから sqlite で開く
+                    target = Path(work_dir) / path
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    with open(target, 'wb') as out:
+                        while True:
+                            chunk = handle.read(1 << 20)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                    if not path.endswith('-wal'):
+                        rpmdbs.append((path, target))
+                    continue
+                text = handle.read().decode('utf-8', 'replace')
+                try:
+                    files[path] = parsers[kind](text)
+                except ValueError:
+                    continue  # 壊れたメタデータは無視する
+        for path, target in rpmdbs:
+            files[path] = read_rpmdb(target)
+    return {'version': SCAN_VERSION, 'files': files, 'whiteouts': whiteouts, 'opaque': opaque}
+
+
+def _cached_scan(cache_dir: Path, diff_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads((cache_dir / f"{diff_id.replace(':', '-')}.json").read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return data if data.get('version') == SCAN_VERSION else None
+
+
+def _store_scan(cache_dir: Path, diff_id: str, scan: Dict[str, Any]) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = cache_dir / f"{diff_id.replace(':', '-')}.json"
+    tmp = target.with_suffix('.tmp')
+    tmp.write_text(json.dumps(scan), encoding='utf-8')
+    os.replace(tmp, target)
+
+
+def scan_image(image: str, runtime: ContainerRuntime, cache_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """Return {digest, layers: [(diff_id, scan)], scanned} for a local image."""
+    cache_dir = Path(cache_dir) if cache_dir else sbom_cache_dir()
+    info = runtime.inspect_image(image)
+    if info is None:
+        raise SBOMError(f"Image not found locally: {image}")
+    diff_ids = list((info.get('RootFS') or {}).get('Layers') or [])
+    scans = {diff_id: _cached_scan(cache_dir, diff_id) for diff_id in diff_ids}
+    scanned = 0
+    if not diff_ids or any(scan is None for scan in scans.values()):
+        with tempfile.TemporaryDirectory(prefix='ee-sbom-') as work_dir:
+            archive = Path(work_dir) / 'image.tar'
+            try:
+                runtime.save(image, str(archive))
+            except RuntimeCommandError as e:
+                raise SBOMError(str(e)) from e
+            with OCIArchive(archive) as layout:
+                _, blobs = layout.image()
+                diff_ids = list(layout.json(blob_path(blobs[1]['digest']))['rootfs']['diff_ids'])
+                for diff_id, layer in zip(diff_ids, blobs[2:]):
+                    if scans.get(diff_id) is not None:
+                        continue
+                    with layout.open(blob_path(layer['digest'])) as handle:
+                        scans[diff_id] = scan_layer(handle)
+                    _store_scan(cache_dir, diff_id, scans[diff_id])
+                    scanned += 1
+    digests = [ref.split('@', 1)[1] for ref in info.get('RepoDigests') or [] if '@' in ref]
+    return {
+        'id': info.get('Id') or '',
+        'digest': info.get('Digest') or (digests[0] if digests else None),
+        'layers': [(diff_id, scans[diff_id]) for diff_id in diff_ids],
+        'scanned': scanned,
+    }
+
+
+def installed_components(layers: List[Tuple[str, Dict[str, Any]]]) -> List[Component]:
+    """Apply the layers in order (whiteouts included) and return what the final filesystem lists."""
+    state: Dict[str, Tuple[str, List[Component]]] = {}
+    for diff_id, scan in layers:
+        for directory in scan['opaque']:
+            state = {path: value for path, value in state.items() if not path.startswith(directory + '/')}
+        for removed in scan['whiteouts']:
+            state = {path: value for path, value in state.items()
+                     if path != removed and not path.startswith(removed + '/')}
+        for path, components in scan['files'].items():
+            state[path] = (diff_id, components)
+    result = []
+    for path, (diff_id, components) in sorted(state.items()):
+        for component in components:
+            result.append(dict(component, source='layer', layer=diff_id, path=path))
+    return result
+
+
+# === components ===
+def declared_components(ee_config: Dict[str, Any], base_dir: Path) -> List[Component]:
+    """Components as the EE file declares them (versions are specifiers, not resolved)."""
+    components = []
+    for collection in galaxy_requirements(ee_config, base_dir).get('collections') or []:
+        entry = {'name': collection} if isinstance(collection, str) else dict(collection or {})
+        if entry.get('name'):
+            components.append({'type': 'collection', 'name': str(entry['name']),
+                               'version': None, 'specifier': entry.get('version'), 'source': 'ee'})
+    for line in requirement_lines(ee_config, 'python', base_dir):
+        try:
+            requirement = parse_requirement(line.split('#', 1)[0].strip())
+        except ValueError:
+            continue
+        components.append({'type': 'python', 'name': canonical_name(requirement['name']), 'version': None,
+                           'specifier': requirement['specifier'] or None, 'source': 'ee'})
+    for line in requirement_lines(ee_config, 'system', base_dir):
+        try:
+            components.append({'type': 'system', 'name': parse_bindep(line.split('#', 1)[0].strip())['name'],
+                               'version': None, 'source': 'ee'})
+        except ValueError:
+            continue
+    return components
+
+
+def locked_components(sections: Dict[str, Dict[str, Any]]) -> List[Component]:
+    components = []
+    for entry in (sections.get('galaxy') or {}).get('collections') or []:
+        components.append({'type': 'collection', 'name': entry['name'], 'version': entry.get('version'),
+                           'hashes': [entry['sha256']] if entry.get('sha256') else [],
+                           'url': entry.get('url') if '://' in str(entry.get('url') or '') else None,
+                           'source': 'lock'})
+    for entry in (sections.get('python') or {}).get('packages') or []:
+        components.append({'type': 'python', 'name': canonical_name(entry['name']), 'version': entry.get('version'),
+                           'hashes': [h.split(':', 1)[-1] for h in entry.get('hashes') or []],
+                           'source': 'lock'})
+    return components
+
+
+def merge_components(installed: List[Component], locked: List[Component],
+                     declared: List[Component]) -> List[Component]:
+    """One component per package: installed data first, lock hashes/URLs added, declared only as fallback."""
+    merged: Dict[Tuple[str, str, str], Component] = {}
+    names: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = {}
+    for component in installed:
+        key = (component['type'], component['name'], str(component.get('version')))
+        if key not in merged:
+            merged[key] = dict(component)
+            names.setdefault(key[:2], []).append(key)
+    for component in locked:
+        key = (component['type'], component['name'], str(component.get('version')))
+        if key in merged:
+            merged[key]['hashes'] = component['hashes']
+            merged[key]['url'] = component.get('url')
+            merged[key]['source'] = 'layer+lock'
+        elif not names.get(key[:2]):
+            merged[key] = dict(component)
+            names.setdefault(key[:2], []).append(key)
+    # パッケージDBが読めた場合、bindep の宣言はそちらの実際の版で置き換わる
+    has_system_db = any(c['type'] in ('rpm', 'deb') for c in installed)
+    for component in declared:
+        kind = component['type']
+        if names.get((kind, component['name'])) or (kind == 'system' and has_system_db):
+            continue
+        merged.setdefault((kind, component['name'], 'None'), dict(component))
+    ordered = sorted((c['type'], c['name'], str(c.get('version') or ''), i) for i, c in enumerate(merged.values()))
+    values = list(merged.values())
+    return [values[i] for *_, i in ordered]
+
+
+# === output ===
+def _purl(component: Component, os_info: Optional[Component]) -> Optional[str]:
+    name = quote(component['name'], safe='')
+    version = component.get('version')
+    at = f"@{quote(str(version), safe='')}" if version else ''
+    kind = component['type']
+    if kind == 'python':
+        return f"pkg:pypi/{name}{at}"
+    if kind == 'collection':
+        return f"pkg:generic/ansible-collection/{name}{at}"
+    if kind in ('rpm', 'deb'):
+        vendor = quote(os_info['name'], safe='') if os_info else 'unknown'
+        full = f"{version}-{component['release']}" if kind == 'rpm' and component.get('release') else version
+        qualifiers = []
+        if component.get('arch'):
+            qualifiers.append(f"arch={quote(component['arch'], safe='')}")
+        if component.get('epoch'):
+            qualifiers.append(f"epoch={component['epoch']}")
+        if os_info and os_info.get('version'):
+            qualifiers.append(f"distro={quote(os_info['name'] + '-' + os_info['version'], safe='')}")
+        suffix = f"?{'&'.join(qualifiers)}" if qualifiers else ''
+        return f"pkg:{kind}/{vendor}/{name}@{quote(str(full), safe='')}{suffix}" if full else \
+            f"pkg:{kind}/{vendor}/{name}{suffix}"
+    if kind == 'container':
+        repository = component['name'].rsplit(':', 1)[0] if ':' in component['name'].rsplit('/', 1)[-1] \
+            else component['name']
+        last = quote(repository.rsplit('/', 1)[-1], safe='')
+        digest = f"@{quote(version, safe='')}" if version else ''
+        return f"pkg:oci/{last}{digest}?repository_url={quote(repository, safe='')}"
+    return None
+
+
+def _display_version(component: Component) -> Optional[str]:
+    version = component.get('version')
+    if component['type'] == 'rpm' and version and component.get('release'):
+        epoch = f"{component['epoch']}:" if component.get('epoch') else ''
+        return f"{epoch}{version}-{component['release']}"
+    return version or component.get('specifier')
+
+
+def _document_id(image: str, digest: Optional[str], components: List[Component]) -> uuid.UUID:
+    # 同じ入力からは同じ文書IDになる（再現可能なビルド向け）
+    seed = json.dumps([image, digest, [_purl(c, None) or c['name'] for c in components]])
+    return uuid.uuid5(uuid.NAMESPACE_URL, seed)
+
+
+def render_spdx(image: str, digest: Optional[str], components: List[Component], created: str) -> Dict[str, Any]:
+    os_info = next((c for c in components if c['type'] == 'os'), None)
+    packages = [{
+        'SPDXID': 'SPDXRef-Image',
+        'name': image,
+        'versionInfo': digest or 'NOASSERTION',
+        'downloadLocation': 'NOASSERTION',
+        'filesAnalyzed': False,
+        'primaryPackagePurpose': 'CONTAINER',
+    }]
+    relationships = [{'spdxElementId': 'SPDXRef-DOCUMENT', 'relationshipType': 'DESCRIBES',
+                      'relatedSpdxElement': 'SPDXRef-Image'}]
+    for number, component in enumerate(components, 1):
+        spdx_id = f"SPDXRef-{component['type']}-{number}"
+        license_text = component.get('license')
+        package: Dict[str, Any] = {
+            'SPDXID': spdx_id,
+            'name': component['name'],
+            'versionInfo': _display_version(component) or 'NOASSERTION',
+            'downloadLocation': component.get('url') or 'NOASSERTION',
+            'filesAnalyzed': False,
+            'licenseConcluded': 'NOASSERTION',
+            'licenseDeclared': license_text if license_text and _SPDX_LICENSE.match(license_text) else 'NOASSERTION',
+        }
+        if component['type'] == 'container':
+            package['primaryPackagePurpose'] = 'CONTAINER'
+        elif component['type'] == 'os':
+            package['primaryPackagePurpose'] = 'OPERATING-SYSTEM'
+        if component.get('hashes'):
+            package['checksums'] = [{'algorithm': 'SHA256', 'checksumValue': h} for h in component['hashes']]
+        purl = _purl(component, os_info)
+        if purl:
+            package['externalRefs'] = [{'referenceCategory': 'PACKAGE-MANAGER', 'referenceType': 'purl',
+                                        'referenceLocator': purl}]
+        package['comment'] = f"source: {component['source']}"
+        packages.append(package)
+        relationship = 'DESCENDANT_OF' if component['type'] == 'container' else 'CONTAINS'
+        relationships.append({'spdxElementId': 'SPDXRef-Image', 'relationshipType': relationship,
+                              'relatedSpdxElement': spdx_id})
+    document_id = _document_id(image, digest, components)
+    return {
+        'spdxVersion': 'SPDX-2.3',
+        'dataLicense': 'CC0-1.0',
+        'SPDXID': 'SPDXRef-DOCUMENT',
+        'name': image,
+        'documentNamespace': f"https://spdx.org/spdxdocs/ee-builder/{document_id}",
+        'creationInfo': {'created': created, 'creators': ['Tool: ee_builder']},
+        'packages': packages,
+        'relationships': relationships,
+    }
+
+
+def render_cyclonedx(image: str, digest: Optional[str], components: List[Component],
+                     created: str) -> Dict[str, Any]:
+    os_info = next((c for c in components if c['type'] == 'os'), None)
+    entries = []
+    for number, component in enumerate(components, 1):
+        kind = {'container': 'container', 'os': 'operating-system'}.get(component['type'], 'library')
+        entry: Dict[str, Any] = {'type': kind, 'bom-ref': f"{component['type']}-{number}",
+                                 'name': component['name']}
+        version = _display_version(component)
+        if version:
+            entry['version'] = version
+        purl = _purl(component, os_info)
+        if purl:
+            entry['purl'] = purl
+        if component.get('hashes'):
+            entry['hashes'] = [{'alg': 'SHA-256', 'content': h} for h in component['hashes']]
+        license_text = component.get('license')
+        if license_text:
+            entry['licenses'] = [{'expression': license_text}] if _SPDX_LICENSE.match(license_text) \
+                else [{'license': {'name': license_text}}]
+        if component.get('url'):
+            entry['externalReferences'] = [{'type': 'distribution', 'url': component['url']}]
+        entry['properties'] = [{'name': 'ee-builder:source', 'value': component['source']}]
+        entries.append(entry)
+    return {
+        'bomFormat': 'CycloneDX',
+        'specVersion': '1.5',
+        'serialNumber': f"urn:uuid:{_document_id(image, digest, components)}",
+        'version': 1,
+        'metadata': {
+            'timestamp': created,
+            'tools': {'components': [{'type': 'application', 'name': 'ee_builder'}]},
+            'component': {'type': 'container', 'bom-ref': 'image', 'name': image,
+                          **({'version': digest} if digest else {})},
+        },
+        'components': entries,
+        'dependencies': [{'ref': 'image', 'dependsOn': [entry['bom-ref'] for entry in entries]}],
+    }
+
+
+def generate_sbom(image: str, ee_file: Path, runtime: Optional[ContainerRuntime] = None,
+                  lock_sections: Optional[Dict[str, Dict[str, Any]]] = None, output_format: str = 'spdx',
+                  scan_layers: bool = True, cache_dir: Optional[Path] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Return (SBOM document, summary) for a locally built image."""
+    if output_format not in FORMATS:
+        raise SBOMError(f"Unknown SBOM format '{output_format}' (choose from {', '.join(FORMATS)})")
+    started = time.perf_counter()
+    runtime = runtime or connect_runtime()
+    ee_file = Path(ee_file)
+    ee_config = load_ee_file(ee_file)
+
+    base = base_image(ee_config)
+    base_info = runtime.inspect_image(base)
+    base_digests = [ref.split('@', 1)[1] for ref in (base_info or {}).get('RepoDigests') or [] if '@' in ref]
+    base_component = {'type': 'container', 'name': base, 'source': 'base image',
+                      'version': (base_info or {}).get('Digest') or (base_digests[0] if base_digests else None)}
+
+    if scan_layers:
+        scan = scan_image(image, runtime, cache_dir)
+    else:
+        scan = {'digest': (runtime.inspect_image(image) or {}).get('Digest'), 'layers': [], 'scanned': 0}
+    installed = installed_components(scan['layers'])
+    locked = locked_components(lock_sections or {})
+    components = [base_component] + merge_components(installed, locked,
+                                                     declared_components(ee_config, ee_file.parent))
+    created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    render = render_spdx if output_format == 'spdx' else render_cyclonedx
+    document = render(image, scan['digest'], components, created)
+    sources: Dict[str, int] = {}
+    for component in components:
+        sources[component['source']] = sources.get(component['source'], 0) + 1
+    summary = {
+        'image': image,
+        'format': output_format,
+        'components': len(components),
+        'sources': sources,
+        'layers': len(scan['layers']),
+        'layers_scanned': scan['scanned'],
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    return document, summary
+
+
+def write_sbom(path: Path, document: Dict[str, Any]) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(document, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    os.replace(tmp, path)
@@ -0,0 +1,244 @@
+"""
+Secret exposure scanner
+
+Walks a checkout honouring .gitignore files, skips binary files (NUL byte
+in the first block, like git), and matches all patterns in a single pass
+per file: small files are read directly, large ones through mmap so build
+contexts and artifacts never have to fit in memory. Files are scanned on
+all cores and every hit is reported with its line and column.
+"""
+
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Pattern, Sequence, Tuple
+
+SENSITIVE_PATTERNS = ('password', 'token', 'secret', 'key', 'credential')
+DEFAULT_EXCLUDE_DIRS = ('.git', '__pycache__', '.venv')
+
+SNIFF_SIZE = 8000
+MMAP_THRESHOLD = 1 << 20
+BATCH_SIZE = 64
+MAX_EXCERPT = 120
+
+
+# === .gitignore ===
+def _translate_glob(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            out.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape('['))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body + ']')
+                i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(out)
+
+
+# (base directory relative to the root, compiled pattern, negated, directory only)
+IgnoreRule = Tuple[str, Pattern[str], bool, bool]
+
+
+def parse_gitignore(text: str, base: str = '') -> List[IgnoreRule]:
+    """Parse .gitignore content whose patterns are relative to ``base``."""
+    rules: List[IgnoreRule] = []
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        anchored = '/' in line
+        line = line.lstrip('/')
+        prefix = '^' if anchored else '^(?:.*/)?'
+        rules.append((base, re.compile(prefix + _translate_glob(line) + '$'), negate, dir_only))
+    return rules
+
+
+def is_ignored(rel_path: str, is_dir: bool, rules: Sequence[IgnoreRule]) -> bool:
+    """Apply rules in order; the last matching rule decides."""
+    ignored = False
+    for base, regex, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not rel_path.startswith(base + '/'):
+                continue
+            candidate = rel_path[len(base) + 1:]
+        else:
+            candidate = rel_path
+        if regex.match(candidate):
+            ignored = not negate
+    return ignored
+
+
+def iter_files(root: Path, exclude_dirs: Sequence[str] = DEFAULT_EXCLUDE_DIRS,
+               use_gitignore: bool = True) -> Iterator[Path]:
+    """Yield files under ``root`` that are not ignored (ignored directories are not entered)."""
+    root = Path(root)
+    stack: List[Tuple[str, List[IgnoreRule]]] = [('', [])]
+    while stack:
+        rel_dir, inherited = stack.pop()
+        directory = root / rel_dir if rel_dir else root
+        rules = inherited
+        if use_gitignore:
+            try:
+                text = (directory / '.gitignore').read_text(encoding='utf-8', errors='replace')
+                rules = inherited + parse_gitignore(text, rel_dir)
+            except OSError:
+                pass
+        try:
+            entries = [entry for _, entry in sorted((e.name, e) for e in os.scandir(directory))]
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = entry.is_file(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir and entry.name in exclude_dirs:
+                continue
+            if (is_dir or is_file) and rules and is_ignored(rel_path, is_dir, rules):
+                continue
+            if is_dir:
+                subdirs.append((rel_path, rules))
+            elif is_file:
+                yield Path(entry.path)
+        stack.extend(reversed(subdirs))
+
+
+# === matching ===
+def compile_patterns(patterns: Sequence[str] = SENSITIVE_PATTERNS) -> Pattern[bytes]:
+    """Compile ``<pattern>=`` for every pattern into one case-insensitive regex.
+
+    The regex starts with the literal ``=`` so the engine jumps between
+    ``=`` bytes with its fast literal search and only then checks the
+    names behind it (one fixed-width lookbehind group per pattern).
+    """
+    # 長いパターンを先に置き、共通の接尾辞を持つパターンでも最長一致させる
+    ordered = [p for _, p in sorted(((len(p), p) for p in patterns), reverse=True)]
+    lookbehinds = b'|'.join(b'(?<=(' + re.escape(p.encode('utf-8')) + b')=)' for p in ordered)
+    return re.compile(b'=(?:' + lookbehinds + b')', re.IGNORECASE)
+
+
+def is_binary(head: bytes) -> bool:
+    return b'\0' in head
+
+
+def _scan_buffer(buf, regex: Pattern[bytes], path: str) -> List[Dict[str, object]]:
+    hits: List[Dict[str, object]] = []
+    line = 1
+    line_start = 0
+    counted_to = 0
+    for match in regex.finditer(buf):
+        name = match.group(match.lastindex)
+        pos = match.start() - len(name)
+        # mmap には count() が無いため区間を切り出して数える（各区間は一度だけ）
+        newlines = buf[counted_to:pos].count(b'\n')
+        if newlines:
+            line += newlines
+            line_start = buf.rfind(b'\n', counted_to, pos) + 1
+        counted_to = pos
+        line_end = buf.find(b'\n', pos)
+        if line_end == -1:
+            line_end = len(buf)
+        excerpt = bytes(buf[line_start:min(line_end, line_start + MAX_EXCERPT)])
+        hits.append({
+            'path': path,
+            'line': line,
+            'column': len(bytes(buf[line_start:pos]).decode('utf-8', 'replace')) + 1,
+            'pattern': name.decode('utf-8', 'replace').lower(),
+            'text': excerpt.decode('utf-8', 'replace').strip(),
+        })
+    return hits
+
+
+def scan_file(path: Path, regex: Optional[Pattern[bytes]] = None) -> List[Dict[str, object]]:
+    """Return every hit in one file (binary and unreadable files yield nothing)."""
+    regex = regex or compile_patterns()
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+            if not head or is_binary(head):
+                return []
+            size = os.fstat(f.fileno()).st_size
+            if size <= MMAP_THRESHOLD:
+                return _scan_buffer(head + f.read(), regex, str(path))
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _scan_buffer(mm, regex, str(path))
+    except (OSError, ValueError):
+        return []
+
+
+def _scan_batch(paths: List[str], patterns: Tuple[str, ...]) -> List[Dict[str, object]]:
+    regex = compile_patterns(patterns)
+    hits: List[Dict[str, object]] = []
+    for path in paths:
+        hits.extend(scan_file(Path(path), regex))
+    return hits
+
+
+def scan_paths(paths: Sequence[Path], patterns: Sequence[str] = SENSITIVE_PATTERNS,
+               workers: Optional[int] = None) -> List[Dict[str, object]]:
+    """Scan files, in batches across processes when there are enough of them."""
+    paths = [str(p) for p in paths]
+    patterns = tuple(patterns)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= BATCH_SIZE:
+        return _scan_batch(paths, patterns)
+
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    hits: List[Dict[str, object]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch_hits in pool.map(_scan_batch, batches, [patterns] * len(batches)):
+            hits.extend(batch_hits)
+    return hits
+
+
+def scan_tree(root: Path, patterns: Sequence[str] = SENSITIVE_PATTERNS,
+              exclude_dirs: Sequence[str] = DEFAULT_EXCLUDE_DIRS, use_gitignore: bool = True,
+              workers: Optional[int] = None) -> List[Dict[str, object]]:
+    """Scan every non-ignored text file under ``root``; hit paths are relative to it."""
+    root = Path(root)
+    hits = scan_paths(list(iter_files(root, exclude_dirs, use_gitignore)), patterns, workers)
+    for hit in hits:
+        hit['path'] = os.path.relpath(str(hit['path']), root)
+    return hits
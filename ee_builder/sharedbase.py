@@ -0,0 +1,267 @@
+"""
+Shared dependency images for a fleet of EE definitions
+
+EE variants built on the same base image usually install mostly the same
+collections and Python/system packages, yet each is built as its own
+stack of layers. ``plan_shared`` groups the EE files by base image and
+moves what the variants have in common into one intermediate "shared
+deps" EE; ``write_plan`` emits it together with derived variant
+definitions that build FROM the shared image and install only what is
+left. Every shared byte is then stored once in the registry and pulled
+once per node instead of once per variant.
+
+Sizes are the compressed artifact sizes (what a layer roughly weighs on
+the wire): collection tarballs from ``--index``, wheels from
+``--wheelhouse``, explicit values from a sizes file, and a per-kind
+default otherwise (reported as estimated).
+"""
+
+import copy
+import math
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ee_builder.eefile import (
+    base_image, find_ee_files, galaxy_requirements, load_ee_file, requirement_lines,
+)
+from ee_builder.eeschema import canonical_name, parse_bindep, parse_requirement
+from ee_builder.errors import EEBuilderError
+from ee_builder.galaxylock import load_index, version_key
+from ee_builder.impact import produced_image, split_reference
+from ee_builder.pylock import load_python_index, parse_version
+from ee_builder.yamlcache import load_yaml
+
+KINDS = ('collection', 'python', 'system')
+SHARED_IMAGE = 'ansible-custom-ee-shared'
+OUTPUT_DIR = 'shared-ee'
+
+# サイズ不明時の目安（圧縮後のバイト数）
+DEFAULT_SIZES = {'collection': 2 << 20, 'python': 1 << 20, 'system': 4 << 20}
+
+# 共有イメージにも必要な設定（全バリアントで同一の場合のみ引き継ぐ）
+_SHARED_DEPENDENCY_KEYS = ('python_interpreter', 'ansible_core', 'ansible_runner')
+_SHARED_OPTION_KEYS = ('package_manager_path', 'skip_ansible_check', 'relax_passwd_permissions')
+
+Item = Tuple[str, str]  # (kind, name)
+
+
+class SharedBaseError(EEBuilderError):
+    """Raised when a shared image plan cannot be computed or written."""
+
+
+# === items ===
+def ee_items(ee_file: Path) -> Dict[Item, Any]:
+    """Map (kind, name) to the requirement as written (collection entry, pip or bindep line)."""
+    ee_file = Path(ee_file)
+    ee_config = load_ee_file(ee_file)
+    base_dir = ee_file.parent
+    items: Dict[Item, Any] = {}
+    for collection in galaxy_requirements(ee_config, base_dir).get('collections') or []:
+        entry = {'name': collection} if isinstance(collection, str) else dict(collection or {})
+        if entry.get('name'):
+            items[('collection', str(entry['name']))] = entry
+    for line in requirement_lines(ee_config, 'python', base_dir):
+        text = line.split('#', 1)[0].strip()
+        try:
+            items[('python', canonical_name(parse_requirement(text)['name']))] = text
+        except ValueError:
+            continue  # 空行・オプション行は各バリアントに残す
+    for line in requirement_lines(ee_config, 'system', base_dir):
+        text = line.split('#', 1)[0].strip()
+        try:
+            items[('system', parse_bindep(text)['name'])] = text
+        except ValueError:
+            continue
+    return items
+
+
+def _same(value: Any) -> Any:
+    """Comparable form of a requirement (collection entries are dicts)."""
+    return yaml.safe_dump(value, sort_keys=True) if isinstance(value, dict) else value
+
+
+# === sizes ===
+def size_lookup(index: Optional[Path] = None, wheelhouse: Optional[Path] = None,
+                sizes_file: Optional[Path] = None) -> Callable[[str, str], Tuple[int, bool]]:
+    """Return ``size(kind, name) -> (bytes, estimated)`` backed by the given sources."""
+    known: Dict[Item, int] = {}
+    if sizes_file is not None:
+        data = load_yaml(sizes_file) or {}
+        for kind in KINDS:
+            for name, size in (data.get(kind) or {}).items():
+                known[(kind, canonical_name(str(name)) if kind == 'python' else str(name))] = int(size)
+    if index is not None:
+        for name, versions in load_index(index).items():
+            newest = max((version_key(v), v) for v in versions)[1]
+            entry = versions[newest]
+            url = str(entry.get('url') or '')
+            if entry.get('size') is not None:
+                known.setdefault(('collection', name), int(entry['size']))
+            elif url and '://' not in url and os.path.isfile(url):
+                known.setdefault(('collection', name), os.path.getsize(url))
+    if wheelhouse is not None:
+        for name, versions in load_python_index(wheelhouse).items():
+            newest = max((parse_version(v).key, v) for v in versions)[1]
+            sizes = [os.path.getsize(f['url']) for f in versions[newest].get('files') or []
+                     if f.get('url') and os.path.isfile(f['url'])]
+            if sizes:
+                known.setdefault(('python', name), max(sizes))
+
+    def size(kind: str, name: str) -> Tuple[int, bool]:
+        if (kind, name) in known:
+            return known[(kind, name)], False
+        return DEFAULT_SIZES[kind], True
+
+    return size
+
+
+# === plan ===
+def plan_shared(paths: Sequence[Path], root: Path, min_share: float = 1.0,
+                size: Optional[Callable[[str, str], Tuple[int, bool]]] = None,
+                exclude: Sequence[Path] = ()) -> List[Dict[str, Any]]:
+    """Group EE files by base image and pick what each group can share.
+
+    An item goes into the shared image when at least ``min_share`` of the
+    group's variants require it, written identically (variants that do
+    not need it simply inherit it). Groups with fewer than two variants
+    or nothing to share are left out.
+    """
+    if not 0 < min_share <= 1:
+        raise SharedBaseError("min_share must be in (0, 1]")
+    size = size or size_lookup()
+    excluded = [Path(p).resolve() for p in exclude]
+    files = [f for f in find_ee_files(paths)
+             if not any(Path(f).resolve().is_relative_to(e) for e in excluded)]
+
+    groups: Dict[str, List[Path]] = {}
+    for ee_file in files:
+        repository, tag = split_reference(base_image(load_ee_file(ee_file)))
+        groups.setdefault(f"{repository}:{tag or 'latest'}", []).append(ee_file)
+
+    plans = []
+    for base, variants in sorted(groups.items()):
+        if len(variants) < 2:
+            continue
+        items = {ee_file: ee_items(ee_file) for ee_file in variants}
+        needed = max(2, math.ceil(round(min_share * len(variants), 6)))
+        shared: Dict[Item, Any] = {}
+        for item in sorted({i for per_file in items.values() for i in per_file}):
+            values = [per_file[item] for per_file in items.values() if item in per_file]
+            if len(values) >= needed and len({_same(v) for v in values}) == 1:
+                shared[item] = values[0]
+        if not shared:
+            continue
+
+        shared_bytes = 0
+        estimated = 0
+        for kind, name in shared:
+            item_size, guessed = size(kind, name)
+            shared_bytes += item_size
+            estimated += guessed
+        extra = {str(f): sum(size(*item)[0] for item in shared if item not in items[f]) for f in variants}
+        plans.append({
+            'base_image': base,
+            'variants': [str(f) for f in variants],
+            'shared': shared,
+            'shared_bytes': shared_bytes,
+            'estimated_items': estimated,
+            # 全バリアントを取得するノードでは共有分を1回だけ取得する
+            'saved_per_node': sum(sum(size(*item)[0] for item in shared if item in items[f])
+                                  for f in variants) - shared_bytes,
+            'extra_bytes': extra,
+        })
+    return plans
+
+
+# === output ===
+def _common(configs: Sequence[Dict[str, Any]], section: str, keys: Sequence[str]) -> Dict[str, Any]:
+    result = {}
+    for key in keys:
+        values = [(config.get(section) or {}).get(key) for config in configs]
+        if values[0] is not None and all(_same(v) == _same(values[0]) for v in values):
+            result[key] = values[0]
+    return result
+
+
+def _dependencies(items: Dict[Item, Any], kind: str) -> List[Any]:
+    return [value for (item_kind, _), value in items.items() if item_kind == kind]
+
+
+def shared_definition(plan: Dict[str, Any], configs: Sequence[Dict[str, Any]], image: str) -> Dict[str, Any]:
+    dependencies = _common(configs, 'dependencies', _SHARED_DEPENDENCY_KEYS)
+    collections = _dependencies(plan['shared'], 'collection')
+    if collections:
+        dependencies['galaxy'] = {'collections': collections}
+    for kind in ('python', 'system'):
+        if _dependencies(plan['shared'], kind):
+            dependencies[kind] = _dependencies(plan['shared'], kind)
+    definition: Dict[str, Any] = {
+        'version': 3,
+        'images': {'base_image': {'name': plan['base_image']}},
+        'dependencies': dependencies,
+    }
+    build_args = _common(configs, 'build_arg_defaults',
+                         sorted({k for c in configs for k in (c.get('build_arg_defaults') or {})}))
+    if build_args:
+        definition['build_arg_defaults'] = build_args
+    options = _common(configs, 'options', _SHARED_OPTION_KEYS)
+    options['tags'] = [image]
+    definition['options'] = options
+    return definition
+
+
+def derived_definition(ee_file: Path, ee_config: Dict[str, Any], shared: Dict[Item, Any],
+                       base: str, image: str, target: Path) -> Dict[str, Any]:
+    """Variant definition FROM the shared image without the shared items.
+
+    Dependencies are written inline and additional_build_files sources
+    are re-pointed, so the file works from its new directory.
+    """
+    config = copy.deepcopy(ee_config)
+    base_dir = Path(ee_file).parent
+    own = {item: value for item, value in ee_items(ee_file).items() if item not in shared}
+    dependencies = dict(config.get('dependencies') or {})
+    galaxy = dict(galaxy_requirements(ee_config, base_dir))
+    galaxy['collections'] = _dependencies(own, 'collection')
+    dependencies['galaxy'] = galaxy if galaxy['collections'] or galaxy.get('roles') else None
+    for kind in ('python', 'system'):
+        # オプション行（--index-url など）はバリアント側に残す
+        options = [line.strip() for line in requirement_lines(ee_config, kind, base_dir)
+                   if line.strip().startswith('-')]
+        dependencies[kind] = options + _dependencies(own, kind) or None
+    config['dependencies'] = {k: v for k, v in dependencies.items() if v is not None}
+    config.setdefault('images', {})['base_image'] = {'name': base}
+    config.setdefault('options', {})['tags'] = [image]
+    for entry in config.get('additional_build_files') or []:
+        if isinstance(entry, dict) and entry.get('src') and not os.path.isabs(str(entry['src'])):
+            entry['src'] = os.path.relpath(base_dir / str(entry['src']), target.parent)
+    return config
+
+
+def write_plan(plans: Sequence[Dict[str, Any]], output_dir: Path, root: Path,
+               registry: str = 'localhost', tag: str = 'latest') -> List[Path]:
+    """Write the shared EE and the derived variants under ``output_dir``; return the files written."""
+    output_dir = Path(output_dir)
+    written = []
+    for number, plan in enumerate(plans, 1):
+        name = SHARED_IMAGE if len(plans) == 1 else f"{SHARED_IMAGE}-{number}"
+        image = f"{registry}/{name}:{tag}" if registry else f"{name}:{tag}"
+        configs = [load_ee_file(Path(f)) for f in plan['variants']]
+        target = output_dir / name / 'execution-environment.yml'
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(yaml.safe_dump(shared_definition(plan, configs, image), default_flow_style=False,
+                                         sort_keys=False, allow_unicode=True), encoding='utf-8')
+        written.append(target)
+        for ee_file, config in zip(plan['variants'], configs):
+            relative = Path(ee_file).resolve().relative_to(Path(root).resolve())
+            target = output_dir / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            definition = derived_definition(Path(ee_file), config, plan['shared'], image,
+                                            produced_image(Path(ee_file), config, root), target)
+            target.write_text(yaml.safe_dump(definition, default_flow_style=False, sort_keys=False,
+                                             allow_unicode=True), encoding='utf-8')
+            written.append(target)
+    return written
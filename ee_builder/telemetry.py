@@ -0,0 +1,192 @@
+"""
+Structured build telemetry
+
+Records how long each build phase takes and, by watching the container
+build output, how long the ansible-builder sub-stages take (base image
+pull, galaxy install, pip install, system install, commit). Records are
+written as JSON lines (appended, one build after another) or as an
+OpenMetrics text file (rewritten per build, e.g. for a textfile collector).
+"""
+
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from ee_builder.errors import EEBuilderError
+
+FORMATS = ('jsonl', 'openmetrics')
+SUBSTAGES = ('base_pull', 'galaxy_install', 'pip_install', 'system_install', 'commit', 'other')
+
+# podman: "[1/4] STEP 2/9: RUN ..." / docker: "Step 2/9 : RUN ..." / buildkit: "#7 [galaxy 2/4] RUN ..."
+_STEP_LINE = re.compile(
+    r'^(?:\[\d+/\d+\] )?STEP \d+/\d+: (?P<podman>.*)$'
+    r'|^Step \d+/\d+ : (?P<docker>.*)$'
+    r'|^#\d+ \[[\w-]+ +\d+/\d+\] (?P<buildkit>.*)$'
+)
+_COMMIT_LINE = re.compile(r'^(?:COMMIT\b|#\d+ exporting to image)')
+
+
+def classify_step(instruction: str) -> str:
+    """Map a Containerfile instruction generated by ansible-builder to a sub-stage."""
+    text = instruction.strip()
+    upper = text.upper()
+    if upper.startswith('FROM '):
+        return 'base_pull'
+    if 'ansible-galaxy' in text:
+        return 'galaxy_install'
+    # builderステージの assemble が bindep 解決と pip wheel ビルドを行う
+    if '/assemble' in text or 'pip install' in text or 'pip3 install' in text:
+        return 'pip_install'
+    if 'install-from-bindep' in text or 'dnf ' in text or 'microdnf ' in text:
+        return 'system_install'
+    return 'other'
+
+
+def new_build_id() -> str:
+    """Return an identifier that groups the records of one build."""
+    return time.strftime('%Y%m%dT%H%M%S') + f'-{os.getpid()}'
+
+
+class SubstageTracker:
+    """Accumulate sub-stage durations from timestamped build output lines."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.durations: Dict[str, float] = {}
+        self.steps: Dict[str, int] = {}
+        self.current: Optional[str] = None
+        self.current_start = 0.0
+
+    def _switch(self, substage: Optional[str], now: float) -> None:
+        if self.current is not None:
+            self.durations[self.current] = self.durations.get(self.current, 0.0) + (now - self.current_start)
+        self.current = substage
+        self.current_start = now
+        if substage is not None:
+            self.steps[substage] = self.steps.get(substage, 0) + 1
+
+    def feed(self, line: str, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        text = line.rstrip('\r\n')
+        if _COMMIT_LINE.match(text):
+            self._switch('commit', now)
+            return
+        match = _STEP_LINE.match(text)
+        if match:
+            instruction = match.group('podman') or match.group('docker') or match.group('buildkit') or ''
+            self._switch(classify_step(instruction), now)
+
+    def finish(self, now: Optional[float] = None) -> Dict[str, float]:
+        self._switch(None, self.clock() if now is None else now)
+        return dict(self.durations)
+
+
+class Telemetry:
+    """Collect phase/sub-stage records for one build and write them out."""
+
+    def __init__(self, path: Optional[Path], output_format: str = 'jsonl',
+                 build_id: Optional[str] = None, labels: Optional[Dict[str, str]] = None):
+        if output_format not in FORMATS:
+            raise EEBuilderError(f"Unknown telemetry format: {output_format}")
+        self.path = path
+        self.format = output_format
+        self.build_id = build_id or new_build_id()
+        self.labels = dict(labels or {})
+        self.records: List[Dict[str, Any]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def record(self, event: str, name: str, start: float, duration: float,
+               status: str = 'ok', **fields: Any) -> Dict[str, Any]:
+        record = {
+            'ts': round(start, 3),
+            'build_id': self.build_id,
+            'event': event,
+            'name': name,
+            'duration_seconds': round(duration, 3),
+            'status': status,
+        }
+        record.update(self.labels)
+        record.update(fields)
+        self.records.append(record)
+        return record
+
+    @contextmanager
+    def span(self, name: str, event: str = 'phase', **fields: Any) -> Iterator[None]:
+        """Time a block; a raised exception records status=failed."""
+        start = time.time()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'failed'
+            raise
+        finally:
+            self.record(event, name, start, time.time() - start, status, **fields)
+
+    def record_substages(self, phase: str, tracker: SubstageTracker, start: float) -> None:
+        for name, duration in tracker.finish().items():
+            self.record('substage', name, start, duration, phase=phase, steps=tracker.steps.get(name, 0))
+
+    def flush(self) -> None:
+        """Append JSON lines, or rewrite the OpenMetrics file, then clear the buffer."""
+        if not self.enabled or not self.records:
+            return
+        if self.format == 'jsonl':
+            append_jsonl(self.path, self.records)
+        else:
+            Path(self.path).write_text(render_openmetrics(self.records), encoding='utf-8')
+        self.records = []
+
+
+def append_jsonl(path: Path, records: List[Dict[str, Any]]) -> None:
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read_jsonl(path: Path) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def _label_value(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_openmetrics(records: List[Dict[str, Any]]) -> str:
+    """Render records as OpenMetrics text (one gauge family per event kind)."""
+    families = {
+        'build': 'ee_build_duration_seconds',
+        'phase': 'ee_build_phase_duration_seconds',
+        'substage': 'ee_build_substage_duration_seconds',
+    }
+    reserved = {'ts', 'event', 'name', 'duration_seconds', 'steps'}
+    lines: List[str] = []
+
+    for event, family in families.items():
+        selected = [r for r in records if r.get('event') == event]
+        if not selected:
+            continue
+        lines.append(f'# TYPE {family} gauge')
+        lines.append(f'# UNIT {family} seconds')
+        for record in selected:
+            labels = {'build_id': record.get('build_id', '')}
+            if event != 'build':
+                labels[event] = record['name']
+            labels.update((k, v) for k, v in record.items() if k not in reserved and k not in labels)
+            label_text = ','.join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+            lines.append(f'{family}{{{label_text}}} {record["duration_seconds"]} {record["ts"]}')
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,374 @@
+"""
+Incremental vulnerability scanning keyed by layer diff ID
+
+Consecutive releases of an EE share most of their layers byte for byte
+(the base image, usually the collection layer too), so scanning the whole
+image for every tag repeats the same work. ``scan_image_vulns`` instead
+extracts each layer into a scratch directory, runs the scanner
+(``trivy rootfs``, or EE_VULN_SCANNER) on it once, and caches the findings
+by diff ID (EE_VULN_CACHE_DIR, default ``~/.cache/ee-builder/vulnscan``).
+A new image combines the cached results with fresh scans of only its new
+layers; when every layer is cached the image is not even saved.
+
+Findings are tied to the file that listed the package (the RPM database,
+``*.dist-info``, ...) and layers are applied in order with whiteouts, so
+a package removed or upgraded by a later layer drops out of the result.
+A layer without os-release is scanned with the one inherited from the
+layers below it, which is part of the cache key.
+
+A cached layer is rescanned when the scanner version changes, or when the
+vulnerability DB changed and the entry is older than ``max_age`` hours.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.ocibundle import OCIArchive, blob_path
+from ee_builder.profiling import span
+from ee_builder.runtime import ContainerRuntime, RuntimeCommandError, connect_runtime
+from ee_builder.sbom import DPKG_STATUS, OS_RELEASE, RPMDB_PATHS
+
+SEVERITIES = ('UNKNOWN', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+CACHE_VERSION = 1
+DEFAULT_SCANNER = 'trivy'
+DEFAULT_MAX_AGE = 24.0
+LAYER_TIMEOUT = 600.0
+CHUNK = 1 << 20
+
+Finding = Dict[str, Any]
+
+
+class VulnScanError(EEBuilderError):
+    """Raised when the scanner is missing or fails, or an image cannot be read."""
+
+
+def vulnscan_cache_dir() -> Path:
+    configured = os.environ.get('EE_VULN_CACHE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'vulnscan'
+
+
+def scanner_command() -> str:
+    return os.environ.get('EE_VULN_SCANNER') or DEFAULT_SCANNER
+
+
+def severity_rank(severity: Optional[str]) -> int:
+    severity = (severity or 'UNKNOWN').upper()
+    return SEVERITIES.index(severity) if severity in SEVERITIES else 0
+
+
+# === scanner ===
+def _run_scanner(scanner: str, args: List[str], timeout: Optional[float]) -> Any:
+    try:
+        with span('subprocess', f'{os.path.basename(scanner)} {args[0]}'):
+            result = subprocess.run([scanner] + args, capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError as e:
+        raise VulnScanError(f"Vulnerability scanner not found: {scanner} (set EE_VULN_SCANNER)") from e
+    except subprocess.TimeoutExpired as e:
+        raise VulnScanError(f"{scanner} {args[0]} timed out after {timeout}s") from e
+    if result.returncode != 0:
+        raise VulnScanError(f"{scanner} {args[0]} failed: {(result.stderr or result.stdout).strip()}")
+    try:
+        return json.loads(result.stdout or 'null')
+    except ValueError as e:
+        raise VulnScanError(f"{scanner} {args[0]} did not print JSON: {e}") from e
+
+
+def scanner_version(scanner: str, timeout: Optional[float] = 60.0) -> Dict[str, Optional[str]]:
+    """Return {'scanner': version, 'db': vulnerability DB version} from ``<scanner> version``."""
+    data = _run_scanner(scanner, ['version', '--format', 'json'], timeout) or {}
+    db = data.get('VulnerabilityDB') or {}
+    return {'scanner': data.get('Version'), 'db': db.get('UpdatedAt') or db.get('Version')}
+
+
+def parse_report(report: Any, root: Path, package_dbs: List[str]) -> List[Finding]:
+    """Turn a ``trivy --format json`` report for one layer into findings with layer-relative paths."""
+    findings = []
+    prefix = str(root).rstrip('/') + '/'
+    for result in (report or {}).get('Results') or []:
+        target = result.get('Target') or ''
+        klass = result.get('Class') or ''
+        for vuln in result.get('Vulnerabilities') or []:
+            if klass == 'os-pkgs':
+                # OSパッケージはこのレイヤーのパッケージDBに属する
+                path = package_dbs[-1] if package_dbs else None
+            else:
+                path = vuln.get('PkgPath') or target or None
+                if path and path.startswith(prefix):
+                    path = path[len(prefix):]
+                path = path.lstrip('/') if path else None
+            findings.append({
+                'id': vuln.get('VulnerabilityID'),
+                'package': vuln.get('PkgName'),
+                'version': vuln.get('InstalledVersion'),
+                'fixed': vuln.get('FixedVersion') or None,
+                'severity': (vuln.get('Severity') or 'UNKNOWN').upper(),
+                'title': vuln.get('Title') or '',
+                'class': klass,
+                'path': path,
+            })
+    return findings
+
+
+# === layers ===
+def _safe_path(name: str) -> Optional[str]:
+    path = re.sub(r'^(?:\./)+', '', name).lstrip('/')
+    parts = [part for part in path.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return '/'.join(parts)
+
+
+def extract_layer(stream: IO[bytes], target: Path) -> Dict[str, Any]:
+    """Extract the regular files of one layer tar into *target* and return its whiteouts and package DBs."""
+    whiteouts: List[str] = []
+    opaque: List[str] = []
+    package_dbs: List[str] = []
+    os_release = None
+    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+            path = _safe_path(member.name)
+            if path is None:
+                continue
+            directory, _, name = path.rpartition('/')
+            if name == '.wh..wh..opq':
+                opaque.append(directory)
+                continue
+            if name.startswith('.wh.'):
+                whiteouts.append(f"{directory}/{name[4:]}" if directory else name[4:])
+                continue
+            destination = target / path
+            if member.isdir():
+                destination.mkdir(parents=True, exist_ok=True)
+                continue
+            if member.islnk():
+                source = _safe_path(member.linkname)
+                if source and (target / source).is_file():
+                    destination.parent.mkdir(parents=True, exist_ok=True)
+                    if not destination.exists():
+                        os.link(target / source, destination)
+                continue
+            if not member.isfile():
+                continue  # シンボリックリンクやデバイスは展開しない
+            handle = tar.extractfile(member)
+            if handle is None:
+                continue
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with open(destination, 'wb') as out:
+                while True:
+                    chunk = handle.read(CHUNK)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.chmod(destination, (member.mode & 0o755) | 0o600)
+            if path in RPMDB_PATHS or path == DPKG_STATUS:
+                package_dbs.append(path)
+            elif path in OS_RELEASE:
+                os_release = destination.read_text(encoding='utf-8', errors='replace')
+    return {'whiteouts': whiteouts, 'opaque': opaque, 'package_dbs': package_dbs, 'os_release': os_release}
+
+
+def scan_layer(stream: IO[bytes], scanner: str, inherited_os: Optional[str],
+               timeout: Optional[float] = LAYER_TIMEOUT) -> Dict[str, Any]:
+    """Extract one layer, run the scanner on it and return the cacheable result."""
+    with tempfile.TemporaryDirectory(prefix='ee-vulnscan-') as work_dir:
+        root = Path(work_dir) / 'rootfs'
+        root.mkdir()
+        layer = extract_layer(stream, root)
+        if layer['os_release'] is None and inherited_os is not None:
+            # OS判定には下位レイヤーの os-release が必要
+            (root / 'etc').mkdir(exist_ok=True)
+            (root / 'etc' / 'os-release').write_text(inherited_os, encoding='utf-8')
+        report = _run_scanner(scanner, ['rootfs', '--format', 'json', '--quiet', '--scanners', 'vuln', str(root)],
+                              timeout)
+        findings = parse_report(report, root, layer['package_dbs'])
+    return dict(layer, findings=findings)
+
+
+def _os_key(os_release: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(os_release.encode('utf-8')).hexdigest() if os_release is not None else None
+
+
+def _cache_file(cache_dir: Path, diff_id: str) -> Path:
+    return cache_dir / f"{diff_id.replace(':', '-')}.json"
+
+
+def _load_entry(cache_dir: Path, diff_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(_cache_file(cache_dir, diff_id).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return data if data.get('version') == CACHE_VERSION else None
+
+
+def _store_entry(cache_dir: Path, diff_id: str, entry: Dict[str, Any]) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = _cache_file(cache_dir, diff_id)
+    tmp = target.with_suffix('.tmp')
+    tmp.write_text(json.dumps(entry), encoding='utf-8')
+    os.replace(tmp, target)
+
+
+def _reusable(entry: Optional[Dict[str, Any]], versions: Dict[str, Optional[str]], os_key: Optional[str],
+              max_age: float) -> bool:
+    if entry is None or entry.get('scanner') != versions['scanner'] or entry.get('os') != os_key:
+        return False
+    if entry.get('db') == versions['db']:
+        return True
+    return time.time() - entry.get('scanned_at', 0) < max_age * 3600
+
+
+def apply_layers(layers: List[Tuple[str, Dict[str, Any]]]) -> List[Finding]:
+    """Apply the layer results in order (whiteouts included) and return the findings left in the image."""
+    state: Dict[str, Tuple[str, List[Finding]]] = {}
+    unplaced: List[Finding] = []
+    for diff_id, entry in layers:
+        for directory in entry['opaque']:
+            state = {path: value for path, value in state.items() if not path.startswith(directory + '/')}
+        for removed in entry['whiteouts']:
+            state = {path: value for path, value in state.items()
+                     if path != removed and not path.startswith(removed + '/')}
+        by_path: Dict[str, List[Finding]] = {}
+        for finding in entry['findings']:
+            if finding.get('path'):
+                by_path.setdefault(finding['path'], []).append(finding)
+            else:
+                unplaced.append(dict(finding, layer=diff_id))
+        for path in entry['package_dbs']:
+            state[path] = (diff_id, [])  # 脆弱性のないパッケージDBも下位レイヤーの結果を置き換える
+        for path, findings in by_path.items():
+            state[path] = (diff_id, findings)
+    seen = set()
+    decorated = []
+    for finding in unplaced + [dict(f, layer=diff_id) for diff_id, findings in state.values() for f in findings]:
+        identity = (finding['id'], finding['package'], finding['version'], finding.get('path'))
+        if identity in seen:
+            continue
+        seen.add(identity)
+        decorated.append((-severity_rank(finding['severity']), finding['id'] or '', finding['package'] or '',
+                          finding.get('path') or '', finding))
+    decorated.sort()
+    return [item[-1] for item in decorated]
+
+
+def scan_image_vulns(image: str, runtime: Optional[ContainerRuntime] = None, scanner: Optional[str] = None,
+                     cache_dir: Optional[Path] = None, max_age: float = DEFAULT_MAX_AGE,
+                     timeout: Optional[float] = LAYER_TIMEOUT) -> Dict[str, Any]:
+    """Scan *image* layer by layer, reusing cached layer results, and return the combined findings."""
+    started = time.perf_counter()
+    runtime = runtime or connect_runtime()
+    scanner = scanner or scanner_command()
+    cache_dir = Path(cache_dir) if cache_dir else vulnscan_cache_dir()
+    versions = scanner_version(scanner)
+    info = runtime.inspect_image(image)
+    if info is None:
+        raise VulnScanError(f"Image not found locally: {image}")
+
+    diff_ids = list((info.get('RootFS') or {}).get('Layers') or [])
+    entries = {diff_id: _load_entry(cache_dir, diff_id) for diff_id in diff_ids}
+
+    def walk(order: List[str]) -> Optional[List[str]]:
+        """Return the layers that need a scan, or None if an os-release below is unknown."""
+        needed = []
+        os_release = None
+        for diff_id in order:
+            entry = entries.get(diff_id)
+            if entry is None:
+                return None
+            if not _reusable(entry, versions, _os_key(os_release), max_age):
+                needed.append(diff_id)
+            if entry.get('os_release') is not None:
+                os_release = entry['os_release']
+        return needed
+
+    needed = walk(diff_ids) if diff_ids else None
+    scanned = 0
+    if needed is None or needed:
+        with tempfile.TemporaryDirectory(prefix='ee-vulnscan-') as work_dir:
+            archive = Path(work_dir) / 'image.tar'
+            try:
+                runtime.save(image, str(archive))
+            except RuntimeCommandError as e:
+                raise VulnScanError(str(e)) from e
+            with OCIArchive(archive) as layout:
+                _, blobs = layout.image()
+                diff_ids = list(layout.json(blob_path(blobs[1]['digest']))['rootfs']['diff_ids'])
+                os_release = None
+                for diff_id, layer in zip(diff_ids, blobs[2:]):
+                    entry = entries.get(diff_id)
+                    os_key = _os_key(os_release)
+                    if not _reusable(entry, versions, os_key, max_age):
+                        with layout.open(blob_path(layer['digest'])) as handle:
+                            entry = scan_layer(handle, scanner, os_release, timeout)
+                        entry.update(version=CACHE_VERSION, os=os_key, scanned_at=time.time(), **versions)
+                        _store_entry(cache_dir, diff_id, entry)
+                        entries[diff_id] = entry
+                        scanned += 1
+                    if entry.get('os_release') is not None:
+                        os_release = entry['os_release']
+
+    layers = [(diff_id, entries[diff_id]) for diff_id in diff_ids]
+    findings = apply_layers(layers)
+    digests = [ref.split('@', 1)[1] for ref in info.get('RepoDigests') or [] if '@' in ref]
+    return {
+        'image': image,
+        'digest': info.get('Digest') or (digests[0] if digests else None),
+        'scanner': versions['scanner'],
+        'db': versions['db'],
+        'layers': [{'diff_id': diff_id, 'findings': len(entry['findings']),
+                    'db': entry.get('db')} for diff_id, entry in layers],
+        'findings': findings,
+        'scanned': scanned,
+        'reused': len(layers) - scanned,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+# === output ===
+def severity_counts(findings: List[Finding]) -> Dict[str, int]:
+    counts = {severity: 0 for severity in reversed(SEVERITIES)}
+    for finding in findings:
+        counts[finding['severity'] if finding['severity'] in counts else 'UNKNOWN'] += 1
+    return counts
+
+
+def render_sarif(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Render the findings as SARIF 2.1.0 for code scanning upload."""
+    levels = {'CRITICAL': 'error', 'HIGH': 'error', 'MEDIUM': 'warning'}
+    rules: Dict[str, Dict[str, Any]] = {}
+    results = []
+    for finding in result['findings']:
+        rule_id = finding['id'] or 'UNKNOWN'
+        rules.setdefault(rule_id, {
+            'id': rule_id,
+            'shortDescription': {'text': finding['title'] or rule_id},
+            'properties': {'tags': ['vulnerability', 'security', finding['severity']]},
+        })
+        fixed = f", fixed in {finding['fixed']}" if finding['fixed'] else ''
+        results.append({
+            'ruleId': rule_id,
+            'level': levels.get(finding['severity'], 'note'),
+            'message': {'text': f"{finding['package']} {finding['version']}: {rule_id} "
+                                f"({finding['severity']}{fixed}) in layer {finding['layer']}"},
+            'locations': [{'physicalLocation': {'artifactLocation': {'uri': finding.get('path') or result['image']}}}],
+        })
+    return {
+        '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+        'version': '2.1.0',
+        'runs': [{
+            'tool': {'driver': {'name': 'ee_builder vulnscan', 'version': result['scanner'] or 'unknown',
+                                'rules': list(rules.values())}},
+            'results': results,
+        }],
+    }
@@ -0,0 +1,342 @@
+"""
+Watch mode for EE development
+
+``watch`` follows the EE file, ``ansible.cfg``, the lock file and every
+file the EE definition references (requirement files, COPY/ADD sources,
+additional_build_files), and after a burst of changes settles (debounce)
+reruns only the affected stage:
+
+- config: ``ansible.cfg`` changed -> regenerate ansible-navigator.yml;
+- build:  a build input changed -> ansible-builder rebuild, then the smoke
+  tests. ansible-builder keeps the galaxy, python and system installs in
+  separate Containerfile steps, so the engine's layer cache rebuilds only
+  from the changed dependency layer on;
+- test:   the inputs changed back to what the current image was built
+  from (e.g. an edit was reverted) -> smoke tests only.
+
+Changes are compared per section of the parsed inputs, so comment or
+formatting edits do not trigger anything. File events come from inotify
+(through libc, no extra dependency) and fall back to polling mtimes on
+platforms without it.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+from ee_builder.build import IMAGE_NAME, BuildError, build, image_reference, test_ee
+from ee_builder.eefile import (
+    base_image, copied_files, dependency_files, galaxy_requirements, load_ee_file, requirement_lines
+)
+from ee_builder.errors import EEBuilderError
+from ee_builder.log import log_error, log_info, log_success, log_warn
+from ee_builder.profiling import span
+from ee_builder.runtime import ContainerRuntime, connect_runtime
+
+DEFAULT_DEBOUNCE = 0.5
+POLL_INTERVAL = 0.5
+GENERATE_CONFIG = Path(__file__).resolve().parent.parent / 'scripts' / 'generate-navigator-config.py'
+
+# config: ansible-navigator.yml の再生成 / build: 再ビルド / test: スモークテストのみ
+CONFIG, BUILD, TEST = 'config', 'build', 'test'
+BUILD_SECTIONS = ('base_image', 'galaxy', 'python', 'system', 'build_steps', 'build_files', 'lock', 'options')
+
+# inotify(7): IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_IN_MASK = 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+_EVENT = struct.Struct('iIII')
+
+
+class WatchError(EEBuilderError):
+    """Raised when the watcher cannot start or the navigator config cannot be generated."""
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _file_digest(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def build_files(ee_config: Dict[str, Any], ee_file: Path, project_dir: Path) -> List[Path]:
+    """Return local files that end up in the build context (COPY/ADD sources, additional_build_files)."""
+    base = ee_file.parent
+    files = copied_files(ee_config, [base, project_dir])
+    for entry in ee_config.get('additional_build_files') or []:
+        src = entry.get('src') if isinstance(entry, dict) else None
+        if not src:
+            continue
+        pattern = Path(src)
+        matches = [pattern] if pattern.is_absolute() else sorted(base.glob(src))
+        for path in matches:
+            candidates = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+            files.extend(p for p in candidates if p not in files)
+    return files
+
+
+def watched_files(ee_file: Path, project_dir: Path, lock_file: Optional[Path] = None) -> List[Path]:
+    """Return every file whose change can affect the image or the navigator config."""
+    files = [ee_file, project_dir / 'ansible.cfg'] + ([lock_file] if lock_file else [])
+    try:
+        config = load_ee_file(ee_file)
+    except EEBuilderError:
+        return files
+    for path in dependency_files(config, ee_file.parent) + build_files(config, ee_file, project_dir):
+        if path not in files:
+            files.append(path)
+    return files
+
+
+def input_fingerprint(ee_file: Path, project_dir: Path, lock_file: Optional[Path] = None) -> Dict[str, str]:
+    """Return {section: digest} of the parsed build inputs; raises EEBuilderError on invalid files."""
+    config = load_ee_file(ee_file)
+    base = ee_file.parent
+    dependencies = config.get('dependencies') or {}
+    values = {
+        'base_image': base_image(config),
+        'galaxy': galaxy_requirements(config, base),
+        'python': requirement_lines(config, 'python', base),
+        'system': requirement_lines(config, 'system', base),
+        'build_steps': config.get('additional_build_steps'),
+        'build_files': {str(path): _file_digest(path) for path in build_files(config, ee_file, project_dir)},
+        'lock': _file_digest(lock_file) if lock_file else None,
+        'options': [{key: value for key, value in config.items()
+                     if key not in ('images', 'dependencies', 'additional_build_steps')},
+                    {key: value for key, value in dependencies.items() if key not in ('galaxy', 'python', 'system')}],
+        'ansible_cfg': _file_digest(project_dir / 'ansible.cfg'),
+    }
+    return {name: _digest(value) for name, value in values.items()}
+
+
+def plan_stages(built: Dict[str, str], current: Dict[str, str], new: Dict[str, str]) -> Dict[str, Any]:
+    """Decide the stages to rerun from the inputs of the current image, the last seen and the new inputs."""
+    stages = []
+    if new['ansible_cfg'] != current['ansible_cfg']:
+        stages.append(CONFIG)
+    changed = [name for name in BUILD_SECTIONS if new[name] != built.get(name)]
+    if changed:
+        stages += [BUILD, TEST]
+    elif any(new[name] != current[name] for name in BUILD_SECTIONS):
+        # 変更が取り消され、現在のイメージの入力と同じに戻った
+        stages.append(TEST)
+    return {'stages': stages, 'sections': changed}
+
+
+def generate_config(ee_file: Path, image: str, project_dir: Path, output: Path) -> None:
+    """Regenerate ansible-navigator.yml with scripts/generate-navigator-config.py."""
+    if not GENERATE_CONFIG.is_file():
+        raise WatchError(f"{GENERATE_CONFIG} not found")
+    with span('subprocess', GENERATE_CONFIG.name):
+        result = subprocess.run(
+            [sys.executable, str(GENERATE_CONFIG), '--ee-file', str(Path(ee_file).resolve()), '--image', image,
+             '--output', str(Path(output).resolve()), '--force'],
+            cwd=str(project_dir), capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        raise WatchError(f"generate-navigator-config.py failed: {(result.stderr or result.stdout).strip()}")
+
+
+class InotifyWatcher:
+    """Report changed paths in the watched files' directories through inotify(7)."""
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: Dict[int, Path] = {}
+
+    def watch(self, paths: Sequence[Path]) -> None:
+        # エディタはリネームで保存するのでファイルではなくディレクトリを監視する
+        for directory in {Path(path).resolve().parent for path in paths}:
+            if directory in self._dirs.values() or not directory.is_dir():
+                continue
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), _IN_MASK)
+            if wd >= 0:
+                self._dirs[wd] = directory
+
+    def read(self, timeout: float) -> List[Path]:
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        paths, offset = [], 0
+        while offset + _EVENT.size <= len(data):
+            wd, _, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if wd in self._dirs and name:
+                paths.append(self._dirs[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """Fallback watcher comparing (mtime, size) of the watched files every POLL_INTERVAL."""
+
+    def __init__(self, interval: float = POLL_INTERVAL) -> None:
+        self.interval = interval
+        self._stats: Dict[Path, Any] = {}
+
+    @staticmethod
+    def _stat(path: Path) -> Any:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def watch(self, paths: Sequence[Path]) -> None:
+        resolved = {Path(path).resolve() for path in paths}
+        self._stats = {path: self._stats.get(path, self._stat(path)) for path in resolved}
+
+    def read(self, timeout: float) -> List[Path]:
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            changed = [path for path, stat in self._stats.items() if self._stat(path) != stat]
+            if changed:
+                for path in changed:
+                    self._stats[path] = self._stat(path)
+                return changed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            time.sleep(min(self.interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+def file_watcher(poll: bool = False) -> Any:
+    """Return an InotifyWatcher, or a PollWatcher when asked or inotify is unavailable."""
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            log_warn(f"inotify unavailable ({e}), polling for changes")
+    return PollWatcher()
+
+
+def wait_for_changes(watcher: Any, files: Sequence[Path], debounce: float = DEFAULT_DEBOUNCE,
+                     stop: Optional[threading.Event] = None) -> Set[Path]:
+    """Block until a watched file changes and no further change follows within ``debounce`` seconds."""
+    relevant = {Path(path).resolve() for path in files}
+    watcher.watch(list(relevant))
+    changed: Set[Path] = set()
+    quiet_at = None
+    while not (stop is not None and stop.is_set()):
+        timeout = POLL_INTERVAL if quiet_at is None else quiet_at - time.monotonic()
+        if quiet_at is not None and timeout <= 0:
+            return changed
+        hits = {path for path in watcher.read(timeout) if path.resolve() in relevant}
+        if hits:
+            changed |= hits
+            quiet_at = time.monotonic() + debounce
+    return changed
+
+
+def watch(ee_file: Path, tag: str = 'latest', registry: str = 'localhost', image_name: str = IMAGE_NAME,
+          runtime: Optional[ContainerRuntime] = None, project_dir: Path = Path('.'),
+          navigator_config: Optional[Path] = None, lock_file: Optional[Path] = None,
+          debounce: float = DEFAULT_DEBOUNCE, poll: bool = False, verbose: bool = False,
+          cycles: Optional[int] = None, stop: Optional[threading.Event] = None,
+          on_cycle: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Rerun the affected stage whenever the EE inputs change; returns one result per cycle.
+
+    Runs until ``stop`` is set, interrupted, or ``cycles`` change cycles
+    have run. When the image does not exist yet it is built first. Each
+    cycle result is also passed to ``on_cycle`` as soon as it finishes.
+    """
+    ee_file = Path(ee_file)
+    project_dir = Path(project_dir)
+    navigator_config = navigator_config or project_dir / 'ansible-navigator.yml'
+    runtime = runtime or connect_runtime()
+    image = image_reference(registry, tag, image_name)
+    context = project_dir / 'context'
+
+    current = input_fingerprint(ee_file, project_dir, lock_file)
+    built = dict(current) if runtime.inspect_image(image) is not None else {}
+    results: List[Dict[str, Any]] = []
+
+    def finish(result: Dict[str, Any]) -> None:
+        results.append(result)
+        if on_cycle is not None:
+            on_cycle(result)
+
+    def run_cycle(stages: List[str], changed: Sequence[Path], sections: Sequence[str]) -> None:
+        nonlocal built
+        start = time.time()
+        result: Dict[str, Any] = {'changed': [str(path) for path in changed], 'stages': stages,
+                                  'sections': list(sections), 'status': 'ok', 'error': None}
+        try:
+            if CONFIG in stages:
+                log_info(f"Regenerating {navigator_config}...")
+                generate_config(ee_file, image, project_dir, navigator_config)
+                log_success(f"{navigator_config} regenerated")
+            if BUILD in stages:
+                if sections:
+                    log_info(f"Changed: {', '.join(sections)}; unchanged layers come from the build cache")
+                build(ee_file, tag=tag, registry=registry, runtime=runtime, verbose=verbose, context=context,
+                      image_name=image_name, run_tests=False, lock_file=lock_file)
+                built = dict(current)
+            if TEST in stages:
+                test_ee(image, runtime)
+        except EEBuilderError as e:
+            if not isinstance(e, BuildError):
+                log_error(str(e))
+            result.update(status='failed', error=str(e))
+        result['seconds'] = round(time.time() - start, 3)
+        finish(result)
+
+    if not built:
+        log_info(f"{image} not found locally, building it first")
+        run_cycle(([] if navigator_config.is_file() else [CONFIG]) + [BUILD, TEST], [], [])
+
+    watcher = file_watcher(poll)
+    try:
+        while cycles is None or len(results) < cycles:
+            files = watched_files(ee_file, project_dir, lock_file)
+            log_info(f"Watching {len(files)} file(s) for changes (Ctrl-C to stop)...")
+            changed = wait_for_changes(watcher, files, debounce, stop)
+            if not changed:
+                break
+            try:
+                new = input_fingerprint(ee_file, project_dir, lock_file)
+            except EEBuilderError as e:
+                # 編集途中の不正なYAMLなどは次の変更を待つ
+                log_error(str(e))
+                finish({'changed': sorted(str(path) for path in changed), 'stages': [], 'sections': [],
+                        'status': 'failed', 'error': str(e), 'seconds': 0.0})
+                continue
+            plan = plan_stages(built, current, new)
+            current = new
+            if not plan['stages']:
+                log_info("No effective change (comments or formatting only)")
+                continue
+            log_info(f"Changed {', '.join(sorted(path.name for path in changed))}: running {', '.join(plan['stages'])}")
+            run_cycle(plan['stages'], sorted(changed), plan['sections'])
+    except KeyboardInterrupt:
+        log_info("Stopped watching")
+    finally:
+        watcher.close()
+    return results
@@ -0,0 +1,155 @@
+"""
+Cached YAML parsing
+
+load_yaml() parses with the libyaml C loader when PyYAML was built with
+it and caches results in two layers:
+
+- in process, keyed by (path, mtime, size), so repeated loads skip both
+  reading and hashing the file;
+- on disk, keyed by the SHA-256 of the file content, so test suites
+  running in separate processes parse each file only once.
+
+Results are stored with marshal (fast, and unlike pickle it cannot run code)
+and every call returns a fresh object, so callers may mutate it. Data
+marshal cannot represent (e.g. YAML timestamps) is only cached in
+process. EE_YAML_CACHE=0 disables the disk cache; EE_YAML_CACHE_DIR
+moves it.
+"""
+
+import copy
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import yaml
+
+from ee_builder.profiling import span
+
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_lock = threading.Lock()
+_stat_index: Dict[Tuple[str, int, int], str] = {}
+_blobs: Dict[str, bytes] = {}
+_objects: Dict[str, Any] = {}
+
+stats = {'parsed': 0, 'memory_hits': 0, 'disk_hits': 0}
+
+# ローダーや marshal 形式が変わったら別のキャッシュエントリになるよう内容ハッシュに含める
+_CACHE_SALT = f"{yaml.__version__}:{SafeLoader.__name__}:{marshal.version}:{sys.version_info[:2]}\n".encode()
+
+
+def cache_dir() -> Optional[Path]:
+    """Return the disk cache directory, or None when the disk cache is disabled."""
+    if os.environ.get('EE_YAML_CACHE', '1').lower() in ('0', 'false', 'no'):
+        return None
+    configured = os.environ.get('EE_YAML_CACHE_DIR')
+    if configured:
+        return Path(configured)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'ee-builder' / 'yaml'
+
+
+def parse_yaml(text: Any) -> Any:
+    """Parse YAML text or bytes with the fastest safe loader (no caching)."""
+    return yaml.load(text, Loader=SafeLoader)  # nosec B506 - SafeLoader/CSafeLoader
+
+
+def _read_disk(directory: Path, digest: str) -> Optional[bytes]:
+    try:
+        return (directory / f"{digest}.marshal").read_bytes()
+    except OSError:
+        return None
+
+
+def _write_disk(directory: Path, digest: str, blob: bytes) -> None:
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, directory / f"{digest}.marshal")
+    except OSError:
+        pass
+
+
+def _from_blob(digest: str) -> Tuple[bool, Any]:
+    blob = _blobs.get(digest)
+    if blob is not None:
+        return True, marshal.loads(blob)
+    if digest in _objects:
+        # marshal で表現できないデータ（日時など）はプロセス内のみキャッシュ
+        return True, copy.deepcopy(_objects[digest])
+    return False, None
+
+
+def load_yaml(path: Any, use_disk: bool = True) -> Any:
+    """Load a YAML file through the cache; raises OSError / yaml.YAMLError like yaml.safe_load."""
+    path = os.path.abspath(os.fspath(path))
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+
+    with _lock:
+        digest = _stat_index.get(key)
+        if digest is not None:
+            found, data = _from_blob(digest)
+            if found:
+                stats['memory_hits'] += 1
+                return data
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(_CACHE_SALT + content).hexdigest()
+
+    with _lock:
+        _stat_index[key] = digest
+        found, data = _from_blob(digest)
+        if found:
+            stats['memory_hits'] += 1
+            return data
+
+    directory = cache_dir() if use_disk else None
+    if directory is not None:
+        blob = _read_disk(directory, digest)
+        if blob is not None:
+            try:
+                data = marshal.loads(blob)
+            except (EOFError, ValueError, TypeError):
+                data = None
+            else:
+                with _lock:
+                    _blobs[digest] = blob
+                    stats['disk_hits'] += 1
+                return data
+
+    with span('yaml', 'parse'):
+        data = parse_yaml(content)
+    try:
+        blob = marshal.dumps(data)
+    except ValueError:
+        blob = None
+    with _lock:
+        stats['parsed'] += 1
+        if blob is None:
+            _objects[digest] = data
+        else:
+            _blobs[digest] = blob
+    if blob is None:
+        return copy.deepcopy(data)
+    if directory is not None:
+        _write_disk(directory, digest, blob)
+    return marshal.loads(blob)
+
+
+def clear_memory_cache() -> None:
+    """Forget everything cached in this process (the disk cache is kept)."""
+    with _lock:
+        _stat_index.clear()
+        _blobs.clear()
+        _objects.clear()
+        for name in stats:
+            stats[name] = 0
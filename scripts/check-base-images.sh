@@ -8,6 +8,7 @@ set -euo pipefail
 VERBOSE=false
 OUTPUT_FORMAT="table"
 CHECK_AUTH=true
+PROJECT_ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 
 # カラー定義
 RED='\033[0;31m'
@@ -131,8 +132,9 @@ authenticate_redhat() {
         local runtime
         runtime=$(get_container_runtime)
         
-        if echo "$REDHAT_REGISTRY_PASSWORD" | \
-           $runtime login registry.redhat.io -u "$REDHAT_REGISTRY_USERNAME" --password-stdin; then
+        # 直近のログインが認証情報キャッシュに記録されていれば再ログインしない
+        if PYTHONPATH="${PROJECT_ROOT}${PYTHONPATH:+:$PYTHONPATH}" \
+           python3 -m ee_builder credentials login --runtime "$runtime"; then
             log_success "Red Hat registry authentication successful"
             return 0
         else
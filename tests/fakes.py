@@ -0,0 +1,869 @@
+"""
+Local stand-ins used by the test suites
+
+FakeRegistry serves a subset of the registry v2 API from memory,
+FakeGalaxy serves the Galaxy v3 collection API and an SSO token endpoint,
+FakeEngineAPI serves a subset of the podman/docker REST API on a Unix
+socket, and write_fake_runtime creates a podman-like executable backed by
+a JSON state file, so the tooling can be tested without a network or a
+real container engine. write_collection_tarball builds collection
+artifacts like ``ansible-galaxy collection build`` does, write_wheel
+builds minimal wheels like ``pip download`` leaves in a wheelhouse,
+rpmdb_bytes builds an rpmdb.sqlite like the one in RHEL 9 based images,
+and write_fake_scanner creates a trivy-like vulnerability scanner.
+run_command is the shared command helper of the class-based suites.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shlex
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from ee_builder.errors import EEBuilderError
+from ee_builder.execution import ProgressSink, run
+
+
+class FakeRegistry:
+    """In-memory registry v2 stand-in with optional bearer authentication."""
+
+    def __init__(self, require_auth=False):
+        self.require_auth = require_auth
+        self.manifests = {}  # (repository, reference) -> (digest, body)
+        self.requests = []
+        self.issued = 'fake-bearer-value'
+        self.blobs = {}  # (repository, digest) -> body
+        self.tag_order = {}  # repository -> tags in push order
+        self.delete_enabled = True
+        self.page_size = None  # tags/list のページサイズ上限（Link ヘッダーでページング）
+        self.delay = 0.0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def add_manifest(self, repository, reference, digest, body=b'{}'):
+        self.manifests[(repository, reference)] = (digest, body)
+        self.manifests[(repository, digest)] = (digest, body)
+        if not reference.startswith('sha256:'):
+            order = self.tag_order.setdefault(repository, [])
+            if reference not in order:
+                order.append(reference)
+
+    def add_image(self, repository, tag, created=None, content=None):
+        """Push a single-platform image: a config blob (with ``created``) and its manifest."""
+        config = json.dumps({'created': created, 'content': content or tag}).encode()
+        config_digest = 'sha256:' + hashlib.sha256(config).hexdigest()
+        self.blobs[(repository, config_digest)] = config
+        body = json.dumps({'schemaVersion': 2, 'mediaType': 'application/vnd.oci.image.manifest.v1+json',
+                           'config': {'digest': config_digest, 'size': len(config)}, 'layers': []}).encode()
+        digest = 'sha256:' + hashlib.sha256(body).hexdigest()
+        self.add_manifest(repository, tag, digest, body)
+        return digest
+
+    def tags(self, repository):
+        return [tag for tag in self.tag_order.get(repository, []) if (repository, tag) in self.manifests]
+
+    def __enter__(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _authorized(self):
+                if not registry.require_auth:
+                    return True
+                if self.headers.get('Authorization') == f'Bearer {registry.issued}':
+                    return True
+                self._send(401, b'{}', {
+                    'WWW-Authenticate': f'Bearer realm="http://{registry.address}/auth",'
+                                        f'service="fake",scope="repository:x:pull"'
+                })
+                return False
+
+            def _handle(self):
+                registry.requests.append((self.command, self.path))
+                if self.path.startswith('/auth'):
+                    self._send(200, json.dumps({'token': registry.issued}).encode())
+                    return
+                if not self._authorized():
+                    return
+                url = urlsplit(self.path)
+                match = re.match(r'^/v2/(.+)/tags/list$', url.path)
+                if match and self.command == 'GET':
+                    tags = sorted(registry.tags(match.group(1)))
+                    query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                    if query.get('last'):
+                        tags = [tag for tag in tags if tag > query['last']]
+                    size = min(int(query.get('n', len(tags) or 1)), registry.page_size or len(tags) or 1)
+                    headers = {}
+                    if len(tags) > size:
+                        headers['Link'] = f'</v2/{match.group(1)}/tags/list?n={size}&last={tags[size - 1]}>; rel="next"'
+                    self._send(200, json.dumps({'name': match.group(1), 'tags': tags[:size]}).encode(), headers)
+                    return
+                match = re.match(r'^/v2/(.+)/blobs/([^/]+)$', url.path)
+                if match and (match.group(1), match.group(2)) in registry.blobs:
+                    self._send(200, registry.blobs[(match.group(1), match.group(2))])
+                    return
+                match = re.match(r'^/v2/(.+)/manifests/([^/]+)$', self.path)
+                if match and self.command == 'DELETE':
+                    self._delete(match.group(1), match.group(2))
+                    return
+                if match and (match.group(1), match.group(2)) in registry.manifests:
+                    digest, body = registry.manifests[(match.group(1), match.group(2))]
+                    self._send(200, body, {
+                        'Docker-Content-Digest': digest,
+                        'Content-Type': 'application/vnd.oci.image.manifest.v1+json'
+                    })
+                    return
+                self._send(404, b'{"errors": [{"code": "MANIFEST_UNKNOWN"}]}')
+
+            def _delete(self, repository, digest):
+                with registry.lock:
+                    registry.inflight += 1
+                    registry.max_inflight = max(registry.max_inflight, registry.inflight)
+                time.sleep(registry.delay)
+                with registry.lock:
+                    registry.inflight -= 1
+                    if not registry.delete_enabled:
+                        self._send(405, b'{"errors": [{"code": "UNSUPPORTED"}]}')
+                        return
+                    if not digest.startswith('sha256:') or (repository, digest) not in registry.manifests:
+                        self._send(404, b'{"errors": [{"code": "MANIFEST_UNKNOWN"}]}')
+                        return
+                    for key in [key for key, value in registry.manifests.items()
+                                if key[0] == repository and value[0] == digest]:
+                        del registry.manifests[key]
+                self._send(202)
+
+            do_GET = _handle
+            do_HEAD = _handle
+            do_DELETE = _handle
+
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeGalaxy:
+    """Galaxy v3 API stand-in (HTTP/1.1 keep-alive, ETags) with an optional SSO token endpoint.
+
+    ``collections`` maps ``namespace.name`` to ``{version: dependencies}``.
+    With ``offline`` set, API calls need the bearer issued by POST /sso/token
+    for that offline token; with ``authorization`` set they need that header.
+    With ``redirect`` set, every authorized GET is answered by a 302 to the
+    same path on that base URL. ``auth_headers`` records what each GET sent.
+    """
+
+    def __init__(self, collections, prefix='/api/', offline=None, authorization=None, page_size=2):
+        self.collections = collections
+        self.prefix = prefix
+        self.offline = offline
+        self.authorization = authorization
+        self.page_size = page_size
+        self.access = 'fake-access-value'
+        self.exchange_delay = 0.0
+        self.redirect = None
+        self.requests = []  # (method, path, status)
+        self.auth_headers = []
+        self.connections = 0
+        self.exchanges = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        galaxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with galaxy.lock:
+                    galaxy.connections += 1
+
+            def _send(self, status, data=None, chunked=False):
+                body = json.dumps(data).encode() if data is not None else b''
+                etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+                if status == 200 and self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                galaxy.requests.append((self.command, self.path, status))
+                self.send_response(status)
+                if status in (200, 304) and self.command == 'GET':
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                if chunked and body:
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    for start in range(0, len(body), 7):
+                        piece = body[start:start + 7]
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                    self.wfile.write(b'0\r\n\r\n')
+                    return
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode())
+                if self.path != '/sso/token':
+                    self._send(404, {})
+                    return
+                with galaxy.lock:
+                    galaxy.exchanges += 1
+                time.sleep(galaxy.exchange_delay)
+                if form.get('grant_type') == ['refresh_token'] and form.get('refresh_token') == [galaxy.offline]:
+                    self._send(200, {'access_token': galaxy.access, 'expires_in': 300})
+                else:
+                    self._send(400, {'error': 'invalid_grant'})
+
+            def do_GET(self):
+                galaxy.auth_headers.append(self.headers.get('Authorization'))
+                wanted = f'Bearer {galaxy.access}' if galaxy.offline else galaxy.authorization
+                if wanted and self.headers.get('Authorization') != wanted:
+                    self._send(401, {'errors': [{'status': '401'}]})
+                    return
+                if galaxy.redirect:
+                    galaxy.requests.append((self.command, self.path, 302))
+                    self.send_response(302)
+                    self.send_header('Location', galaxy.redirect + self.path)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                url = urlsplit(self.path)
+                if url.path == galaxy.prefix:
+                    self._send(200, {'available_versions': {'v3': 'v3/'}})
+                    return
+                match = re.match(f'^{re.escape(galaxy.prefix)}v3/collections/([^/]+)/([^/]+)/versions/(?:([^/]+)/)?$',
+                                 url.path)
+                versions = galaxy.collections.get(f'{match.group(1)}.{match.group(2)}') if match else None
+                if versions is None:
+                    self._send(404, {'errors': [{'status': '404'}]})
+                    return
+                name = f'{match.group(1)}.{match.group(2)}'
+                if match.group(3):
+                    version = match.group(3)
+                    if version not in versions:
+                        self._send(404, {'errors': [{'status': '404'}]})
+                        return
+                    filename = f"{name.replace('.', '-')}-{version}.tar.gz"
+                    self._send(200, {
+                        'version': version,
+                        'download_url': f'/download/{filename}',
+                        'artifact': {'filename': filename, 'sha256': hashlib.sha256(filename.encode()).hexdigest()},
+                        'metadata': {'dependencies': versions[version] or {}},
+                    })
+                    return
+                offset = int((parse_qs(url.query).get('offset') or ['0'])[0])
+                ordered = list(versions)
+                page = ordered[offset:offset + galaxy.page_size]
+                next_link = None
+                if offset + galaxy.page_size < len(ordered):
+                    next_link = f'{url.path}?limit={galaxy.page_size}&offset={offset + galaxy.page_size}'
+                self._send(200, {'meta': {'count': len(ordered)}, 'links': {'next': next_link},
+                                 'data': [{'version': version} for version in page]}, chunked=True)
+
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeEngineAPI:
+    """In-memory container engine REST API stand-in listening on a Unix socket.
+
+    ``images`` maps references to inspect data; ``remote`` maps pullable
+    references to digests. Containers "run" instantly and echo their command.
+    ``delay`` stalls every request but /_ping for that many seconds, and with
+    ``drop`` set they are read and the connection is closed without a reply.
+    """
+
+    def __init__(self, socket_path, images=None, remote=None):
+        self.socket_path = str(socket_path)
+        self.images = dict(images or {})
+        self.remote = dict(remote or {})
+        self.requests = []
+        self.connections = 0
+        self.pushed = []
+        self.auth_headers = []
+        self.containers = {}
+        self.delay = 0.0
+        self.drop = False
+        self.server = None
+        self._sockets = []
+
+    def __enter__(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                api.connections += 1
+                api._sockets.append(self.connection)
+
+            def log_message(self, *args):
+                pass
+
+            def address_string(self):
+                return 'unix'
+
+            def _send(self, status, body=b'', content_type='application/json'):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                path = unquote(url.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                api.requests.append((self.command, path))
+                if 'X-Registry-Auth' in self.headers:
+                    api.auth_headers.append(json.loads(base64.urlsafe_b64decode(self.headers['X-Registry-Auth'])))
+
+                if path == '/_ping':
+                    return self._send(200, b'OK', 'text/plain')
+                time.sleep(api.delay)
+                if api.drop:
+                    self.close_connection = True
+                    return None
+                if self.command == 'GET' and path == '/images/json':
+                    return self._send(200, [dict(info, RepoTags=[ref]) for ref, info in api.images.items()])
+                match = re.match(r'^/images/(.+)/json$', path)
+                if self.command == 'GET' and match:
+                    info = api.images.get(match.group(1))
+                    return self._send(200, info) if info else self._send(404, {'message': 'no such image'})
+                if self.command == 'POST' and path == '/images/create':
+                    ref = query['fromImage'] + (':' + query['tag'] if query.get('tag') else '')
+                    if ref not in api.remote:
+                        return self._send(200, b'{"status":"Pulling"}\n{"error":"manifest unknown"}\n')
+                    digest = api.remote[ref]
+                    api.images[ref] = {'Id': digest[7:19], 'RepoDigests': [ref.rsplit(':', 1)[0] + '@' + digest],
+                                       'Size': 1024, 'Created': 1700000000}
+                    return self._send(200, b'{"status":"Pulling"}\n{"status":"Downloaded"}\n')
+                match = re.match(r'^/images/(.+)/push$', path)
+                if self.command == 'POST' and match:
+                    ref = match.group(1) + ':' + query.get('tag', 'latest')
+                    if ref not in api.images or 'X-Registry-Auth' not in self.headers:
+                        return self._send(200, b'{"error":"image not known"}\n')
+                    api.pushed.append(ref)
+                    return self._send(200, b'{"status":"Pushed"}\n')
+                match = re.match(r'^/images/(.+)$', path)
+                if self.command == 'DELETE' and match:
+                    if api.images.pop(match.group(1), None) is None:
+                        return self._send(404, {'message': 'no such image'})
+                    return self._send(200, [{'Untagged': match.group(1)}])
+                if self.command == 'POST' and path == '/containers/create':
+                    if body['Image'] not in api.images:
+                        return self._send(404, {'message': 'no such image'})
+                    container = f"c{len(api.containers) + 1}"
+                    api.containers[container] = body
+                    return self._send(201, {'Id': container})
+                match = re.match(r'^/containers/(\w+)(/\w+)?$', path)
+                if match and match.group(1) in api.containers:
+                    action = match.group(2)
+                    cmd = api.containers[match.group(1)]['Cmd']
+                    if action == '/start':
+                        return self._send(204, b'')
+                    if action == '/wait':
+                        return self._send(200, {'StatusCode': 1 if cmd[:1] == ['false'] else 0})
+                    if action == '/logs':
+                        out = (' '.join(cmd) + '\n').encode()
+                        return self._send(200, struct.pack('>BxxxL', 1, len(out)) + out,
+                                          'application/vnd.docker.raw-stream')
+                    if self.command == 'DELETE' and action is None:
+                        del api.containers[match.group(1)]
+                        return self._send(204, b'')
+                return self._send(404, {'message': f'unsupported {self.command} {path}'})
+
+            do_GET = _handle
+            do_POST = _handle
+            do_DELETE = _handle
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        # keep-alive 接続も切断してエンジン停止を再現する
+        for sock in self._sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        Path(self.socket_path).unlink(missing_ok=True)
+
+
+FAKE_RUNTIME = r'''#!{python}
+"""podman-like stand-in driven by a JSON state file."""
+import base64
+import fcntl
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+
+STATE = {state!r}
+
+
+def load():
+    with open(STATE) as f:
+        return json.load(f)
+
+
+def save(state):
+    # 並列ビルド中に他のプロセスが書きかけの状態を読まないよう、置き換えで書き込む
+    tmp = f'{{STATE}}.{{os.getpid()}}'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE)
+
+
+def add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def layer_bytes(layer):
+    """A layer is raw text, or {{path: content}} for a tar.
+
+    None content is a whiteout; 'base64:...' content is binary.
+    """
+    if isinstance(layer, str):
+        return layer.encode()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        for name, content in layer.items():
+            if content is None:
+                directory, _, base = name.rpartition('/')
+                name = (directory + '/' if directory else '') + '.wh.' + base
+                content = ''
+            data = base64.b64decode(content[7:]) if content.startswith('base64:') else content.encode()
+            add_member(tar, name, data)
+    return buffer.getvalue()
+
+
+def save_archive(image, info, path):
+    """Write an OCI archive of info['Layers'] (see layer_bytes)."""
+    blobs = {{}}
+
+    def blob(data, media_type):
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        blobs[digest] = data
+        return {{'mediaType': media_type, 'digest': digest, 'size': len(data)}}
+
+    layers = [blob(layer_bytes(layer), 'application/vnd.oci.image.layer.v1.tar') for layer in info.get('Layers', [])]
+    config = blob(json.dumps({{'rootfs': {{'diff_ids': [l['digest'] for l in layers]}}}}).encode(),
+                  'application/vnd.oci.image.config.v1+json')
+    manifest = blob(json.dumps({{'schemaVersion': 2, 'config': config, 'layers': layers}}).encode(),
+                    'application/vnd.oci.image.manifest.v1+json')
+    manifest['annotations'] = {{'org.opencontainers.image.ref.name': image}}
+    with tarfile.open(path, 'w') as tar:
+        for digest, data in blobs.items():
+            add_member(tar, 'blobs/sha256/' + digest[7:], data)
+        add_member(tar, 'oci-layout', b'{{"imageLayoutVersion": "1.0.0"}}')
+        add_member(tar, 'index.json', json.dumps({{'schemaVersion': 2, 'manifests': [manifest]}}).encode())
+
+
+def load_archive(path):
+    """Read an OCI archive back; returns (image, manifest digest, layer strings) after checking digests."""
+    with tarfile.open(path) as tar:
+        def read(name):
+            return tar.extractfile(name).read()
+
+        descriptor = json.loads(read('index.json'))['manifests'][0]
+
+        def blob(desc):
+            data = read('blobs/sha256/' + desc['digest'][7:])
+            if 'sha256:' + hashlib.sha256(data).hexdigest() != desc['digest']:
+                raise ValueError('digest mismatch ' + desc['digest'])
+            return data
+
+        manifest = json.loads(blob(descriptor))
+        blob(manifest['config'])
+        layers = [blob(layer).decode() for layer in manifest['layers']]
+    return descriptor['annotations']['org.opencontainers.image.ref.name'], descriptor['digest'], layers
+
+
+def main(argv):
+    state = load()
+    state.setdefault('calls', []).append(argv)
+    save(state)
+
+    if argv[:1] == ['save']:
+        image = argv[-1]
+        if image not in state['images'] or argv[1:3] != ['--format', 'oci-archive']:
+            print('Error: image not known', file=sys.stderr)
+            return 125
+        save_archive(image, state['images'][image], argv[argv.index('-o') + 1])
+        return 0
+
+    if argv[:2] == ['load', '-i']:
+        try:
+            image, digest, layers = load_archive(argv[2])
+        except (OSError, KeyError, ValueError, tarfile.TarError) as e:
+            print('Error: ' + str(e), file=sys.stderr)
+            return 125
+        state['images'][image] = {{'Id': digest[7:19], 'Digest': digest, 'RepoDigests': [], 'Layers': layers}}
+        state.setdefault('loaded', []).append(image)
+        save(state)
+        return 0
+
+    if argv[:2] == ['image', 'inspect']:
+        infos = []
+        for name in argv[2:]:
+            info = state['images'].get(name)
+            if info is None:
+                # イメージIDで指定された場合は全タグを RepoTags に入れる
+                tags = [ref for ref, entry in state['images'].items() if entry.get('Id') == name]
+                info = dict(state['images'][tags[0]], RepoTags=tags) if tags else None
+            if info is None:
+                print('Error: image not known', file=sys.stderr)
+                return 125
+            if 'Layers' in info:
+                info = dict(info, RootFS={{'Type': 'layers', 'Layers': [
+                    'sha256:' + hashlib.sha256(layer_bytes(layer)).hexdigest() for layer in info['Layers']]}})
+            infos.append(info)
+        print(json.dumps(infos))
+        return 0
+
+    if argv[:1] == ['images'] and '-q' in argv:
+        for image_id in dict.fromkeys(entry.get('Id') for entry in state['images'].values()):
+            print(image_id)
+        return 0
+
+    if argv[:1] == ['rmi']:
+        name = argv[-1]
+        refs = [name] if name in state['images'] else \
+            [ref for ref, entry in state['images'].items() if entry.get('Id') == name]
+        if not refs:
+            print('Error: image not known', file=sys.stderr)
+            return 125
+        if '-f' not in argv and any(ref in state.get('running', []) for ref in refs):
+            print('Error: image is in use by a container', file=sys.stderr)
+            return 2
+        for ref in refs:
+            del state['images'][ref]
+        state.setdefault('removed', []).append(name)
+        save(state)
+        return 0
+
+    if argv[:1] == ['events']:
+        since = float(argv[argv.index('--since') + 1])
+        until = float(argv[argv.index('--until') + 1])
+        for event in state.get('events', []):
+            if since <= event['time'] <= until:
+                print(json.dumps(event))
+        return 0
+
+    if argv[:1] == ['pull']:
+        image = argv[1]
+        if image not in state.get('remote', {{}}):
+            print('Error: pull failed', file=sys.stderr)
+            return 125
+        name = image.rsplit(':', 1)[0] if ':' in image.rsplit('/', 1)[-1] else image
+        digest = state['remote'][image]
+        state['images'][image] = {{'Id': digest[7:19], 'Digest': digest,
+                                  'RepoDigests': [name + '@' + digest]}}
+        save(state)
+        return 0
+
+    if argv[:1] == ['push']:
+        if argv[1] not in state['images']:
+            print('Error: image not known', file=sys.stderr)
+            return 125
+        state.setdefault('remote', {{}})[argv[1]] = state['images'][argv[1]].get('Digest', '')
+        save(state)
+        return 0
+
+    if argv[:1] == ['login']:
+        secret = sys.stdin.read().strip()
+        state.setdefault('logins', []).append([argv[1], secret])
+        save(state)
+        # podman と同様に REGISTRY_AUTH_FILE へ書き込む
+        auth_file = os.environ.get('REGISTRY_AUTH_FILE')
+        if auth_file:
+            try:
+                auths = json.load(open(auth_file))
+            except (OSError, ValueError):
+                auths = {{'auths': {{}}}}
+            user = argv[argv.index('-u') + 1]
+            auths['auths'][argv[1]] = {{'auth': base64.b64encode(f'{{user}}:{{secret}}'.encode()).decode()}}
+            json.dump(auths, open(auth_file, 'w'))
+        return 0
+
+    if argv[:2] == ['run', '--rm']:
+        if argv[2] not in state['images']:
+            print('Error: image not known', file=sys.stderr)
+            return 125
+        print('fake: ' + ' '.join(argv[3:]))
+        return 0
+
+    print('Error: unsupported command ' + ' '.join(argv), file=sys.stderr)
+    return 125
+
+
+with open(STATE + '.lock', 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    code = main(sys.argv[1:])
+sys.exit(code)
+'''
+
+
+def write_fake_runtime(directory, images=None, remote=None):
+    """Create a fake runtime executable; returns (command path, state path)."""
+    directory = Path(directory)
+    state_path = directory / 'fake-runtime-state.json'
+    state_path.write_text(json.dumps({'images': images or {}, 'remote': remote or {}}))
+
+    script = directory / 'fake-podman'
+    script.write_text(FAKE_RUNTIME.format(python=sys.executable, state=str(state_path)))
+    script.chmod(0o755)
+    return str(script), state_path
+
+
+def read_state(state_path):
+    return json.loads(Path(state_path).read_text())
+
+
+def run_command(command, budget, cwd=None, timeout=60, env=None, sinks=()):
+    """Run a command (argv, no shell) within ``budget``, streaming its output.
+
+    Returns (success, stdout, stderr); a command that cannot start or runs
+    out of budget fails with the reason in place of stderr.
+    """
+    argv = shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
+    progress = ProgressSink(os.path.basename(argv[0]))
+    try:
+        result = run(argv, cwd=cwd, env=env, budget=budget, timeout=timeout, sinks=[progress, *sinks])
+    except EEBuilderError as e:
+        return False, "", str(e)
+    if result["timed_out"]:
+        return False, result["stdout"], result["error"]
+    return result["returncode"] == 0, result["stdout"], result["stderr"]
+
+
+FAKE_BUILDER = r'''#!{python}
+"""ansible-builder stand-in: prints podman-style steps and registers the tag."""
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import time
+
+STATE = {state!r}
+
+args = sys.argv[1:]
+tag = args[args.index('--tag') + 1]
+ee_file = args[args.index('--file') + 1]
+started = time.time()
+with open(STATE) as f:
+    time.sleep(json.load(f).get('build_delay', 0))
+print('[1/2] STEP 1/2: FROM quay.io/ansible/creator-ee:latest AS base', flush=True)
+print('[2/2] STEP 1/1: RUN ansible-galaxy collection install -r requirements.yml', flush=True)
+print('COMMIT ' + tag, flush=True)
+
+with open(STATE + '.lock', 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    with open(STATE) as f:
+        state = json.load(f)
+    with open(ee_file, 'rb') as f:
+        content = f.read()
+    digest = 'sha256:' + hashlib.sha256(content).hexdigest()
+    state['images'][tag] = {{'Id': digest[7:19], 'Digest': digest, 'RepoDigests': []}}
+    state.setdefault('builds', []).append(tag)
+    state.setdefault('build_spans', []).append([tag, started, time.time()])
+    state.setdefault('ee_files', []).append(content.decode('utf-8'))
+    tmp = f'{{STATE}}.{{os.getpid()}}'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE)
+'''
+
+
+def write_fake_builder(directory, state_path):
+    """Create a fake ansible-builder that adds built tags to a fake runtime state."""
+    script = Path(directory) / 'ansible-builder'
+    script.write_text(FAKE_BUILDER.format(python=sys.executable, state=str(state_path)))
+    script.chmod(0o755)
+    return str(script)
+
+
+FAKE_SCANNER = r'''#!{python}
+"""trivy stand-in: reports the vulnerabilities listed in the state for files present in the rootfs."""
+import json
+import os
+import sys
+
+STATE = {state!r}
+PACKAGE_DBS = ('var/lib/rpm/rpmdb.sqlite', 'var/lib/dpkg/status')
+
+with open(STATE) as f:
+    state = json.load(f)
+args = sys.argv[1:]
+if args[0] == 'version':
+    print(json.dumps({{'Version': state['version'], 'VulnerabilityDB': {{'UpdatedAt': state['db']}}}}))
+    sys.exit(0)
+if args[0] != 'rootfs' or args[1:3] != ['--format', 'json']:
+    sys.exit('unexpected arguments: ' + ' '.join(args))
+
+root = args[-1]
+os_release = os.path.join(root, 'etc', 'os-release')
+results = []
+for path, vulns in sorted(state['vulns'].items()):
+    if not os.path.isfile(os.path.join(root, path)):
+        continue
+    with open(os.path.join(root, path)) as f:
+        content = f.read()
+    entries = [{{'VulnerabilityID': v['id'], 'PkgName': v['package'], 'InstalledVersion': v['version'],
+                'FixedVersion': v.get('fixed', ''), 'Severity': v['severity']}}
+               for v in vulns if v.get('match', '') in content]
+    if not entries:
+        continue
+    if path in PACKAGE_DBS:
+        # trivy と同様、OSを判定できないとOSパッケージは報告しない
+        if os.path.isfile(os_release):
+            results.append({{'Target': 'rootfs', 'Class': 'os-pkgs', 'Vulnerabilities': entries}})
+    else:
+        results.append({{'Target': path, 'Class': 'lang-pkgs', 'Vulnerabilities': entries}})
+state['scans'].append(sorted(os.path.relpath(os.path.join(d, name), root)
+                             for d, _, names in os.walk(root) for name in names))
+with open(STATE, 'w') as f:
+    json.dump(state, f)
+print(json.dumps({{'Results': results}}))
+'''
+
+
+def write_fake_scanner(directory, vulns, db='2026-10-01T00:00:00Z', version='0.56.0'):
+    """Create a trivy-like scanner; returns (executable path, state path)."""
+    state_path = Path(directory) / 'fake-scanner-state.json'
+    state_path.write_text(json.dumps({'vulns': vulns, 'db': db, 'version': version, 'scans': []}))
+    script = Path(directory) / 'fake-trivy'
+    script.write_text(FAKE_SCANNER.format(python=sys.executable, state=str(state_path)))
+    script.chmod(0o755)
+    return str(script), state_path
+
+
+def write_collection_tarball(directory, name, version, dependencies=None, files=None):
+    """Write <namespace>-<name>-<version>.tar.gz with a MANIFEST.json and extra files."""
+    namespace, collection = name.split('.')
+    manifest = {'collection_info': {
+        'namespace': namespace, 'name': collection, 'version': version,
+        'dependencies': dependencies or {},
+    }}
+    members = {'MANIFEST.json': json.dumps(manifest)}
+    members.update(files or {})
+    path = Path(directory) / f"{namespace}-{collection}-{version}.tar.gz"
+    with tarfile.open(path, 'w:gz') as archive:
+        for member, content in members.items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return path
+
+
+def write_wheel(directory, name, version, requires=(), requires_python=None, tag='py3-none-any'):
+    """Write <name>-<version>-<tag>.whl holding only its METADATA."""
+    dist = re.sub(r'[-_.]+', '_', name)
+    lines = ['Metadata-Version: 2.1', f'Name: {name}', f'Version: {version}']
+    if requires_python:
+        lines.append(f'Requires-Python: {requires_python}')
+    lines += [f'Requires-Dist: {requirement}' for requirement in requires]
+    path = Path(directory) / f"{dist}-{version}-{tag}.whl"
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr(f"{dist}-{version}.dist-info/METADATA", '\n'.join(lines) + '\n')
+    return path
+
+
+RPM_TAGS = {'name': 1000, 'version': 1001, 'release': 1002, 'epoch': 1003, 'license': 1014, 'arch': 1022}
+
+
+def rpm_header(**tags):
+    """Encode an RPM header blob (index entries + data store) with string and INT32 tags."""
+    index, data = b'', b''
+    for field, value in tags.items():
+        if value is None:
+            continue
+        if isinstance(value, int):
+            data += b'\0' * (-len(data) % 4)
+            index += struct.pack('>IIiI', RPM_TAGS[field], 4, len(data), 1)
+            data += struct.pack('>i', value)
+        else:
+            index += struct.pack('>IIiI', RPM_TAGS[field], 6, len(data), 1)
+            data += value.encode() + b'\0'
+    return struct.pack('>II', len(index) // 16, len(data)) + index + data
+
+
+def rpmdb_bytes(packages):
+    """Return an rpmdb.sqlite file holding one header per {name, version, ...} dict."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / 'rpmdb.sqlite'
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE Packages (hnum INTEGER PRIMARY KEY AUTOINCREMENT, blob BLOB NOT NULL)')
+        connection.executemany('INSERT INTO Packages (blob) VALUES (?)',
+                               [(rpm_header(**package),) for package in packages])
+        connection.commit()
+        connection.close()
+        return path.read_bytes()
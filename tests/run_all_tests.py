@@ -1,65 +1,385 @@
 #!/usr/bin/env python3
 """
 Complete Test Suite Runner for Ansible Custom EE Builder
+
+Suites run in parallel in a process pool. The checks inside a suite are
+taken from the suite's own run_all_tests() (same list, same order) and
+also run as separate pool tasks; each suite's output is captured and
+printed as one block. Suites marked serial (the integration build tests
+share the project root and the test image) run as a whole, one at a time.
+
+With --profile DIR (or EE_PROFILE=DIR) every check and suite script is
+profiled into DIR (see ee_builder/profiling.py).
+
+Usage: python tests/run_all_tests.py [-j N] [--changed-only [--since REF]] [--serial] [--profile DIR]
 """
 
-import sys
+import argparse
+import ast
+import contextlib
+import fnmatch
+import importlib.util
+import io
+import os
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def run_test_suite(test_script, description):
-    """Run a test suite and return results."""
-    print(f"\n{'='*60}")
-    print(f"🧪 Running {description}")
-    print('='*60)
-    
+TESTS_DIR = Path(__file__).resolve().parent
+
+# (script, description, extra inputs, serial)
+# 追加の入力は --changed-only 用（"dir/*" は配下全て、"**" は全ファイル）。
+# Python の依存関係は import から自動で辿る
+TEST_SUITES = [
+    ("tests/test_build.py", "Project Structure Tests",
+     ["*.yml", "*.yaml", "*.cfg", "Makefile", "scripts/*", "examples/*", ".github/*"], False),
+    ("tests/test_release.py", "Release Readiness Tests",
+     ["**"], False),
+    ("tests/test_integration.py", "Integration Tests",
+     ["*.yml", "*.cfg", "Makefile", "scripts/*", "examples/*", "ee_builder/*"], True),
+    ("tests/test_workflows.py", "GitHub Actions Workflow Tests",
+     [".github/*"], False),
+    ("tests/test_artifacts.py", "Artifact Query Tests", [], False),
+    ("tests/test_prewarm.py", "Image Pre-warm Tests", [], False),
+    ("tests/test_telemetry.py", "Build Telemetry Tests",
+     ["scripts/build-local.sh", "examples/execution-environment.yml", "ee_builder/*"], False),
+    ("tests/test_build_driver.py", "Build Driver Tests", [], False),
+    ("tests/test_runtime.py", "Container Runtime Tests", [], False),
+    ("tests/test_secretscan.py", "Secret Scanner Tests", [], False),
+    ("tests/test_yamlcache.py", "YAML Cache Tests", [], False),
+    ("tests/test_eeschema.py", "EE Validator Tests",
+     ["execution-environment.yml", "examples/*"], False),
+    ("tests/test_galaxylock.py", "Collection Lock Tests", [], False),
+    ("tests/test_pylock.py", "Python Lock Tests", [], False),
+    ("tests/test_collectiondeps.py", "Collection Dependency Tests", [], False),
+    ("tests/test_impact.py", "Rebuild Impact Tests",
+     ["*.yml", "*.cfg", "examples/*"], False),
+    ("tests/test_sharedbase.py", "Shared Image Tests", [], False),
+    ("tests/test_ocibundle.py", "OCI Bundle Tests", [], False),
+    ("tests/test_sbom.py", "SBOM Tests", [], False),
+    ("tests/test_vulnscan.py", "Vulnerability Scan Tests", [], False),
+    ("tests/test_registrygc.py", "Registry GC Tests", [], False),
+    ("tests/test_imageprune.py", "Image Prune Tests", [], False),
+    ("tests/test_watch.py", "Watch Mode Tests", [], False),
+    ("tests/test_buildqueue.py", "Build Queue Tests", [], False),
+    ("tests/test_galaxyapi.py", "Galaxy Prefetch Tests", [], False),
+    ("tests/test_credentials.py", "Credential Broker Tests", [], False),
+    ("tests/test_profiling.py", "Profiling Tests", [], False),
+    ("tests/test_execution.py", "Execution Layer Tests", [], False),
+]
+
+# これらの変更は全スイートを対象にする
+RUN_ALL_INPUTS = ["tests/run_all_tests.py", "requirements*.txt"]
+
+
+# === check discovery ===
+def discover_checks(script):
+    """Return (class name or None, [check names]) from a suite's run_all_tests().
+
+    Function suites list their checks in ``tests = [...]``; class suites
+    call ``self.test_*()`` in order. An empty list means the suite has to
+    run as a whole.
+    """
+    tree = ast.parse(Path(script).read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "run_all_tests":
+            for stmt in ast.walk(node):
+                if (isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.List)
+                        and any(isinstance(t, ast.Name) and t.id == "tests" for t in stmt.targets)):
+                    return None, [elt.id for elt in stmt.value.elts if isinstance(elt, ast.Name)]
+        if isinstance(node, ast.ClassDef):
+            for method in node.body:
+                if isinstance(method, ast.FunctionDef) and method.name == "run_all_tests":
+                    calls = [
+                        (call.lineno, call.col_offset, call.func.attr) for call in ast.walk(method)
+                        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                        and isinstance(call.func.value, ast.Name) and call.func.value.id == "self"
+                        and call.func.attr.startswith("test_")
+                    ]
+                    calls.sort()
+                    return node.name, [name for _, _, name in calls]
+    return None, []
+
+
+# === workers ===
+def _init_worker():
+    if str(TESTS_DIR) not in sys.path:
+        sys.path.insert(0, str(TESTS_DIR))
+
+
+@contextlib.contextmanager
+def _captured_output():
+    """Capture Python-level and fd-level stdout/stderr (child processes included)."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with tempfile.TemporaryFile(mode="w+b") as capture:
+        saved = os.dup(1), os.dup(2)
+        os.dup2(capture.fileno(), 1)
+        os.dup2(capture.fileno(), 2)
+        buffer = io.StringIO()
+        result = {"output": ""}
+        try:
+            with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+                yield result
+        finally:
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            capture.seek(0)
+            result["output"] = buffer.getvalue() + capture.read().decode("utf-8", "replace")
+
+
+def _load_suite(script):
+    name = "suite_" + Path(script).stem
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, script)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _profiling(profile_dir, name):
+    if not profile_dir:
+        return contextlib.nullcontext()
+    if str(TESTS_DIR.parent) not in sys.path:
+        sys.path.insert(0, str(TESTS_DIR.parent))
+    from ee_builder.profiling import profiling
+    return profiling(profile_dir, name)
+
+
+def run_check(script, class_name, check, profile_dir=None):
+    """Pool task: run one check of a suite, returning (success, output, seconds)."""
+    start = time.monotonic()
+    with _captured_output() as captured, _profiling(profile_dir, f"{Path(script).stem}-{check}"):
+        try:
+            module = _load_suite(script)
+            if class_name is None:
+                success = getattr(module, check)() is not False
+            else:
+                suite = getattr(module, class_name)()
+                result = getattr(suite, check)()
+                success = result is not False and all(test["status"] for test in suite.test_results)
+        except Exception as e:
+            print(f"❌ Test {check} failed with error: {e}")
+            success = False
+    return success, captured["output"], time.monotonic() - start
+
+
+def run_script(script, profile_dir=None):
+    """Pool task: run a whole suite script, returning (success, output, seconds)."""
+    start = time.monotonic()
+    command = [sys.executable, script]
+    if profile_dir:
+        command[1:1] = ["-m", "ee_builder", "profile", "-o", profile_dir]
     try:
-        result = subprocess.run([sys.executable, test_script], 
-                              capture_output=False, text=True)
-        return result.returncode == 0
+        result = subprocess.run(command, capture_output=True, text=True)
+        success, output = result.returncode == 0, result.stdout + result.stderr
     except Exception as e:
-        print(f"❌ Error running {test_script}: {e}")
+        success, output = False, f"❌ Error running {script}: {e}\n"
+    return success, output, time.monotonic() - start
+
+
+# === --changed-only ===
+def changed_files(project_root, since=None):
+    """Return files changed relative to ``since`` (default HEAD), plus untracked files."""
+    commands = [["git", "diff", "--name-only", since or "HEAD"],
+                ["git", "ls-files", "--others", "--exclude-standard"]]
+    if since:
+        commands.append(["git", "diff", "--name-only", "HEAD"])
+    files = set()
+    for command in commands:
+        result = subprocess.run(command, cwd=project_root, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+        files.update(line.strip() for line in result.stdout.splitlines() if line.strip())
+    return files
+
+
+def local_imports(path, project_root):
+    """Return project files imported by a Python file (ee_builder modules and test helpers)."""
+    try:
+        tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    except (OSError, SyntaxError):
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+            names.update(f"{node.module}.{alias.name}" for alias in node.names)
+    files = set()
+    for name in names:
+        for candidate in (Path(*name.split(".")).with_suffix(".py"), Path("tests", name + ".py")):
+            if (project_root / candidate).is_file():
+                files.add(candidate.as_posix())
+    return files
+
+
+def suite_dependencies(script, project_root):
+    """Return the suite file and every project Python file it imports, transitively."""
+    seen = set()
+    pending = [script]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        pending.extend(local_imports(project_root / current, project_root) - seen)
+    if any(path.startswith("ee_builder/") for path in seen):
+        seen.update({"ee_builder/__init__.py", "ee_builder/errors.py"})
+    return seen
+
+
+def _matches(path, pattern):
+    if pattern == "**":
+        return True
+    if pattern.endswith("/*"):
+        return path.startswith(pattern[:-1])
+    if "/" not in pattern and "/" in path:
         return False
+    return fnmatch.fnmatch(path, pattern)
+
+
+def select_suites(suites, files, project_root):
+    """Return the suites affected by the changed files."""
+    files = set(files)
+    if any(_matches(f, pattern) for f in files for pattern in RUN_ALL_INPUTS):
+        return list(suites)
+    selected = []
+    for suite in suites:
+        script, _, inputs, _ = suite
+        dependencies = suite_dependencies(script, project_root)
+        if files & dependencies or any(_matches(f, p) for f in files for p in inputs):
+            selected.append(suite)
+    return selected
 
-def main():
+
+# === main ===
+def print_block(description, success, output):
+    print(f"\n{'='*60}")
+    print(f"🧪 {description}")
+    print('='*60)
+    print(output.rstrip())
+    print("✅ PASSED" if success else "❌ FAILED")
+
+
+def main(argv=None):
     """Run all test suites."""
+    parser = argparse.ArgumentParser(description="Run the Ansible Custom EE Builder test suites")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 2,
+                        help="Parallel workers (default: number of CPUs)")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="Only run suites affected by modified files (git diff + untracked)")
+    parser.add_argument("--since", help="With --changed-only, compare against this git ref instead of HEAD")
+    parser.add_argument("--serial", action="store_true", help="Run every suite as a whole, one after another")
+    parser.add_argument("--profile", metavar="DIR", default=os.environ.get("EE_PROFILE"),
+                        help="Profile every check into DIR (pstats, collapsed stacks, span timings)")
+    args = parser.parse_args(argv)
+
     project_root = Path.cwd()
-    test_scripts = [
-        (project_root / "tests/test_build.py", "Project Structure Tests"),
-        (project_root / "tests/test_release.py", "Release Readiness Tests"),
-        (project_root / "tests/test_integration.py", "Integration Tests"),
-        (project_root / "tests/test_workflows.py", "GitHub Actions Workflow Tests"),
-    ]
-    
+    suites = list(TEST_SUITES)
+    profile_dir = str(Path(args.profile).resolve()) if args.profile else None
+
     print("🚀 Ansible Custom EE Builder - Complete Test Suite")
     print("=" * 60)
-    
+
+    if args.changed_only:
+        files = changed_files(project_root, args.since)
+        suites = select_suites(suites, files, project_root)
+        print(f"🔍 {len(files)} changed file(s), {len(suites)} suite(s) selected")
+        if not suites:
+            print("Nothing to test.")
+            return True
+
     results = []
-    
-    for test_script, description in test_scripts:
-        if test_script.exists():
-            success = run_test_suite(test_script, description)
+    durations = []
+    start = time.monotonic()
+
+    if args.serial:
+        for script, description, _, _ in suites:
+            success, output, seconds = run_script(str(project_root / script), profile_dir)
+            print_block(description, success, output)
             results.append((description, success))
-        else:
-            print(f"❌ Test script not found: {test_script}")
-            results.append((description, False))
-    
+            durations.append((seconds, description))
+    else:
+        with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=_init_worker) as pool:
+            plans = []
+            serial_scripts = []
+            for script, description, _, serial in suites:
+                path = project_root / script
+                if not path.exists():
+                    plans.append((description, None, []))
+                    continue
+                class_name, checks = discover_checks(path)
+                if serial or not checks:
+                    serial_scripts.append(str(path))
+                    plans.append((description, None, [("<suite>", str(path))]))
+                else:
+                    futures = [(check, pool.submit(run_check, str(path), class_name, check, profile_dir)) for check in checks]
+                    plans.append((description, class_name, futures))
+
+            # 資源を共有するスイートは並列スイートと並行しつつ 1 つずつ実行する
+            serial_results = {}
+            if serial_scripts:
+                def run_serial():
+                    for script in serial_scripts:
+                        serial_results[script] = run_script(script, profile_dir)
+                serial_thread = threading.Thread(target=run_serial)
+                serial_thread.start()
+            else:
+                serial_thread = None
+
+            for description, class_name, futures in plans:
+                if not futures:
+                    print(f"\n❌ Test script not found for {description}")
+                    results.append((description, False))
+                    continue
+                if futures[0][0] == "<suite>":
+                    serial_thread.join()
+                    success, output, seconds = serial_results[futures[0][1]]
+                    durations.append((seconds, description))
+                else:
+                    outcomes = [(check, future.result()) for check, future in futures]
+                    success = all(ok for _, (ok, _, _) in outcomes)
+                    output = "\n".join(out.rstrip() for _, (_, out, _) in outcomes)
+                    passed = sum(1 for _, (ok, _, _) in outcomes if ok)
+                    output += f"\n\n📊 Test Results: {passed}/{len(outcomes)} tests passed"
+                    durations.extend((seconds, f"{description} :: {check}")
+                                     for check, (_, _, seconds) in outcomes)
+                print_block(description, success, output)
+                results.append((description, success))
+
+    # Durations
+    print(f"\n{'='*60}")
+    print(f"⏱️  DURATIONS (wall clock {time.monotonic() - start:.1f}s)")
+    print('='*60)
+    for seconds, name in sorted(durations, reverse=True):
+        print(f"{seconds:8.2f}s  {name}")
+
     # Summary
     print(f"\n{'='*60}")
     print("📊 TEST SUITE SUMMARY")
     print('='*60)
-    
+
     passed = 0
     total = len(results)
-    
+
     for description, success in results:
         status = "✅ PASSED" if success else "❌ FAILED"
         print(f"{status} - {description}")
         if success:
             passed += 1
-    
+
     print(f"\n📈 Overall Results: {passed}/{total} test suites passed")
-    
+
     if passed == total:
         print("🎉 ALL TESTS PASSED! Project is ready for release! 🎉")
         print("\n✅ Next steps:")
@@ -74,4 +394,4 @@ def main():
 
 if __name__ == "__main__":
     success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Artifact query tests for Ansible Custom EE Builder
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder import artifacts  # noqa: E402
+
+
+def make_artifact(path, tasks, stdout_lines=3):
+    """Write a navigator-style playbook artifact."""
+    data = {
+        "version": "2.0.0",
+        "plays": [
+            {"__play_name": "Sample", "name": "Sample", "tasks": tasks}
+        ],
+        "stdout": ["line with ] and { \"quoted\" text %d" % i for i in range(stdout_lines)],
+        "status": "failed",
+        "status_color": 9
+    }
+    path.write_text(json.dumps(data, indent=1))
+
+
+def task(host, name, result, changed=False):
+    return {"__host": host, "__task": name, "__result": result, "__changed": changed,
+            "res": {"msg": "x" * 50}}
+
+
+def test_stream_scanner_small_chunks():
+    """Test the built-in scanner across tiny read chunks."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "site-1.json"
+        tasks = [task("web1", "Install", "Ok", True), task("web2", "Install", "Failed"),
+                 task("db1", "Gather", "Skipped")]
+        make_artifact(path, tasks, stdout_lines=50)
+
+        numbers_path = Path(temp_dir) / "numbers.json"
+        numbers = [-2500.0, 1e5, 12, 2.5e-3, {"elapsed": -0.75}]
+        numbers_path.write_text('{"plays": [{"tasks": [-2500.0, 1e5, 12, 2.5E-3, {"elapsed": -0.75}]}]}')
+
+        original = artifacts.CHUNK_SIZE
+        artifacts.CHUNK_SIZE = 7
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                parsed = list(artifacts._StreamScanner(f, artifacts._TASKS_PATH).items())
+            # 数値が "." や "e" の直後で読み込み単位の境界に掛かるケース
+            artifacts.CHUNK_SIZE = 3
+            with open(numbers_path, 'r', encoding='utf-8') as f:
+                parsed_numbers = list(artifacts._StreamScanner(f, artifacts._TASKS_PATH).items())
+        finally:
+            artifacts.CHUNK_SIZE = original
+
+    if parsed != tasks:
+        print(f"❌ Scanner returned unexpected tasks: {parsed}")
+        return False
+    if parsed_numbers != numbers:
+        print(f"❌ Numbers split across chunks should decode whole: {parsed_numbers}")
+        return False
+
+    print("✅ Streaming scanner decodes tasks across chunk boundaries")
+    return True
+
+
+def test_query_aggregates_across_files():
+    """Test filtering and aggregation over several artifacts."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        for i in range(4):
+            make_artifact(temp_path / f"site-{i}.json", [
+                task("web1", "Install packages", "Ok", True),
+                task("web2", "Install packages", "Failed" if i % 2 else "Ok"),
+                task("db1", "Install packages", "Unreachable"),
+            ])
+        (temp_path / "broken.json").write_text('{"plays": [{"tasks": [{"__host": "x"')
+
+        result = artifacts.query_artifacts(
+            [temp_path], task="Install*", status="failed,unreachable",
+            group_by=["host", "status"], workers=2
+        )
+
+    rows = {(row["host"], row["status"]): row for row in result["rows"]}
+    expected = {("db1", "unreachable"): (4, 4), ("web2", "failed"): (2, 2)}
+    actual = {key: (row["count"], row["runs"]) for key, row in rows.items()}
+
+    if actual != expected:
+        print(f"❌ Unexpected aggregation: {actual}")
+        return False
+    if result["files"] != 5 or len(result["errors"]) != 1:
+        print(f"❌ Unexpected file/error totals: {result['files']} / {result['errors']}")
+        return False
+
+    print("✅ Query aggregates filtered task results across artifacts")
+    return True
+
+
+def test_query_last_n():
+    """Test --last limits the scan to the most recent artifacts."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        for i in range(3):
+            path = temp_path / f"site-{i}.json"
+            make_artifact(path, [task("web1", "Deploy", "Failed" if i == 2 else "Ok")])
+            os.utime(path, (1000 + i, 1000 + i))
+
+        result = artifacts.query_artifacts([temp_path], status="ok", last=2, workers=1)
+
+    if result["files"] != 2 or sum(row["count"] for row in result["rows"]) != 1:
+        print(f"❌ --last did not restrict scanned files: {result}")
+        return False
+
+    print("✅ --last restricts the query to recent artifacts")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_stream_scanner_small_chunks,
+        test_query_aggregates_across_files,
+        test_query_last_n
+    ]
+
+    print("🧪 Running artifact query tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -4,28 +4,35 @@ Test script for Ansible Custom EE Builder
 """
 
 import os
+import re
 import sys
 import subprocess
 import tempfile
 import yaml
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.eeschema import has_errors, validate_ee_file, validate_files  # noqa: E402
+from ee_builder.yamlcache import load_yaml  # noqa: E402
+
 def test_ee_file_validity():
-    """Test that execution-environment.yml is valid YAML."""
+    """Test that execution-environment.yml passes the EE version 3 validator."""
     ee_file = Path("execution-environment.yml")
     
     if not ee_file.exists():
         print("❌ execution-environment.yml not found")
         return False
     
-    try:
-        with open(ee_file, 'r') as f:
-            yaml.safe_load(f)
-        print("✅ execution-environment.yml is valid YAML")
-        return True
-    except yaml.YAMLError as e:
-        print(f"❌ execution-environment.yml has YAML syntax error: {e}")
+    issues = validate_ee_file(ee_file)
+    for issue in issues:
+        print(f"   {issue['path']}:{issue['line']}:{issue['column']}: "
+              f"{issue['severity']}: {issue['field']}: {issue['message']}")
+    if has_errors(issues):
+        print("❌ execution-environment.yml is not a valid EE definition")
         return False
+    print("✅ execution-environment.yml is a valid EE definition")
+    return True
 
 def test_ansible_cfg_validity():
     """Test that ansible.cfg exists and has required sections."""
@@ -121,8 +128,7 @@ def test_examples_validity():
     invalid_files = []
     for yaml_file in yaml_files:
         try:
-            with open(yaml_file, 'r') as f:
-                yaml.safe_load(f)
+            load_yaml(yaml_file)
         except yaml.YAMLError:
             invalid_files.append(yaml_file.name)
     
@@ -130,6 +136,14 @@ def test_examples_validity():
         print(f"❌ Invalid example YAML files: {invalid_files}")
         return False
     
+    ee_files = [f for f in yaml_files if f.name.startswith("execution-environment")]
+    issues = validate_files(ee_files)
+    if has_errors(issues):
+        for issue in issues:
+            print(f"   {issue['path']}:{issue['line']}: {issue['field']}: {issue['message']}")
+        print("❌ Example EE definitions have schema errors")
+        return False
+    
     print("✅ All example files are valid YAML")
     return True
 
@@ -171,21 +185,31 @@ def test_github_workflows():
         return False
     
     invalid_workflows = []
+    undeclared_outputs = []
     for workflow_file in workflow_files:
         try:
-            with open(workflow_file, 'r') as f:
-                workflow_data = yaml.safe_load(f)
+            workflow_data = load_yaml(workflow_file)
             
             # Basic structure check (handle 'on' parsed as True in YAML)
             has_on = 'on' in workflow_data or True in workflow_data
             if 'name' not in workflow_data or not has_on or 'jobs' not in workflow_data:
                 invalid_workflows.append(workflow_file.name)
+                continue
         except yaml.YAMLError:
             invalid_workflows.append(workflow_file.name)
+            continue
+
+        # needs.<job>.outputs.<name> は参照先ジョブの outputs に宣言されていないと空文字列になる
+        for job, name in re.findall(r'needs\.([\w-]+)\.outputs\.([\w-]+)', workflow_file.read_text()):
+            if name not in (workflow_data['jobs'].get(job) or {}).get('outputs', {}):
+                undeclared_outputs.append(f"{workflow_file.name}: {job}.{name}")
     
     if invalid_workflows:
         print(f"❌ Invalid workflow files: {invalid_workflows}")
         return False
+    if undeclared_outputs:
+        print(f"❌ Job outputs used but not declared: {undeclared_outputs}")
+        return False
     
     print("✅ All GitHub workflow files are valid")
     return True
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Python build driver tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import BuildCache, BuildError, build, build_many  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from ee_builder.telemetry import Telemetry  # noqa: E402
+from fakes import read_state, write_fake_builder, write_fake_runtime  # noqa: E402
+
+
+@contextlib.contextmanager
+def fake_toolchain():
+    """Yield (temp dir, runtime, state path) with a fake ansible-builder on PATH."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+
+        ee_file = temp_path / "execution-environment.yml"
+        ee_file.write_text(yaml.dump({
+            "version": 3,
+            "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+            "additional_build_steps": {"append_final": ["COPY ansible.cfg /etc/ansible/ansible.cfg"]},
+        }))
+        (temp_path / "ansible.cfg").write_text("[defaults]\n")
+
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                yield temp_path, ContainerRuntime(command), state_path
+        finally:
+            os.environ["PATH"] = old_path
+
+
+def test_build_test_and_push():
+    """Test a full build runs every phase against the runtime."""
+    with fake_toolchain() as (temp_path, runtime, state_path):
+        telemetry = Telemetry(temp_path / "build.jsonl")
+        result = build(temp_path / "execution-environment.yml", tag="v1", registry="registry.example.com",
+                       runtime=runtime, push=True, context=temp_path / "context", telemetry=telemetry)
+        state = read_state(state_path)
+        records = (temp_path / "build.jsonl").read_text().splitlines()
+        context_left = (temp_path / "context").exists()
+
+    image = "registry.example.com/ansible-custom-ee:v1"
+    runs = [call for call in state["calls"] if call[:1] == ["run"]]
+    if result["image"] != image or image not in state["remote"] or len(runs) != 3:
+        print(f"❌ Build/test/push did not reach the runtime: {result} {state['calls']}")
+        return False
+    if len(records) < 7 or context_left:
+        print(f"❌ Telemetry not written or context left behind: {len(records)} records")
+        return False
+
+    print("✅ Build driver builds, tests and pushes the image")
+    return True
+
+
+def test_cache_skips_unchanged_build():
+    """Test the build cache skips ansible-builder until an input file changes."""
+    with fake_toolchain() as (temp_path, runtime, state_path):
+        cache = BuildCache(temp_path / "cache.json")
+        ee_file = temp_path / "execution-environment.yml"
+        first = build(ee_file, runtime=runtime, cache=cache, run_tests=False, context=temp_path / "ctx")
+        second = build(ee_file, runtime=runtime, cache=cache, run_tests=False, context=temp_path / "ctx")
+        (temp_path / "ansible.cfg").write_text("[defaults]\nforks = 10\n")
+        third = build(ee_file, runtime=runtime, cache=cache, run_tests=False, context=temp_path / "ctx")
+        builds = read_state(state_path)["builds"]
+
+    if first["cached"] or not second["cached"] or third["cached"] or len(builds) != 2:
+        print(f"❌ Unexpected cache behaviour: {first['cached']} {second['cached']} {third['cached']} {builds}")
+        return False
+    if first["inputs_digest"] == third["inputs_digest"]:
+        print("❌ Copied file change did not change the inputs digest")
+        return False
+
+    print("✅ Unchanged inputs reuse the cached image")
+    return True
+
+
+def test_build_many_parallel():
+    """Test parallel builds use separate contexts and report failures per build."""
+    with fake_toolchain() as (temp_path, runtime, state_path):
+        ee_file = temp_path / "execution-environment.yml"
+        results = build_many([
+            {"ee_file": ee_file, "tag": "a", "runtime": runtime, "context": temp_path / "ctx-a"},
+            {"ee_file": ee_file, "tag": "b", "runtime": runtime, "context": temp_path / "ctx-b"},
+            {"ee_file": temp_path / "missing.yml", "tag": "c", "runtime": runtime},
+        ], jobs=3)
+        builds = sorted(read_state(state_path)["builds"])
+
+    if builds != ["localhost/ansible-custom-ee:a", "localhost/ansible-custom-ee:b"]:
+        print(f"❌ Unexpected builds: {builds}")
+        return False
+    if "error" in results[0] or "error" in results[1] or "not found" not in results[2].get("error", ""):
+        print(f"❌ Unexpected results: {results}")
+        return False
+
+    print("✅ Parallel builds succeed independently")
+    return True
+
+
+def test_missing_ee_file():
+    """Test a missing EE file fails the build."""
+    failed = False
+    with fake_toolchain() as (temp_path, runtime, state_path):
+        try:
+            build(temp_path / "missing.yml", runtime=runtime, context=temp_path / "context")
+        except BuildError:
+            failed = True
+
+    if not failed:
+        print("❌ Missing EE file should raise BuildError")
+        return False
+
+    print("✅ Missing EE file fails the build")
+    return True
+
+
+def test_invalid_ee_file():
+    """Test schema errors fail the build before ansible-builder runs."""
+    failed = False
+    with fake_toolchain() as (temp_path, runtime, state_path):
+        ee_file = temp_path / "execution-environment.yml"
+        ee_file.write_text("version: 3\ndependencies:\n  python: |\n    requests>=>2\n")
+        try:
+            build(ee_file, runtime=runtime, context=temp_path / "context")
+        except BuildError:
+            failed = True
+        state = read_state(state_path)
+
+    if not failed:
+        print("❌ Invalid EE file should raise BuildError")
+        return False
+    if state.get("builds"):
+        print(f"❌ ansible-builder should not run for an invalid EE file: {state['builds']}")
+        return False
+
+    print("✅ Invalid EE file fails before ansible-builder runs")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_build_test_and_push,
+        test_cache_skips_unchanged_build,
+        test_build_many_parallel,
+        test_missing_ee_file,
+        test_invalid_ee_file
+    ]
+
+    print("🧪 Running build driver tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Build queue tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import BuildError  # noqa: E402
+from ee_builder.buildqueue import (  # noqa: E402
+    BuildQueue, BuildQueueError, BuildQueueServer, queue_status, submit_build
+)
+from ee_builder.cli import main  # noqa: E402
+from fakes import read_state, write_fake_builder, write_fake_runtime  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(directory, marker="a"):
+    directory.mkdir(parents=True, exist_ok=True)
+    ee_file = directory / "execution-environment.yml"
+    ee_file.write_text(yaml.dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"python": [f"jmespath>=1.0.{ord(marker) - ord('a')}"]},
+    }))
+    return ee_file
+
+
+@contextlib.contextmanager
+def fake_toolchain(build_delay=0.0):
+    """Yield (temp dir, runtime command, state path) with fake podman and ansible-builder on PATH."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+        state = read_state(state_path)
+        state["build_delay"] = build_delay
+        state_path.write_text(json.dumps(state))
+        # キューは podman / docker 以外のランタイムを受け付けないので、偽の podman を PATH に置く
+        (temp_path / "podman").symlink_to(command)
+
+        saved = {name: os.environ.get(name) for name in ("PATH", "EE_RUNTIME_API")}
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{saved['PATH']}"
+        os.environ["EE_RUNTIME_API"] = "0"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                yield temp_path, "podman", state_path
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+@contextlib.contextmanager
+def running_queue(socket_path, **kwargs):
+    """Serve a BuildQueue on ``socket_path`` in a background thread."""
+    queue = BuildQueue(**kwargs)
+    server = BuildQueueServer(socket_path, queue)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield queue
+    finally:
+        server.shutdown()
+        server.server_close()
+        queue.shutdown()
+
+
+def test_coalescing():
+    """Test identical concurrent requests share one build, its output and its result."""
+    with fake_toolchain(build_delay=0.5) as (temp_path, command, state_path):
+        ee_file = write_ee(temp_path / "ee")
+        socket_path = temp_path / "q.sock"
+        messages = {n: [] for n in range(4)}
+        results = {}
+        with running_queue(socket_path, workdir=temp_path, roots=[temp_path]):
+            def client(n):
+                request = {"ee_file": str(ee_file), "tag": "dev", "runtime": command, "run_tests": False}
+                results[n] = submit_build(request, socket_path, messages[n].append, timeout=30)
+
+            threads = [threading.Thread(target=client, args=(n,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.05)
+            for thread in threads:
+                thread.join(30)
+        state = read_state(state_path)
+
+    if state["builds"] != ["localhost/ansible-custom-ee:dev"]:
+        print(f"❌ Identical requests should build once: {state['builds']}")
+        return False
+    if len({result["id"] for result in results.values()}) != 1 or \
+            any(result["status"] != "ok" or result["waiters"] != 4 for result in results.values()):
+        print(f"❌ Every waiter should get the same result: {results}")
+        return False
+    accepted = [next(m for m in messages[n] if m["event"] == "accepted")["coalesced"] for n in range(4)]
+    lines = [[m["line"] for m in messages[n] if m["event"] == "line"] for n in range(4)]
+    if accepted != [False, True, True, True] or any(line != lines[0] or not line for line in lines):
+        print(f"❌ Waiters should join and all see the builder output: {accepted} {lines}")
+        return False
+
+    print("✅ Identical requests are coalesced into one build")
+    return True
+
+
+def test_limits():
+    """Test the concurrency limit and that builds of one image tag never overlap."""
+    with fake_toolchain(build_delay=0.4) as (temp_path, command, state_path):
+        queue = BuildQueue(jobs=2, workdir=temp_path, roots=[temp_path])
+        requests = [("a", "one"), ("b", "two"), ("c", "three"), ("d", "one")]
+        jobs = [queue.submit({"ee_file": str(write_ee(temp_path / marker, marker)), "tag": tag,
+                              "runtime": command, "run_tests": False}) for marker, tag in requests]
+        results = [list(queue.follow(job, timeout=30))[-1] for job in jobs]
+        queue.shutdown()
+        spans = read_state(state_path)["build_spans"]
+
+    if [result["status"] for result in results] != ["ok"] * 4 or len({job["id"] for job in jobs}) != 4:
+        print(f"❌ Different inputs should build separately: {results}")
+        return False
+    events = sorted([(start, 1) for _, start, _ in spans] + [(end, -1) for _, _, end in spans])
+    running, peak = 0, 0
+    for _, delta in events:
+        running += delta
+        peak = max(peak, running)
+    same_tag = [(start, end) for tag, start, end in spans if tag.endswith(":one")]
+    if peak != 2 or same_tag[0][1] > same_tag[1][0]:
+        print(f"❌ Expected at most 2 concurrent builds and no overlap per tag: peak {peak}, {same_tag}")
+        return False
+
+    print("✅ Concurrency is limited and builds of one tag are serialized")
+    return True
+
+
+def test_waiting_tag_keeps_slot_free():
+    """Test a build waiting for its tag does not hold a slot, and per-image state is dropped afterwards."""
+    with fake_toolchain(build_delay=0.4) as (temp_path, command, state_path):
+        queue = BuildQueue(jobs=2, workdir=temp_path, roots=[temp_path])
+        requests = [("a", "one"), ("b", "one"), ("c", "two")]
+        jobs = [queue.submit({"ee_file": str(write_ee(temp_path / marker, marker)), "tag": tag,
+                              "runtime": command, "run_tests": False}) for marker, tag in requests]
+        results = [list(queue.follow(job, timeout=30))[-1] for job in jobs]
+        queue.shutdown()
+        leftover = dict(queue._image_queues)
+        spans = read_state(state_path)["build_spans"]
+
+    if [result["status"] for result in results] != ["ok"] * 3:
+        print(f"❌ All builds should succeed: {results}")
+        return False
+    first, second = [(start, end) for tag, start, end in spans if tag.endswith(":one")]
+    other = next((start, end) for tag, start, end in spans if tag.endswith(":two"))
+    if first[1] > second[0] or other[0] >= first[1]:
+        print(f"❌ The other tag should start while the first one builds: {first} {second} {other}")
+        return False
+    if leftover:
+        print(f"❌ Finished images should not stay tracked: {leftover}")
+        return False
+
+    print("✅ Builds waiting for their tag leave the slot to other tags")
+    return True
+
+
+def test_replay_and_failures():
+    """Test late waiters get the output replayed and failures reach every waiter."""
+    release = threading.Event()
+    calls = []
+
+    def stub_build(ee_file, **kwargs):
+        calls.append(kwargs["tag"])
+        kwargs["line_sink"]("STEP 1/2\n")
+        kwargs["line_sink"]("STEP 2/2\n")
+        release.wait(10)
+        if kwargs["tag"] == "broken":
+            raise BuildError("ansible-builder exited with 1")
+        if kwargs["tag"] == "crash":
+            raise RuntimeError("unexpected")
+        return {"image": f"localhost/ansible-custom-ee:{kwargs['tag']}", "cached": False}
+
+    with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        ee_file = write_ee(Path(temp_dir))
+        queue = BuildQueue(jobs=1, workdir=Path(temp_dir), build_func=stub_build, roots=[Path(temp_dir)])
+        first = queue.submit({"ee_file": str(ee_file), "tag": "broken", "runtime": "podman"})
+        time.sleep(0.2)
+        joined = queue.submit({"ee_file": str(ee_file), "tag": "broken", "runtime": "podman"})
+        crash = queue.submit({"ee_file": str(ee_file), "tag": "crash", "runtime": "podman"})
+        release.set()
+        replayed = list(queue.follow(joined, timeout=10))
+        crashed = list(queue.follow(crash, timeout=10))[-1]
+        after = queue.submit({"ee_file": str(ee_file), "tag": "ok", "runtime": "podman"})
+        ok = list(queue.follow(after, timeout=10))[-1]
+        queue.shutdown()
+
+    if joined is not first or [m["line"] for m in replayed[:-1]] != ["STEP 1/2\n", "STEP 2/2\n"]:
+        print(f"❌ A late waiter should join and get the output replayed: {replayed}")
+        return False
+    if replayed[-1]["status"] != "failed" or "exited with 1" not in replayed[-1]["error"]:
+        print(f"❌ The failure should reach the waiters: {replayed[-1]}")
+        return False
+    if crashed["status"] != "failed" or ok["status"] != "ok" or calls != ["broken", "crash", "ok"]:
+        print(f"❌ An unexpected error should fail only its job: {crashed} {ok} {calls}")
+        return False
+
+    print("✅ Output is replayed and failures are shared")
+    return True
+
+
+def test_protocol_errors_and_status():
+    """Test invalid requests, status and a missing queue."""
+    with fake_toolchain() as (temp_path, command, state_path):
+        ee_file = write_ee(temp_path / "ee")
+        socket_path = temp_path / "q.sock"
+        errors = []
+        with running_queue(socket_path, workdir=temp_path, roots=[temp_path]):
+            for request in ({"ee_file": str(temp_path / "missing.yml")}, {"ee_file": ""}):
+                try:
+                    submit_build(request, socket_path, timeout=10)
+                except BuildQueueError as e:
+                    errors.append(str(e))
+            submit_build({"ee_file": str(ee_file), "runtime": command, "run_tests": False}, socket_path, timeout=30)
+            jobs = queue_status(socket_path)
+            try:
+                BuildQueueServer(socket_path, BuildQueue())
+                duplicate = None
+            except BuildQueueError as e:
+                duplicate = str(e)
+        try:
+            queue_status(socket_path)
+            missing = None
+        except BuildQueueError as e:
+            missing = str(e)
+
+    if len(errors) != 2 or "not found" not in errors[0] or "required" not in errors[1]:
+        print(f"❌ Invalid requests should be rejected: {errors}")
+        return False
+    if [(job["id"], job["state"], job["waiters"]) for job in jobs] != [(1, "ok", 1)]:
+        print(f"❌ Unexpected status: {jobs}")
+        return False
+    if not duplicate or "already listening" not in duplicate or not missing or "queue serve" not in missing:
+        print(f"❌ Unexpected socket errors: {duplicate} / {missing}")
+        return False
+
+    print("✅ Invalid requests, status and a missing queue are handled")
+    return True
+
+
+def test_untrusted_requests():
+    """Test the queue only runs podman/docker and only builds files inside its project roots."""
+    def stub_build(ee_file, **kwargs):
+        return {"image": f"localhost/ansible-custom-ee:{kwargs['tag']}", "cached": False}
+
+    with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        temp_path = Path(temp_dir)
+        project = temp_path / "project"
+        ee_file = write_ee(project)
+        outside = write_ee(temp_path / "elsewhere")
+        (temp_path / "elsewhere" / "ee.lock").write_text("{}\n")
+        (project / "linked.yml").symlink_to(outside)
+        queue = BuildQueue(jobs=1, workdir=temp_path, build_func=stub_build, roots=[project])
+        errors = []
+        for request in ({"ee_file": str(ee_file), "runtime": "/bin/sh"},
+                        {"ee_file": str(ee_file), "runtime": "sh"},
+                        {"ee_file": str(outside), "runtime": "podman"},
+                        {"ee_file": str(project / "linked.yml"), "runtime": "podman"},
+                        {"ee_file": str(project / ".." / "elsewhere" / "execution-environment.yml")},
+                        {"ee_file": str(ee_file), "lock_file": str(temp_path / "elsewhere" / "ee.lock")}):
+            try:
+                queue.submit(request)
+            except BuildQueueError as e:
+                errors.append(str(e))
+        accepted = list(queue.follow(queue.submit({"ee_file": str(ee_file), "runtime": "docker"}), timeout=10))
+        queue.shutdown()
+
+    if len(errors) != 6 or not all("Unsupported runtime" in e for e in errors[:2]) or \
+            not all("outside the build queue's project roots" in e for e in errors[2:]):
+        print(f"❌ Requests outside the allowed runtimes and roots should be rejected: {errors}")
+        return False
+    if accepted[-1]["status"] != "ok":
+        print(f"❌ A request inside the project should build: {accepted}")
+        return False
+
+    print("✅ Runtimes and file paths in requests are restricted")
+    return True
+
+
+def test_deadline_and_local_options():
+    """Test --timeout bounds the whole wait and build-local.sh builds locally for client-side outputs."""
+    def chatty_build(ee_file, **kwargs):
+        for i in range(20):
+            kwargs["line_sink"](f"line {i}\n")
+            time.sleep(0.1)
+        return {"image": f"localhost/ansible-custom-ee:{kwargs['tag']}", "cached": False}
+
+    with fake_toolchain() as (temp_path, command, state_path):
+        ee_file = write_ee(temp_path / "ee")
+        socket_path = temp_path / "q.sock"
+        with running_queue(socket_path, workdir=temp_path, roots=[temp_path], build_func=chatty_build) as queue:
+            start = time.monotonic()
+            try:
+                submit_build({"ee_file": str(ee_file), "runtime": command}, socket_path, timeout=0.6)
+                timed_out = None
+            except BuildQueueError as e:
+                timed_out = str(e)
+            elapsed = time.monotonic() - start
+
+            env = dict(os.environ, EE_BUILD_SOCKET=str(socket_path))
+            telemetry = temp_path / "build.jsonl"
+            script = subprocess.run(
+                [str(PROJECT_ROOT / "scripts/build-local.sh"), "-f", str(ee_file), "-t", "v2", "--runtime", command,
+                 "--skip-tests", "--telemetry", str(telemetry), "--context", str(temp_path / "ctx")],
+                capture_output=True, text=True, env=env, timeout=60
+            )
+            jobs = queue.status()
+            telemetry_written = telemetry.is_file()
+        builds = read_state(state_path).get("builds", [])
+
+    if not timed_out or "Timed out after 0.6s" not in timed_out or elapsed > 2:
+        print(f"❌ The timeout should cover the whole wait, not each line: {timed_out} {elapsed:.1f}s")
+        return False
+    if script.returncode != 0 or not telemetry_written or builds != ["localhost/ansible-custom-ee:v2"]:
+        print(f"❌ Builds with client-side outputs should run locally: {script.returncode} {script.stderr}")
+        return False
+    if len(jobs) != 1:
+        print(f"❌ The local build should not go through the queue: {jobs}")
+        return False
+
+    print("✅ The client deadline is total and local-only options bypass the queue")
+    return True
+
+
+def test_cli_and_build_script():
+    """Test build-local.sh submits to the queue when EE_BUILD_SOCKET is set, and the status CLI."""
+    with fake_toolchain() as (temp_path, command, state_path):
+        ee_file = write_ee(temp_path / "ee")
+        socket_path = temp_path / "q.sock"
+        with running_queue(socket_path, workdir=temp_path, roots=[temp_path]):
+            env = dict(os.environ, EE_BUILD_SOCKET=str(socket_path))
+            script = subprocess.run(
+                [str(PROJECT_ROOT / "scripts/build-local.sh"), "-f", str(ee_file), "-t", "v1", "--runtime", command],
+                capture_output=True, text=True, env=env, timeout=60
+            )
+            code, data = run_cli(["queue", "status", "--socket", str(socket_path), "-f", "json"])
+        state = read_state(state_path)
+
+    if script.returncode != 0 or "queued as build #1" not in script.stdout or "COMMIT" not in script.stdout:
+        print(f"❌ build-local.sh should submit to the queue: {script.returncode} {script.stdout} {script.stderr}")
+        return False
+    runs = [call for call in state["calls"] if call[:1] == ["run"]]
+    if state["builds"] != ["localhost/ansible-custom-ee:v1"] or len(runs) != 3:
+        print(f"❌ The queue should build and smoke-test: {state['builds']} {len(runs)}")
+        return False
+    if code != 0 or [job["image"] for job in json.loads(data)] != ["localhost/ansible-custom-ee:v1"]:
+        print(f"❌ Unexpected status output: {data}")
+        return False
+
+    print("✅ build-local.sh and the CLI use the queue")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_coalescing,
+        test_limits,
+        test_waiting_tag_keeps_slot_free,
+        test_replay_and_failures,
+        test_protocol_errors_and_status,
+        test_untrusted_requests,
+        test_deadline_and_local_options,
+        test_cli_and_build_script
+    ]
+
+    print("🧪 Running build queue tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Collection dependency conflict tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import BuildError, build  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.collectiondeps import Range, analyze, read_collection_requirements  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import read_state, write_collection_tarball, write_fake_builder, write_fake_runtime, write_wheel  # noqa: E402
+
+AMAZON_AWS = {
+    "name": "amazon.aws", "version": "7.0.0",
+    "python": ["boto3>=1.26.0", "botocore>=1.29.0", "pytest", 'pywin32; sys_platform == "win32"'],
+    "system": ["libxml2-devel [platform:rpm] <2.0", "gcc [platform:dpkg] >=99", "make [test]"],
+}
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(path, python, collections):
+    path.write_text(yaml.safe_dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"python": python, "galaxy": {"collections": collections}},
+    }))
+    return path
+
+
+def test_read_tarball():
+    """Test requirements are streamed out of tarballs, honouring meta/execution-environment.yml."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plain = write_collection_tarball(temp_dir, "test.plain", "1.0.0", files={
+            "requirements.txt": "requests>=2\n", "bindep.txt": "gcc [compile]\n",
+        })
+        custom = write_collection_tarball(temp_dir, "test.custom", "2.0.0", files={
+            "meta/execution-environment.yml": "dependencies:\n  python: meta/ee-requirements.txt\n",
+            "meta/ee-requirements.txt": "kubernetes>=24.2.0\n",
+            "requirements.txt": "ignored\n",
+        })
+        plain_deps = read_collection_requirements(plain)
+        custom_deps = read_collection_requirements(custom)
+
+    if plain_deps != {"name": "test.plain", "version": "1.0.0",
+                      "python": ["requests>=2"], "system": ["gcc [compile]"]}:
+        print(f"❌ Unexpected requirements: {plain_deps}")
+        return False
+    if custom_deps["python"] != ["kubernetes>=24.2.0"] or custom_deps["system"]:
+        print(f"❌ meta/execution-environment.yml not honoured: {custom_deps}")
+        return False
+
+    print("✅ Collection requirements are read from tarballs")
+    return True
+
+
+def test_ranges():
+    """Test range intersection and containment."""
+    empty = [">=2,<1", "==1.0,!=1.0", ">1.0,<=1.0", "~=1.4,>=2"]
+    for spec in empty:
+        if not Range.parse(spec).empty:
+            print(f"❌ {spec} should be empty")
+            return False
+    if Range.parse("==1.4.*,>=1.4.2").empty or Range.parse(">=1.0,!=1.3").empty:
+        print("❌ Satisfiable ranges reported empty")
+        return False
+
+    inside = [(">=1.29", ">=1.20", True), (">=1.20", ">=1.29", False),
+              ("~=1.4.2", "<1.5", True), ("==2.0", "!=2.0", False), (">=1,<2", "", True)]
+    for inner, outer, expected in inside:
+        if Range.parse(inner).within(Range.parse(outer)) != expected:
+            print(f"❌ {inner} within {outer} should be {expected}")
+            return False
+
+    print("✅ Version ranges intersect and nest correctly")
+    return True
+
+
+def test_conflicts():
+    """Test unsatisfiable ranges are errors and implied EE pins are warnings."""
+    ee_config = {
+        "version": 3,
+        "dependencies": {
+            "python": ["boto3<1.20", "botocore>=1.20", "jmespath"],
+            "system": ["libxml2-devel [platform:rpm] >=2.9"],
+        },
+    }
+    issues = analyze(ee_config, Path("."), [AMAZON_AWS])
+    found = {(i["severity"], i["kind"], i["name"]) for i in issues}
+    expected = {("error", "python", "boto3"), ("warning", "python", "botocore"),
+                ("error", "system", "libxml2-devel")}
+    if found != expected:
+        print(f"❌ Unexpected issues: {issues}")
+        return False
+
+    ee_config["dependencies"]["exclude"] = {"python": ["boto3"], "system": ["libxml2-devel"]}
+    issues = analyze(ee_config, Path("."), [AMAZON_AWS])
+    if any(i["severity"] == "error" for i in issues):
+        print(f"❌ Excluded requirements should not conflict: {issues}")
+        return False
+
+    print("✅ Unsatisfiable and redundant pins are reported")
+    return True
+
+
+def test_cli_directory():
+    """Test `deps --collections` on a download directory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        collections = temp_path / "collections"
+        collections.mkdir()
+        write_collection_tarball(collections, "amazon.aws", "6.0.0", files={"requirements.txt": "boto3>=1.0\n"})
+        write_collection_tarball(collections, "amazon.aws", "7.0.0", files={"requirements.txt": "boto3>=1.26\n"})
+        ee_file = write_ee(temp_path / "execution-environment.yml", ["boto3<1.20"], ["amazon.aws"])
+
+        code, output = run_cli(["deps", "-f", str(ee_file), "--collections", str(collections), "--format", "json"])
+        issues = json.loads(output)
+        if code != 1 or len(issues) != 1 or "amazon.aws 7.0.0" not in issues[0]["message"]:
+            print(f"❌ Newest tarball should conflict: {code} {output}")
+            return False
+
+        write_ee(ee_file, ["boto3>=1.20"], ["amazon.aws"])
+        code, output = run_cli(["deps", "-f", str(ee_file), "--collections", str(collections)])
+        if code != 0 or "1 warning(s)" not in output:
+            print(f"❌ Redundant pin should only warn: {output}")
+            return False
+        code, _ = run_cli(["deps", "-f", str(ee_file), "--collections", str(collections), "--strict"])
+        if code != 1:
+            print("❌ --strict should fail on warnings")
+            return False
+
+    print("✅ deps checks a collection directory")
+    return True
+
+
+def test_build_checks_locked_collections():
+    """Test a hash-locked build fails before ansible-builder on uncovered collection requirements."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+        tarballs = temp_path / "tarballs"
+        tarballs.mkdir()
+        write_collection_tarball(tarballs, "test.k8s", "1.0.0", files={"requirements.txt": "kubernetes>=24\n"})
+        wheels = temp_path / "wheels"
+        wheels.mkdir()
+        write_wheel(wheels, "jmespath", "1.0.1")
+        ee_file = write_ee(temp_path / "execution-environment.yml", ["jmespath"], ["test.k8s"])
+        # Python を先にロックし、後からコレクションを追加した（kubernetes は未固定）
+        for argv in (["--wheelhouse", str(wheels)], ["--index", str(tarballs)]):
+            code, output = run_cli(["lock", "-f", str(ee_file)] + argv)
+            if code != 0:
+                print(f"❌ lock failed: {output}")
+                return False
+
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        os.environ["EE_COLLECTION_CACHE_DIR"] = str(temp_path / "cache")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                try:
+                    build(ee_file, runtime=ContainerRuntime(command), run_tests=False,
+                          context=temp_path / "context", lock_file=temp_path / "ee.lock")
+                    failed = False
+                except BuildError:
+                    failed = True
+            code, output = run_cli(["deps", "-f", str(ee_file)])
+        finally:
+            os.environ["PATH"] = old_path
+            os.environ.pop("EE_COLLECTION_CACHE_DIR")
+        built = "ee_files" in read_state(state_path)
+
+    if not failed or built:
+        print("❌ Unpinned collection requirement should stop the build before ansible-builder")
+        return False
+    if code != 1 or "not pinned in ee.lock" not in output:
+        print(f"❌ deps should read the cached locked tarballs: {output}")
+        return False
+
+    print("✅ Locked builds check collection requirements first")
+    return True
+
+
+def test_lock_includes_collection_requirements():
+    """Test `lock --index --wheelhouse` pins collection-declared Python requirements too."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        tarballs = temp_path / "tarballs"
+        tarballs.mkdir()
+        write_collection_tarball(tarballs, "test.k8s", "1.0.0",
+                                 files={"requirements.txt": "kubernetes>=24\npytest\n"})
+        wheels = temp_path / "wheels"
+        wheels.mkdir()
+        write_wheel(wheels, "jmespath", "1.0.1")
+        write_wheel(wheels, "kubernetes", "23.6.0")
+        write_wheel(wheels, "kubernetes", "28.1.0")
+        ee_file = write_ee(temp_path / "execution-environment.yml", ["jmespath"], ["test.k8s"])
+        code, output = run_cli(["lock", "-f", str(ee_file), "--index", str(tarballs), "--wheelhouse", str(wheels)])
+        lock = yaml.safe_load((temp_path / "ee.lock").read_text()) if code == 0 else {}
+        deps_code, deps_output = run_cli(["deps", "-f", str(ee_file)])
+
+    pinned = {p["name"]: p["version"] for p in lock.get("python", {}).get("packages", [])}
+    if pinned != {"jmespath": "1.0.1", "kubernetes": "28.1.0"}:
+        print(f"❌ Collection requirements should be locked: {pinned} {output}")
+        return False
+    if deps_code != 0:
+        print(f"❌ Fully locked EE should pass deps: {deps_output}")
+        return False
+
+    print("✅ lock pins collection-declared Python requirements")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_read_tarball,
+        test_ranges,
+        test_conflicts,
+        test_cli_directory,
+        test_build_checks_locked_collections,
+        test_lock_includes_collection_requirements
+    ]
+
+    print("🧪 Running collection dependency tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Credential broker tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import authenticate_redhat  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.credentials import CredentialBroker, CredentialError  # noqa: E402
+from ee_builder.galaxyapi import prefetch  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import FakeGalaxy, read_state, write_fake_runtime  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+OFFLINE = "offline-value"
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+@contextlib.contextmanager
+def environment(values):
+    """Set (or with None, unset) environment variables for the block."""
+    saved = {name: os.environ.get(name) for name in values}
+    for name, value in values.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def test_sso_token_cached():
+    """Test the access token is exchanged once, reused across brokers and refreshed before expiry."""
+    with FakeGalaxy({}, offline=OFFLINE) as sso, tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "ee-builder" / "credentials.json"
+        auth_url = f"{sso.url}/sso/token"
+        clock = Clock()
+        first = CredentialBroker(path, clock).sso_token(auth_url, OFFLINE)
+        second = CredentialBroker(path, clock).sso_token(auth_url, OFFLINE)
+        after_first = sso.exchanges
+        clock.now += 250  # expires_in=300 から余裕（60秒）を引いた時刻を過ぎる
+        CredentialBroker(path, clock).sso_token(auth_url, OFFLINE)
+        mode = stat.S_IMODE(path.stat().st_mode)
+        text = path.read_text()
+
+    if first != sso.access or second != first or after_first != 1:
+        print(f"❌ The token should be exchanged once and reused: {after_first} exchange(s)")
+        return False
+    if sso.exchanges != 2:
+        print(f"❌ A token close to expiry should be exchanged again: {sso.exchanges}")
+        return False
+    if mode != 0o600 or OFFLINE in text:
+        print(f"❌ The cache should be private and never store the offline token: {oct(mode)}")
+        return False
+
+    print("✅ SSO access tokens are cached until they expire")
+    return True
+
+
+def test_concurrent_processes():
+    """Test processes starting together share one token exchange through the file lock."""
+    script = ("import sys; from ee_builder.credentials import CredentialBroker; "
+              "print(CredentialBroker().sso_token(sys.argv[1], sys.argv[2]))")
+    with FakeGalaxy({}, offline=OFFLINE) as sso, tempfile.TemporaryDirectory() as temp_dir:
+        sso.exchange_delay = 0.5
+        env = dict(os.environ, EE_CREDENTIAL_CACHE=str(Path(temp_dir) / "credentials.json"),
+                   PYTHONPATH=str(PROJECT_ROOT))
+        processes = [subprocess.Popen([sys.executable, "-c", script, f"{sso.url}/sso/token", OFFLINE],
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+                     for _ in range(4)]
+        outputs = [process.communicate(timeout=30) for process in processes]
+
+    tokens = {out.strip() for out, _ in outputs}
+    if tokens != {sso.access} or any(process.returncode for process in processes):
+        print(f"❌ Every process should get the access token: {outputs}")
+        return False
+    if sso.exchanges != 1:
+        print(f"❌ Concurrent processes should share one exchange: {sso.exchanges}")
+        return False
+
+    print("✅ Concurrent processes share one token exchange")
+    return True
+
+
+def test_rejected_token():
+    """Test a rejected offline token or unreachable endpoint raises and caches nothing."""
+    with FakeGalaxy({}, offline=OFFLINE) as sso, tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "credentials.json"
+        broker = CredentialBroker(path)
+        errors = []
+        for auth_url, offline in ((f"{sso.url}/sso/token", "revoked"), ("http://127.0.0.1:9/token", OFFLINE)):
+            try:
+                broker.sso_token(auth_url, offline)
+            except CredentialError as e:
+                errors.append(str(e))
+        entries = broker.entries()
+
+    if len(errors) != 2 or "HTTP 400" not in errors[0] or "failed" not in errors[1]:
+        print(f"❌ Unexpected errors: {errors}")
+        return False
+    if entries:
+        print(f"❌ Failed exchanges should not be cached: {entries}")
+        return False
+
+    print("✅ Rejected tokens are reported and not cached")
+    return True
+
+
+def test_registry_login_cached():
+    """Test registry logins are reused until the TTL, a logout or a password change."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        command, state_path = write_fake_runtime(temp_dir)
+        auth_file = Path(temp_dir) / "auth.json"
+        runtime = ContainerRuntime(command)
+        clock = Clock()
+        broker = CredentialBroker(Path(temp_dir) / "credentials.json", clock)
+        with environment({"REGISTRY_AUTH_FILE": str(auth_file), "REDHAT_REGISTRY_USERNAME": "builder",
+                          "REDHAT_REGISTRY_PASSWORD": "pw-1"}), \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            outcomes = [broker.registry_login(runtime, "registry.redhat.io", "builder", "pw-1")]
+            authenticate_redhat(runtime, broker)                      # キャッシュ済み
+            auth_file.write_text(json.dumps({"auths": {}}))           # logout 相当
+            outcomes.append(broker.registry_login(runtime, "registry.redhat.io", "builder", "pw-1"))
+            outcomes.append(broker.registry_login(runtime, "registry.redhat.io", "builder", "pw-2"))
+            outcomes.append(broker.registry_login(runtime, "registry.redhat.io", "builder", "pw-2"))
+            clock.now += 3601
+            outcomes.append(broker.registry_login(runtime, "registry.redhat.io", "builder", "pw-2"))
+        logins = read_state(state_path)["logins"]
+
+    if outcomes != [True, True, True, False, True]:
+        print(f"❌ Unexpected login decisions: {outcomes}")
+        return False
+    if [secret for _, secret in logins] != ["pw-1", "pw-1", "pw-2", "pw-2"]:
+        print(f"❌ Unexpected runtime logins: {logins}")
+        return False
+
+    print("✅ Registry logins are reused while still valid")
+    return True
+
+
+def test_cli_and_galaxy():
+    """Test the credentials command and that galaxy runs share the cached SSO token."""
+    with FakeGalaxy({"redhat.rhel_system_roles": {"1.23.0": {}}}, prefix="/api/automation-hub/",
+                    offline=OFFLINE) as hub, tempfile.TemporaryDirectory() as temp_dir:
+        command, state_path = write_fake_runtime(temp_dir)
+        cache = Path(temp_dir) / "credentials.json"
+        servers = [{"name": "automation_hub", "url": f"{hub.url}/api/automation-hub/",
+                    "auth_url": f"{hub.url}/sso/token", "token": OFFLINE, "validate_certs": True}]
+        ee_config = yaml.safe_load("dependencies: {galaxy: {collections: [redhat.rhel_system_roles]}}")
+        with environment({"EE_CREDENTIAL_CACHE": str(cache), "REGISTRY_AUTH_FILE": str(Path(temp_dir) / "auth.json"),
+                          "REDHAT_REGISTRY_USERNAME": "builder", "REDHAT_REGISTRY_PASSWORD": "pw-1"}):
+            runs = [prefetch(ee_config, Path(temp_dir), servers, broker=CredentialBroker())["resolved"]
+                    for _ in range(2)]
+            first = run_cli(["credentials", "login", "--runtime", command])
+            second = run_cli(["credentials", "login", "--runtime", command])
+            _, listed = run_cli(["credentials", "status", "-f", "json"])
+            cleared = run_cli(["credentials", "clear"])
+            _, empty = run_cli(["credentials", "status"])
+        text = cache.read_text()
+        logins = read_state(state_path)["logins"]
+
+    if runs != [{"redhat.rhel_system_roles": "1.23.0"}] * 2 or hub.exchanges != 1:
+        print(f"❌ galaxy runs should share one exchange: {runs} {hub.exchanges}")
+        return False
+    if "Logged in" not in first[1] or "still valid" not in second[1] or len(logins) != 1:
+        print(f"❌ Unexpected login output: {first} {second}")
+        return False
+    kinds = sorted(row["kind"] for row in json.loads(listed))
+    if kinds != ["registry", "sso"] or "pw-1" in listed or "Removed 2" not in cleared[1] or "No cached" not in empty:
+        print(f"❌ Unexpected status / clear output: {listed} {cleared} {empty}")
+        return False
+    if "access_token" in text and hub.access in text:
+        print("❌ Cleared credentials should be gone from the cache file")
+        return False
+
+    print("✅ credentials command and galaxy share the cache")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_sso_token_cached,
+        test_concurrent_processes,
+        test_rejected_token,
+        test_registry_login_cached,
+        test_cli_and_galaxy
+    ]
+
+    print("🧪 Running credential broker tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
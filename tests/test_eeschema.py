@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+EE definition validator tests for Ansible Custom EE Builder
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.eeschema import (  # noqa: E402
+    has_errors, parse_bindep, parse_requirement, validate_files, validate_text,
+)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+BROKEN_EE = """\
+version: 3
+images:
+  base_image:
+    name: quay.io/ansible/creator-ee:latest
+dependencies:
+  galaxy: |
+    collections:
+      - name: community.general
+        version: ">=8.0.0"
+      - name: community-general
+  python: |
+    jmespath>=1.0.0
+    requests>=>2
+  system: |
+    git [platform:rpm
+additional_build_steps:
+  prepend:
+    - RUN true
+"""
+
+
+def find(issues, field):
+    return [issue for issue in issues if issue["field"] == field]
+
+
+def test_project_ee_files():
+    """Test the shipped EE definitions validate without errors."""
+    files = [PROJECT_ROOT / "execution-environment.yml",
+             PROJECT_ROOT / "examples/execution-environment.yml"]
+    issues = validate_files(files)
+    if has_errors(issues):
+        print(f"❌ Shipped EE files have errors: {issues}")
+        return False
+
+    print("✅ Shipped EE definitions are valid")
+    return True
+
+
+def test_line_numbers():
+    """Test errors inside inline requirement blocks point at the EE file line."""
+    issues = validate_text(BROKEN_EE, "ee.yml")
+    expected = {
+        "dependencies.galaxy": (10, 15),
+        "dependencies.python": (13, 5),
+        "dependencies.system": (15, 5),
+        "additional_build_steps.prepend": (17, 3),
+    }
+    for field, position in expected.items():
+        found = find(issues, field)
+        if len(found) != 1 or (found[0]["line"], found[0]["column"]) != position:
+            print(f"❌ Expected one {field} issue at {position}: {found}")
+            return False
+    if "prepend_final" not in find(issues, "additional_build_steps.prepend")[0]["message"]:
+        print("❌ Version 1/2 key should point at its version 3 name")
+        return False
+
+    print("✅ Issues carry line and column in the EE file")
+    return True
+
+
+def test_schema_rules():
+    """Test types, unknown keys, required keys and the version check."""
+    text = ("version: 2\n"
+            "dependencies:\n"
+            "  pyhton: requirements.txt\n"
+            "  ansible_core: {}\n"
+            "options:\n"
+            "  user: 1000\n"
+            "  user: '1000'\n")
+    issues = validate_text(text)
+    messages = [(issue["line"], issue["message"]) for issue in issues]
+    checks = [
+        (1, "unsupported EE version"),
+        (3, "did you mean 'python'"),
+        (4, "missing required key 'package_pip'"),
+        (6, "expected string, got integer"),
+        (7, "duplicate key"),
+    ]
+    for line, needle in checks:
+        if not any(l == line and needle in m for l, m in messages):
+            print(f"❌ Missing issue '{needle}' on line {line}: {messages}")
+            return False
+
+    print("✅ Schema rules are enforced")
+    return True
+
+
+def test_requirement_parsers():
+    """Test the PEP 508 and bindep line parsers."""
+    requirement = parse_requirement('foo[bar, baz]>=1.0,<2.0 ; python_version >= "3.8" and os_name == "posix"')
+    if requirement["name"] != "foo" or requirement["extras"] != ["bar", "baz"] \
+            or requirement["specifier"] != ">=1.0,<2.0":
+        print(f"❌ Unexpected requirement: {requirement}")
+        return False
+    if parse_requirement("pkg @ https://example.com/pkg.whl")["url"] != "https://example.com/pkg.whl":
+        print("❌ Direct references should be parsed")
+        return False
+    for bad in ("requests>=>2", "foo>=1.*", "foo~=1", 'foo; python_versio == "3"', "foo; (os_name == 'x'"):
+        try:
+            parse_requirement(bad)
+        except ValueError:
+            continue
+        print(f"❌ '{bad}' should be rejected")
+        return False
+
+    package = parse_bindep("python39-devel [platform:rhel-9 !platform:centos] >=3.9")
+    if package != {"name": "python39-devel", "selectors": ["platform:rhel-9", "!platform:centos"],
+                   "version": ">=3.9"}:
+        print(f"❌ Unexpected bindep entry: {package}")
+        return False
+    for bad in ("gcc [platform:rpm", "gcc []", "gcc [platform:rpm] ~2"):
+        try:
+            parse_bindep(bad)
+        except ValueError:
+            continue
+        print(f"❌ '{bad}' should be rejected")
+        return False
+
+    print("✅ Requirement lines are parsed")
+    return True
+
+
+def test_referenced_files():
+    """Test single-line dependency strings are read as files next to the EE file."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        (temp_path / "requirements.txt").write_text("requests>=2\nbroken==\n")
+        (temp_path / "requirements.yml").write_text("collections:\n  - name: ansible.posix\n")
+        ee_file = temp_path / "execution-environment.yml"
+        ee_file.write_text("version: 3\n"
+                           "dependencies:\n"
+                           "  python: requirements.txt\n"
+                           "  galaxy: requirements.yml\n"
+                           "  system: bindep.txt\n")
+        issues = validate_files([ee_file])
+
+    python = find(issues, "dependencies.python")
+    system = find(issues, "dependencies.system")
+    if len(python) != 1 or not python[0]["path"].endswith("requirements.txt") or python[0]["line"] != 2:
+        print(f"❌ Expected an issue on requirements.txt line 2: {python}")
+        return False
+    if len(system) != 1 or "cannot be read" not in system[0]["message"]:
+        print(f"❌ Missing bindep.txt should be reported: {system}")
+        return False
+    if find(issues, "dependencies.galaxy"):
+        print(f"❌ Valid requirements.yml reported issues: {issues}")
+        return False
+
+    print("✅ Referenced dependency files are validated")
+    return True
+
+
+def test_many_files_fast():
+    """Test hundreds of EE files validate quickly in one process."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = (PROJECT_ROOT / "execution-environment.yml").read_text(encoding="utf-8")
+        files = []
+        for index in range(300):
+            path = Path(temp_dir) / f"execution-environment-{index}.yml"
+            path.write_text(source, encoding="utf-8")
+            files.append(path)
+        start = time.perf_counter()
+        issues = validate_files(files)
+        elapsed = time.perf_counter() - start
+
+    if issues:
+        print(f"❌ Unexpected issues: {issues[:3]}")
+        return False
+    if elapsed > 10:
+        print(f"❌ Validating 300 files took {elapsed:.1f}s")
+        return False
+
+    print(f"✅ 300 EE files validated in {elapsed * 1000:.0f}ms")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_project_ee_files,
+        test_line_numbers,
+        test_schema_rules,
+        test_requirement_parsers,
+        test_referenced_files,
+        test_many_files_fast
+    ]
+
+    print("🧪 Running EE validator tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
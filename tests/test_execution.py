@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Subprocess execution layer tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.execution import Budget, ExecutionError, ProgressSink, run, tracker_sink  # noqa: E402
+from ee_builder.telemetry import SubstageTracker  # noqa: E402
+from test_integration import IntegrationTestSuite  # noqa: E402
+from test_release import ReleaseTestSuite  # noqa: E402
+from test_workflows import WorkflowTestSuite  # noqa: E402
+
+# 子プロセスを起動して孫プロセスの PID を書き出し、自身も待ち続ける（SIGTERM は無視）
+SPAWNER = """
+import signal, subprocess, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+open(sys.argv[1], "w").write(str(child.pid))
+print("started", flush=True)
+time.sleep(60)
+"""
+
+
+def alive(pid):
+    """True while ``pid`` exists and is not a zombie."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_streaming_sinks():
+    """Test lines reach sinks while the command runs and only a bounded tail is kept."""
+    script = ("import sys, time\n"
+              "print('first', flush=True)\n"
+              "print('warning', file=sys.stderr, flush=True)\n"
+              "time.sleep(0.5)\n"
+              "for i in range(5000):\n"
+              "    print(f'line {i}')\n"
+              "sys.stdout.write('x' * 200000)\n")
+    start = time.monotonic()
+    seen = []
+    result = run([sys.executable, "-c", script], tail_lines=100,
+                 sinks=[lambda stream, line: seen.append((stream, line, time.monotonic() - start))])
+
+    first = next(elapsed for stream, line, elapsed in seen if line == "first\n")
+    if result["returncode"] != 0 or first > result["seconds"] - 0.4:
+        print(f"❌ Output should be streamed before the command exits: {first:.2f}s of {result['seconds']:.2f}s")
+        return False
+    if ("stderr", "warning\n") not in [(stream, line) for stream, line, _ in seen]:
+        print("❌ stderr lines should reach the sinks")
+        return False
+    chunks = [len(line) for stream, line, _ in seen if line.startswith("x")]
+    if not result["truncated"] or result["lines"]["stdout"] != 5005:
+        print(f"❌ Only the last lines should be kept: {result['lines']}")
+        return False
+    # 100 件の末尾 = 96 行 + 改行のない 200000 バイトの出力を 64KiB ごとに区切った 4 件
+    if not result["stdout"].startswith("line 4904\n") or not result["stdout"].endswith("line 4999\n" + "x" * 200000):
+        print(f"❌ Unexpected tail: {result['stdout'][:20]!r}")
+        return False
+    if chunks != [65536, 65536, 65536, 200000 - 3 * 65536] or result["stderr"] != "warning\n":
+        print(f"❌ Long lines should be split into bounded chunks: {chunks}")
+        return False
+
+    print("✅ Output is streamed to sinks with a bounded tail")
+    return True
+
+
+def test_no_shell():
+    """Test commands run without a shell and start failures raise ExecutionError."""
+    result = run("echo '$HOME; true' \"a b\" *.py", cwd=Path(__file__).resolve().parent)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result_stdin = run([sys.executable, "-c", "import os, sys; print(sys.stdin.read().upper(), os.getcwd())"],
+                           cwd=temp_dir, stdin_text="hello")
+        expected_cwd = os.path.realpath(temp_dir)
+    errors = []
+    for command in (["no-such-command-ee"], []):
+        try:
+            run(command)
+        except ExecutionError as e:
+            errors.append(str(e))
+
+    if result["stdout"] != "$HOME; true a b *.py\n":
+        print(f"❌ Arguments should not be expanded by a shell: {result['stdout']!r}")
+        return False
+    if result_stdin["stdout"] != f"HELLO {expected_cwd}\n":
+        print(f"❌ stdin and cwd should be passed through: {result_stdin['stdout']!r}")
+        return False
+    if len(errors) != 2 or "Cannot run no-such-command-ee" not in errors[0]:
+        print(f"❌ Unexpected start errors: {errors}")
+        return False
+
+    print("✅ Commands run without a shell")
+    return True
+
+
+def test_timeout_kills_group():
+    """Test an exhausted budget kills the whole process group, escalating to SIGKILL."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pid_file = Path(temp_dir) / "grandchild.pid"
+        seen = []
+        start = time.monotonic()
+        result = run([sys.executable, "-c", SPAWNER, str(pid_file)], timeout=1.0, kill_grace=0.5,
+                     sinks=[lambda stream, line: seen.append(line)])
+        elapsed = time.monotonic() - start
+        grandchild = int(pid_file.read_text())
+        for _ in range(50):
+            if not alive(grandchild):
+                break
+            time.sleep(0.1)
+
+    if not result["timed_out"] or result["returncode"] != -9 or seen != ["started\n"]:
+        print(f"❌ The command should be killed when its budget runs out: {result}")
+        return False
+    if elapsed > 5 or "command budget of 1s" not in result["error"]:
+        print(f"❌ Unexpected timeout handling: {elapsed:.1f}s {result['error']}")
+        return False
+    if alive(grandchild):
+        print(f"❌ The grandchild {grandchild} should be killed with the process group")
+        return False
+
+    print("✅ Budget expiry kills the whole process group")
+    return True
+
+
+def test_interrupted_run_kills_group():
+    """Test a sink exception stops the command and its process group before propagating."""
+    def failing_sink(stream, line):
+        raise RuntimeError("log disk full")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pid_file = Path(temp_dir) / "grandchild.pid"
+        start = time.monotonic()
+        try:
+            run([sys.executable, "-c", SPAWNER, str(pid_file)], kill_grace=0.5, sinks=[failing_sink])
+            error = None
+        except RuntimeError as e:
+            error = str(e)
+        elapsed = time.monotonic() - start
+        grandchild = int(pid_file.read_text())
+        for _ in range(50):
+            if not alive(grandchild):
+                break
+            time.sleep(0.1)
+
+    if error != "log disk full" or elapsed > 10:
+        print(f"❌ The sink error should propagate once the command is stopped: {error} {elapsed:.1f}s")
+        return False
+    if alive(grandchild):
+        print(f"❌ The grandchild {grandchild} should not outlive an interrupted run")
+        return False
+
+    print("✅ An interrupted run kills the whole process group")
+    return True
+
+
+def test_hierarchical_budgets():
+    """Test child budgets end with their parents and exhausted budgets start nothing."""
+    clock = Clock()
+    suite = Budget(100, "suite", clock=clock)
+    step = suite.child(30, "step")
+    command = step.child(None)
+    clock.now += 20
+    checks = [command.remaining() == 10, command.describe() == "step budget of 30s",
+              suite.child(500).remaining() == 80, Budget().remaining() is None]
+    clock.now += 15
+    checks += [step.expired, not suite.expired, suite.child(5).describe() == "command budget of 5s"]
+
+    parent = Budget(1.0, "integration tests")
+    start = time.monotonic()
+    slow = run([sys.executable, "-c", "import time; time.sleep(30)"], budget=parent, timeout=60, kill_grace=0.5)
+    skipped = run([sys.executable, "-c", "print('never')"], budget=parent, timeout=60)
+    elapsed = time.monotonic() - start
+
+    if not all(checks):
+        print(f"❌ Unexpected budget arithmetic: {checks}")
+        return False
+    if not slow["timed_out"] or "integration tests budget of 1s" not in slow["error"] or elapsed > 5:
+        print(f"❌ The parent budget should limit the command: {slow['error']} {elapsed:.1f}s")
+        return False
+    if not skipped["timed_out"] or skipped["returncode"] is not None or "Not started" not in skipped["error"]:
+        print(f"❌ Commands should not start once the budget is exhausted: {skipped}")
+        return False
+
+    print("✅ Budgets nest and stop later commands")
+    return True
+
+
+def test_suite_helpers():
+    """Test the suites' run_command helpers use the execution layer and its sinks."""
+    build_output = ("import sys\n"
+                    "print('STEP 1/3: FROM quay.io/ansible/creator-ee:latest')\n"
+                    "print('STEP 2/3: RUN ansible-galaxy collection install ansible.posix')\n"
+                    "print('COMMIT localhost/test', file=sys.stderr)\n")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        results = [suite.run_command([sys.executable, "-c", "print('ok')"])
+                   for suite in (IntegrationTestSuite(), ReleaseTestSuite(), WorkflowTestSuite())]
+        release = ReleaseTestSuite()
+        timed_out = release.run_command([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+        missing = release.run_command(["no-such-command-ee", "--version"])
+        tracker = SubstageTracker()
+        built = IntegrationTestSuite().run_command([sys.executable, "-c", build_output],
+                                                   sinks=[tracker_sink(tracker)])
+    progress_out = io.StringIO()
+    progress = ProgressSink("podman", interval=0, out=progress_out)
+    progress("stdout", "STEP 2/3: RUN dnf install -y git\n")
+
+    if results != [(True, "ok\n", "")] * 3 or not built[0]:
+        print(f"❌ run_command should return (success, stdout, stderr): {results}")
+        return False
+    if timed_out[0] or "timed out" not in timed_out[2] or missing[0] or "Cannot run" not in missing[2]:
+        print(f"❌ Unexpected failure results: {timed_out} {missing}")
+        return False
+    if set(tracker.finish()) != {"base_pull", "galaxy_install", "commit"}:
+        print(f"❌ Build output should feed the sub-stage tracker: {tracker.durations}")
+        return False
+    if "podman: 1 lines" not in progress_out.getvalue() or "dnf install" not in progress_out.getvalue():
+        print(f"❌ Unexpected progress output: {progress_out.getvalue()!r}")
+        return False
+
+    print("✅ Test suites run commands through the execution layer")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_streaming_sinks,
+        test_no_shell,
+        test_timeout_kills_group,
+        test_interrupted_run_kills_group,
+        test_hierarchical_budgets,
+        test_suite_helpers
+    ]
+
+    print("🧪 Running execution layer tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Galaxy metadata prefetcher tests for Ansible Custom EE Builder
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.galaxyapi import ConnectionPool, GalaxyAPIError, galaxy_servers, prefetch  # noqa: E402
+from ee_builder.galaxylock import load_index  # noqa: E402
+from fakes import FakeGalaxy  # noqa: E402
+
+HUB_COLLECTIONS = {
+    'redhat.rhel_system_roles': {'1.22.0': {}, '1.23.0': {'ansible.posix': '>=1.4.0,<2.0.0'}},
+}
+GALAXY_COLLECTIONS = {
+    'community.general': {'7.5.0': {}, '8.0.0': {}, '8.1.0': {}, '8.2.0': {}, '9.0.0-beta1': {},
+                          '9.0.0': {'ansible.posix': '>=1.5.0,<2.0.0'}},
+    'ansible.posix': {'1.4.0': {}, '1.5.4': {}, '1.6.0': {}, '2.0.0': {}},
+}
+EXPECTED = {'community.general': '9.0.0', 'redhat.rhel_system_roles': '1.23.0', 'ansible.posix': '1.6.0'}
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+@contextlib.contextmanager
+def environment(values):
+    """Set (or with None, unset) environment variables for the block."""
+    saved = {name: os.environ.get(name) for name in values}
+    for name, value in values.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def write_project(path, hub_url, galaxy_url):
+    """EE file with a galaxy block and an ansible.cfg listing Automation Hub (SSO) then Galaxy."""
+    ee_file = path / "execution-environment.yml"
+    ee_file.write_text(yaml.dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"galaxy": {"collections": [
+            {"name": "community.general", "version": ">=8.0.0,<10.0.0"},
+            {"name": "redhat.rhel_system_roles"},
+            {"name": "https://github.com/example/collection.git", "type": "git"},
+        ]}},
+    }))
+    config = path / "ansible.cfg"
+    config.write_text(f"""[galaxy]
+server_list = automation_hub, galaxy
+
+[galaxy_server.automation_hub]
+url = {hub_url}/api/automation-hub/
+auth_url = {hub_url}/sso/token
+token = ${{HUB_OFFLINE_TOKEN}}
+
+[galaxy_server.galaxy]
+url = {galaxy_url}/
+""")
+    return ee_file, config
+
+
+def test_servers_from_config():
+    """Test the server list, environment overrides and unset ${VAR} tokens."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _, config = write_project(Path(temp_dir), "https://hub.example", "https://galaxy.example")
+        with environment({"HUB_OFFLINE_TOKEN": None}):
+            unset = galaxy_servers(config)
+        with environment({"HUB_OFFLINE_TOKEN": "from-cfg",
+                          "ANSIBLE_GALAXY_SERVER_GALAXY_URL": "https://mirror.example"}):
+            overridden = galaxy_servers(config)
+        default = galaxy_servers(Path(temp_dir) / "missing.cfg")
+        (Path(temp_dir) / "bad.cfg").write_text("[galaxy]\nserver_list = nowhere\n")
+        try:
+            galaxy_servers(Path(temp_dir) / "bad.cfg")
+            missing_url = None
+        except GalaxyAPIError as e:
+            missing_url = str(e)
+
+    hub, galaxy = unset
+    if hub["token"] is not None or hub["auth_url"] != "https://hub.example/sso/token" or galaxy["token"] is not None:
+        print(f"❌ An unset ${{VAR}} token should count as no token: {unset}")
+        return False
+    if overridden[0]["token"] != "from-cfg" or overridden[1]["url"] != "https://mirror.example/":
+        print(f"❌ Environment values and overrides should apply: {overridden}")
+        return False
+    if [s["url"] for s in default] != ["https://galaxy.ansible.com/"] or "nowhere" not in (missing_url or ""):
+        print(f"❌ Unexpected default / invalid server handling: {default} {missing_url}")
+        return False
+
+    print("✅ Galaxy servers are read from ansible.cfg")
+    return True
+
+
+def test_connection_pool():
+    """Test keep-alive reuse, chunked and close-delimited bodies and retry on a stale connection."""
+    async def scenario():
+        async def handle(reader, writer):
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                path = head.split(b" ")[1]
+                if path == b"/chunked":
+                    writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                                 b"3\r\n{\"a\r\n5\r\n\": 1}\r\n0\r\n\r\n")
+                elif path == b"/eof":
+                    writer.write(b"HTTP/1.1 200 OK\r\n\r\n{\"b\": 2}")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                await writer.drain()
+                if path == b"/then-close":
+                    break  # Connection: close を付けずに切断する（待機中接続の失効）
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        base = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        pool = ConnectionPool(size=2)
+        bodies = []
+        for path in ("/a", "/b", "/chunked", "/then-close", "/c", "/eof", "/d"):
+            bodies.append((await pool.request("GET", base + path))[2])
+        parallel = await asyncio.gather(*(pool.request("GET", f"{base}/p{n}") for n in range(6)))
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+        return bodies, [body for _, _, body in parallel], pool.stats
+
+    bodies, parallel, stats = asyncio.run(scenario())
+
+    if bodies != [b"{}", b"{}", b'{"a": 1}', b"{}", b"{}", b'{"b": 2}', b"{}"] or parallel != [b"{}"] * 6:
+        print(f"❌ Unexpected bodies: {bodies} {parallel}")
+        return False
+    # /a〜/then-close で1本、失効後の再接続で1本、/eof の後に1本、並列時に1本追加（上限2）
+    if stats["connections"] != 4 or stats["requests"] != 13:
+        print(f"❌ Connections should be reused and bounded: {stats}")
+        return False
+
+    print("✅ Keep-alive connections are pooled and reused")
+    return True
+
+
+def test_prefetch_and_etag_cache():
+    """Test concurrent prefetch over pooled connections, SSO exchange and ETag revalidation."""
+    with FakeGalaxy(HUB_COLLECTIONS, prefix="/api/automation-hub/", offline="offline-value") as hub, \
+            FakeGalaxy(GALAXY_COLLECTIONS) as galaxy, tempfile.TemporaryDirectory() as temp_dir:
+        ee_file, config = write_project(Path(temp_dir), hub.url, galaxy.url)
+        ee_config = yaml.safe_load(ee_file.read_text())
+        cache_dir = Path(temp_dir) / "cache"
+        with environment({"HUB_OFFLINE_TOKEN": "offline-value"}):
+            servers = galaxy_servers(config)
+            first = prefetch(ee_config, Path(temp_dir), servers, cache_dir=cache_dir, connections=2)
+            fetched = [r for r in galaxy.requests if r[0] == "GET" and r[2] == 200]
+            connections = galaxy.connections
+            hub.requests.clear()
+            galaxy.requests.clear()
+            second = prefetch(ee_config, Path(temp_dir), servers, cache_dir=cache_dir, connections=2)
+        refetched = [r for r in hub.requests + galaxy.requests if r[0] == "GET" and r[2] == 200]
+
+    if first["resolved"] != EXPECTED or first["error"]:
+        print(f"❌ Unexpected resolution: {first['resolved']} {first['error']}")
+        return False
+    rows = {row["name"]: row for row in first["collections"]}
+    if (rows["community.general"]["server"], rows["ansible.posix"]["server"],
+            rows["redhat.rhel_system_roles"]["server"]) != ("galaxy", "galaxy", "automation_hub"):
+        print(f"❌ Collections should come from the first server that has them: {rows}")
+        return False
+    if sorted(first["index"]["community.general"]) != ["8.0.0", "8.1.0", "8.2.0", "9.0.0"]:
+        print(f"❌ Only versions in range should be fetched: {sorted(first['index']['community.general'])}")
+        return False
+    if connections > 2 or len(fetched) <= 2 or hub.exchanges != 2 or first["stats"]["exchanges"] != 1:
+        print(f"❌ Requests should share keep-alive connections and exchange the token once per run: "
+              f"{connections} connection(s) for {len(fetched)} request(s), {hub.exchanges} exchange(s)")
+        return False
+    if second["resolved"] != EXPECTED or refetched or second["stats"]["revalidated"] < len(fetched):
+        print(f"❌ The second run should be served by ETag revalidation: {refetched} {second['stats']}")
+        return False
+
+    print("✅ Metadata is prefetched concurrently and revalidated with ETags")
+    return True
+
+
+def test_unreachable_and_auth_errors():
+    """Test a rejected token and a dead server are reported without stopping the other servers."""
+    with FakeGalaxy(HUB_COLLECTIONS, prefix="/api/automation-hub/", offline="offline-value") as hub, \
+            FakeGalaxy(GALAXY_COLLECTIONS, authorization="Token community") as galaxy, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        ee_file, config = write_project(Path(temp_dir), hub.url, galaxy.url)
+        ee_config = yaml.safe_load(ee_file.read_text())
+        with environment({"HUB_OFFLINE_TOKEN": "revoked", "ANSIBLE_GALAXY_SERVER_GALAXY_TOKEN": "community"}):
+            rejected = prefetch(ee_config, Path(temp_dir), galaxy_servers(config))
+        dead = [{"name": "mirror", "url": "http://127.0.0.1:9/", "auth_url": None, "token": None}] + \
+            [{**s, "token": "community"} for s in galaxy_servers(config)[1:]]
+        fallback = prefetch({"dependencies": {"galaxy": {"collections": [{"name": "ansible.posix"}]}}},
+                            Path(temp_dir), dead)
+
+    servers = {row["server"]: row for row in rejected["servers"]}
+    rows = {row["name"]: row for row in rejected["collections"]}
+    if servers["automation_hub"]["status"] != "error" or "token exchange" not in servers["automation_hub"]["error"]:
+        print(f"❌ A rejected offline token should be reported: {servers}")
+        return False
+    if servers["galaxy"]["auth"] != "token" or rows["community.general"]["latest"] != "9.0.0":
+        print(f"❌ Galaxy should still answer with its API token: {servers['galaxy']} {rows['community.general']}")
+        return False
+    if not rows["redhat.rhel_system_roles"]["error"] or not rejected["error"]:
+        print(f"❌ The Automation Hub collection should fail to resolve: {rows} {rejected['error']}")
+        return False
+    mirror = fallback["servers"][0]
+    if "Cannot connect" not in (mirror["error"] or "") or fallback["resolved"] != {"ansible.posix": "2.0.0"}:
+        print(f"❌ A dead server should be skipped: {mirror} {fallback['resolved']}")
+        return False
+
+    print("✅ Unreachable servers and rejected tokens are reported per server")
+    return True
+
+
+def test_redirect_drops_token():
+    """Test a redirect to another host is followed without forwarding the API token."""
+    with FakeGalaxy(GALAXY_COLLECTIONS, authorization="Token community") as galaxy, \
+            FakeGalaxy(GALAXY_COLLECTIONS) as cdn, tempfile.TemporaryDirectory() as temp_dir:
+        galaxy.redirect = f"http://localhost:{cdn.server.server_address[1]}"
+        servers = [{"name": "galaxy", "url": f"{galaxy.url}/api/", "auth_url": None, "token": "community"}]
+        result = prefetch({"dependencies": {"galaxy": {"collections": [{"name": "ansible.posix"}]}}},
+                          Path(temp_dir), servers)
+
+    if result["resolved"] != {"ansible.posix": "2.0.0"}:
+        print(f"❌ The redirected lookups should still resolve: {result}")
+        return False
+    if not galaxy.auth_headers or set(galaxy.auth_headers) != {"Token community"}:
+        print(f"❌ The configured server should receive the token: {galaxy.auth_headers}")
+        return False
+    if not cdn.auth_headers or any(cdn.auth_headers):
+        print(f"❌ The token leaked to the redirect target: {cdn.auth_headers}")
+        return False
+
+    print("✅ Cross-host redirects are followed without the Authorization header")
+    return True
+
+
+def test_cli_writes_index():
+    """Test the galaxy command and that its index snapshot feeds lock --index."""
+    with FakeGalaxy(HUB_COLLECTIONS, prefix="/api/automation-hub/", offline="offline-value") as hub, \
+            FakeGalaxy(GALAXY_COLLECTIONS) as galaxy, tempfile.TemporaryDirectory() as temp_dir:
+        ee_file, config = write_project(Path(temp_dir), hub.url, galaxy.url)
+        index = Path(temp_dir) / "galaxy-index.yml"
+        with environment({"HUB_OFFLINE_TOKEN": "offline-value", "EE_GALAXY_CACHE_DIR": str(Path(temp_dir) / "cache")}):
+            code, text = run_cli(["galaxy", "-f", str(ee_file), "--config", str(config), "-o", str(index)])
+            json_code, data = run_cli(["galaxy", "-f", str(ee_file), "--config", str(config), "--format", "json"])
+            # git ソースのコレクションはロックできないので、ロック前に取り除く
+            definition = yaml.safe_load(ee_file.read_text())
+            definition["dependencies"]["galaxy"]["collections"].pop()
+            ee_file.write_text(yaml.dump(definition))
+            lock_code, _ = run_cli(["lock", "-f", str(ee_file), "--index", str(index)])
+        with environment({"HUB_OFFLINE_TOKEN": "revoked"}):
+            failed, _ = run_cli(["galaxy", "-f", str(ee_file), "--config", str(config), "--no-cache"])
+        snapshot = load_index(index)
+        lock = yaml.safe_load((Path(temp_dir) / "ee.lock").read_text())
+
+    if code != 0 or "9.0.0" not in text or "unchanged (ETag)" not in text:
+        print(f"❌ Unexpected table output: {code} {text}")
+        return False
+    if json_code != 0 or json.loads(data)["resolved"] != EXPECTED or failed != 1:
+        print(f"❌ Unexpected JSON output or exit codes: {json_code} {failed} {data[:200]}")
+        return False
+    pinned = {c["name"]: c["version"] for c in lock["galaxy"]["collections"]}
+    if set(snapshot) != set(EXPECTED) or lock_code != 0 or pinned != EXPECTED or \
+            not all(c["sha256"] and c["url"].startswith("http://") for c in lock["galaxy"]["collections"]):
+        print(f"❌ The index snapshot should lock the same versions: {pinned} {lock_code}")
+        return False
+
+    print("✅ galaxy writes an index snapshot that lock --index uses")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_servers_from_config,
+        test_connection_pool,
+        test_prefetch_and_etag_cache,
+        test_unreachable_and_auth_errors,
+        test_redirect_drops_token,
+        test_cli_writes_index
+    ]
+
+    print("🧪 Running Galaxy prefetch tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Collection resolver and ee.lock tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import BuildError, build, build_many  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.galaxylock import (  # noqa: E402
+    ResolutionError, fetch_collections, load_index, matches, resolve,
+)
+from ee_builder.lockfile import LockError, load_lock  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import read_state, write_collection_tarball, write_fake_builder, write_fake_runtime  # noqa: E402
+
+# a の最新版は b<2 を要求し、c は b>=2 を要求する → a を 1.x に戻す必要がある
+SYNTHETIC_INDEX = {
+    "test.a": {
+        "2.0.0": {"dependencies": {"test.b": "<2.0.0"}},
+        "1.5.0": {"dependencies": {"test.b": ">=2.0.0"}},
+        "1.0.0": {"dependencies": {}},
+    },
+    "test.b": {"1.0.0": {}, "2.0.0": {}, "2.1.0": {}, "3.0.0-beta.1": {}},
+    "test.c": {"1.0.0": {"dependencies": {"test.b": ">=2.0.0"}}},
+}
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(path, collections):
+    path.write_text(yaml.safe_dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"galaxy": {"collections": collections}},
+    }))
+    return path
+
+
+def test_version_ranges():
+    """Test galaxy range matching and pre-release handling."""
+    cases = [
+        ("1.5.0", ">=1.0.0,<2.0.0", True),
+        ("2.0.0", ">=1.0.0,<2.0.0", False),
+        ("1.0.0", "*", True),
+        ("1.0.0", "1.0.0", True),
+        ("1.0.1", "!=1.0.1", False),
+        ("3.0.0-beta.1", ">=2.0.0", False),
+        ("3.0.0-beta.1", "==3.0.0-beta.1", True),
+        ("1.10.0", ">1.9.0", True),
+    ]
+    for version, spec, expected in cases:
+        if matches(version, spec) != expected:
+            print(f"❌ matches({version!r}, {spec!r}) should be {expected}")
+            return False
+
+    print("✅ Version ranges match like ansible-galaxy")
+    return True
+
+
+def test_backtracking():
+    """Test the resolver backtracks out of a newest-first dead end."""
+    pinned = resolve([{"name": "test.a", "version": "*"}, {"name": "test.c", "version": "*"}],
+                     SYNTHETIC_INDEX)
+    if pinned != {"test.a": "1.5.0", "test.b": "2.1.0", "test.c": "1.0.0"}:
+        print(f"❌ Unexpected resolution: {pinned}")
+        return False
+
+    pinned = resolve([{"name": "test.a", "version": ">=2.0.0"}], SYNTHETIC_INDEX)
+    if pinned != {"test.a": "2.0.0", "test.b": "1.0.0"}:
+        print(f"❌ Unexpected resolution: {pinned}")
+        return False
+
+    print("✅ Resolver backtracks to a consistent set")
+    return True
+
+
+def test_conflicts_reported():
+    """Test unsatisfiable and unknown requirements name the conflict."""
+    try:
+        resolve([{"name": "test.a", "version": ">=2.0.0"}, {"name": "test.c", "version": "*"}],
+                SYNTHETIC_INDEX)
+        print("❌ Conflicting ranges should not resolve")
+        return False
+    except ResolutionError as e:
+        if "test.b" not in str(e):
+            print(f"❌ Conflict message should name test.b: {e}")
+            return False
+
+    try:
+        resolve([{"name": "test.missing", "version": "*"}], SYNTHETIC_INDEX)
+        print("❌ Unknown collection should not resolve")
+        return False
+    except ResolutionError as e:
+        if "not in the index" not in str(e):
+            print(f"❌ Unexpected message: {e}")
+            return False
+
+    print("✅ Conflicts are reported with their origins")
+    return True
+
+
+def test_lock_and_fetch():
+    """Test lock from a tarball directory, then parallel fetch with hash checks."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        tarballs = temp_path / "tarballs"
+        tarballs.mkdir()
+        write_collection_tarball(tarballs, "test.a", "1.0.0", {"test.b": ">=1.0.0"})
+        write_collection_tarball(tarballs, "test.a", "1.1.0", {"test.b": ">=1.0.0"})
+        write_collection_tarball(tarballs, "test.b", "1.2.0")
+        ee_file = write_ee(temp_path / "execution-environment.yml",
+                           [{"name": "test.a", "version": ">=1.0.0"},
+                            {"name": "https://git.example/x.git", "type": "git"}])
+
+        # git ソースの依存関係は --no-deps で落ちてしまうため固定できない
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            code, _ = run_cli(["lock", "-f", str(ee_file), "--index", str(tarballs)])
+        if code != 1 or "https://git.example/x.git (git)" not in err.getvalue():
+            print(f"❌ Collections from git sources should not be locked: {err.getvalue()}")
+            return False
+
+        write_ee(ee_file, [{"name": "test.a", "version": ">=1.0.0"}])
+        code, output = run_cli(["lock", "-f", str(ee_file), "--index", str(tarballs)])
+        if code != 0:
+            print(f"❌ lock failed: {output}")
+            return False
+        lock = load_lock(temp_path / "ee.lock")
+        section = lock["galaxy"]
+        versions = {c["name"]: c["version"] for c in section["collections"]}
+        if versions != {"test.a": "1.1.0", "test.b": "1.2.0"} or "unlocked" in section:
+            print(f"❌ Unexpected lock: {section}")
+            return False
+        if any(os.path.isabs(c["url"]) for c in section["collections"]):
+            print("❌ Local URLs should be stored relative to the lock file")
+            return False
+
+        code, _ = run_cli(["lock", "-f", str(ee_file), "--check"])
+        if code != 0:
+            print("❌ Fresh lock should pass --check")
+            return False
+
+        fetched = fetch_collections(section, temp_path / "out", temp_path, cache_dir=temp_path / "cache")
+        if sorted(p.name for p in fetched) != ["test-a-1.1.0.tar.gz", "test-b-1.2.0.tar.gz"]:
+            print(f"❌ Unexpected fetched files: {fetched}")
+            return False
+
+        section["collections"][0]["sha256"] = "0" * 64
+        try:
+            fetch_collections(section, temp_path / "out2", temp_path, cache_dir=temp_path / "cache2")
+            print("❌ Hash mismatch should fail the fetch")
+            return False
+        except LockError:
+            pass
+
+        write_ee(ee_file, [{"name": "test.a", "version": ">=1.1.0"}])
+        code, output = run_cli(["lock", "-f", str(ee_file), "--check"])
+        if code != 1 or "out of date" not in output:
+            print(f"❌ Changed requirements should make the lock stale: {output}")
+            return False
+
+    print("✅ ee.lock pins versions and hashes; fetch verifies them")
+    return True
+
+
+def test_index_snapshot_file():
+    """Test a YAML index snapshot with relative tarball paths."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        (temp_path / "index.yml").write_text(yaml.safe_dump({"collections": {
+            "test.b": {"1.0.0": {"url": "files/test-b-1.0.0.tar.gz", "sha256": "ab" * 32}},
+        }}))
+        index = load_index(temp_path / "index.yml")
+
+    url = index["test.b"]["1.0.0"]["url"]
+    if url != str((temp_path / "files/test-b-1.0.0.tar.gz").resolve()):
+        print(f"❌ Relative URL not resolved against the snapshot: {url}")
+        return False
+
+    print("✅ Index snapshot files are loaded")
+    return True
+
+
+def test_build_uses_lock():
+    """Test a locked build hands ansible-builder pinned local tarballs and --no-deps."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+        tarballs = temp_path / "tarballs"
+        tarballs.mkdir()
+        write_collection_tarball(tarballs, "test.b", "1.2.0")
+        ee_file = write_ee(temp_path / "execution-environment.yml", [{"name": "test.b", "version": "*"}])
+        run_cli(["lock", "-f", str(ee_file), "--index", str(tarballs), "--output", str(temp_path / "ee.lock")])
+
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        os.environ["EE_COLLECTION_CACHE_DIR"] = str(temp_path / "cache")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                build(ee_file, runtime=ContainerRuntime(command), run_tests=False,
+                      context=temp_path / "context", lock_file=temp_path / "ee.lock")
+                # 同じEEファイルの並列ビルドはそれぞれ専用のステージングを使う
+                parallel = build_many([
+                    {"ee_file": ee_file, "tag": tag, "runtime": ContainerRuntime(command), "run_tests": False,
+                     "context": temp_path / f"context-{tag}", "lock_file": temp_path / "ee.lock"}
+                    for tag in ("a", "b", "c")
+                ], jobs=3)
+                write_ee(ee_file, [{"name": "test.b", "version": ">=2.0.0"}])
+                try:
+                    build(ee_file, runtime=ContainerRuntime(command), run_tests=False,
+                          context=temp_path / "context", lock_file=temp_path / "ee.lock")
+                    stale_failed = False
+                except BuildError:
+                    stale_failed = True
+        finally:
+            os.environ["PATH"] = old_path
+            os.environ.pop("EE_COLLECTION_CACHE_DIR")
+        leftovers = sorted(p.name for p in temp_path.iterdir() if p.name.startswith("."))
+        definition = yaml.safe_load(read_state(state_path)["ee_files"][0])
+
+    collections = definition["dependencies"]["galaxy"]["collections"]
+    if collections != [{"name": "/tmp/ee-lock-collections/test-b-1.2.0.tar.gz", "type": "file"}]:
+        print(f"❌ Locked EE should install the fetched tarball: {collections}")
+        return False
+    if "--no-deps" not in definition["build_arg_defaults"]["ANSIBLE_GALAXY_CLI_COLLECTION_OPTS"]:
+        print("❌ Locked EE should disable dependency resolution")
+        return False
+    if not stale_failed:
+        print("❌ A stale lock should fail the build")
+        return False
+    if any("error" in result for result in parallel):
+        print(f"❌ Concurrent locked builds should not disturb each other: {parallel}")
+        return False
+    if leftovers:
+        print(f"❌ Locked build left files behind: {leftovers}")
+        return False
+
+    print("✅ Builds install locked collections without resolving")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_version_ranges,
+        test_backtracking,
+        test_conflicts_reported,
+        test_lock_and_fetch,
+        test_index_snapshot_file,
+        test_build_uses_lock
+    ]
+
+    print("🧪 Running collection lock tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+LRU image pruning tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.artifacts import CHUNK_SIZE, artifact_image  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.imageprune import (  # noqa: E402
+    FAILED, KEEP, REMOVE, REMOVED, PruneError, image_key, parse_size, plan_prune, prune_images
+)
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import read_state, write_fake_runtime  # noqa: E402
+
+NOW = time.time()
+GB = 1000 ** 3
+EE = "localhost/ansible-custom-ee"
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def run_cli_stderr(argv):
+    """Run the CLI and return (exit code, stderr)."""
+    err = io.StringIO()
+    with contextlib.redirect_stderr(err):
+        code, _ = run_cli(argv)
+    return code, err.getvalue()
+
+
+def local_images():
+    """Five 4GB EE builds (v1 oldest), plus an unrelated image."""
+    images = {}
+    for n in range(1, 6):
+        images[f"{EE}:v{n}"] = {"Id": f"{n:x}" * 64, "Size": 4 * GB, "Created": int(NOW - (10 - n) * 86400)}
+    images[f"{EE}:latest"] = images[f"{EE}:v5"]
+    images["docker.io/library/postgres:16"] = {"Id": "e" * 64, "Size": GB, "Created": int(NOW - 90 * 86400)}
+    return images
+
+
+def write_artifact(path, image, padding=0, flat=False):
+    settings = [{"name": "execution_environment_image", "value": {"current": image}}] if flat else \
+        {"ansible-navigator": {"execution-environment": {"image": image}}}
+    path.write_text(json.dumps({
+        "version": "1.0.0",
+        "plays": [{"tasks": [{"__host": "web1", "__task": "pad", "res": {"msg": "x" * padding}}]}],
+        "stdout": [],
+        "settings_entries": settings,
+    }))
+
+
+def test_size_and_keys():
+    """Test budget sizes and image reference normalization."""
+    sizes = {"20GB": 20 * GB, "512M": 512 * 1000 ** 2, "1.5GiB": int(1.5 * 1024 ** 3), "1000": 1000}
+    wrong = {text: parse_size(text) for text, expected in sizes.items() if parse_size(text) != expected}
+    try:
+        parse_size("lots")
+        invalid = False
+    except PruneError:
+        invalid = True
+    if wrong or not invalid:
+        print(f"❌ Unexpected sizes: {wrong}, invalid rejected: {invalid}")
+        return False
+
+    same = [("ansible-custom-ee:v1", "docker.io/library/ansible-custom-ee:v1"),
+            ("sha256:" + "a" * 64, "a" * 64),
+            (f"{EE}", f"{EE}:latest")]
+    if any(image_key(a) != image_key(b) for a, b in same) or image_key(f"{EE}:v1") == image_key(f"{EE}:v2"):
+        print(f"❌ Unexpected image keys: {[(image_key(a), image_key(b)) for a, b in same]}")
+        return False
+
+    print("✅ Sizes and image references are normalized")
+    return True
+
+
+def test_artifact_image():
+    """Test the EE image is read from the tail of large artifacts in both settings layouts."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        nested = Path(temp_dir) / "site-artifact-1.json"
+        flat = Path(temp_dir) / "site-artifact-2.json"
+        bare = Path(temp_dir) / "site-artifact-3.json"
+        write_artifact(nested, f"{EE}:v3", padding=3 * CHUNK_SIZE)
+        write_artifact(flat, f"{EE}:v4", flat=True)
+        bare.write_text(json.dumps({"plays": []}))
+        images = [artifact_image(path) for path in (nested, flat, bare, Path(temp_dir) / "missing.json")]
+
+    if images != [f"{EE}:v3", f"{EE}:v4", None, None]:
+        print(f"❌ Unexpected artifact images: {images}")
+        return False
+
+    print("✅ Artifact settings give the EE image")
+    return True
+
+
+def test_plan_lru():
+    """Test the least recently used images go first and referenced images stay."""
+    images = [{"id": f"{n:x}" * 64, "tags": [f"{EE}:v{n}"], "size": 4 * GB, "created": NOW - (10 - n) * 86400}
+              for n in range(1, 6)] + [{"id": "e" * 64, "tags": ["postgres:16"], "size": GB, "created": 0}]
+    # v1 は最近使われ、v2 は使用記録が無く作成日時で判定される
+    usage = {"images": {image_key(f"{EE}:v1"): NOW - 60, image_key(f"{EE}:v3"): NOW - 7 * 86400,
+                        image_key("4" * 64): NOW - 3 * 86400}}
+    keep = {image_key(f"{EE}:v5"): "ansible-navigator.yml"}
+    rows = plan_prune(images, usage, keep, 9 * GB, ["*ansible-custom-ee*"])
+
+    actions = {row["tags"][0].rsplit(":", 1)[1]: (row["action"], row["reason"]) for row in rows}
+    if len(rows) != 5:
+        print(f"❌ Only images matching the filter should be managed: {[row['tags'] for row in rows]}")
+        return False
+    if [tag for tag, (action, _) in sorted(actions.items()) if action == REMOVE] != ["v2", "v3", "v4"]:
+        print(f"❌ The three least recently used images should go: {actions}")
+        return False
+    if actions["v5"] != (KEEP, "referenced by ansible-navigator.yml") or actions["v1"] != (KEEP, "within budget"):
+        print(f"❌ Referenced and recently used images should stay: {actions}")
+        return False
+
+    print("✅ Least recently used images are planned for removal")
+    return True
+
+
+def test_prune_runtime():
+    """Test usage is recorded from events and artifacts incrementally and in-use images survive."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        command, state_path = write_fake_runtime(temp_dir, local_images())
+        state = read_state(state_path)
+        state["events"] = [{"Image": f"{EE}:v1", "Status": "start", "time": int(NOW - 3600)},
+                           {"Image": f"{EE}:v2", "Status": "start", "time": int(NOW - 40 * 86400)}]
+        state["running"] = [f"{EE}:v3"]
+        state_path.write_text(json.dumps(state))
+        artifacts = Path(temp_dir) / "artifacts"
+        artifacts.mkdir()
+        write_artifact(artifacts / "site-artifact.json", f"{EE}:v4")
+        config = Path(temp_dir) / "ansible-navigator.yml"
+        config.write_text(yaml.dump({"ansible-navigator": {"execution-environment": {"image": f"{EE}:latest"}}}))
+        usage_path = Path(temp_dir) / "usage.json"
+
+        runtime = ContainerRuntime(command)
+        first = prune_images(runtime, 12 * GB, configs=[config], artifact_paths=[artifacts],
+                             usage_path=usage_path, now=NOW)
+        second = prune_images(runtime, 12 * GB, configs=[config], artifact_paths=[artifacts],
+                              usage_path=usage_path, now=NOW + 60)
+        state = read_state(state_path)
+        usage = json.loads(usage_path.read_text())
+
+    actions = {row["tags"][0].rsplit(":", 1)[1]: row["action"] for row in first["rows"]}
+    if actions != {"v1": KEEP, "v2": REMOVED, "v3": FAILED, "v4": KEEP, "v5": KEEP}:
+        print(f"❌ Unexpected prune outcome: {actions}")
+        return False
+    if sorted(state["removed"]) != [f"{EE}:v2"] or f"{EE}:v3" not in state["images"]:
+        print(f"❌ Only v2 should be removed; v3 is in use: {state['removed']}")
+        return False
+    events = [call for call in state["calls"] if call[0] == "events"]
+    # 初回は30日前から、2回目は前回の終了時刻から読む（v2 の40日前の起動は対象外）
+    if [call[2] for call in events] != [str(int(NOW - 30 * 86400)), str(int(NOW))] or second["artifacts"] != 0:
+        print(f"❌ Usage should be read incrementally: {events} {second['artifacts']}")
+        return False
+    if usage["images"].get(image_key(f"{EE}:v4")) is None or first["events"] != 1:
+        print(f"❌ Artifact and event usage should be recorded: {usage}")
+        return False
+
+    print("✅ Usage is recorded incrementally and in-use images are not forced out")
+    return True
+
+
+def test_cli():
+    """Test the prune command's dry run and budget validation."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        command, state_path = write_fake_runtime(temp_dir, local_images())
+        saved = os.environ.get("EE_IMAGE_USAGE_FILE")
+        os.environ["EE_IMAGE_USAGE_FILE"] = str(Path(temp_dir) / "usage.json")
+        try:
+            code, text = run_cli_stderr(["prune", "--runtime", command, "--budget", "10GB", "--dry-run",
+                                  "--artifacts", str(Path(temp_dir) / "none"), "--config", str(Path(temp_dir) / "x.yml"),
+                                  "--filter", "*ansible-custom-ee*"])
+            code_json, data = run_cli(["prune", "--runtime", command, "--budget", "10GB", "--dry-run",
+                                       "--artifacts", str(Path(temp_dir) / "none"), "-f", "json"])
+            bad, _ = run_cli_stderr(["prune", "--runtime", command, "--budget", "big"])
+        finally:
+            if saved is None:
+                os.environ.pop("EE_IMAGE_USAGE_FILE", None)
+            else:
+                os.environ["EE_IMAGE_USAGE_FILE"] = saved
+        state = read_state(state_path)
+
+    if code != 1 or "x.yml" not in text:
+        print(f"❌ A missing config should be an error: {code} {text}")
+        return False
+    result = json.loads(data)
+    removing = [row["tags"][0] for row in result["rows"] if row["action"] == REMOVE]
+    if code_json != 0 or removing != [f"{EE}:v1", f"{EE}:v2", f"{EE}:v3"] or state.get("removed"):
+        print(f"❌ Dry run should plan the three oldest builds without removing: {removing} {state.get('removed')}")
+        return False
+    if bad != 1:
+        print(f"❌ An invalid budget should fail: {bad}")
+        return False
+
+    print("✅ prune supports dry run and validates the budget")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_size_and_keys,
+        test_artifact_image,
+        test_plan_lru,
+        test_prune_runtime,
+        test_cli
+    ]
+
+    print("🧪 Running image prune tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Rebuild impact graph tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.impact import (  # noqa: E402
+    ImpactError, affected, index_project, parse_change, topological_order,
+)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(path, base, **extra):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    definition = {"version": 3, "images": {"base_image": {"name": base}}}
+    definition.update(extra)
+    path.write_text(yaml.safe_dump(definition))
+    return path
+
+
+def write_project(root):
+    """root EE → derived EE（root のイメージがベース）、他に独立した aws EE。"""
+    (root / "ansible.cfg").write_text("[defaults]\n")
+    (root / "requirements.txt").write_text("boto3>=1.28\n# comment\n")
+    (root / "files").mkdir()
+    (root / "files" / "motd").write_text("hello\n")
+    write_ee(root / "execution-environment.yml", "quay.io/ansible/creator-ee:latest",
+             dependencies={"python": "requirements.txt", "system": "gcc [platform:rpm]\n",
+                           "galaxy": {"collections": [{"name": "ansible.posix", "version": ">=1.5.0"}]}},
+             additional_build_steps={"prepend_final": ["COPY ansible.cfg /etc/ansible/ansible.cfg",
+                                                       "COPY files /opt/files"]})
+    write_ee(root / "derived" / "execution-environment.yml", "localhost/ansible-custom-ee:latest",
+             dependencies={"galaxy": {"collections": ["community.general"]}})
+    write_ee(root / "cloud" / "execution-environment-aws.yml", "quay.io/ansible/creator-ee:v24",
+             dependencies={"galaxy": {"collections": [{"name": "amazon.aws"}]}},
+             options={"tags": ["quay.io/myorg/aws-ee:latest"]})
+    (root / "ee.lock").write_text("version: 1\n")
+
+
+def test_index():
+    """Test inputs and produced image names are indexed."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_project(root)
+        nodes = {node["ee_file"]: node for node in index_project([root], root)}
+
+    if sorted(nodes) != ["cloud/execution-environment-aws.yml", "derived/execution-environment.yml",
+                         "execution-environment.yml"]:
+        print(f"❌ Unexpected EE files: {sorted(nodes)}")
+        return False
+    images = {name: node["image"] for name, node in nodes.items()}
+    if images != {"execution-environment.yml": "ansible-custom-ee",
+                  "derived/execution-environment.yml": "ansible-custom-ee-derived",
+                  "cloud/execution-environment-aws.yml": "quay.io/myorg/aws-ee:latest"}:
+        print(f"❌ Unexpected image names: {images}")
+        return False
+    inputs = nodes["execution-environment.yml"]["inputs"]
+    if sorted(inputs["file"]) != ["ansible.cfg", "ee.lock", "execution-environment.yml", "files/",
+                                  "requirements.txt"]:
+        print(f"❌ Unexpected file inputs: {sorted(inputs['file'])}")
+        return False
+    if inputs["python"] != {"boto3": ">=1.28"} or list(inputs["system"]) != ["gcc"] \
+            or list(inputs["collection"]) != ["ansible.posix"]:
+        print(f"❌ Unexpected dependency inputs: {inputs}")
+        return False
+
+    print("✅ EE inputs are indexed")
+    return True
+
+
+def test_affected():
+    """Test change sets select the minimal image set, parents first."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_project(root)
+        nodes = index_project([root], root)
+
+        def rebuilt(*items):
+            return [entry["ee_file"] for entry in affected(nodes, [parse_change(i, root) for i in items])]
+
+        cases = [
+            (["ansible.cfg"], ["execution-environment.yml", "derived/execution-environment.yml"]),
+            (["files/motd"], ["execution-environment.yml", "derived/execution-environment.yml"]),
+            (["derived/execution-environment.yml"], ["derived/execution-environment.yml"]),
+            (["collection:amazon.aws"], ["cloud/execution-environment-aws.yml"]),
+            (["python:Boto3"], ["execution-environment.yml", "derived/execution-environment.yml"]),
+            (["image:quay.io/ansible/creator-ee:v24"], ["cloud/execution-environment-aws.yml"]),
+            (["image:quay.io/ansible/creator-ee", "README.md"],
+             ["cloud/execution-environment-aws.yml", "execution-environment.yml",
+              "derived/execution-environment.yml"]),
+            (["README.md", "system:make"], []),
+        ]
+        for items, expected in cases:
+            result = rebuilt(*items)
+            if result != expected:
+                print(f"❌ {items}: expected {expected}, got {result}")
+                return False
+
+    print("✅ Only affected images are rebuilt, in dependency order")
+    return True
+
+
+def test_cycles_and_duplicates():
+    """Test cyclic base images and two EE files building one image are rejected."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_ee(root / "a" / "execution-environment.yml", "ansible-custom-ee-b", options={"tags": ["ansible-custom-ee-a"]})
+        write_ee(root / "b" / "execution-environment.yml", "localhost/ansible-custom-ee-a:latest")
+        try:
+            topological_order(index_project([root], root))
+            print("❌ Cycle should be reported")
+            return False
+        except ImpactError as e:
+            if "Cyclic" not in str(e):
+                print(f"❌ Unexpected error: {e}")
+                return False
+
+        write_ee(root / "c" / "execution-environment.yml", "x", options={"tags": ["localhost/ansible-custom-ee-a:v2"]})
+        try:
+            index_project([root], root)
+            print("❌ Duplicate image names should be reported")
+            return False
+        except ImpactError:
+            pass
+
+    print("✅ Cycles and duplicate images are rejected")
+    return True
+
+
+def test_cli_since():
+    """Test `impact --since` reads the change set from git."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_project(root)
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        for command in (["init", "-q"], ["add", "-A"], ["commit", "-q", "-m", "init"]):
+            subprocess.run(git + command, cwd=root, check=True, capture_output=True)
+        (root / "requirements.txt").write_text("boto3>=1.30\n")
+
+        code, output = run_cli(["impact", str(root), "--root", str(root), "--since", "HEAD", "-f", "json"])
+        result = json.loads(output) if code == 0 else []
+        code_graph, graph = run_cli(["impact", str(root), "--root", str(root)])
+
+    if [entry["image"] for entry in result] != ["ansible-custom-ee", "ansible-custom-ee-derived"]:
+        print(f"❌ Unexpected impact: {output}")
+        return False
+    if "requirements.txt (dependencies.python)" not in result[0]["reasons"]:
+        print(f"❌ Reason should name the changed file: {result[0]['reasons']}")
+        return False
+    if code_graph != 0 or "ansible-custom-ee-derived" not in graph:
+        print(f"❌ Graph listing failed: {graph}")
+        return False
+
+    print("✅ impact --since uses git changes")
+    return True
+
+
+def test_project_ee_files():
+    """Test the repository's own EE files share ansible.cfg as an input."""
+    nodes = index_project([PROJECT_ROOT], PROJECT_ROOT)
+    names = [entry["ee_file"] for entry in affected(nodes, [parse_change("ansible.cfg", PROJECT_ROOT)])]
+    if sorted(names) != ["examples/execution-environment.yml", "execution-environment.yml"]:
+        print(f"❌ Unexpected project impact: {names}")
+        return False
+
+    print("✅ Project EE files are indexed")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_index,
+        test_affected,
+        test_cycles_and_duplicates,
+        test_cli_since,
+        test_project_ee_files
+    ]
+
+    print("🧪 Running rebuild impact tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
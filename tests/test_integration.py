@@ -5,18 +5,25 @@ Integration Tests for Ansible Custom EE Builder
 
 import os
 import sys
-import subprocess
 import tempfile
 import yaml
 import json
 import time
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.errors import EEBuilderError  # noqa: E402
+from ee_builder.execution import budget_from_env, tracker_sink  # noqa: E402
+from ee_builder.telemetry import SubstageTracker  # noqa: E402
+from fakes import run_command  # noqa: E402
+
 class IntegrationTestSuite:
     def __init__(self):
         self.project_root = Path.cwd()
         self.test_results = []
         self.test_image_name = "localhost/integration-test-ee:test"
+        self.budget = budget_from_env("EE_TEST_BUDGET", "integration tests")
         
     def log_test(self, name, status, message=""):
         """Log test result."""
@@ -24,18 +31,14 @@ class IntegrationTestSuite:
         print(f"{icon} {name}: {message}")
         self.test_results.append({"name": name, "status": status, "message": message})
     
-    def run_command(self, command, cwd=None, timeout=300):
-        """Run command and return result."""
-        try:
-            result = subprocess.run(
-                command, shell=True, cwd=cwd, timeout=timeout,
-                capture_output=True, text=True
-            )
-            return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", f"Command timed out after {timeout}s"
-        except Exception as e:
-            return False, "", str(e)
+    def run_command(self, command, cwd=None, timeout=300, env=None, sinks=()):
+        """Run a command (argv, no shell) within the suite budget, streaming its output."""
+        return run_command(command, self.budget, cwd=cwd, timeout=timeout, env=env, sinks=sinks)
+
+    def local_bin_env(self):
+        """Environment with ~/.local/bin (pip --user installs) on PATH."""
+        local_bin = str(Path.home() / ".local/bin")
+        return dict(os.environ, PATH=os.environ.get("PATH", "") + os.pathsep + local_bin)
 
     def create_minimal_ee_config(self):
         """Create minimal EE config for testing."""
@@ -125,12 +128,12 @@ class IntegrationTestSuite:
 
     def test_ansible_builder_availability(self):
         """Test if ansible-builder is available."""
-        success, stdout, stderr = self.run_command("pip show ansible-builder")
+        success, stdout, stderr = self.run_command(["pip", "show", "ansible-builder"])
         if success:
             self.log_test("Ansible Builder Available", True, "Package found")
         else:
             # Try to install it
-            success, stdout, stderr = self.run_command("pip install --break-system-packages ansible-builder")
+            success, stdout, stderr = self.run_command(["pip", "install", "--break-system-packages", "ansible-builder"])
             if success:
                 self.log_test("Ansible Builder Install", True, "Installed successfully")
             else:
@@ -144,17 +147,29 @@ class IntegrationTestSuite:
             self.log_test("Example EE Build", False, "Example EE file not found")
             return
         
-        # Create a build command using the script
-        build_cmd = f"export PATH=$PATH:/home/taso/.local/bin && ./scripts/build-local.sh --file {example_ee_path} --tag {self.test_image_name} --registry localhost"
-        
+        # Build in-process with the Python build driver
+        from ee_builder.build import build
+
+        local_bin = str(Path.home() / ".local/bin")
+        if local_bin not in os.environ.get("PATH", "").split(os.pathsep):
+            os.environ["PATH"] = os.environ.get("PATH", "") + os.pathsep + local_bin
+
+        repository, _, tag = self.test_image_name.rpartition(":")
+        registry, _, image_name = repository.partition("/")
+        output = []
         start_time = time.time()
-        success, stdout, stderr = self.run_command(build_cmd, timeout=600)
+        try:
+            build(example_ee_path, tag=tag, registry=registry, image_name=image_name,
+                  context=self.project_root / "context", line_sink=output.append)
+            success, error = True, ""
+        except EEBuilderError as e:
+            success, error = False, f"{e}\n{''.join(output[-20:])}"
         build_time = time.time() - start_time
         
         if success:
             self.log_test("Example EE Build", True, f"Built in {build_time:.1f}s")
         else:
-            self.log_test("Example EE Build", False, f"Build failed: {stderr}")
+            self.log_test("Example EE Build", False, f"Build failed: {error}")
 
     def test_minimal_ee_build(self):
         """Test minimal EE build."""
@@ -187,14 +202,16 @@ LABEL ansible-execution-environment=true
                 f.write(dockerfile_content)
             
             # Build with podman directly
-            build_cmd = f"podman build -f test.Dockerfile -t {self.test_image_name} ."
+            build_cmd = ["podman", "build", "-f", "test.Dockerfile", "-t", self.test_image_name, "."]
+            tracker = SubstageTracker()
             
             start_time = time.time()
-            success, stdout, stderr = self.run_command(build_cmd, timeout=600)
+            success, stdout, stderr = self.run_command(build_cmd, timeout=600, sinks=[tracker_sink(tracker)])
             build_time = time.time() - start_time
+            substages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in tracker.finish().items())
             
             if success:
-                self.log_test("Minimal EE Build", True, f"Built in {build_time:.1f}s")
+                self.log_test("Minimal EE Build", True, f"Built in {build_time:.1f}s ({substages})")
             else:
                 self.log_test("Minimal EE Build", False, f"Build failed: {stderr}")
                 
@@ -211,13 +228,13 @@ LABEL ansible-execution-environment=true
     def test_ee_functionality(self):
         """Test EE functionality."""
         # Check if image exists
-        success, stdout, stderr = self.run_command(f"podman images {self.test_image_name}")
+        success, stdout, stderr = self.run_command(["podman", "images", self.test_image_name])
         if not success:
             self.log_test("EE Functionality", False, "Test image not found")
             return
         
         # Test basic ansible command
-        test_cmd = f"podman run --rm {self.test_image_name} ansible --version"
+        test_cmd = ["podman", "run", "--rm", self.test_image_name, "ansible", "--version"]
         success, stdout, stderr = self.run_command(test_cmd)
         
         if success and "ansible" in stdout.lower():
@@ -226,7 +243,7 @@ LABEL ansible-execution-environment=true
             self.log_test("EE Ansible Command", False, f"Ansible test failed: {stderr}")
         
         # Test collection listing
-        test_cmd = f"podman run --rm {self.test_image_name} ansible-galaxy collection list"
+        test_cmd = ["podman", "run", "--rm", self.test_image_name, "ansible-galaxy", "collection", "list"]
         success, stdout, stderr = self.run_command(test_cmd)
         
         if success:
@@ -237,7 +254,7 @@ LABEL ansible-execution-environment=true
     def test_ansible_navigator_integration(self):
         """Test ansible-navigator integration."""
         # Check if ansible-navigator is available
-        success, stdout, stderr = self.run_command("export PATH=$PATH:/home/taso/.local/bin && which ansible-navigator")
+        success, stdout, stderr = self.run_command(["which", "ansible-navigator"], env=self.local_bin_env())
         if not success:
             self.log_test("Navigator Integration", False, "ansible-navigator not found")
             return
@@ -278,8 +295,9 @@ LABEL ansible-execution-environment=true
                 temp_config.write_text(yaml.dump(navigator_config, default_flow_style=False))
                 
                 # Test ansible-navigator run from temp directory
-                nav_cmd = f"export PATH=$PATH:/home/taso/.local/bin && cd {temp_dir} && ansible-navigator run test-playbook.yml -i test-inventory.yml --mode stdout"
-                success, stdout, stderr = self.run_command(nav_cmd, timeout=120)
+                nav_cmd = ["ansible-navigator", "run", "test-playbook.yml", "-i", "test-inventory.yml", "--mode", "stdout"]
+                success, stdout, stderr = self.run_command(nav_cmd, cwd=temp_dir, timeout=120,
+                                                           env=self.local_bin_env())
             
             if success and "PLAY RECAP" in stdout:
                 self.log_test("Navigator Integration", True, "Playbook executed successfully")
@@ -297,14 +315,14 @@ LABEL ansible-execution-environment=true
     def test_make_targets(self):
         """Test Make targets that involve building."""
         # Test make info
-        success, stdout, stderr = self.run_command("make info")
+        success, stdout, stderr = self.run_command(["make", "info"])
         if success:
             self.log_test("Make Info Target", True, "Info target works")
         else:
             self.log_test("Make Info Target", False, f"Error: {stderr}")
         
         # Test make version
-        success, stdout, stderr = self.run_command("make version")
+        success, stdout, stderr = self.run_command(["make", "version"])
         if success:
             self.log_test("Make Version Target", True, "Version target works")
         else:
@@ -313,7 +331,7 @@ LABEL ansible-execution-environment=true
     def cleanup_test_artifacts(self):
         """Clean up test artifacts."""
         # Remove test image
-        self.run_command(f"podman rmi {self.test_image_name} 2>/dev/null || true")
+        self.run_command(["podman", "rmi", self.test_image_name])
         
         # Remove any remaining test files
         test_files = [
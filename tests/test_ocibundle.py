@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+OCI bundle export/import tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.ocibundle import BundleError, export_image, import_bundle, read_bundle_meta  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import read_state, write_fake_runtime  # noqa: E402
+
+BASE_LAYERS = ["base os " * 4000, "python runtime " * 3000]
+V1 = "localhost/ansible-custom-ee:v1"
+V2 = "localhost/ansible-custom-ee:v2"
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def fake_images():
+    """v1 と v2 は最後のレイヤー（コレクション）だけが異なる。"""
+    return {
+        V1: {"Id": "1", "Layers": BASE_LAYERS + ["collections v1"]},
+        V2: {"Id": "2", "Layers": BASE_LAYERS + ["collections v2"]},
+    }
+
+
+def test_full_roundtrip():
+    """Test a full bundle is verified and loads the same layers on the other side."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        (temp_path / "build").mkdir()
+        (temp_path / "node").mkdir()
+        # ビルドマシンと実行ノードは別々のランタイム
+        build_cmd, _ = write_fake_runtime(temp_path / "build", images=fake_images())
+        node_cmd, node_state = write_fake_runtime(temp_path / "node")
+        bundle = temp_path / "ee-v1.tar.gz"
+        result = export_image(V1, bundle, runtime=ContainerRuntime(build_cmd))
+        meta = read_bundle_meta(bundle)
+        sidecar = Path(f"{bundle}.sha256").read_text().split()
+        imported = import_bundle(bundle, runtime=ContainerRuntime(node_cmd), store=temp_path / "store")
+        loaded = read_state(node_state)["images"].get(V1, {})
+
+    if result["blobs"] != 5 or result["included"] != 5 or meta["image"] != V1:
+        print(f"❌ Full bundle should contain manifest, config and 3 layers: {result}")
+        return False
+    if result["bundle_bytes"] >= result["image_bytes"] or sidecar != [result["sha256"], "ee-v1.tar.gz"]:
+        print(f"❌ Bundle should be compressed with a sha256 file: {result} {sidecar}")
+        return False
+    if imported["stored"] != 5 or imported["verified"] != "sha256 file":
+        print(f"❌ Unexpected import: {imported}")
+        return False
+    if loaded.get("Layers") != fake_images()[V1]["Layers"] or loaded.get("Digest") != result["manifest"]:
+        print(f"❌ Loaded image differs: {loaded}")
+        return False
+
+    print("✅ Full bundle round-trips through export and import")
+    return True
+
+
+def test_delta():
+    """Test a delta bundle carries only new blobs and needs its base in the store."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, _ = write_fake_runtime(temp_path, images=fake_images())
+        runtime = ContainerRuntime(command)
+        full = temp_path / "ee-v1.tar.gz"
+        delta = temp_path / "ee-v2.tar.gz"
+        export_image(V1, full, runtime=runtime)
+        result = export_image(V2, delta, runtime=runtime, bases=[full])
+
+        store = temp_path / "store"
+        try:
+            import_bundle(delta, runtime=runtime, store=store)
+            print("❌ Delta without its base should be rejected")
+            return False
+        except BundleError as e:
+            if V1 not in str(e):
+                print(f"❌ Error should name the base bundle's image: {e}")
+                return False
+        import_bundle(full, store=store, load=False)
+        imported = import_bundle(delta, runtime=runtime, store=store)
+        loaded = read_state(temp_path / "fake-runtime-state.json")["images"][V2]
+
+    # マニフェスト・コンフィグ・変わったレイヤーの3つだけ
+    if result["included"] != 3 or result["included_bytes"] * 10 > result["image_bytes"]:
+        print(f"❌ Delta should hold only the changed blobs: {result}")
+        return False
+    # 拒否された1回目で検証済みのブロブは保存されているので、2回目は何も保存しない
+    if result["bases"] != [V1] or imported["stored"] != 0:
+        print(f"❌ Unexpected delta import: {result} {imported}")
+        return False
+    if loaded.get("Layers") != fake_images()[V2]["Layers"]:
+        print(f"❌ Delta should load the full image: {loaded}")
+        return False
+
+    print("✅ Delta bundles ship only missing blobs")
+    return True
+
+
+def test_corruption():
+    """Test tampered bundles are rejected by checksum and by blob digest."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, _ = write_fake_runtime(temp_path, images=fake_images())
+        bundle = temp_path / "ee-v1.tar"
+        export_image(V1, bundle, runtime=ContainerRuntime(command), level=0)
+
+        data = bytearray(bundle.read_bytes())
+        offset = data.index(b"base os base os")
+        data[offset] = ord("B")
+        bundle.write_bytes(bytes(data))
+        errors = []
+        for remove_sidecar in (False, True):
+            if remove_sidecar:
+                os.unlink(f"{bundle}.sha256")
+            try:
+                import_bundle(bundle, store=temp_path / "store", load=False)
+                errors.append(None)
+            except BundleError as e:
+                errors.append(str(e))
+        stored = list((temp_path / "store").rglob("*")) if (temp_path / "store").exists() else []
+
+    if errors[0] is None or errors[1] is None:
+        print(f"❌ Corrupt bundles should be rejected: {errors}")
+        return False
+    if "corrupt" not in errors[0] or "corrupt" not in errors[1]:
+        print(f"❌ Blob digest should be checked while streaming: {errors}")
+        return False
+    if any(path.is_file() and BASE_LAYERS[0][:10] in path.read_text(errors="ignore") for path in stored):
+        print("❌ A corrupt blob was stored")
+        return False
+
+    print("✅ Corrupt bundles are rejected")
+    return True
+
+
+def test_bundle_layout():
+    """Test bundle.json comes first and the bundle is itself an OCI layout."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, _ = write_fake_runtime(temp_path, images=fake_images())
+        bundle = temp_path / "ee-v1.tar.gz"
+        export_image(V1, bundle, runtime=ContainerRuntime(command))
+        with tarfile.open(bundle, "r:gz") as tar:
+            names = tar.getnames()
+            index = json.load(tar.extractfile("index.json"))
+
+    if names[:3] != ["bundle.json", "oci-layout", "index.json"] or len(names) != 8:
+        print(f"❌ Unexpected bundle members: {names}")
+        return False
+    annotations = index["manifests"][0]["annotations"]
+    if annotations.get("org.opencontainers.image.ref.name") != V1:
+        print(f"❌ index.json should name the image: {index}")
+        return False
+
+    print("✅ Bundles are OCI layouts with bundle.json first")
+    return True
+
+
+def test_cli():
+    """Test `export --base` and `import` from the command line."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path, images=fake_images())
+        full, delta = temp_path / "v1.tar.gz", temp_path / "v2.tar.gz"
+        code1, out1 = run_cli(["export", V1, "-o", str(full), "--runtime", command])
+        code2, out2 = run_cli(["export", V2, "-o", str(delta), "--base", str(full), "--runtime", command,
+                               "-f", "json"])
+        code3, out3 = run_cli(["import", str(full), str(delta), "--store", str(temp_path / "store"),
+                               "--runtime", command, "-f", "json"])
+        loaded = read_state(state_path).get("loaded")
+
+    if code1 != 0 or "Wrote" not in out1 or code2 != 0 or json.loads(out2)["included"] != 3:
+        print(f"❌ export failed: {out1} {out2}")
+        return False
+    if code3 != 0 or [row["stored"] for row in json.loads(out3)] != [5, 3] or loaded != [V1, V2]:
+        print(f"❌ import failed: {out3} {loaded}")
+        return False
+
+    print("✅ export and import work from the CLI")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_full_roundtrip,
+        test_delta,
+        test_corruption,
+        test_bundle_layout,
+        test_cli
+    ]
+
+    print("🧪 Running OCI bundle tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
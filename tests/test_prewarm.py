@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Image pre-warmer tests for Ansible Custom EE Builder
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.prewarm import collect_images, prewarm  # noqa: E402
+from ee_builder.registry import RegistryClient, parse_image_ref  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import FakeRegistry, read_state, write_fake_runtime  # noqa: E402
+
+DIGEST_A = "sha256:" + "a" * 64
+DIGEST_B = "sha256:" + "b" * 64
+DIGEST_C = "sha256:" + "c" * 64
+
+
+def test_parse_image_ref():
+    """Test image reference parsing."""
+    cases = {
+        "registry.redhat.io/ansible-automation-platform-24/ee-minimal-rhel9:latest":
+            ("registry.redhat.io", "ansible-automation-platform-24/ee-minimal-rhel9", "latest"),
+        "localhost:5000/ee:dev": ("localhost:5000", "ee", "dev"),
+        "ubuntu": ("docker.io", "library/ubuntu", "latest"),
+        f"quay.io/ansible/creator-ee@{DIGEST_A}": ("quay.io", "ansible/creator-ee", DIGEST_A),
+    }
+    wrong = {ref: parse_image_ref(ref) for ref, expected in cases.items() if parse_image_ref(ref) != expected}
+
+    if wrong:
+        print(f"❌ Unexpected image reference parsing: {wrong}")
+        return False
+
+    print("✅ Image references are parsed correctly")
+    return True
+
+
+def test_collect_images():
+    """Test images are read from navigator configs and EE files."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        nav = Path(temp_dir) / "ansible-navigator.yml"
+        ee = Path(temp_dir) / "execution-environment.yml"
+        nav.write_text(yaml.dump({"ansible-navigator": {"execution-environment": {"image": "localhost/ee:1"}}}))
+        ee.write_text(yaml.dump({"version": 3, "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}}}))
+
+        images = collect_images([nav, ee, nav], ["localhost/ee:1", "localhost/extra:2"])
+
+    expected = ["localhost/ee:1", "quay.io/ansible/creator-ee:latest", "localhost/extra:2"]
+    if images != expected:
+        print(f"❌ Unexpected images: {images}")
+        return False
+
+    print("✅ Images collected from navigator and EE files")
+    return True
+
+
+def test_prewarm_pulls_only_cold_images():
+    """Test warm images are skipped and stale/missing images are pulled."""
+    with FakeRegistry(require_auth=True) as registry, tempfile.TemporaryDirectory() as temp_dir:
+        host = registry.address
+        warm, stale, missing, absent = (f"{host}/ee/{name}:1" for name in ("warm", "stale", "missing", "absent"))
+        registry.add_manifest("ee/warm", "1", DIGEST_A)
+        registry.add_manifest("ee/stale", "1", DIGEST_B)
+        registry.add_manifest("ee/missing", "1", DIGEST_C)
+
+        command, state_path = write_fake_runtime(
+            temp_dir,
+            images={
+                warm: {"Id": "1", "RepoDigests": [f"{host}/ee/warm@{DIGEST_A}"]},
+                stale: {"Id": "2", "RepoDigests": [f"{host}/ee/stale@{DIGEST_A}"]},
+            },
+            remote={stale: DIGEST_B, missing: DIGEST_C}
+        )
+
+        rows = prewarm(
+            [warm, stale, missing, absent],
+            runtime=ContainerRuntime(command),
+            registry=RegistryClient(insecure=[host], auth_file=Path(temp_dir) / "none.json"),
+            jobs=4, max_pulls=2
+        )
+        pulls = [call[1] for call in read_state(state_path)["calls"] if call[0] == "pull"]
+
+    result = {row["image"].split("/")[-1]: (row["state"], row["action"]) for row in rows}
+    expected = {
+        "warm:1": ("warm", ""),
+        "stale:1": ("stale", "pulled"),
+        "missing:1": ("missing", "pulled"),
+        "absent:1": ("missing", "failed"),
+    }
+
+    if result != expected:
+        print(f"❌ Unexpected pre-warm result: {result}")
+        return False
+    if sorted(pulls) != sorted([stale, missing, absent]):
+        print(f"❌ Unexpected pulls: {pulls}")
+        return False
+
+    print("✅ Pre-warm pulls only stale and missing images")
+    return True
+
+
+def test_prewarm_check_only():
+    """Test --check-only reports without pulling."""
+    with FakeRegistry() as registry, tempfile.TemporaryDirectory() as temp_dir:
+        image = f"{registry.address}/ee/app:2"
+        registry.add_manifest("ee/app", "2", DIGEST_B)
+        command, state_path = write_fake_runtime(temp_dir, remote={image: DIGEST_B})
+
+        rows = prewarm([image], runtime=ContainerRuntime(command),
+                       registry=RegistryClient(insecure=[registry.address]), check_only=True)
+        calls = read_state(state_path)["calls"]
+
+    if rows[0]["state"] != "missing" or any(call[0] == "pull" for call in calls):
+        print(f"❌ Check-only mode pulled or misreported: {rows}")
+        return False
+
+    print("✅ Check-only mode reports cold images without pulling")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_parse_image_ref,
+        test_collect_images,
+        test_prewarm_pulls_only_cold_images,
+        test_prewarm_check_only
+    ]
+
+    print("🧪 Running image pre-warm tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Profiling hook tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder import profiling as profiling_module  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.profiling import Profiler, ProfilingError, span, span_summary  # noqa: E402
+from fakes import write_fake_runtime  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout, stderr)."""
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue(), err.getvalue()
+
+
+def outputs(directory, name):
+    """Return {suffix: path} for the profile files written for ``name``."""
+    found = {}
+    for path in Path(directory).glob(f"{name}-*"):
+        found[path.name.split(".", 1)[1]] = path
+    return found
+
+
+def leaf():
+    total = 0
+    for i in range(200000):
+        total += i
+    return total
+
+
+def middle():
+    return leaf()
+
+
+def top():
+    return middle() + leaf()
+
+
+def test_spans():
+    """Test spans are only recorded while profiling, and summarised largest first."""
+    with span("subprocess", "ignored"):
+        pass
+    profiler = Profiler("sample", 0.01)
+    profiler.start()
+    for _ in range(3):
+        with span("subprocess", "podman pull"):
+            time.sleep(0.01)
+    with span("yaml", "parse"):
+        pass
+    try:
+        with span("http", "registry GET"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    profiler.stop()
+    with span("subprocess", "after"):
+        pass
+
+    rows = span_summary(profiler.spans)
+    names = [row["name"] for row in rows]
+    if names[0] != "podman pull" or sorted(names) != ["parse", "podman pull", "registry GET"]:
+        print(f"❌ Unexpected spans: {rows}")
+        return False
+    if rows[0]["count"] != 3 or rows[0]["total_seconds"] < 0.03 or rows[0]["max_seconds"] < 0.01:
+        print(f"❌ Unexpected span totals: {rows[0]}")
+        return False
+    if profiling_module._spans is not None:
+        print("❌ Spans should stop recording when the profiler stops")
+        return False
+
+    print("✅ Named spans are recorded while profiling")
+    return True
+
+
+def test_cprofile_collapsed():
+    """Test cProfile output and the collapsed stacks rebuilt from its caller graph."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        profiler = Profiler()
+        profiler.start()
+        top()
+        profiler.stop()
+        written = profiler.write(Path(temp_dir) / "unit")
+        stats = pstats.Stats(str(written[0]))
+        lines = written[1].read_text().splitlines()
+        report = json.loads(written[2].read_text())
+
+    functions = {func[2] for func in stats.stats}
+    if not {"top", "middle", "leaf"} <= functions or report["mode"] != "cprofile":
+        print(f"❌ pstats should contain the profiled functions: {sorted(functions)[:10]}")
+        return False
+    stacks = {}
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        stacks[tuple(frame.split(" (")[0] for frame in stack.split(";"))] = int(count)
+    through_middle = [count for stack, count in stacks.items() if stack[-3:] == ("top", "middle", "leaf")]
+    direct = [count for stack, count in stacks.items() if stack[-2:] == ("top", "leaf")]
+    if not through_middle or not direct:
+        print(f"❌ leaf should appear under both callers: {list(stacks)}")
+        return False
+    # leaf は middle 経由と直接で1回ずつ呼ばれるので、自身の時間がほぼ半分ずつ配分される
+    ratio = through_middle[0] / (through_middle[0] + direct[0])
+    if not 0.3 < ratio < 0.7:
+        print(f"❌ leaf time should be split between its callers: {ratio:.2f}")
+        return False
+    try:
+        Profiler("perf")
+        print("❌ An unknown mode should be rejected")
+        return False
+    except ProfilingError:
+        pass
+
+    print("✅ cProfile writes pstats and approximate collapsed stacks")
+    return True
+
+
+def test_cli_profile_option():
+    """Test --profile wraps a command and records its runtime subprocess spans."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        command, _ = write_fake_runtime(temp_dir)
+        profile_dir = Path(temp_dir) / "profiles"
+        saved = os.environ.pop("EE_RUNTIME_API", None)
+        os.environ["EE_RUNTIME_API"] = "0"
+        try:
+            code, _, err = run_cli(["--profile", str(profile_dir), "images", "--runtime", command])
+            plain = run_cli(["images", "--runtime", command])
+        finally:
+            if saved is None:
+                os.environ.pop("EE_RUNTIME_API", None)
+            else:
+                os.environ["EE_RUNTIME_API"] = saved
+        files = outputs(profile_dir, "ee_builder-images")
+        report = json.loads(files["spans.json"].read_text()) if "spans.json" in files else {}
+        collapsed = files["collapsed"].read_text() if "collapsed" in files else ""
+        written = sorted(p.name for p in profile_dir.iterdir())
+
+    if code != 0 or plain[0] != 0 or sorted(files) != ["collapsed", "pstats", "spans.json"]:
+        print(f"❌ Unexpected profile output: {code} {sorted(files)} {err}")
+        return False
+    spans = {(row["kind"], row["name"]) for row in report["spans"]}
+    if ("subprocess", "fake-podman images") not in spans or "cmd_images" not in collapsed:
+        print(f"❌ Runtime calls should be recorded as spans: {spans}")
+        return False
+    if "Profile written" not in err or len(written) != 3:
+        print(f"❌ Only the profiled run should write files: {written}")
+        return False
+
+    print("✅ --profile writes pstats, collapsed stacks and spans")
+    return True
+
+
+def test_environment_and_sampling():
+    """Test EE_PROFILE reaches child processes and the sampler records every thread."""
+    script = ("import threading, time\n"
+              "from ee_builder.yamlcache import load_yaml\n"
+              "def spin(until):\n"
+              "    while time.time() < until:\n"
+              "        pass\n"
+              "worker = threading.Thread(target=spin, args=(time.time() + 0.3,), name='spinner')\n"
+              "worker.start()\n"
+              f"load_yaml({str(PROJECT_ROOT / 'execution-environment.yml')!r})\n"
+              "worker.join()\n")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "spin.py"
+        path.write_text(script)
+        env = dict(os.environ, EE_PROFILE=str(Path(temp_dir) / "profiles"), EE_PROFILE_MODE="sample",
+                   EE_PROFILE_INTERVAL="0.002", EE_YAML_CACHE="0", PYTHONPATH=str(PROJECT_ROOT))
+        result = subprocess.run([sys.executable, "-m", "ee_builder", "profile", str(path)],
+                                cwd=temp_dir, env=env, capture_output=True, text=True, timeout=60)
+        files = outputs(Path(temp_dir) / "profiles", "spin")
+        report = json.loads(files["spans.json"].read_text()) if "spans.json" in files else {}
+        collapsed = files["collapsed"].read_text() if "collapsed" in files else ""
+
+    if result.returncode != 0 or sorted(files) != ["collapsed", "spans.json"]:
+        print(f"❌ Sampling mode should write collapsed stacks and spans: {sorted(files)} {result.stderr}")
+        return False
+    if report.get("mode") != "sample" or report.get("samples", 0) < 10:
+        print(f"❌ Unexpected sampling report: {report}")
+        return False
+    if not any(line.startswith("spinner;") and "spin (spin.py:3)" in line for line in collapsed.splitlines()):
+        print("❌ The sampler should record the worker thread's stacks")
+        return False
+    if ("yaml", "parse") not in {(row["kind"], row["name"]) for row in report["spans"]}:
+        print(f"❌ YAML parsing should be recorded as a span: {report['spans']}")
+        return False
+
+    print("✅ EE_PROFILE and the sampling profiler cover child processes and threads")
+    return True
+
+
+def test_profile_command():
+    """Test the profile command runs scripts like python would and keeps their exit code."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        profile_dir = str(Path(temp_dir) / "profiles")
+        output = Path(temp_dir) / "ansible-navigator.yml"
+        generated = run_cli(["profile", "-o", profile_dir, str(PROJECT_ROOT / "scripts/generate-navigator-config.py"),
+                             "-e", str(PROJECT_ROOT / "execution-environment.yml"), "-o", str(output)])
+        failing = Path(temp_dir) / "failing.py"
+        failing.write_text("import sys\nsys.exit(3)\n")
+        failed = run_cli(["profile", "-o", profile_dir, str(failing)])
+        missing = run_cli(["profile", "-o", profile_dir, str(Path(temp_dir) / "missing.py")])
+        files = outputs(profile_dir, "generate-navigator-config")
+        navigator_written = output.is_file()
+
+    if generated[0] != 0 or not navigator_written or sorted(files) != ["collapsed", "pstats", "spans.json"]:
+        print(f"❌ The script should run under the profiler: {generated}")
+        return False
+    if failed[0] != 3 or missing[0] != 1 or "Script not found" not in missing[2]:
+        print(f"❌ Unexpected exit codes: {failed} {missing}")
+        return False
+
+    print("✅ profile command wraps scripts and keeps their exit code")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_spans,
+        test_cprofile_collapsed,
+        test_cli_profile_option,
+        test_environment_and_sampling,
+        test_profile_command
+    ]
+
+    print("🧪 Running profiling tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
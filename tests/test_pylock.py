@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Python requirements lock tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import build  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.lockfile import LockError, load_lock  # noqa: E402
+from ee_builder.pylock import (  # noqa: E402
+    ResolutionError, evaluate_marker, load_python_index, locked_requirements, parse_requirement_lines,
+    resolve_python, specifier_matches, target_environment,
+)
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from fakes import read_state, write_fake_builder, write_fake_runtime, write_wheel  # noqa: E402
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(path, python):
+    path.write_text(yaml.safe_dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"python": python},
+    }))
+    return path
+
+
+def write_wheelhouse(directory):
+    """boto3 の最新版は botocore<1.30 を要求し、awscli は botocore>=1.30 を要求する。"""
+    directory.mkdir()
+    write_wheel(directory, "boto3", "1.29.0", ["botocore<1.30"])
+    write_wheel(directory, "boto3", "1.28.0", ["botocore>=1.30,<2"])
+    write_wheel(directory, "botocore", "1.29.5")
+    write_wheel(directory, "botocore", "1.31.0", ['urllib3<2; python_version < "3.10"'])
+    write_wheel(directory, "botocore", "2.0.0rc1")
+    write_wheel(directory, "awscli", "1.0.0", ["botocore>=1.30"])
+    write_wheel(directory, "urllib3", "1.26.18")
+    write_wheel(directory, "urllib3", "2.0.7", requires_python=">=3.7")
+    write_wheel(directory, "requests", "2.31.0", ['PySocks!=1.5.7,>=1.5.6; extra == "socks"'])
+    write_wheel(directory, "PySocks", "1.7.1")
+    write_wheel(directory, "newonly", "1.0.0", requires_python=">=3.12")
+    write_wheel(directory, "native", "1.0.0", tag="cp311-cp311-manylinux_2_17_x86_64")
+    return directory
+
+
+def test_specifiers():
+    """Test PEP 440 ordering and specifier matching."""
+    cases = [
+        ("1.31.0", ">=1.30,<2", True),
+        ("2.0.0rc1", ">=1.30", False),
+        ("2.0.0rc1", ">=2.0.0rc1", True),
+        ("1.0.post1", ">1.0", False),
+        ("1.1", "~=1.0", True),
+        ("2.0", "~=1.0", False),
+        ("1.3.2", "!=1.3.*", False),
+        ("1.0+local.1", "==1.0", True),
+        ("1.10", ">1.9", True),
+        ("1!0.1", ">=2.0", True),
+    ]
+    for version, spec, expected in cases:
+        if specifier_matches(version, spec) != expected:
+            print(f"❌ specifier_matches({version!r}, {spec!r}) should be {expected}")
+            return False
+
+    print("✅ PEP 440 specifiers match like pip")
+    return True
+
+
+def test_markers():
+    """Test markers are evaluated for the image interpreter, not the host."""
+    env = target_environment("3.9")
+    cases = [
+        ('python_version < "3.10"', True),
+        ('python_version >= "3.9" and sys_platform == "win32"', False),
+        ('platform_system == "Windows" or os_name == "posix"', True),
+        ('"linux" in sys_platform', True),
+    ]
+    for marker, expected in cases:
+        if evaluate_marker(marker, env) != expected:
+            print(f"❌ {marker!r} should be {expected}")
+            return False
+
+    lines = ["boto3>=1.28 # aws", 'pywin32; sys_platform == "win32"', "--index-url https://example/simple"]
+    names = [r["name"] for r in parse_requirement_lines(lines, env)]
+    if names != ["boto3"]:
+        print(f"❌ Unexpected requirements: {names}")
+        return False
+    try:
+        parse_requirement_lines(["-e git+https://example/x.git#egg=x"], env)
+        print("❌ Editable requirements cannot be locked")
+        return False
+    except LockError:
+        pass
+
+    print("✅ Markers and pip options are handled")
+    return True
+
+
+def test_resolution():
+    """Test backtracking, extras, Requires-Python and wheel tags against a wheelhouse."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index = load_python_index(write_wheelhouse(Path(temp_dir) / "wheels"))
+
+    env = target_environment("3.9")
+    pinned = resolve_python(parse_requirement_lines(["boto3", "awscli", "requests[socks]"], env), index, "3.9")
+    expected = {"boto3": "1.28.0", "botocore": "1.31.0", "awscli": "1.0.0", "urllib3": "1.26.18",
+                "requests": "2.31.0", "pysocks": "1.7.1"}
+    if pinned != expected:
+        print(f"❌ Unexpected resolution: {pinned}")
+        return False
+
+    for line, message in [("newonly", "newonly"), ("native", "native"), ("boto3>=1.29\nawscli", "botocore")]:
+        try:
+            resolve_python(parse_requirement_lines(line.split("\n"), env), index, "3.9")
+            print(f"❌ {line!r} should not resolve for Python 3.9")
+            return False
+        except ResolutionError as e:
+            if message not in str(e):
+                print(f"❌ Conflict should name {message}: {e}")
+                return False
+    if resolve_python(parse_requirement_lines(["native"], env), index, "3.11") != {"native": "1.0.0"}:
+        print("❌ cp311 wheel should resolve for Python 3.11")
+        return False
+
+    print("✅ Resolver backtracks and honours extras, Requires-Python and wheel tags")
+    return True
+
+
+def test_lock_and_check():
+    """Test `lock --wheelhouse` writes hash pins and `--check` notices edits."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        wheels = write_wheelhouse(temp_path / "wheels")
+        (temp_path / "requirements.txt").write_text("boto3>=1.28\nawscli\n")
+        ee_file = write_ee(temp_path / "execution-environment.yml", "requirements.txt")
+
+        code, output = run_cli(["lock", "-f", str(ee_file), "--wheelhouse", str(wheels)])
+        if code != 0 or "Python package(s) in" not in output:
+            print(f"❌ lock failed: {output}")
+            return False
+        section = load_lock(temp_path / "ee.lock")["python"]
+        lines = locked_requirements(section)
+        if not lines or not all("==" in line and "--hash=sha256:" in line for line in lines):
+            print(f"❌ Locked requirements should carry hashes: {lines}")
+            return False
+        if section["python_version"] != "3.9":
+            print(f"❌ Unexpected python_version: {section['python_version']}")
+            return False
+
+        code, _ = run_cli(["lock", "-f", str(ee_file), "--check"])
+        if code != 0:
+            print("❌ Fresh lock should pass --check")
+            return False
+
+        (temp_path / "requirements.txt").write_text("boto3>=1.29\n")
+        code, output = run_cli(["lock", "-f", str(ee_file), "--check"])
+        if code != 1 or "python section is out of date" not in output:
+            print(f"❌ Edited requirements should make the lock stale: {output}")
+            return False
+
+    print("✅ ee.lock pins Python packages with hashes")
+    return True
+
+
+def test_build_uses_lock():
+    """Test a locked build hands ansible-builder hash-pinned requirements only."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+        wheels = write_wheelhouse(temp_path / "wheels")
+        ee_file = write_ee(temp_path / "execution-environment.yml", ["requests[socks]>=2"])
+        run_cli(["lock", "-f", str(ee_file), "--wheelhouse", str(wheels)])
+
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                build(ee_file, runtime=ContainerRuntime(command), run_tests=False,
+                      context=temp_path / "context", lock_file=temp_path / "ee.lock")
+        finally:
+            os.environ["PATH"] = old_path
+        definition = yaml.safe_load(read_state(state_path)["ee_files"][0])
+
+    python = definition["dependencies"]["python"]
+    if [line.split(" ")[0] for line in python] != ["pysocks==1.7.1", "requests==2.31.0"]:
+        print(f"❌ Locked EE should list pinned packages: {python}")
+        return False
+    if not all("--hash=sha256:" in line for line in python):
+        print("❌ Every locked requirement needs a hash")
+        return False
+    if definition["dependencies"]["exclude"]["python"] != ["pysocks", "requests"]:
+        print("❌ Locked packages should be excluded from collection requirements")
+        return False
+
+    print("✅ Builds install hash-pinned Python packages")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_specifiers,
+        test_markers,
+        test_resolution,
+        test_lock_and_check,
+        test_build_uses_lock
+    ]
+
+    print("🧪 Running Python lock tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
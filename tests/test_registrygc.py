@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Registry tag garbage collection tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.registry import RegistryClient  # noqa: E402
+from ee_builder.registrygc import (  # noqa: E402
+    DELETE, DELETED, FAILED, KEEP, SKIPPED, RegistryGCError, apply_gc, configured_repositories, plan_gc
+)
+from fakes import FakeRegistry  # noqa: E402
+
+REPO = "myorg/ansible-custom-ee"
+NOW = time.time()
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def created(days_ago):
+    return (datetime.fromtimestamp(NOW, timezone.utc) - timedelta(days=days_ago)).strftime("%Y-%m-%dT%H:%M:%S.123456789Z")
+
+
+def push_history(registry, repository=REPO):
+    """12 releases, daily dev tags for 30 days, latest = v1.11.0, and a dev tag on the same image as v1.0.0."""
+    digests = {}
+    for minor in range(12):
+        digests[f"v1.{minor}.0"] = registry.add_image(repository, f"v1.{minor}.0", created(100 - minor * 5))
+    registry.add_manifest(repository, "latest", digests["v1.11.0"], registry.manifests[(repository, digests["v1.11.0"])][1])
+    for day in range(30):
+        tag = "dev-" + (datetime.fromtimestamp(NOW, timezone.utc) - timedelta(days=day)).strftime("%Y%m%d")
+        registry.add_image(repository, tag, created(day) if day % 2 else None)
+    registry.add_manifest(repository, "dev-pinned", digests["v1.0.0"], registry.manifests[(repository, digests["v1.0.0"])][1])
+    return digests
+
+
+def test_plan():
+    """Test keep-rules: protected tags, newest releases, age limit and shared digests."""
+    with FakeRegistry(require_auth=True) as registry, tempfile.TemporaryDirectory() as temp_dir:
+        push_history(registry)
+        registry.page_size = 7
+        client = RegistryClient(insecure=[registry.address], auth_file=Path(temp_dir) / "none.json")
+        rows = plan_gc([f"{registry.address}/{REPO}"], client, keep_releases=10, max_age_days=14, now=NOW)
+        deleted_requests = [r for r in registry.requests if r[0] == "DELETE"]
+
+    actions = {row["tag"]: (row["action"], row["reason"]) for row in rows}
+    if len(rows) != 12 + 1 + 30 + 1 or deleted_requests:
+        print(f"❌ Every page of tags should be planned without deleting: {len(rows)} {deleted_requests}")
+        return False
+    if actions["latest"][0] != KEEP or actions["v1.11.0"][0] != KEEP or actions["v1.2.0"][0] != KEEP:
+        print(f"❌ latest and the newest 10 releases should be kept: {actions}")
+        return False
+    if actions["v1.1.0"][0] != DELETE or actions["v1.0.0"][0] != DELETE:
+        print(f"❌ Releases beyond the newest 10 should be deleted: {actions['v1.1.0']} {actions['v1.0.0']}")
+        return False
+    dev = {tag: action for tag, (action, _) in actions.items() if tag.startswith("dev-2")}
+    # 作成日時が無いタグはタグ名の日付で判定される
+    if sum(1 for action in dev.values() if action == KEEP) != 14 or len(dev) != 30:
+        print(f"❌ Only dev tags younger than 14 days should be kept: {dev}")
+        return False
+    if actions["dev-pinned"][0] != DELETE:
+        print(f"❌ A dev tag on a deleted release should go too: {actions['dev-pinned']}")
+        return False
+
+    print("✅ Keep-rules produce a dry-run plan")
+    return True
+
+
+def test_shared_digest():
+    """Test a tag is kept when a kept tag points at the same digest."""
+    with FakeRegistry() as registry:
+        digests = push_history(registry)
+        registry.add_manifest(REPO, "stable", digests["v1.0.0"], registry.manifests[(REPO, digests["v1.0.0"])][1])
+        rows = plan_gc([f"{registry.address}/{REPO}"], RegistryClient(insecure=[registry.address]),
+                       protected=["latest", "stable"], now=NOW)
+
+    actions = {row["tag"]: (row["action"], row["reason"]) for row in rows}
+    if actions["v1.0.0"] != (KEEP, "same digest as kept tag stable") or actions["dev-pinned"][0] != KEEP:
+        print(f"❌ Deleting v1.0.0 by digest would remove 'stable': {actions['v1.0.0']} {actions['dev-pinned']}")
+        return False
+
+    print("✅ Digests shared with kept tags are not deleted")
+    return True
+
+
+def test_malformed_created():
+    """Test an out-of-range config timestamp falls back to the tag date instead of aborting the plan."""
+    with FakeRegistry() as registry:
+        registry.add_image(REPO, "dev-20200105", "2020-13-01T00:00:00Z")
+        registry.add_image(REPO, "nightly", "2024-02-30T10:00:00Z")
+        rows = plan_gc([f"{registry.address}/{REPO}"], RegistryClient(insecure=[registry.address]),
+                       max_age_days=14, now=NOW)
+
+    actions = {row["tag"]: (row["action"], row["reason"]) for row in rows}
+    if actions.get("dev-20200105", (None,))[0] != DELETE:
+        print(f"❌ The tag date should be used when created is invalid: {actions}")
+        return False
+    if actions.get("nightly") != (KEEP, "age unknown"):
+        print(f"❌ A tag without any usable date should be kept: {actions}")
+        return False
+
+    print("✅ Malformed creation times fall back to the tag date")
+    return True
+
+
+def test_apply_batches():
+    """Test deletes run in bounded parallel batches across repositories and only remove planned tags."""
+    with FakeRegistry() as registry:
+        push_history(registry)
+        push_history(registry, "other/ee")
+        registry.delay = 0.05
+        client = RegistryClient(insecure=[registry.address])
+        repositories = [f"{registry.address}/{REPO}", f"{registry.address}/other/ee"]
+        rows = apply_gc(plan_gc(repositories, client, now=NOW), client, jobs=3, batch_size=4)
+        remaining = {repo: set(registry.tags(repo)) for repo in (REPO, "other/ee")}
+
+    deleted = [row for row in rows if row["action"] == DELETED]
+    kept = {(row["repository"], row["tag"]) for row in rows if row["action"] == KEEP}
+    if len(deleted) != 2 * 19 or any(row["action"] in (DELETE, FAILED) for row in rows):
+        print(f"❌ Every planned tag should be deleted: {len(deleted)}")
+        return False
+    if registry.max_inflight != 3:
+        print(f"❌ Deletes should run 3 at a time: {registry.max_inflight}")
+        return False
+    if {(repo, tag) for repo, tags in remaining.items() for tag in tags} != kept:
+        print(f"❌ Registry should hold exactly the kept tags: {remaining}")
+        return False
+
+    print("✅ Deletes run in bounded parallel batches")
+    return True
+
+
+def test_unsupported_delete():
+    """Test a registry without the delete API stops after the first failed batch."""
+    with FakeRegistry() as registry:
+        push_history(registry)
+        registry.delete_enabled = False
+        client = RegistryClient(insecure=[registry.address])
+        rows = apply_gc(plan_gc([f"{registry.address}/{REPO}"], client, now=NOW), client, jobs=2, batch_size=5)
+        deletes = [r for r in registry.requests if r[0] == "DELETE"]
+
+    statuses = [row["action"] for row in rows if row["action"] not in (KEEP,)]
+    if statuses.count(FAILED) != 5 or statuses.count(SKIPPED) != 14 or len(deletes) != 5:
+        print(f"❌ Unexpected outcome: {statuses} {len(deletes)} DELETE request(s)")
+        return False
+    if "HTTP 405" not in next(row["error"] for row in rows if row["action"] == FAILED):
+        print("❌ The registry error should be reported")
+        return False
+
+    print("✅ Unsupported delete stops after one batch")
+    return True
+
+
+def test_configured_and_cli():
+    """Test repositories come from the push settings and the CLI dry run/apply."""
+    env = {"DOCKER_USERNAME": "me", "ECR_REGISTRY": "1234.dkr.ecr.ap-northeast-1.amazonaws.com",
+           "GCP_PROJECT_ID": "proj", "IMAGE_NAME": "ee"}
+    saved = {name: os.environ.pop(name, None) for name in list(env) + ["ACR_REGISTRY"]}
+    try:
+        os.environ.update(env)
+        configured = configured_repositories()
+        for name in env:
+            os.environ.pop(name)
+        try:
+            plan_gc(configured_repositories())
+            empty = None
+        except RegistryGCError as e:
+            empty = str(e)
+    finally:
+        for name, value in saved.items():
+            if value is not None:
+                os.environ[name] = value
+    if configured != ["docker.io/me/ee", "1234.dkr.ecr.ap-northeast-1.amazonaws.com/ee", "gcr.io/proj/ee"]:
+        print(f"❌ Unexpected configured repositories: {configured}")
+        return False
+    if empty is None or "DOCKER_USERNAME" not in empty:
+        print(f"❌ No repositories should be an error: {empty}")
+        return False
+
+    with FakeRegistry() as registry:
+        push_history(registry)
+        repository = f"{registry.address}/{REPO}"
+        code, text = run_cli(["gc", repository, "--insecure-registry", registry.address])
+        before = len(registry.tags(REPO))
+        code_apply, data = run_cli(["gc", repository, "--insecure-registry", registry.address, "--apply",
+                                    "--keep-releases", "3", "--protect", "dev-*", "-f", "json"])
+        after = set(registry.tags(REPO))
+
+    if code != 0 or "19 delete" not in text or "dry run" not in text or before != 44:
+        print(f"❌ Unexpected dry run: {text}")
+        return False
+    # dev-pinned が保護されるので同じダイジェストの v1.0.0 も残る
+    expected = {"latest", "v1.11.0", "v1.10.0", "v1.9.0", "v1.0.0"} | {row["tag"] for row in json.loads(data)
+                                                             if row["tag"].startswith("dev-")}
+    if code_apply != 0 or after != expected:
+        print(f"❌ Unexpected tags after --apply: {sorted(after)}")
+        return False
+
+    print("✅ gc uses the configured registries and supports dry run")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_plan,
+        test_shared_digest,
+        test_malformed_created,
+        test_apply_batches,
+        test_unsupported_delete,
+        test_configured_and_cli
+    ]
+
+    print("🧪 Running registry GC tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -5,17 +5,23 @@ Release Testing Framework for Ansible Custom EE Builder
 
 import os
 import sys
-import subprocess
 import tempfile
 import yaml
 import json
 from pathlib import Path
 import shutil
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.execution import budget_from_env  # noqa: E402
+from ee_builder.yamlcache import load_yaml  # noqa: E402
+from fakes import run_command  # noqa: E402
+
 class ReleaseTestSuite:
     def __init__(self):
         self.project_root = Path.cwd()
         self.test_results = []
+        self.budget = budget_from_env("EE_TEST_BUDGET", "release tests")
         
     def log_test(self, name, status, message=""):
         """Log test result."""
@@ -23,18 +29,9 @@ class ReleaseTestSuite:
         print(f"{icon} {name}: {message}")
         self.test_results.append({"name": name, "status": status, "message": message})
     
-    def run_command(self, command, cwd=None, timeout=60):
-        """Run command and return result."""
-        try:
-            result = subprocess.run(
-                command, shell=True, cwd=cwd, timeout=timeout,
-                capture_output=True, text=True
-            )
-            return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", "Command timed out"
-        except Exception as e:
-            return False, "", str(e)
+    def run_command(self, command, cwd=None, timeout=60, env=None, sinks=()):
+        """Run a command (argv, no shell) within the suite budget, streaming its output."""
+        return run_command(command, self.budget, cwd=cwd, timeout=timeout, env=env, sinks=sinks)
 
     # === ユニットテスト ===
     def test_project_structure(self):
@@ -98,8 +95,7 @@ class ReleaseTestSuite:
             file_path = self.project_root / yaml_file
             if file_path.exists():
                 try:
-                    with open(file_path, 'r') as f:
-                        yaml.safe_load(f)
+                    load_yaml(file_path)
                 except yaml.YAMLError:
                     invalid_files.append(yaml_file)
         
@@ -131,13 +127,13 @@ class ReleaseTestSuite:
     # === 統合テスト ===
     def test_makefile_targets(self):
         """Test Makefile targets work."""
-        success, stdout, stderr = self.run_command("make help")
+        success, stdout, stderr = self.run_command(["make", "help"])
         if success and "Ansible Custom EE Builder" in stdout:
             self.log_test("Makefile Help", True, "Help target works")
         else:
             self.log_test("Makefile Help", False, f"Error: {stderr}")
         
-        success, stdout, stderr = self.run_command("make check-deps")
+        success, stdout, stderr = self.run_command(["make", "check-deps"])
         if success:
             self.log_test("Dependency Check", True, "Dependencies available")
         else:
@@ -147,7 +143,7 @@ class ReleaseTestSuite:
         """Test script basic functionality."""
         # Test generate-navigator-config.py
         success, stdout, stderr = self.run_command(
-            "python3 scripts/generate-navigator-config.py --help"
+            ["python3", "scripts/generate-navigator-config.py", "--help"]
         )
         if success:
             self.log_test("Navigator Config Script", True, "Script help works")
@@ -155,7 +151,7 @@ class ReleaseTestSuite:
             self.log_test("Navigator Config Script", False, f"Error: {stderr}")
         
         # Test build-local.sh
-        success, stdout, stderr = self.run_command("scripts/build-local.sh --help")
+        success, stdout, stderr = self.run_command(["scripts/build-local.sh", "--help"])
         if success:
             self.log_test("Build Script", True, "Script help works")
         else:
@@ -165,14 +161,14 @@ class ReleaseTestSuite:
     def test_container_runtime_compatibility(self):
         """Test container runtime compatibility."""
         # Test podman
-        success, stdout, stderr = self.run_command("podman --version")
+        success, stdout, stderr = self.run_command(["podman", "--version"])
         if success:
             self.log_test("Podman Compatibility", True, f"Version: {stdout.strip()}")
         else:
             self.log_test("Podman Compatibility", False, "Podman not available")
         
         # Test docker
-        success, stdout, stderr = self.run_command("docker --version")
+        success, stdout, stderr = self.run_command(["docker", "--version"])
         if success:
             self.log_test("Docker Compatibility", True, f"Version: {stdout.strip()}")
         else:
@@ -180,7 +176,7 @@ class ReleaseTestSuite:
 
     def test_ansible_compatibility(self):
         """Test Ansible compatibility."""
-        success, stdout, stderr = self.run_command("ansible --version")
+        success, stdout, stderr = self.run_command(["ansible", "--version"])
         if success:
             version_line = stdout.split('\n')[0]
             self.log_test("Ansible Compatibility", True, version_line)
@@ -190,28 +186,20 @@ class ReleaseTestSuite:
     # === セキュリティテスト ===
     def test_secret_exposure(self):
         """Test for exposed secrets."""
-        sensitive_patterns = [
-            "password", "token", "secret", "key", "credential"
+        from ee_builder.secretscan import scan_tree
+
+        hits = [
+            hit for hit in scan_tree(self.project_root)
+            if "example" not in hit["path"] and
+            "claude.md" not in hit["path"].lower() and
+            "readme" not in hit["path"].lower() and
+            # 秘密情報スキャナー自身のテストは検出対象のダミー値を意図的に含む
+            hit["path"] != os.path.join("tests", "test_secretscan.py")
         ]
         
-        exposed_files = []
-        for file_path in self.project_root.rglob("*"):
-            if file_path.is_file() and not any(exclude in str(file_path) for exclude in ['.git', '__pycache__', '.venv']):
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read().lower()
-                        for pattern in sensitive_patterns:
-                            if f"{pattern}=" in content and \
-                               "example" not in str(file_path) and \
-                               "claude.md" not in str(file_path).lower() and \
-                               "readme" not in str(file_path).lower():
-                                exposed_files.append(str(file_path))
-                                break
-                except Exception:
-                    continue
-        
-        if exposed_files:
-            self.log_test("Secret Exposure", False, f"Potential secrets in: {exposed_files}")
+        if hits:
+            locations = [f"{hit['path']}:{hit['line']}:{hit['column']}" for hit in hits]
+            self.log_test("Secret Exposure", False, f"Potential secrets at: {locations}")
         else:
             self.log_test("Secret Exposure", True, "No exposed secrets found")
 
@@ -266,8 +254,7 @@ class ReleaseTestSuite:
             return
         
         try:
-            with open(example_ee, 'r') as f:
-                ee_config = yaml.safe_load(f)
+            ee_config = load_yaml(example_ee)
             
             # Check required fields
             required_fields = ["version", "images", "dependencies"]
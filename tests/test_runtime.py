@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Container runtime layer tests for Ansible Custom EE Builder
+"""
+
+import base64
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.errors import EEBuilderError  # noqa: E402
+from ee_builder.runtime import (  # noqa: E402
+    APIRuntime, ContainerRuntime, connect_runtime, find_socket, image_summary
+)
+from fakes import FakeEngineAPI, read_state, write_fake_runtime  # noqa: E402
+
+DIGEST_A = "sha256:" + "a" * 64
+DIGEST_B = "sha256:" + "b" * 64
+LOCAL = {"Id": "a" * 12, "RepoDigests": [f"quay.io/ansible/creator-ee@{DIGEST_A}"],
+         "Size": 2048, "Created": "2024-05-01T10:00:00.123456789Z"}
+
+
+def test_api_operations_share_connection():
+    """Test inspect/pull/run/push/list/remove over one keep-alive connection."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        socket_path = Path(temp_dir) / "engine.sock"
+        with FakeEngineAPI(socket_path, images={"quay.io/ansible/creator-ee:latest": LOCAL},
+                           remote={"localhost/ee:dev": DIGEST_B}) as api:
+            runtime = connect_runtime("podman", socket_path=str(socket_path))
+            if not isinstance(runtime, APIRuntime):
+                print(f"❌ Expected the API runtime, got {type(runtime).__name__}")
+                return False
+
+            digests = runtime.image_digests("quay.io/ansible/creator-ee:latest")
+            missing = runtime.inspect_image("localhost/ee:missing")
+            runtime.pull("localhost/ee:dev")
+            result = runtime.run_container("localhost/ee:dev", ["ansible", "--version"])
+            runtime.push("localhost/ee:dev")
+            names = sorted(tag for image in runtime.list_images() for tag in image["tags"])
+            runtime.remove_image("localhost/ee:dev", force=True)
+            remaining = [tag for image in runtime.list_images() for tag in image["tags"]]
+            runtime.close()
+
+            connections = api.connections
+            pushed = api.pushed
+
+    if digests != [DIGEST_A] or missing is not None or result.stdout != "ansible --version\n":
+        print(f"❌ Unexpected API results: {digests} {missing} {result.stdout!r}")
+        return False
+    if names != ["localhost/ee:dev", "quay.io/ansible/creator-ee:latest"] or remaining != [
+            "quay.io/ansible/creator-ee:latest"] or pushed != ["localhost/ee:dev"]:
+        print(f"❌ Unexpected image state: {names} {remaining} {pushed}")
+        return False
+    if connections != 1:
+        print(f"❌ Expected one pooled connection, server saw {connections}")
+        return False
+
+    print("✅ API runtime reuses one connection for all operations")
+    return True
+
+
+def test_api_registry_auth():
+    """Test API pulls and pushes send the auth file's credentials for the image's registry."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        auth_file = Path(temp_dir) / "auth.json"
+        auth_file.write_text(json.dumps({"auths": {
+            "quay.io": {"auth": base64.b64encode(b"robot:s3cret").decode()}
+        }}))
+        socket_path = Path(temp_dir) / "engine.sock"
+        saved = os.environ.get("REGISTRY_AUTH_FILE")
+        os.environ["REGISTRY_AUTH_FILE"] = str(auth_file)
+        try:
+            with FakeEngineAPI(socket_path, remote={"quay.io/org/ee:1": DIGEST_A,
+                                                    "localhost/ee:dev": DIGEST_B}) as api:
+                runtime = APIRuntime(str(socket_path), "podman")
+                runtime.pull("quay.io/org/ee:1")
+                runtime.push("quay.io/org/ee:1")
+                runtime.pull("localhost/ee:dev")
+                runtime.close()
+                sent = api.auth_headers
+        finally:
+            if saved is None:
+                os.environ.pop("REGISTRY_AUTH_FILE", None)
+            else:
+                os.environ["REGISTRY_AUTH_FILE"] = saved
+
+    quay = {"username": "robot", "password": "s3cret", "serveraddress": "quay.io"}
+    if sent != [quay, quay, {}]:
+        print(f"❌ Unexpected X-Registry-Auth headers: {sent}")
+        return False
+
+    print("✅ API pull/push authenticate with the auth file credentials")
+    return True
+
+
+def test_api_errors():
+    """Test API failures surface as runtime errors."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        socket_path = Path(temp_dir) / "engine.sock"
+        with FakeEngineAPI(socket_path, images={"localhost/ee:dev": LOCAL}):
+            runtime = APIRuntime(str(socket_path), "podman")
+            failures = []
+            for call in (lambda: runtime.pull("localhost/ee:nope"),
+                         lambda: runtime.run_container("localhost/ee:dev", ["false"]),
+                         lambda: runtime.remove_image("localhost/ee:nope")):
+                try:
+                    call()
+                except EEBuilderError as e:
+                    failures.append(str(e))
+            runtime.close()
+
+    if len(failures) != 3 or "manifest unknown" not in failures[0]:
+        print(f"❌ Expected three runtime errors, got {failures}")
+        return False
+
+    print("✅ API errors are reported as runtime errors")
+    return True
+
+
+def test_cli_fallback():
+    """Test the CLI is used without a socket and after the socket goes away."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path, images={"localhost/ee:dev": LOCAL})
+        without_socket = connect_runtime(command, socket_path=str(temp_path / "missing.sock"))
+
+        socket_path = temp_path / "engine.sock"
+        with FakeEngineAPI(socket_path, images={"localhost/ee:dev": LOCAL}):
+            runtime = APIRuntime(str(socket_path), command)
+            before = runtime.image_digests("localhost/ee:dev")
+        after = runtime.image_digests("localhost/ee:dev")
+        cli_calls = read_state(state_path)["calls"]
+
+    if not isinstance(without_socket, ContainerRuntime):
+        print("❌ Missing socket should select the CLI runtime")
+        return False
+    if before != after or runtime.use_api or cli_calls != [["image", "inspect", "localhost/ee:dev"]]:
+        print(f"❌ Runtime did not fall back to the CLI: {before} {after} {cli_calls}")
+        return False
+
+    print("✅ Runtime falls back to the CLI")
+    return True
+
+
+def test_sent_requests_are_not_retried():
+    """Test a request that fails or times out after being sent is reported instead of re-run with the CLI."""
+    errors = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path, images={"localhost/ee:dev": LOCAL})
+        socket_path = temp_path / "engine.sock"
+        with FakeEngineAPI(socket_path, remote={"localhost/ee:next": DIGEST_B}) as api:
+            runtime = APIRuntime(str(socket_path), command, timeout=0.2)
+            for delay, drop in ((1.0, False), (0.0, True)):
+                api.delay, api.drop = delay, drop
+                try:
+                    runtime.pull("localhost/ee:next", timeout=0.2)
+                    errors.append(None)
+                except EEBuilderError as e:
+                    errors.append(str(e))
+                runtime.client.close()
+        cli_calls = read_state(state_path).get("calls", [])
+
+    if not all(errors) or "timed out" not in errors[0]:
+        print(f"❌ The failures should surface as runtime errors: {errors}")
+        return False
+    if not runtime.use_api or cli_calls:
+        print(f"❌ The pull should not be repeated with the CLI: {cli_calls}")
+        return False
+
+    print("✅ Requests that reached the engine are not retried with the CLI")
+    return True
+
+
+def test_find_socket_per_engine():
+    """Test CONTAINER_HOST only applies to podman and DOCKER_HOST only to docker."""
+    names = ("CONTAINER_HOST", "DOCKER_HOST", "XDG_RUNTIME_DIR")
+    saved = {name: os.environ.get(name) for name in names}
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ.update({"CONTAINER_HOST": "unix:///run/podman.sock", "DOCKER_HOST": "unix:///run/docker.sock",
+                               "XDG_RUNTIME_DIR": temp_dir})
+            both = (find_socket("podman"), find_socket("/usr/bin/docker"))
+            del os.environ["DOCKER_HOST"]
+            podman_only = find_socket("docker")
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    if both != ("/run/podman.sock", "/run/docker.sock"):
+        print(f"❌ Each engine should use its own variable: {both}")
+        return False
+    if podman_only == "/run/podman.sock":
+        print("❌ docker should not connect to the socket in CONTAINER_HOST")
+        return False
+
+    print("✅ Socket variables are read per engine")
+    return True
+
+
+def test_image_summary():
+    """Test inspect data and API list entries normalize to the same shape."""
+    summary = image_summary(dict(LOCAL, RepoTags=["quay.io/ansible/creator-ee:latest", "<none>:<none>"]))
+    expected = {"id": "a" * 12, "tags": ["quay.io/ansible/creator-ee:latest"], "digests": [DIGEST_A],
+                "size": 2048, "created": 1714557600.123456}
+    if summary != expected or image_summary({"Id": "x", "Created": 1700000000})["created"] != 1700000000.0:
+        print(f"❌ Unexpected image summary: {summary}")
+        return False
+
+    print("✅ Image summaries are normalized")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_api_operations_share_connection,
+        test_api_registry_auth,
+        test_api_errors,
+        test_cli_fallback,
+        test_sent_requests_are_not_retried,
+        test_find_socket_per_engine,
+        test_image_summary
+    ]
+
+    print("🧪 Running container runtime tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
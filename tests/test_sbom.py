@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+SBOM generation tests for Ansible Custom EE Builder
+"""
+
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.build import build  # noqa: E402
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from ee_builder.sbom import generate_sbom, installed_components, scan_image  # noqa: E402
+from fakes import read_state, rpmdb_bytes, write_fake_builder, write_fake_runtime  # noqa: E402
+
+IMAGE = "localhost/ansible-custom-ee:latest"
+BASE = "quay.io/ansible/creator-ee:latest"
+BASE_DIGEST = "sha256:" + "b" * 64
+SITE = "usr/lib/python3.9/site-packages"
+COLLECTIONS = "usr/share/ansible/collections/ansible_collections"
+
+BASE_RPMS = [
+    {"name": "bash", "version": "5.1.8", "release": "9.el9", "arch": "x86_64", "license": "GPLv3+ and GPLv2"},
+    {"name": "openssl", "version": "3.0.7", "release": "27.el9", "epoch": 1, "arch": "x86_64",
+     "license": "Apache-2.0"},
+    {"name": "gpg-pubkey", "version": "fd431d51", "release": "4ae0493b"},
+]
+GIT_RPM = {"name": "git", "version": "2.39.3", "release": "1.el9", "arch": "x86_64", "license": "GPL-2.0-only"}
+
+LOCK = {
+    "galaxy": {"collections": [{"name": "amazon.aws", "version": "7.0.0", "sha256": "a" * 64,
+                                "url": "https://galaxy.ansible.com/download/amazon-aws-7.0.0.tar.gz"}]},
+    "python": {"packages": [{"name": "JMESPath", "version": "1.0.1", "hashes": ["sha256:" + "c" * 64]}]},
+}
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def metadata(name, version, license_name=None):
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+    if license_name:
+        lines.append(f"License: {license_name}")
+    return "\n".join(lines) + "\n\nLong description\n"
+
+
+def collection_manifest(namespace, name, version):
+    return json.dumps({"collection_info": {"namespace": namespace, "name": name, "version": version,
+                                           "license": ["GPL-3.0-or-later"]}})
+
+
+def image_layers():
+    """ベースレイヤーとEEのレイヤー（rpmdb を更新し、six をアンインストール）。"""
+    base = {
+        "etc/os-release": 'ID="rhel"\nVERSION_ID="9.4"\nPRETTY_NAME="Red Hat Enterprise Linux 9.4"\n',
+        "var/lib/rpm/rpmdb.sqlite": "base64:" + base64.b64encode(rpmdb_bytes(BASE_RPMS)).decode(),
+        f"{SITE}/six-1.16.0.dist-info/METADATA": metadata("six", "1.16.0", "MIT"),
+        f"{SITE}/six-1.16.0.dist-info/RECORD": "six.py,,\n",
+        f"{COLLECTIONS}/ansible/posix/MANIFEST.json": collection_manifest("ansible", "posix", "1.5.4"),
+    }
+    ee = {
+        "var/lib/rpm/rpmdb.sqlite": "base64:" + base64.b64encode(rpmdb_bytes(BASE_RPMS + [GIT_RPM])).decode(),
+        f"{SITE}/jmespath-1.0.1.dist-info/METADATA": metadata("jmespath", "1.0.1", "MIT"),
+        f"{SITE}/six-1.16.0.dist-info": None,
+        f"{COLLECTIONS}/amazon/aws/MANIFEST.json": collection_manifest("amazon", "aws", "7.0.0"),
+    }
+    return [base, ee]
+
+
+@contextlib.contextmanager
+def fake_image():
+    """Yield (temp dir, runtime, state path, EE file) with a built image in the fake runtime."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path, images={
+            IMAGE: {"Id": "1", "Digest": "sha256:" + "d" * 64, "Layers": image_layers()},
+            BASE: {"Id": "2", "Digest": BASE_DIGEST},
+        })
+        ee_file = temp_path / "execution-environment.yml"
+        ee_file.write_text(yaml.safe_dump({
+            "version": 3,
+            "images": {"base_image": {"name": BASE}},
+            "dependencies": {"galaxy": {"collections": [{"name": "amazon.aws"}]}, "python": ["jmespath"],
+                             "system": ["git [platform:rpm]"]},
+        }))
+        old = os.environ.get("EE_SBOM_CACHE_DIR")
+        os.environ["EE_SBOM_CACHE_DIR"] = str(temp_path / "cache")
+        try:
+            yield temp_path, ContainerRuntime(command), state_path, ee_file
+        finally:
+            if old is None:
+                os.environ.pop("EE_SBOM_CACHE_DIR")
+            else:
+                os.environ["EE_SBOM_CACHE_DIR"] = old
+
+
+def test_layers():
+    """Test packages are read from the layers with the last rpmdb and whiteouts applied."""
+    with fake_image() as (_, runtime, _, _):
+        scan = scan_image(IMAGE, runtime)
+        components = installed_components(scan["layers"])
+
+    found = {(c["type"], c["name"], c["version"]) for c in components}
+    expected = {("os", "rhel", "9.4"), ("rpm", "bash", "5.1.8"), ("rpm", "openssl", "3.0.7"),
+                ("rpm", "git", "2.39.3"), ("python", "jmespath", "1.0.1"),
+                ("collection", "ansible.posix", "1.5.4"), ("collection", "amazon.aws", "7.0.0")}
+    if found != expected:
+        print(f"❌ Unexpected installed components: {sorted(found)}")
+        return False
+    openssl = next(c for c in components if c["name"] == "openssl")
+    if openssl["epoch"] != 1 or openssl["release"] != "27.el9" or scan["scanned"] != 2:
+        print(f"❌ RPM header not fully read: {openssl} {scan['scanned']}")
+        return False
+
+    print("✅ Layer manifests are read in layer order")
+    return True
+
+
+def test_spdx():
+    """Test the SPDX document merges layer data with lock hashes and the base image digest."""
+    with fake_image() as (_, runtime, _, ee_file):
+        document, summary = generate_sbom(IMAGE, ee_file, runtime, LOCK, "spdx")
+
+    packages = {p["name"]: p for p in document["packages"]}
+    purls = {p["name"]: p["externalRefs"][0]["referenceLocator"] for p in document["packages"] if "externalRefs" in p}
+    if document["spdxVersion"] != "SPDX-2.3" or packages[IMAGE]["versionInfo"] != "sha256:" + "d" * 64:
+        print(f"❌ Unexpected document header: {document['spdxVersion']} {packages.get(IMAGE)}")
+        return False
+    if purls["openssl"] != "pkg:rpm/rhel/openssl@3.0.7-27.el9?arch=x86_64&epoch=1&distro=rhel-9.4" \
+            or purls["jmespath"] != "pkg:pypi/jmespath@1.0.1" or BASE_DIGEST.replace(":", "%3A") not in purls[BASE]:
+        print(f"❌ Unexpected purls: {purls}")
+        return False
+    if packages["jmespath"]["checksums"] != [{"algorithm": "SHA256", "checksumValue": "c" * 64}] \
+            or not packages["amazon.aws"]["downloadLocation"].startswith("https://"):
+        print(f"❌ Lock hashes/URLs missing: {packages['jmespath']} {packages['amazon.aws']}")
+        return False
+    if packages["bash"]["licenseDeclared"] != "NOASSERTION" or packages["git"]["licenseDeclared"] != "GPL-2.0-only":
+        print("❌ Only valid SPDX license expressions should be declared")
+        return False
+    descendant = [r for r in document["relationships"] if r["relationshipType"] == "DESCENDANT_OF"]
+    if len(descendant) != 1 or summary["sources"].get("layer+lock") != 2 or "ee" in summary["sources"]:
+        print(f"❌ Unexpected relationships/sources: {descendant} {summary}")
+        return False
+
+    print("✅ SPDX SBOM combines layers, lock and base image")
+    return True
+
+
+def test_layer_cache():
+    """Test a second SBOM reuses cached layer results without saving the image."""
+    with fake_image() as (_, runtime, state_path, ee_file):
+        _, first = generate_sbom(IMAGE, ee_file, runtime, LOCK)
+        _, second = generate_sbom(IMAGE, ee_file, runtime, LOCK)
+        saves = [call for call in read_state(state_path)["calls"] if call[:1] == ["save"]]
+
+    if first["layers_scanned"] != 2 or second["layers_scanned"] != 0 or len(saves) != 1:
+        print(f"❌ Layer results should be cached: {first} {second} {len(saves)} save(s)")
+        return False
+    if first["components"] != second["components"]:
+        print("❌ Cached results differ")
+        return False
+
+    print("✅ Layer scans are cached by diff ID")
+    return True
+
+
+def test_cli_cyclonedx():
+    """Test `sbom --format cyclonedx` and the lock/EE-only fallback."""
+    with fake_image() as (temp_path, runtime, _, ee_file):
+        output = temp_path / "sbom.cdx.json"
+        code, text = run_cli(["sbom", IMAGE, "-f", str(ee_file), "--format", "cyclonedx", "-o", str(output),
+                              "--runtime", runtime.command])
+        document = json.loads(output.read_text()) if code == 0 else {}
+        code_declared, declared = run_cli(["sbom", IMAGE, "-f", str(ee_file), "--no-layers",
+                                           "--runtime", runtime.command])
+
+    components = {c["name"]: c for c in document.get("components", [])}
+    if document.get("bomFormat") != "CycloneDX" or "2/2 layer(s)" not in text:
+        print(f"❌ Unexpected CycloneDX output: {text}")
+        return False
+    if components["openssl"]["version"] != "1:3.0.7-27.el9" or components[BASE]["type"] != "container":
+        print(f"❌ Unexpected components: {components.get('openssl')} {components.get(BASE)}")
+        return False
+    names = {p["name"]: p for p in json.loads(declared)["packages"]} if code_declared == 0 else {}
+    if names.get("git", {}).get("comment") != "source: ee" or names.get("jmespath", {}).get("versionInfo") != "NOASSERTION":
+        print(f"❌ --no-layers should fall back to the EE file: {declared}")
+        return False
+
+    print("✅ sbom writes CycloneDX and works without layers")
+    return True
+
+
+def test_build_writes_sbom():
+    """Test `build(sbom=...)` writes the SBOM as part of the build."""
+    with fake_image() as (temp_path, runtime, _, ee_file):
+        write_fake_builder(temp_path, temp_path / "fake-runtime-state.json")
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                result = build(ee_file, tag="v1", runtime=runtime, run_tests=False, context=temp_path / "ctx",
+                               sbom=temp_path / "out" / "sbom.spdx.json")
+        finally:
+            os.environ["PATH"] = old_path
+        document = json.loads((temp_path / "out" / "sbom.spdx.json").read_text())
+
+    if result.get("sbom") is None or document["name"] != "localhost/ansible-custom-ee:v1":
+        print(f"❌ Build should write the SBOM: {result}")
+        return False
+
+    print("✅ build writes the SBOM")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_layers,
+        test_spdx,
+        test_layer_cache,
+        test_cli_cyclonedx,
+        test_build_writes_sbom
+    ]
+
+    print("🧪 Running SBOM tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
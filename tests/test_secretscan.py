@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Secret exposure scanner tests for Ansible Custom EE Builder
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder import secretscan  # noqa: E402
+from ee_builder.secretscan import iter_files, scan_paths, scan_tree  # noqa: E402
+
+
+def test_gitignore_rules():
+    """Test .gitignore handling (anchoring, directories, negation, nesting)."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        files = ["keep.txt", "debug.log", "important.log", "context/Containerfile",
+                 "sub/build/out.txt", "sub/notes.md", "sub/draft.md", "docs/build/page.md",
+                 "artifacts/run.json", ".git/config", "__pycache__/x.pyc"]
+        for name in files:
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_text("x\n")
+        (root / ".gitignore").write_text("*.log\n!important.log\n/context/\nartifacts\n")
+        (root / "sub/.gitignore").write_text("build/\ndraft.md\n")
+
+        found = sorted(p.relative_to(root).as_posix() for p in iter_files(root))
+
+    expected = [".gitignore", "docs/build/page.md", "important.log", "keep.txt", "sub/.gitignore", "sub/notes.md"]
+    if found != expected:
+        print(f"❌ Unexpected files: {found}")
+        return False
+
+    print("✅ .gitignore rules are honoured")
+    return True
+
+
+def test_hits_have_line_and_column():
+    """Test exact positions, case-insensitivity and binary sniffing."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        (root / "app.env").write_text("# settings\nUSER=admin\nDB_PASSWORD=hunter2  # api_token=x\n")
+        (root / "image.bin").write_bytes(b"\x00\x01password=abc")
+        hits = scan_tree(root, workers=1)
+
+    positions = [(h["path"], h["line"], h["column"], h["pattern"]) for h in hits]
+    expected = [("app.env", 3, 4, "password"), ("app.env", 3, 28, "token")]
+    if positions != expected:
+        print(f"❌ Unexpected hits: {positions}")
+        return False
+
+    print("✅ Hits report line/column and binary files are skipped")
+    return True
+
+
+def test_large_file_mmap():
+    """Test large files are scanned through mmap with correct line numbers."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        big = Path(temp_dir) / "big.log"
+        filler = "INFO nothing to see here\n" * 100000
+        big.write_text(filler + "  secret=abc\n" + filler + "Credential=z")
+        hits = scan_paths([big], workers=1)
+
+    positions = [(h["line"], h["column"], h["pattern"]) for h in hits]
+    if positions != [(100001, 3, "secret"), (200002, 1, "credential")]:
+        print(f"❌ Unexpected hits in large file: {positions}")
+        return False
+
+    print("✅ Large files are streamed through mmap")
+    return True
+
+
+def test_parallel_matches_serial():
+    """Test multi-process scanning returns the same hits as a serial scan."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        for i in range(secretscan.BATCH_SIZE * 3):
+            (root / f"f{i:03d}.cfg").write_text(f"name={i}\n" + ("key=v\n" if i % 7 == 0 else ""))
+        serial = scan_tree(root, workers=1)
+        parallel = scan_tree(root, workers=4)
+
+    if serial != parallel or len(serial) != len(range(0, secretscan.BATCH_SIZE * 3, 7)):
+        print(f"❌ Parallel scan differs: {len(serial)} vs {len(parallel)}")
+        return False
+
+    print("✅ Parallel scan matches the serial scan")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_gitignore_rules,
+        test_hits_have_line_and_column,
+        test_large_file_mmap,
+        test_parallel_matches_serial
+    ]
+
+    print("🧪 Running secret scanner tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Shared dependency image tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.eeschema import has_errors, validate_files  # noqa: E402
+from ee_builder.impact import index_project, topological_order  # noqa: E402
+from ee_builder.sharedbase import DEFAULT_SIZES, plan_shared, size_lookup, write_plan  # noqa: E402
+from fakes import write_collection_tarball, write_wheel  # noqa: E402
+
+BASE = "quay.io/ansible/creator-ee:latest"
+MB = 1 << 20
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+def write_ee(path, base, collections, python, system="", **extra):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    definition = {
+        "version": 3,
+        "images": {"base_image": {"name": base}},
+        "dependencies": {"galaxy": {"collections": collections}, "python": python},
+    }
+    if system:
+        definition["dependencies"]["system"] = system
+    definition.update(extra)
+    path.write_text(yaml.safe_dump(definition))
+    return path
+
+
+def write_fleet(root):
+    """同じベースの3バリアント（aws/azure/k8s）と、別ベースの1つ。"""
+    posix = {"name": "ansible.posix", "version": ">=1.5.0"}
+    general = {"name": "community.general", "version": ">=8.0.0"}
+    (root / "aws").mkdir(parents=True)
+    (root / "aws" / "requirements.txt").write_text("jmespath>=1.0.0\nboto3>=1.28.0\n")
+    (root / "aws" / "files").mkdir()
+    write_ee(root / "aws" / "execution-environment.yml", BASE,
+             [posix, general, {"name": "amazon.aws"}], "requirements.txt", "git [platform:rpm]\n",
+             additional_build_files=[{"src": "files", "dest": "configs"}])
+    write_ee(root / "azure" / "execution-environment.yml", "quay.io/ansible/creator-ee",
+             [posix, general, {"name": "azure.azcollection"}], "jmespath>=1.0.0\n", "git [platform:rpm]\n")
+    write_ee(root / "k8s" / "execution-environment.yml", BASE,
+             [posix, {"name": "community.general", "version": ">=9.0.0"}, {"name": "kubernetes.core"}],
+             "jmespath>=1.0.0\nboto3>=1.28.0\n")
+    write_ee(root / "other" / "execution-environment.yml", "quay.io/ansible/awx-ee:latest",
+             [posix], "jmespath>=1.0.0\n")
+
+
+def test_plan():
+    """Test common items are shared per base image and savings are counted once per variant."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_fleet(root)
+        (root / "sizes.yml").write_text(yaml.safe_dump({
+            "collection": {"ansible.posix": 3 * MB}, "python": {"JMESPath": MB}, "system": {"git": 5 * MB},
+        }))
+        plans = plan_shared([root], root, size=size_lookup(sizes_file=root / "sizes.yml"))
+
+    if len(plans) != 1 or plans[0]["base_image"] != BASE or len(plans[0]["variants"]) != 3:
+        print(f"❌ Unexpected groups: {plans}")
+        return False
+    plan = plans[0]
+    if sorted(plan["shared"]) != [("collection", "ansible.posix"), ("python", "jmespath")]:
+        print(f"❌ Unexpected shared items: {sorted(plan['shared'])}")
+        return False
+    if plan["shared_bytes"] != 4 * MB or plan["saved_per_node"] != 8 * MB or plan["estimated_items"]:
+        print(f"❌ Unexpected sizes: {plan['shared_bytes']} {plan['saved_per_node']}")
+        return False
+
+    print("✅ Common items are planned into one shared image per base")
+    return True
+
+
+def test_min_share():
+    """Test --min-share shares items most variants use and counts what others inherit."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_fleet(root)
+        plan = plan_shared([root], root, min_share=0.6)[0]
+
+    shared = sorted(plan["shared"])
+    expected = [("collection", "ansible.posix"), ("python", "boto3"), ("python", "jmespath"),
+                ("system", "git")]
+    if shared != expected:
+        print(f"❌ Unexpected shared items: {shared}")
+        return False
+    extra = {Path(f).parent.name: size for f, size in plan["extra_bytes"].items()}
+    if extra != {"aws": 0, "azure": DEFAULT_SIZES["python"], "k8s": DEFAULT_SIZES["system"]}:
+        print(f"❌ Unexpected inherited bytes: {extra}")
+        return False
+    # community.general は k8s だけ指定が違うので共有しない
+    if ("collection", "community.general") in plan["shared"]:
+        print("❌ Differently pinned items must not be shared")
+        return False
+
+    print("✅ Partial sharing follows --min-share")
+    return True
+
+
+def test_write_plan():
+    """Test the emitted shared and derived EE files are valid and build in order."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_fleet(root)
+        output = root / "shared-ee"
+        written = write_plan(plan_shared([root], root), output, root)
+        issues = validate_files(written)
+        order = topological_order(index_project([output], output))
+        aws = yaml.safe_load((output / "aws" / "execution-environment.yml").read_text())
+        shared = yaml.safe_load((output / "ansible-custom-ee-shared" / "execution-environment.yml").read_text())
+        files_src = (output / "aws" / aws["additional_build_files"][0]["src"]).resolve()
+        files_ok = files_src == (root / "aws" / "files").resolve()
+
+    if len(written) != 4 or has_errors(issues):
+        print(f"❌ Written files invalid: {written} {issues}")
+        return False
+    if order[0] != "ansible-custom-ee-shared/execution-environment.yml":
+        print(f"❌ Shared image should build first: {order}")
+        return False
+    if aws["images"]["base_image"]["name"] != "localhost/ansible-custom-ee-shared:latest" \
+            or aws["options"]["tags"] != ["ansible-custom-ee-aws"]:
+        print(f"❌ Derived EE should build FROM the shared image under its old name: {aws}")
+        return False
+    if [c["name"] for c in aws["dependencies"]["galaxy"]["collections"]] != ["community.general", "amazon.aws"] \
+            or aws["dependencies"]["python"] != ["boto3>=1.28.0"]:
+        print(f"❌ Derived EE should keep only its own items: {aws['dependencies']}")
+        return False
+    if shared["dependencies"]["python"] != ["jmespath>=1.0.0"] or shared["images"]["base_image"]["name"] != BASE:
+        print(f"❌ Unexpected shared EE: {shared}")
+        return False
+    if not files_ok:
+        print("❌ additional_build_files should point back at the original directory")
+        return False
+
+    print("✅ Shared and derived EE files are written")
+    return True
+
+
+def test_cli_sizes():
+    """Test `share` takes sizes from local collection tarballs and wheels."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        write_fleet(root)
+        tarballs = root / "tarballs"
+        tarballs.mkdir()
+        tarball = write_collection_tarball(tarballs, "ansible.posix", "1.5.4", files={"plugins/x.py": "x" * 5000})
+        wheels = root / "wheels"
+        wheels.mkdir()
+        wheel = write_wheel(wheels, "jmespath", "1.0.1")
+        expected = tarball.stat().st_size + wheel.stat().st_size
+
+        code, output = run_cli(["share", str(root), "--root", str(root), "--index", str(tarballs),
+                                "--wheelhouse", str(wheels), "-f", "json"])
+        rows = json.loads(output) if code == 0 else []
+        code_table, table = run_cli(["share", str(root), "--root", str(root), "-o", str(root / "out")])
+
+    if len(rows) != 1 or rows[0]["shared_bytes"] != expected or rows[0]["estimated_items"] != 0:
+        print(f"❌ Sizes should come from the artifacts: {output}")
+        return False
+    if code_table != 0 or "saved per node" not in table or "wrote" not in table:
+        print(f"❌ Unexpected table output: {table}")
+        return False
+
+    print("✅ share reports sizes from local artifacts")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_plan,
+        test_min_share,
+        test_write_plan,
+        test_cli_sizes
+    ]
+
+    print("🧪 Running shared image tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Build telemetry tests for Ansible Custom EE Builder
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.telemetry import SubstageTracker, Telemetry, render_openmetrics  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+FAKE_BUILDER = """#!/bin/bash
+echo "Running command:"
+echo "[1/4] STEP 1/3: FROM quay.io/ansible/creator-ee:latest AS base"
+sleep 0.2
+echo "[2/4] STEP 1/2: RUN ansible-galaxy collection install -r requirements.yml"
+sleep 0.3
+echo "[3/4] STEP 1/2: RUN /output/scripts/assemble"
+sleep 0.1
+echo "[4/4] STEP 2/3: RUN /output/scripts/install-from-bindep && rm -rf /output/wheels"
+echo "COMMIT localhost/ansible-custom-ee:telemetry"
+exit ${FAKE_BUILD_EXIT:-0}
+"""
+
+FAKE_RUNTIME = """#!/bin/bash
+exit 0
+"""
+
+
+def run_build(temp_path, telemetry_file, fmt, build_exit=0):
+    bin_dir = temp_path / "bin"
+    bin_dir.mkdir(exist_ok=True)
+    for name, content in (("ansible-builder", FAKE_BUILDER), ("podman", FAKE_RUNTIME)):
+        script = bin_dir / name
+        script.write_text(content)
+        script.chmod(0o755)
+
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", FAKE_BUILD_EXIT=str(build_exit),
+               EE_RUNTIME_API="0")
+    env.pop("REDHAT_REGISTRY_USERNAME", None)
+    return subprocess.run(
+        [str(PROJECT_ROOT / "scripts/build-local.sh"),
+         "--file", str(PROJECT_ROOT / "examples/execution-environment.yml"),
+         "--tag", "telemetry", "--context", str(temp_path / "context"),
+         "--telemetry", str(telemetry_file), "--telemetry-format", fmt],
+        cwd=temp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+
+
+def test_substage_tracker():
+    """Test sub-stage classification and duration accounting."""
+    tracker = SubstageTracker()
+    lines = [
+        (0.0, "STEP 1/5: FROM registry.redhat.io/ee-minimal-rhel9:latest AS base"),
+        (5.0, "Step 2/5 : RUN ansible-galaxy collection install -r requirements.yml"),
+        (9.0, "#7 [builder 1/3] RUN /output/scripts/assemble"),
+        (12.0, "STEP 4/5: RUN /output/scripts/install-from-bindep"),
+        (13.5, "COMMIT localhost/ee:latest"),
+    ]
+    for now, line in lines:
+        tracker.feed(line, now)
+    durations = tracker.finish(14.0)
+
+    expected = {"base_pull": 5.0, "galaxy_install": 4.0, "pip_install": 3.0,
+                "system_install": 1.5, "commit": 0.5}
+    if durations != expected:
+        print(f"❌ Unexpected sub-stage durations: {durations}")
+        return False
+
+    print("✅ Builder sub-stages are classified and timed")
+    return True
+
+
+def test_openmetrics_rendering():
+    """Test OpenMetrics output structure."""
+    telemetry = Telemetry(None, "openmetrics", build_id="b1", labels={"tag": 'v"1'})
+    telemetry.record("phase", "build_ee", 100.0, 12.5)
+    telemetry.record("substage", "galaxy_install", 100.0, 4.25, phase="build_ee", steps=1)
+    text = render_openmetrics(telemetry.records)
+
+    expected_lines = [
+        '# TYPE ee_build_phase_duration_seconds gauge',
+        'ee_build_phase_duration_seconds{build_id="b1",phase="build_ee",status="ok",tag="v\\"1"} 12.5 100.0',
+        'ee_build_substage_duration_seconds{build_id="b1",substage="galaxy_install",status="ok",'
+        'tag="v\\"1",phase="build_ee"} 4.25 100.0',
+    ]
+    missing = [line for line in expected_lines if line not in text.splitlines()]
+    if missing or not text.endswith("# EOF\n"):
+        print(f"❌ OpenMetrics output missing lines: {missing}\n{text}")
+        return False
+
+    print("✅ OpenMetrics output is well-formed")
+    return True
+
+
+def test_build_script_jsonl():
+    """Test build-local.sh records every phase and builder sub-stage."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        telemetry_file = temp_path / "build.jsonl"
+        result = run_build(temp_path, telemetry_file, "jsonl")
+        if result.returncode != 0:
+            print(f"❌ Build script failed: {result.stderr}")
+            return False
+        records = [json.loads(line) for line in telemetry_file.read_text().splitlines()]
+
+    phases = [r["name"] for r in records if r["event"] == "phase"]
+    substages = {r["name"] for r in records if r["event"] == "substage"}
+    expected_phases = ["check_dependencies", "check_ee_file", "authenticate_redhat",
+                       "build_ee", "test_ee", "push_to_registry"]
+
+    if phases != expected_phases:
+        print(f"❌ Unexpected phases: {phases}")
+        return False
+    if substages != {"base_pull", "galaxy_install", "pip_install", "system_install", "commit"}:
+        print(f"❌ Unexpected sub-stages: {substages}")
+        return False
+    if len({r["build_id"] for r in records}) != 1 or records[-1]["event"] != "build":
+        print("❌ Records are not grouped under one build")
+        return False
+
+    print("✅ build-local.sh writes phase and sub-stage telemetry")
+    return True
+
+
+def test_build_script_failure_openmetrics():
+    """Test a failed build records the failing phase in OpenMetrics output."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        telemetry_file = temp_path / "build.prom"
+        result = run_build(temp_path, telemetry_file, "openmetrics", build_exit=1)
+        text = telemetry_file.read_text() if telemetry_file.exists() else ""
+
+    if result.returncode == 0:
+        print("❌ Build script should fail when ansible-builder fails")
+        return False
+    if 'phase="build_ee",status="failed"' not in text or 'status="failed"' not in text.split("# TYPE ee_build_phase")[0]:
+        print(f"❌ Failed phase not recorded:\n{text}")
+        return False
+
+    print("✅ Failed builds record the failing phase")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_substage_tracker,
+        test_openmetrics_rendering,
+        test_build_script_jsonl,
+        test_build_script_failure_openmetrics
+    ]
+
+    print("🧪 Running build telemetry tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
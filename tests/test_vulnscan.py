@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Incremental vulnerability scan tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.cli import main  # noqa: E402
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from ee_builder.vulnscan import VulnScanError, scan_image_vulns  # noqa: E402
+from fakes import read_state, write_fake_runtime, write_fake_scanner  # noqa: E402
+
+V1 = "localhost/ansible-custom-ee:v1"
+V2 = "localhost/ansible-custom-ee:v2"
+RPMDB = "var/lib/rpm/rpmdb.sqlite"
+SITE = "usr/lib/python3.9/site-packages"
+
+BASE_LAYER = {
+    "etc/os-release": 'ID="rhel"\nVERSION_ID="9.4"\n',
+    RPMDB: "rpmdb: bash openssl-3.0.7",
+    f"{SITE}/six-1.16.0.dist-info/METADATA": "Name: six\nVersion: 1.16.0\n",
+}
+COLLECTIONS_V1 = {f"{SITE}/requests-2.31.0.dist-info/METADATA": "Name: requests\nVersion: 2.31.0\n"}
+COLLECTIONS_V2 = {f"{SITE}/requests-2.32.3.dist-info/METADATA": "Name: requests\nVersion: 2.32.3\n"}
+# v2 では openssl を更新し、six を削除する
+SYSTEM_V2 = {RPMDB: "rpmdb: bash openssl-3.0.8", f"{SITE}/six-1.16.0.dist-info": None}
+
+VULNS = {
+    RPMDB: [{"id": "CVE-2024-0727", "package": "openssl", "version": "3.0.7", "severity": "MEDIUM",
+             "fixed": "3.0.8", "match": "openssl-3.0.7"}],
+    f"{SITE}/six-1.16.0.dist-info/METADATA": [{"id": "CVE-2099-0001", "package": "six", "version": "1.16.0",
+                                               "severity": "LOW"}],
+    f"{SITE}/requests-2.31.0.dist-info/METADATA": [{"id": "CVE-2024-35195", "package": "requests",
+                                                    "version": "2.31.0", "severity": "HIGH",
+                                                    "fixed": "2.32.0"}],
+}
+
+
+def run_cli(argv):
+    """Run the CLI and return (exit code, stdout)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            main(argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+    return code, out.getvalue()
+
+
+@contextlib.contextmanager
+def fake_tools(images=None):
+    """Yield (temp dir, runtime, runtime state, scanner, scanner state)."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, runtime_state = write_fake_runtime(temp_path, images=images or {
+            V1: {"Id": "1", "Layers": [BASE_LAYER, COLLECTIONS_V1]},
+            V2: {"Id": "2", "Layers": [BASE_LAYER, COLLECTIONS_V2, SYSTEM_V2]},
+        })
+        scanner, scanner_state = write_fake_scanner(temp_path, VULNS)
+        old = os.environ.get("EE_VULN_CACHE_DIR")
+        os.environ["EE_VULN_CACHE_DIR"] = str(temp_path / "cache")
+        try:
+            yield temp_path, ContainerRuntime(command), runtime_state, scanner, scanner_state
+        finally:
+            if old is None:
+                os.environ.pop("EE_VULN_CACHE_DIR")
+            else:
+                os.environ["EE_VULN_CACHE_DIR"] = old
+
+
+def found(result):
+    return [(f["id"], f["package"]) for f in result["findings"]]
+
+
+def test_first_scan():
+    """Test every layer is scanned separately and the findings are combined."""
+    with fake_tools() as (_, runtime, _, scanner, scanner_state):
+        result = scan_image_vulns(V1, runtime, scanner)
+        scans = read_state(scanner_state)["scans"]
+
+    if result["scanned"] != 2 or len(scans) != 2:
+        print(f"❌ Each layer should be scanned once: {result['scanned']} {scans}")
+        return False
+    # 2番目のレイヤーにはrequestsだけが展開され、os-release は下位から引き継がれる
+    if sorted(scans[1]) != ["etc/os-release", f"{SITE}/requests-2.31.0.dist-info/METADATA"]:
+        print(f"❌ Layer should be scanned on its own: {scans[1]}")
+        return False
+    if found(result) != [("CVE-2024-35195", "requests"), ("CVE-2024-0727", "openssl"), ("CVE-2099-0001", "six")]:
+        print(f"❌ Unexpected findings (severity order): {found(result)}")
+        return False
+    if result["findings"][1]["path"] != RPMDB or result["findings"][1]["layer"] != result["layers"][0]["diff_id"]:
+        print(f"❌ OS findings should belong to the package DB: {result['findings'][1]}")
+        return False
+
+    print("✅ Layers are scanned separately and combined")
+    return True
+
+
+def test_new_image_reuses_layers():
+    """Test a new release only scans its new layers and applies upgrades and whiteouts."""
+    with fake_tools() as (_, runtime, runtime_state, scanner, scanner_state):
+        scan_image_vulns(V1, runtime, scanner)
+        result = scan_image_vulns(V2, runtime, scanner)
+        again = scan_image_vulns(V2, runtime, scanner)
+        scans = read_state(scanner_state)["scans"]
+        saves = [call for call in read_state(runtime_state)["calls"] if call[:1] == ["save"]]
+
+    if result["scanned"] != 2 or result["reused"] != 1 or len(scans) != 4:
+        print(f"❌ Only the two new layers should be scanned: {result['scanned']} {len(scans)}")
+        return False
+    if found(result) != []:
+        print(f"❌ Upgraded/removed packages should drop out: {found(result)}")
+        return False
+    if again["scanned"] != 0 or len(saves) != 2:
+        print(f"❌ A fully cached image should not be saved: {again['scanned']} {len(saves)} save(s)")
+        return False
+
+    print("✅ New images scan only their new layers")
+    return True
+
+
+def test_db_update():
+    """Test a DB update rescans only entries older than max_age."""
+    with fake_tools() as (_, runtime, _, scanner, scanner_state):
+        scan_image_vulns(V1, runtime, scanner)
+        state = read_state(scanner_state)
+        state["db"] = "2026-10-02T00:00:00Z"
+        scanner_state.write_text(json.dumps(state))
+        fresh = scan_image_vulns(V1, runtime, scanner)
+        strict = scan_image_vulns(V1, runtime, scanner, max_age=0)
+        after = scan_image_vulns(V1, runtime, scanner, max_age=0)
+
+    if fresh["scanned"] != 0 or strict["scanned"] != 2 or after["scanned"] != 0:
+        print(f"❌ Unexpected rescans: {fresh['scanned']} {strict['scanned']} {after['scanned']}")
+        return False
+    if {layer["db"] for layer in after["layers"]} != {"2026-10-02T00:00:00Z"}:
+        print(f"❌ Cache should record the new DB: {after['layers']}")
+        return False
+
+    print("✅ DB updates invalidate stale layer results")
+    return True
+
+
+def test_os_context():
+    """Test the same layer on a different base OS is rescanned."""
+    other_base = dict(BASE_LAYER, **{"etc/os-release": 'ID="rhel"\nVERSION_ID="9.5"\n'})
+    images = {
+        V1: {"Id": "1", "Layers": [BASE_LAYER, COLLECTIONS_V1]},
+        V2: {"Id": "2", "Layers": [other_base, COLLECTIONS_V1]},
+    }
+    with fake_tools(images) as (_, runtime, _, scanner, _):
+        scan_image_vulns(V1, runtime, scanner)
+        result = scan_image_vulns(V2, runtime, scanner)
+        try:
+            scan_image_vulns(V1, runtime, scanner + "-missing")
+            missing = None
+        except VulnScanError as e:
+            missing = str(e)
+
+    if result["scanned"] != 2:
+        print(f"❌ A shared layer over a different os-release should be rescanned: {result['scanned']}")
+        return False
+    if missing is None or "EE_VULN_SCANNER" not in missing:
+        print(f"❌ A missing scanner should be reported: {missing}")
+        return False
+
+    print("✅ Inherited os-release is part of the cache key")
+    return True
+
+
+def test_cli():
+    """Test `vulnscan` output formats and --fail-on."""
+    with fake_tools() as (temp_path, runtime, _, scanner, _):
+        code, text = run_cli(["vulnscan", V1, "--scanner", scanner, "--runtime", runtime.command])
+        sarif_path = temp_path / "trivy-results.sarif"
+        code_sarif, summary = run_cli(["vulnscan", V1, "--scanner", scanner, "--runtime", runtime.command,
+                                       "-f", "sarif", "-o", str(sarif_path), "--fail-on", "HIGH"])
+        sarif = json.loads(sarif_path.read_text())
+        code_filtered, filtered = run_cli(["vulnscan", V1, "--scanner", scanner, "--runtime", runtime.command,
+                                           "-f", "json", "--severity", "MEDIUM", "--fail-on", "CRITICAL"])
+
+    if code != 0 or "CVE-2024-35195" not in text or "2/2 layer(s) scanned, 0 reused" not in text:
+        print(f"❌ Unexpected table output: {text}")
+        return False
+    results = sarif["runs"][0]["results"]
+    if code_sarif != 1 or "Wrote" not in summary or [r["level"] for r in results] != ["error", "warning", "note"]:
+        print(f"❌ Unexpected SARIF output: {code_sarif} {summary} {results}")
+        return False
+    if code_filtered != 0 or len(json.loads(filtered)["findings"]) != 2:
+        print(f"❌ --severity should filter findings: {filtered}")
+        return False
+
+    print("✅ vulnscan prints tables, JSON and SARIF")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_first_scan,
+        test_new_image_reuses_layers,
+        test_db_update,
+        test_os_context,
+        test_cli
+    ]
+
+    print("🧪 Running vulnerability scan tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Watch mode tests for Ansible Custom EE Builder
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.runtime import ContainerRuntime  # noqa: E402
+from ee_builder.watch import (  # noqa: E402
+    BUILD, CONFIG, TEST, InotifyWatcher, PollWatcher, generate_config, input_fingerprint, plan_stages,
+    wait_for_changes, watch, watched_files
+)
+from fakes import read_state, write_fake_builder, write_fake_runtime  # noqa: E402
+
+IMAGE = "localhost/ansible-custom-ee:latest"
+
+
+def write_project(path):
+    """EE file with a python requirements file, a COPY'd script and an ansible.cfg that is not copied."""
+    (path / "requirements.txt").write_text("jmespath>=1.0.0\n")
+    (path / "motd.sh").write_text("echo hello\n")
+    (path / "ansible.cfg").write_text("[defaults]\n")
+    ee_file = path / "execution-environment.yml"
+    ee_file.write_text(yaml.dump({
+        "version": 3,
+        "images": {"base_image": {"name": "quay.io/ansible/creator-ee:latest"}},
+        "dependencies": {"python": "requirements.txt",
+                         "galaxy": {"collections": [{"name": "ansible.posix"}]}},
+        "additional_build_steps": {"append_final": ["COPY motd.sh /etc/profile.d/motd.sh"]},
+    }))
+    return ee_file
+
+
+def save_atomically(path, text):
+    """Save the way editors do: write a temporary file and rename it over the original."""
+    tmp = path.with_name(f".{path.name}.swp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def test_fingerprint():
+    """Test fingerprints change per section and ignore comments and formatting."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        ee_file = write_project(temp_path)
+        files = {path.name for path in watched_files(ee_file, temp_path)}
+        before = input_fingerprint(ee_file, temp_path)
+        ee_file.write_text("# comment\n" + yaml.dump(yaml.safe_load(ee_file.read_text()), indent=4))
+        cosmetic = input_fingerprint(ee_file, temp_path)
+        (temp_path / "requirements.txt").write_text("jmespath>=1.0.0\nnetaddr\n")
+        (temp_path / "motd.sh").write_text("echo hi\n")
+        changed = input_fingerprint(ee_file, temp_path)
+
+    if files != {"execution-environment.yml", "ansible.cfg", "requirements.txt", "motd.sh"}:
+        print(f"❌ Unexpected watched files: {files}")
+        return False
+    if cosmetic != before:
+        print("❌ Comments and indentation should not change the fingerprint")
+        return False
+    sections = sorted(name for name in before if before[name] != changed[name])
+    if sections != ["build_files", "python"]:
+        print(f"❌ Only the python and build file sections should change: {sections}")
+        return False
+
+    print("✅ Fingerprints track the parsed inputs per section")
+    return True
+
+
+def test_plan_stages():
+    """Test the affected stage is chosen from the image's inputs and the last seen inputs."""
+    built = {"base_image": "a", "galaxy": "a", "python": "a", "system": "a", "build_steps": "a",
+             "build_files": "a", "lock": "a", "options": "a", "ansible_cfg": "a"}
+    edited = dict(built, python="b")
+    cases = [
+        (built, built, dict(built, ansible_cfg="b"), [CONFIG], []),
+        (built, built, edited, [BUILD, TEST], ["python"]),
+        (built, edited, built, [TEST], []),
+        (built, edited, dict(edited, galaxy="c", ansible_cfg="c"), [CONFIG, BUILD, TEST], ["galaxy", "python"]),
+        ({}, built, built, [BUILD, TEST], list(built)[:-1]),
+    ]
+    wrong = []
+    for image_inputs, current, new, stages, sections in cases:
+        plan = plan_stages(image_inputs, current, new)
+        if plan != {"stages": stages, "sections": sections}:
+            wrong.append((stages, plan))
+    if wrong:
+        print(f"❌ Unexpected plans: {wrong}")
+        return False
+
+    print("✅ Stages are planned from the changed sections")
+    return True
+
+
+def test_watchers_debounce():
+    """Test inotify and polling both see rename-saves and a burst of writes is reported once."""
+    watchers = [PollWatcher(interval=0.05)]
+    try:
+        watchers.insert(0, InotifyWatcher())
+    except (OSError, AttributeError):
+        print("ℹ️  inotify unavailable, testing the polling watcher only")
+
+    for watcher in watchers:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            target = Path(temp_dir) / "execution-environment.yml"
+            other = Path(temp_dir) / "notes.txt"
+            target.write_text("version: 3\n")
+            found = []
+            thread = threading.Thread(target=lambda: found.append(wait_for_changes(watcher, [target], 0.3)))
+            thread.start()
+            time.sleep(0.3)
+            other.write_text("unrelated")
+            for n in range(3):
+                save_atomically(target, f"version: 3\n# {n}\n")
+                time.sleep(0.1)
+            started = time.monotonic()
+            thread.join(5)
+            waited = time.monotonic() - started
+            watcher.close()
+
+        name = type(watcher).__name__
+        if found != [{target.resolve()}]:
+            print(f"❌ {name} should report the saved file once: {found}")
+            return False
+        if waited < 0.15:
+            print(f"❌ {name} did not wait for the burst to settle ({waited:.2f}s)")
+            return False
+
+    print("✅ File watchers debounce rename-saves")
+    return True
+
+
+def test_watch_reruns_affected_stage():
+    """Test a watch session rebuilds on dependency edits, regenerates config and only retests on revert."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        command, state_path = write_fake_runtime(temp_path)
+        write_fake_builder(temp_path, state_path)
+        ee_file = write_project(temp_path)
+        navigator = temp_path / "ansible-navigator.yml"
+        stop = threading.Event()
+        results = []
+
+        def wait_results(count):
+            deadline = time.monotonic() + 20
+            while len(results) < count and time.monotonic() < deadline:
+                time.sleep(0.05)
+            time.sleep(0.2)
+
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = f"{temp_path}{os.pathsep}{old_path}"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                thread = threading.Thread(target=lambda: watch(
+                    ee_file, runtime=ContainerRuntime(command), project_dir=temp_path, debounce=0.2,
+                    cycles=6, stop=stop, on_cycle=results.append))
+                thread.start()
+                wait_results(1)                          # 初回ビルド（イメージが無い）
+                save_atomically(temp_path / "requirements.txt", "jmespath>=1.0.0\nnetaddr\n")
+                wait_results(2)
+                (temp_path / "ansible.cfg").write_text("[defaults]\nforks = 20\n")
+                wait_results(3)
+                save_atomically(temp_path / "requirements.txt", "jmespath>>=1\n")
+                wait_results(4)                          # 検証エラーでビルド失敗
+                save_atomically(temp_path / "requirements.txt", "jmespath>=1.0.0\nnetaddr\n")
+                wait_results(5)                          # 現在のイメージの入力に戻ったのでテストのみ
+                ee_file.write_text("version: 3\ndependencies: [\n")
+                wait_results(6)                          # 不正なYAMLは失敗として次の変更を待つ
+                stop.set()
+                thread.join(10)
+        finally:
+            stop.set()
+            os.environ["PATH"] = old_path
+        state = read_state(state_path)
+        navigator_config = yaml.safe_load(navigator.read_text()) if navigator.exists() else {}
+
+    stages = [result["stages"] for result in results]
+    expected = [[CONFIG, BUILD, TEST], [BUILD, TEST], [CONFIG], [BUILD, TEST], [TEST], []]
+    if stages != expected:
+        print(f"❌ Unexpected stages: {stages} {[r['error'] for r in results]}")
+        return False
+    statuses = [result["status"] for result in results]
+    if results[1]["sections"] != ["python"] or statuses != ["ok", "ok", "ok", "failed", "ok", "failed"]:
+        print(f"❌ Unexpected cycle details: {results[1]['sections']} {statuses}")
+        return False
+    runs = [call for call in state["calls"] if call[:1] == ["run"]]
+    if state["builds"] != [IMAGE, IMAGE] or len(runs) != 3 * 3:
+        print(f"❌ Expected two builds and three smoke test runs: {state['builds']} {len(runs)}")
+        return False
+    if navigator_config["ansible-navigator"]["execution-environment"]["image"] != IMAGE:
+        print(f"❌ Navigator config not regenerated: {navigator_config}")
+        return False
+
+    print("✅ Watch mode reruns only the affected stage")
+    return True
+
+
+def test_generate_config():
+    """Test the navigator config is regenerated for the image and mounts ansible.cfg."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        ee_file = write_project(temp_path)
+        output = temp_path / "nav" / "ansible-navigator.yml"
+        output.parent.mkdir()
+        output.write_text("old: true\n")
+        generate_config(ee_file, IMAGE, temp_path, output)
+        config = yaml.safe_load(output.read_text())["ansible-navigator"]["execution-environment"]
+
+    if config["image"] != IMAGE or not any("ansible.cfg" in volume for volume in config["volume-mounts"]):
+        print(f"❌ Unexpected navigator config: {config}")
+        return False
+
+    print("✅ Navigator config is regenerated in the project directory")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_fingerprint,
+        test_plan_stages,
+        test_watchers_debounce,
+        test_watch_reruns_affected_stage,
+        test_generate_config
+    ]
+
+    print("🧪 Running watch mode tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -5,15 +5,21 @@ GitHub Actions Workflow Tests for Ansible Custom EE Builder
 
 import os
 import sys
-import subprocess
 import yaml
 import json
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder.execution import budget_from_env  # noqa: E402
+from ee_builder.yamlcache import load_yaml  # noqa: E402
+from fakes import run_command  # noqa: E402
+
 class WorkflowTestSuite:
     def __init__(self):
         self.project_root = Path.cwd()
         self.test_results = []
+        self.budget = budget_from_env("EE_TEST_BUDGET", "workflow tests")
         
     def log_test(self, name, status, message=""):
         """Log test result."""
@@ -21,18 +27,9 @@ class WorkflowTestSuite:
         print(f"{icon} {name}: {message}")
         self.test_results.append({"name": name, "status": status, "message": message})
     
-    def run_command(self, command, cwd=None, timeout=60):
-        """Run command and return result."""
-        try:
-            result = subprocess.run(
-                command, shell=True, cwd=cwd, timeout=timeout,
-                capture_output=True, text=True
-            )
-            return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", "Command timed out"
-        except Exception as e:
-            return False, "", str(e)
+    def run_command(self, command, cwd=None, timeout=60, env=None, sinks=()):
+        """Run a command (argv, no shell) within the suite budget, streaming its output."""
+        return run_command(command, self.budget, cwd=cwd, timeout=timeout, env=env, sinks=sinks)
 
     def test_workflow_yaml_syntax(self):
         """Test GitHub Actions workflow YAML syntax."""
@@ -53,8 +50,7 @@ class WorkflowTestSuite:
         
         for workflow_file in workflow_files:
             try:
-                with open(workflow_file, 'r') as f:
-                    workflow_data = yaml.safe_load(f)
+                workflow_data = load_yaml(workflow_file)
                 
                 # Check if workflow_data is valid
                 if not isinstance(workflow_data, dict):
@@ -94,8 +90,7 @@ class WorkflowTestSuite:
             return
         
         try:
-            with open(build_workflow, 'r') as f:
-                workflow = yaml.safe_load(f)
+            workflow = load_yaml(build_workflow)
             
             issues = []
             
@@ -159,8 +154,7 @@ class WorkflowTestSuite:
             return
         
         try:
-            with open(action_file, 'r') as f:
-                action = yaml.safe_load(f)
+            action = load_yaml(action_file)
             
             issues = []
             
@@ -259,8 +253,7 @@ class WorkflowTestSuite:
             return
         
         try:
-            with open(build_workflow, 'r') as f:
-                workflow = yaml.safe_load(f)
+            workflow = load_yaml(build_workflow)
             
             issues = []
             
@@ -372,7 +365,7 @@ class WorkflowTestSuite:
                     issues.append(f"{workflow_file.name}: Potential insecure password usage")
                 
                 # 3. Check for proper permissions
-                workflow_data = yaml.safe_load(content)
+                workflow_data = load_yaml(workflow_file)
                 if 'permissions' in workflow_data:
                     good_practices.append(f"{workflow_file.name}: Explicit permissions defined")
                 
@@ -391,14 +384,14 @@ class WorkflowTestSuite:
     def test_action_lint_compatibility(self):
         """Test GitHub Actions lint compatibility."""
         # Check if actionlint is available
-        success, stdout, stderr = self.run_command("which actionlint")
+        success, stdout, stderr = self.run_command(["which", "actionlint"])
         if not success:
             self.log_test("Action Lint", True, "actionlint not available (optional - skipped)")
             return
         
         # Run actionlint on workflows
         workflow_dir = self.project_root / ".github/workflows"
-        success, stdout, stderr = self.run_command(f"actionlint {workflow_dir}/*.yml")
+        success, stdout, stderr = self.run_command(["actionlint", *sorted(workflow_dir.glob("*.yml"))])
         
         if success:
             self.log_test("Action Lint", True, "Workflows pass actionlint")
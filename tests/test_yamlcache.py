@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+YAML parse cache tests for Ansible Custom EE Builder
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ee_builder import yamlcache  # noqa: E402
+from ee_builder.yamlcache import clear_memory_cache, load_yaml, stats  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def with_cache_dir(test):
+    """Run a test with a private disk cache and an empty memory cache."""
+    def wrapper():
+        with tempfile.TemporaryDirectory() as temp_dir:
+            old = os.environ.get("EE_YAML_CACHE_DIR")
+            os.environ["EE_YAML_CACHE_DIR"] = str(Path(temp_dir) / "cache")
+            clear_memory_cache()
+            try:
+                return test(Path(temp_dir))
+            finally:
+                clear_memory_cache()
+                if old is None:
+                    os.environ.pop("EE_YAML_CACHE_DIR")
+                else:
+                    os.environ["EE_YAML_CACHE_DIR"] = old
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@with_cache_dir
+def test_parsed_once(temp_path):
+    """Test repeated loads parse once and return independent copies."""
+    path = temp_path / "ee.yml"
+    path.write_text("version: 3\ndependencies:\n  python:\n    - requests\n")
+    first = load_yaml(path)
+    first["dependencies"]["python"].append("mutated")
+    second = load_yaml(path)
+
+    if second != {"version": 3, "dependencies": {"python": ["requests"]}}:
+        print(f"❌ Cached data was mutated or wrong: {second}")
+        return False
+    if stats["parsed"] != 1 or stats["memory_hits"] != 1:
+        print(f"❌ Unexpected cache stats: {stats}")
+        return False
+
+    print("✅ Files are parsed once and callers get their own copy")
+    return True
+
+
+@with_cache_dir
+def test_invalidation(temp_path):
+    """Test a changed file is parsed again and an unchanged rewrite is not."""
+    path = temp_path / "ee.yml"
+    path.write_text("version: 3\n")
+    load_yaml(path)
+    path.write_text("version: 4\n")
+    os.utime(path, ns=(1, 1))
+    changed = load_yaml(path)
+    path.write_text("version: 4\n")
+    same = load_yaml(path)
+
+    if changed != {"version": 4} or same != {"version": 4} or stats["parsed"] != 2:
+        print(f"❌ Cache was not invalidated correctly: {changed} {same} {stats}")
+        return False
+
+    print("✅ Changed files are re-parsed, identical content is reused")
+    return True
+
+
+@with_cache_dir
+def test_disk_cache_shared_between_processes(temp_path):
+    """Test a second process reads the parse result from the disk cache."""
+    path = temp_path / "workflow.yml"
+    path.write_text("name: Build\non: [push]\njobs:\n  build:\n    runs-on: ubuntu-latest\n")
+    load_yaml(path)
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1])\n"
+        "from ee_builder.yamlcache import load_yaml, stats\n"
+        "data = load_yaml(sys.argv[2]); print(stats['parsed'], stats['disk_hits'], data[True])\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script, str(PROJECT_ROOT), str(path)],
+                            capture_output=True, text=True, env=dict(os.environ), timeout=60)
+
+    if result.stdout.split() != ["0", "1", "['push']"]:
+        print(f"❌ Second process did not use the disk cache: {result.stdout} {result.stderr}")
+        return False
+
+    print("✅ Parse results are shared through the disk cache")
+    return True
+
+
+@with_cache_dir
+def test_errors_and_unmarshallable_data(temp_path):
+    """Test YAML errors propagate and timestamp data stays in memory only."""
+    broken = temp_path / "broken.yml"
+    broken.write_text("key: [unclosed\n")
+    dated = temp_path / "dated.yml"
+    dated.write_text("released: 2024-05-01\n")
+    try:
+        load_yaml(broken)
+        print("❌ Invalid YAML should raise")
+        return False
+    except yaml.YAMLError:
+        pass
+
+    first = load_yaml(dated)
+    second = load_yaml(dated)
+    disk_files = list(yamlcache.cache_dir().glob("*.marshal")) if yamlcache.cache_dir().exists() else []
+    if first != second or str(first["released"]) != "2024-05-01" or disk_files:
+        print(f"❌ Unexpected handling of timestamps: {first} {disk_files}")
+        return False
+
+    print("✅ Errors propagate and unmarshallable data is cached in memory only")
+    return True
+
+
+def run_all_tests():
+    """Run all tests and return overall result."""
+    tests = [
+        test_parsed_once,
+        test_invalidation,
+        test_disk_cache_shared_between_processes,
+        test_errors_and_unmarshallable_data
+    ]
+
+    print("🧪 Running YAML cache tests...\n")
+
+    results = []
+    for test in tests:
+        try:
+            result = test()
+            results.append(result)
+        except Exception as e:
+            print(f"❌ Test {test.__name__} failed with error: {e}")
+            results.append(False)
+        print()
+
+    passed = sum(results)
+    total = len(results)
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print(f"💥 {total - passed} tests failed")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)